@@ -49,6 +49,7 @@ import pandas as pd
 from Chan import CChan
 from ChanConfig import CChanConfig
 from Common.CEnum import AUTYPE, DATA_SRC, KL_TYPE
+from Scanner import CScanner
 
 
 def get_tradable_stocks():
@@ -111,7 +112,7 @@ class ScanThread(QThread):
 
     Signals:
         progress: (int, int, str) 当前进度、总数、当前股票信息
-        found_signal: (dict) 发现买点时发出，包含股票详情和 CChan 对象
+        found_signal: (dict) 发现买点时发出，包含股票详情和买点信息
         finished: (int, int) 扫描完成，返回成功数和失败数
         log_signal: (str) 日志消息
     """
@@ -120,7 +121,7 @@ class ScanThread(QThread):
     finished = pyqtSignal(int, int)
     log_signal = pyqtSignal(str)
 
-    def __init__(self, stock_list, config, days=365):
+    def __init__(self, stock_list, config, days=365, max_workers=None):
         """
         初始化扫描线程
 
@@ -128,96 +129,92 @@ class ScanThread(QThread):
             stock_list: pd.DataFrame, 待扫描的股票列表
             config: CChanConfig, 缠论配置
             days: int, 获取多少天的历史数据，默认365天
+            max_workers: int, 扫描进程数，None表示cpu核数
         """
         super().__init__()
         self.stock_list = stock_list
         self.config = config
         self.days = days
-        self.is_running = True
+        self.max_workers = max_workers
+        self.scanner = None
 
     def stop(self):
-        """停止扫描，设置标志位让 run() 循环退出"""
-        self.is_running = False
+        """停止扫描，尚未开始的股票会被取消"""
+        if self.scanner:
+            self.scanner.stop()
 
     def run(self):
         """
-        线程主函数，遍历股票列表进行缠论分析
+        线程主函数，通过 CScanner 多进程并行扫描股票列表
 
         扫描逻辑:
             1. 跳过无K线数据的股票
             2. 跳过停牌超过15天的股票
             3. 检测最近3天内是否出现买点
-            4. 发现买点时通过 found_signal 发出通知
+            4. 发现买点时通过 found_signal 发出通知（不带 CChan 对象，点击时再单独分析）
         """
         begin_time = (datetime.now() - timedelta(days=self.days)).strftime("%Y-%m-%d")
         end_time = datetime.now().strftime("%Y-%m-%d")
         total = len(self.stock_list)
         success_count = 0
         fail_count = 0
-
-        for idx, row in self.stock_list.iterrows():
-            if not self.is_running:
-                break
-
+        rows = [row for _, row in self.stock_list.iterrows()]
+
+        self.scanner = CScanner(
+            lv_list=[KL_TYPE.K_DAY],
+            config=self.config,
+            begin_time=begin_time,
+            end_time=end_time,
+            data_src=DATA_SRC.AKSHARE,
+            autype=AUTYPE.QFQ,
+            max_workers=self.max_workers,
+            bsp_cnt=0,
+        )
+        on_progress = lambda done, _total, res: self.progress.emit(done, total, f"{res.code} {rows[res.idx]['名称']}")  # noqa: E731
+        for res in self.scanner.scan([row['代码'] for row in rows], progress_cb=on_progress):
+            row = rows[res.idx]
             code = row['代码']
             name = row['名称']
-            self.progress.emit(idx + 1, total, f"{code} {name}")
-            self.log_signal.emit(f"🔍 扫描 {code} {name}...")
-
-            try:
-                chan = CChan(
-                    code=code,
-                    begin_time=begin_time,
-                    end_time=end_time,
-                    data_src=DATA_SRC.AKSHARE,
-                    lv_list=[KL_TYPE.K_DAY],
-                    config=self.config,
-                    autype=AUTYPE.QFQ,
-                )
-
-                # 检查最近15天是否有数据
-                if len(chan[0]) == 0:
-                    fail_count += 1
-                    self.log_signal.emit(f"⏭️ {code} {name}: 无K线数据")
-                    continue
-                last_klu = chan[0][-1][-1]
-                last_time = last_klu.time
-                last_date = datetime(last_time.year, last_time.month, last_time.day)
-                if (datetime.now() - last_date).days > 15:
-                    fail_count += 1
-                    self.log_signal.emit(f"⏸️ {code} {name}: 停牌超过15天")
-                    continue
-
-                success_count += 1
-
-                # 检查是否有买点（只找最近3天内出现的买点）
-                bsp_list = chan.get_latest_bsp(number=0)
-                cutoff_date = datetime.now() - timedelta(days=3)
-                buy_points = [
-                    bsp for bsp in bsp_list
-                    if bsp.is_buy and datetime(bsp.klu.time.year, bsp.klu.time.month, bsp.klu.time.day) >= cutoff_date
-                ]
-
-                if buy_points:
-                    # 获取最近的买点
-                    latest_buy = buy_points[0]
-                    self.log_signal.emit(f"✅ {code} {name}: 发现买点 {latest_buy.type2str()}")
-                    self.found_signal.emit({
-                        'code': code,
-                        'name': name,
-                        'price': row['最新价'],
-                        'change': row['涨跌幅'],
-                        'bsp_type': latest_buy.type2str(),
-                        'bsp_time': str(latest_buy.klu.time),
-                        'chan': chan,
-                    })
-                else:
-                    self.log_signal.emit(f"➖ {code} {name}: 无近期买点")
-            except Exception as e:
+
+            if not res.ok:
+                fail_count += 1
+                self.log_signal.emit(f"❌ {code} {name}: {res.error[:50]}")
+                continue
+            # 检查最近15天是否有数据
+            if res.last_time is None:
                 fail_count += 1
-                self.log_signal.emit(f"❌ {code} {name}: {str(e)[:50]}")
+                self.log_signal.emit(f"⏭️ {code} {name}: 无K线数据")
+                continue
+            last_date = datetime(res.last_time.year, res.last_time.month, res.last_time.day)
+            if (datetime.now() - last_date).days > 15:
+                fail_count += 1
+                self.log_signal.emit(f"⏸️ {code} {name}: 停牌超过15天")
                 continue
 
+            success_count += 1
+
+            # 检查是否有买点（只找最近3天内出现的买点）
+            cutoff_date = datetime.now() - timedelta(days=3)
+            buy_points = [
+                bsp for bsp in res.bsp_lst
+                if bsp.is_buy and datetime(bsp.time.year, bsp.time.month, bsp.time.day) >= cutoff_date
+            ]
+
+            if buy_points:
+                # 获取最近的买点
+                latest_buy = buy_points[0]
+                self.log_signal.emit(f"✅ {code} {name}: 发现买点 {latest_buy.type}")
+                self.found_signal.emit({
+                    'code': code,
+                    'name': name,
+                    'price': row['最新价'],
+                    'change': row['涨跌幅'],
+                    'bsp_type': latest_buy.type,
+                    'bsp_time': str(latest_buy.time),
+                })
+            else:
+                self.log_signal.emit(f"➖ {code} {name}: 无近期买点")
+
         self.finished.emit(success_count, fail_count)
 
 
@@ -598,7 +595,7 @@ class AkshareGUI(QMainWindow):
         发现买点的回调函数
 
         Args:
-            data: dict, 包含股票代码、名称、价格、买点类型、CChan对象等信息
+            data: dict, 包含股票代码、名称、价格、买点类型等信息
         """
         row = self.stock_table.rowCount()
         self.stock_table.insertRow(row)
@@ -608,9 +605,6 @@ class AkshareGUI(QMainWindow):
         self.stock_table.setItem(row, 3, QTableWidgetItem(f"{data['change']:.2f}%"))
         self.stock_table.setItem(row, 4, QTableWidgetItem(f"{data['bsp_type']} ({data['bsp_time']})"))
 
-        # 缓存 chan 对象
-        self.stock_cache[data['code']] = data['chan']
-
     def on_scan_finished(self, success_count, fail_count):
         """扫描完成"""
         self.scan_btn.setEnabled(True)
@@ -655,6 +649,7 @@ class AkshareGUI(QMainWindow):
     def on_analysis_finished(self, chan):
         """单只股票分析完成"""
         self.chan = chan
+        self.stock_cache[chan.code] = chan  # 扫描结果不带 CChan，点击过的股票缓存起来
         self.analyze_btn.setEnabled(True)
         self.plot_chart()
         self.statusBar.showMessage(f'分析完成: {chan.code}')
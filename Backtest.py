@@ -0,0 +1,569 @@
+"""
+事件驱动回测
+用trigger_step逐根K线驱动CChan，每一步和上一步比较各级别的尾部，把变化整理成事件回调给策略：
+    - CBarEvent: 新K线(各级别)
+    - CBiEvent: 笔新增/变化/删除
+    - CSegEvent: 线段确定
+    - CZSEvent: 新中枢
+    - CBspEvent: 买卖点出现/消失
+策略只需要重写关心的回调，没重写的事件不会去计算；下单通过ctx.buy/ctx.sell，由CBroker按手续费、滑点撮合
+
+    class MyStrategy(CStrategy):
+        def on_bsp(self, ctx, event):
+            if event.change == CHANGE_TYPE.NEW and event.lv == ctx.lv_list[0] and BSP_TYPE.T1 in event.bsp.type:
+                ctx.buy() if event.bsp.is_buy else ctx.sell()
+
+    tester = CBacktester(MyStrategy, lv_list=[KL_TYPE.K_DAY], config={"divergence_rate": 0.8}, begin_time="2018-01-01")
+    res = tester.run("sz.000001")
+    for res in tester.run_many(code_list, max_workers=8): print(res.summary)
+"""
+import copy
+import math
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type, Union
+
+from Bi.Bi import CBi
+from BuySellPoint.BS_Point import CBS_Point
+from Chan import CChan
+from ChanConfig import CChanConfig
+from Common.CEnum import AUTYPE, CHANGE_TYPE, DATA_SRC, KL_TYPE
+from Common.ChanException import CChanException, ErrCode
+from Common.CTime import CTime
+from KLine.KLine_List import CKLine_List
+from KLine.KLine_Unit import CKLine_Unit
+from Seg.Seg import CSeg
+from ZS.ZS import CZS
+
+
+@dataclass
+class CBarEvent:
+    lv: KL_TYPE
+    klu: CKLine_Unit
+
+
+@dataclass
+class CBiEvent:
+    lv: KL_TYPE
+    change: CHANGE_TYPE  # NEW/CHANGED/REMOVED
+    idx: int
+    bi: Optional[CBi]  # REMOVED时为None
+
+
+@dataclass
+class CSegEvent:
+    lv: KL_TYPE
+    seg: CSeg  # 刚确定的线段
+
+
+@dataclass
+class CZSEvent:
+    lv: KL_TYPE
+    zs: CZS  # 新出现的中枢
+
+
+@dataclass
+class CBspEvent:
+    lv: KL_TYPE
+    change: CHANGE_TYPE  # NEW/CHANGED(类型变了)/REMOVED
+    bsp: CBS_Point
+    is_seg: bool = False  # 线段买卖点
+
+
+EVENT_TYPE = Union[CBarEvent, CBiEvent, CSegEvent, CZSEvent, CBspEvent]
+
+
+class CStrategy:
+    """
+    回调里可以直接读ctx.chan；事件里的对象是CChan内部对象，之后可能被修改，需要保存的字段请当场取出
+    """
+    def on_start(self, ctx: 'CBacktestContext'):
+        pass
+
+    def on_bar(self, ctx: 'CBacktestContext', event: CBarEvent):
+        pass
+
+    def on_bi(self, ctx: 'CBacktestContext', event: CBiEvent):
+        pass
+
+    def on_seg(self, ctx: 'CBacktestContext', event: CSegEvent):
+        pass
+
+    def on_zs(self, ctx: 'CBacktestContext', event: CZSEvent):
+        pass
+
+    def on_bsp(self, ctx: 'CBacktestContext', event: CBspEvent):
+        pass
+
+    def on_step(self, ctx: 'CBacktestContext'):
+        # 每根最高级别K线的所有事件之后调用一次
+        pass
+
+    def on_finish(self, ctx: 'CBacktestContext'):
+        pass
+
+
+def _overridden(strategy: CStrategy, name: str) -> bool:
+    return getattr(type(strategy), name) is not getattr(CStrategy, name)
+
+
+def _diff_tail(old_sig: list, stable_len: int, items, make_sig) -> Tuple[int, list, list]:
+    """
+    笔、线段、中枢只会在尾部变化，从上一步记录的不会再变的前缀长度stable_len开始比较(确定的部分被回退时往前找到断开处)
+    返回(第一个变化的位置, 变化前从该位置起的签名, 变化后从该位置起的签名)，并原地更新old_sig
+    """
+    start = min(stable_len, len(items), len(old_sig))
+    while start > 0 and make_sig(items[start - 1]) != old_sig[start - 1]:
+        start -= 1
+    new_tail = [make_sig(item) for item in items[start:]]
+    pos = start
+    while pos - start < len(new_tail) and pos < len(old_sig) and old_sig[pos] == new_tail[pos - start]:
+        pos += 1
+    old_changed = old_sig[pos:]
+    old_sig[start:] = new_tail
+    return pos, old_changed, new_tail[pos - start:]
+
+
+def _bi_stable_len(bi_list) -> int:
+    # 末尾的虚笔会被删除重算；最后两根确定的笔还可能更新终点(update_peak会删掉最后一笔、延长倒数第二笔)
+    idx = len(bi_list)
+    while idx > 0 and not bi_list[idx - 1].is_sure:
+        idx -= 1
+    return max(idx - 2, 0)
+
+
+def _zs_stable_len(zs_list) -> int:
+    # 开始笔不早于last_sure_pos的中枢下一次会被删除重算，之前的中枢只会被合并延长，开始笔和是否确定都不变
+    idx = len(zs_list.zs_lst)
+    while idx > 0 and zs_list.zs_lst[idx - 1].begin_bi.idx >= zs_list.last_sure_pos:
+        idx -= 1
+    return idx
+
+
+def _bi_sig(bi: CBi) -> tuple:
+    return bi.begin_klc.idx, bi.end_klc.idx, bi.is_sure, bi.end_klc.high, bi.end_klc.low
+
+
+def _seg_sig(seg: CSeg) -> tuple:
+    return seg.start_bi.idx, seg.end_bi.idx, seg.is_sure
+
+
+def _zs_sig(zs: CZS) -> tuple:
+    return zs.begin_bi.idx, zs.is_sure
+
+
+class CLevelTracker:
+    # 记录一个级别上一步的尾部状态，计算本步的事件
+    def __init__(self, lv: KL_TYPE, kinds: set):
+        self.lv = lv
+        self.kinds = kinds
+        self.last_klu_idx = -1
+        self.bi_sig: List[tuple] = []
+        self.seg_sig: List[tuple] = []
+        self.zs_sig: List[tuple] = []
+        self.bi_stable_len = self.seg_stable_len = self.zs_stable_len = 0  # 上一步时各列表不会再变的前缀长度
+        # 笔/线段买卖点 -> {(类型, 是否买点): (不会再变的前缀长度, [(笔序号, 类型, 买卖点)])}
+        self.bsp_tracked: Dict[bool, Dict[tuple, Tuple[int, List[Tuple[int, str, CBS_Point]]]]] = {False: {}, True: {}}
+
+    def events(self, kl_list: CKLine_List) -> List[EVENT_TYPE]:
+        res: List[EVENT_TYPE] = []
+        if "bar" in self.kinds:
+            self.bar_events(kl_list, res)
+        if "bi" in self.kinds:
+            self.bi_events(kl_list, res)
+        if "seg" in self.kinds:
+            self.seg_events(kl_list, res)
+        if "zs" in self.kinds:
+            self.zs_events(kl_list, res)
+        if "bsp" in self.kinds:
+            self.bsp_events(res, kl_list.bs_point_lst, False)
+            self.bsp_events(res, kl_list.seg_bs_point_lst, True)
+        return res
+
+    def bar_events(self, kl_list: CKLine_List, res: list):
+        new_klu = []
+        for klc in reversed(kl_list.lst):
+            if klc.lst[-1].idx <= self.last_klu_idx:
+                break
+            new_klu.extend(klu for klu in reversed(klc.lst) if klu.idx > self.last_klu_idx)
+        if new_klu:
+            self.last_klu_idx = new_klu[0].idx
+            res.extend(CBarEvent(self.lv, klu) for klu in reversed(new_klu))
+
+    def bi_events(self, kl_list: CKLine_List, res: list):
+        bi_list = kl_list.bi_list
+        pos, old, new = _diff_tail(self.bi_sig, self.bi_stable_len, bi_list, _bi_sig)
+        self.bi_stable_len = _bi_stable_len(bi_list)
+        for offset in range(max(len(old), len(new))):
+            idx = pos + offset
+            if offset >= len(new):
+                res.append(CBiEvent(self.lv, CHANGE_TYPE.REMOVED, idx, None))
+            else:
+                res.append(CBiEvent(self.lv, CHANGE_TYPE.NEW if offset >= len(old) else CHANGE_TYPE.CHANGED, idx, bi_list[idx]))
+
+    def seg_events(self, kl_list: CKLine_List, res: list):
+        pos, old, new = _diff_tail(self.seg_sig, self.seg_stable_len, kl_list.seg_list, _seg_sig)
+        self.seg_stable_len = kl_list.seg_list.frontier_begin()
+        for offset, sig in enumerate(new):
+            if sig[2] and (offset >= len(old) or old[offset] != sig):
+                res.append(CSegEvent(self.lv, kl_list.seg_list[pos + offset]))
+
+    def zs_events(self, kl_list: CKLine_List, res: list):
+        zs_lst = kl_list.zs_list.zs_lst
+        pos, old, new = _diff_tail(self.zs_sig, self.zs_stable_len, zs_lst, _zs_sig)
+        self.zs_stable_len = _zs_stable_len(kl_list.zs_list)
+        for offset, sig in enumerate(new):
+            if offset >= len(old) or old[offset][0] != sig[0]:
+                res.append(CZSEvent(self.lv, zs_lst[pos + offset]))
+
+    def bsp_events(self, res: list, bsp_list, is_seg: bool):
+        """
+        CBSPointList里每个(类型, 买卖)的列表只会从尾部删除、按笔序号往后追加，买卖点按所在笔比较，重新生成的同一个买卖点不算变化；
+        结束K线不晚于last_sure_pos的前缀一般不会再变，只比较之后的部分(last_sure_pos回退时从断开处开始比较)
+        """
+        tracked = self.bsp_tracked[is_seg]
+        removed, changed, added = [], [], []
+        for key, store in bsp_list.bsp_store_dict.items():
+            for is_buy in (True, False):
+                lst = store[is_buy]
+                stable_len, sig = tracked.get((key, is_buy), (0, []))
+                start = min(stable_len, len(lst), len(sig))
+                while start > 0 and lst[start - 1].bi.idx != sig[start - 1][0]:
+                    start -= 1
+                pos = start
+                while pos < len(lst) and pos < len(sig) and lst[pos].bi.idx == sig[pos][0]:
+                    if lst[pos].type2str() != sig[pos][1]:
+                        changed.append(lst[pos])
+                    pos += 1
+                removed.extend(item[2] for item in sig[pos:])
+                added.extend(lst[pos:])
+                sig[start:] = [(bsp.bi.idx, bsp.type2str(), bsp) for bsp in lst[start:]]
+                while start < len(lst) and lst[start].bi.get_end_klu().idx <= bsp_list.last_sure_pos:
+                    start += 1
+                tracked[(key, is_buy)] = (start, sig)
+        res.extend(CBspEvent(self.lv, CHANGE_TYPE.REMOVED, bsp, is_seg) for bsp in removed)
+        res.extend(CBspEvent(self.lv, CHANGE_TYPE.CHANGED, bsp, is_seg) for bsp in changed)
+        res.extend(CBspEvent(self.lv, CHANGE_TYPE.NEW, bsp, is_seg) for bsp in sorted(added, key=lambda bsp: bsp.bi.idx))
+
+
+@dataclass
+class CTrade:
+    # 一次卖出对应的已实现盈亏，成本按持仓均价
+    entry_time: CTime
+    exit_time: CTime
+    size: float
+    entry_price: float
+    exit_price: float
+    pnl: float  # 扣除买卖两边手续费
+    ret: float
+
+
+@dataclass
+class COrder:
+    is_buy: bool
+    size: Optional[float]  # None: 买入时用全部现金，卖出时卖出全部持仓
+    time: CTime
+    reason: Any = None
+
+
+class CBroker:
+    def __init__(
+        self,
+        cash: float = 1_000_000.0,
+        fee_rate: float = 0.0003,
+        min_fee: float = 0.0,
+        sell_tax: float = 0.0,
+        slippage: float = 0.0,
+        lot_size: float = 1,
+    ):
+        """
+        fee_rate/min_fee: 买卖双向佣金比例和单笔最低佣金；sell_tax: 卖出额外收取的比例(如A股印花税)
+        slippage: 成交价相对参考价的不利偏移比例；lot_size: 成交数量取整的单位(A股为100)
+        """
+        self.init_cash = cash
+        self.cash = cash
+        self.fee_rate = fee_rate
+        self.min_fee = min_fee
+        self.sell_tax = sell_tax
+        self.slippage = slippage
+        self.lot_size = lot_size
+        self.position = 0.0
+        self.avg_cost = 0.0  # 含买入手续费的持仓均价
+        self.entry_time: Optional[CTime] = None
+        self.fees = 0.0
+        self.trades: List[CTrade] = []
+        self.fills: List[Tuple[CTime, bool, float, float]] = []  # (时间, 是否买入, 数量, 成交价)
+
+    def fee(self, amount: float, is_buy: bool) -> float:
+        if amount <= 0:
+            return 0.0
+        return max(amount * self.fee_rate, self.min_fee) + (0.0 if is_buy else amount * self.sell_tax)
+
+    def execute(self, order: COrder, price: float, time: CTime) -> bool:
+        if order.is_buy:
+            fill_price = price * (1 + self.slippage)
+            size = order.size
+            if size is None:
+                size = self.cash / (fill_price * (1 + self.fee_rate))
+            size = math.floor(size / self.lot_size) * self.lot_size
+            while size > 0 and size * fill_price + self.fee(size * fill_price, True) > self.cash:
+                size -= self.lot_size
+            if size <= 0:
+                return False
+            fee = self.fee(size * fill_price, True)
+            self.cash -= size * fill_price + fee
+            self.avg_cost = (self.avg_cost * self.position + size * fill_price + fee) / (self.position + size)
+            if self.position == 0:
+                self.entry_time = time
+            self.position += size
+        else:
+            size = self.position if order.size is None else min(order.size, self.position)
+            if size <= 0:
+                return False
+            fill_price = price * (1 - self.slippage)
+            fee = self.fee(size * fill_price, False)
+            self.cash += size * fill_price - fee
+            pnl = size * (fill_price - self.avg_cost) - fee
+            self.trades.append(CTrade(self.entry_time, time, size, self.avg_cost, fill_price, pnl, pnl / (size * self.avg_cost)))
+            self.position -= size
+            if self.position == 0:
+                self.avg_cost = 0.0
+                self.entry_time = None
+        self.fees += fee
+        self.fills.append((time, order.is_buy, size, fill_price))
+        return True
+
+    def equity(self, price: float) -> float:
+        return self.cash + self.position * price
+
+
+class CBacktestContext:
+    def __init__(self, chan: CChan, broker: CBroker, fill_at: str):
+        self.chan = chan
+        self.broker = broker
+        self.fill_at = fill_at
+        self.lv_list = chan.lv_list
+        self.klu: Optional[CKLine_Unit] = None  # 当前最高级别K线
+        self.pending: List[COrder] = []
+
+    @property
+    def time(self) -> CTime:
+        return self.klu.time
+
+    @property
+    def position(self) -> float:
+        return self.broker.position
+
+    def buy(self, size: Optional[float] = None, reason=None):
+        self.order(COrder(True, size, self.time, reason))
+
+    def sell(self, size: Optional[float] = None, reason=None):
+        self.order(COrder(False, size, self.time, reason))
+
+    def order(self, order: COrder):
+        if self.fill_at == "close":
+            self.broker.execute(order, self.klu.close, self.time)
+        else:
+            self.pending.append(order)
+
+
+@dataclass
+class CBacktestSummary:
+    code: str
+    bars: int = 0
+    final_equity: float = 0.0
+    total_return: float = 0.0
+    annual_return: float = 0.0
+    max_drawdown: float = 0.0
+    sharpe: float = 0.0
+    trade_cnt: int = 0
+    win_rate: float = 0.0
+    avg_trade_return: float = 0.0
+    profit_factor: float = 0.0
+    fees: float = 0.0
+    exposure: float = 0.0  # 持仓K线占比
+
+
+@dataclass
+class CBacktestResult:
+    code: str
+    summary: Optional[CBacktestSummary] = None
+    trades: List[CTrade] = field(default_factory=list)
+    equity: List[Tuple[CTime, float]] = field(default_factory=list)  # keep_equity=True时每根最高级别K线收盘后的权益
+    error: Optional[str] = None
+    cost: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def summarize(code: str, broker: CBroker, equity: List[Tuple[CTime, float]], hold_bars: int) -> CBacktestSummary:
+    res = CBacktestSummary(code=code, bars=len(equity), trade_cnt=len(broker.trades), fees=broker.fees)
+    if not equity:
+        return res
+    res.final_equity = equity[-1][1]
+    res.total_return = res.final_equity / broker.init_cash - 1
+    peak = broker.init_cash
+    for _, value in equity:
+        peak = max(peak, value)
+        res.max_drawdown = max(res.max_drawdown, 1 - value / peak)
+    years = (equity[-1][0].epoch - equity[0][0].epoch) / (365.25 * 86400)
+    if years > 0 and res.final_equity > 0:
+        res.annual_return = (res.final_equity / broker.init_cash) ** (1 / years) - 1
+    rets = [b / a - 1 for (_, a), (_, b) in zip(equity, equity[1:]) if a > 0]
+    if len(rets) > 1 and years > 0:
+        mean = sum(rets) / len(rets)
+        std = math.sqrt(sum((r - mean) ** 2 for r in rets) / (len(rets) - 1))
+        if std > 0:
+            res.sharpe = mean / std * math.sqrt(len(rets) / years)
+    if broker.trades:
+        res.win_rate = sum(trade.pnl > 0 for trade in broker.trades) / len(broker.trades)
+        res.avg_trade_return = sum(trade.ret for trade in broker.trades) / len(broker.trades)
+        gain = sum(trade.pnl for trade in broker.trades if trade.pnl > 0)
+        loss = -sum(trade.pnl for trade in broker.trades if trade.pnl < 0)
+        res.profit_factor = gain / loss if loss > 0 else float("inf")
+    res.exposure = hold_bars / len(equity)
+    return res
+
+
+@dataclass
+class CBacktestJob:
+    strategy_cls: Type[CStrategy]
+    strategy_kwargs: dict
+    lv_list: List[KL_TYPE]
+    config: CChanConfig
+    begin_time: Optional[str]
+    end_time: Optional[str]
+    data_src: Union[DATA_SRC, str]
+    autype: AUTYPE
+    broker_kwargs: dict
+    fill_at: str
+    keep_equity: bool
+
+
+def backtest_one(job: CBacktestJob, code: str) -> CBacktestResult:
+    res = CBacktestResult(code=code)
+    start = time.perf_counter()
+    try:
+        chan = CChan(
+            code=code,
+            begin_time=job.begin_time,
+            end_time=job.end_time,
+            data_src=job.data_src,
+            lv_list=list(job.lv_list),
+            config=job.config,
+            autype=job.autype,
+        )
+        strategy = job.strategy_cls(**job.strategy_kwargs)
+        broker = CBroker(**job.broker_kwargs)
+        ctx = CBacktestContext(chan, broker, job.fill_at)
+        kinds = {kind for kind in ("bar", "bi", "seg", "zs", "bsp") if _overridden(strategy, f"on_{kind}")}
+        trackers = [CLevelTracker(lv, kinds) for lv in chan.lv_list]
+        handlers: Dict[type, Callable] = {
+            CBarEvent: strategy.on_bar,
+            CBiEvent: strategy.on_bi,
+            CSegEvent: strategy.on_seg,
+            CZSEvent: strategy.on_zs,
+            CBspEvent: strategy.on_bsp,
+        }
+        equity: List[Tuple[CTime, float]] = []
+        hold_bars = 0
+        strategy.on_start(ctx)
+        for _ in chan.step_load():
+            ctx.klu = chan[0][-1][-1]
+            if ctx.pending:  # 上一步下的单按这根K线开盘价成交
+                orders, ctx.pending = ctx.pending, []
+                for order in orders:
+                    broker.execute(order, ctx.klu.open, ctx.time)
+            for tracker in trackers:
+                for event in tracker.events(chan[tracker.lv]):
+                    handlers[type(event)](ctx, event)
+            strategy.on_step(ctx)
+            equity.append((ctx.time, broker.equity(ctx.klu.close)))
+            hold_bars += broker.position > 0
+        strategy.on_finish(ctx)
+        res.trades = broker.trades
+        res.summary = summarize(code, broker, equity, hold_bars)
+        if job.keep_equity:
+            res.equity = equity
+    except Exception as e:
+        res.error = f"{type(e).__name__}: {e}"
+    res.cost = time.perf_counter() - start
+    return res
+
+
+_WORKER_JOB: Optional[CBacktestJob] = None
+
+
+def _init_worker(job: CBacktestJob):
+    global _WORKER_JOB
+    _WORKER_JOB = job
+
+
+def _backtest_in_worker(code: str) -> CBacktestResult:
+    assert _WORKER_JOB is not None
+    return backtest_one(_WORKER_JOB, code)
+
+
+class CBacktester:
+    def __init__(
+        self,
+        strategy_cls: Type[CStrategy],
+        lv_list: List[KL_TYPE],
+        config: Optional[Union[dict, CChanConfig]] = None,
+        begin_time=None,
+        end_time=None,
+        data_src: Union[DATA_SRC, str] = DATA_SRC.BAO_STOCK,
+        autype: AUTYPE = AUTYPE.QFQ,
+        strategy_kwargs: Optional[dict] = None,
+        broker_kwargs: Optional[dict] = None,
+        fill_at: str = "next_open",
+        keep_equity: bool = False,
+    ):
+        """
+        config: 会强制打开trigger_step
+        strategy_kwargs: 每只股票用strategy_cls(**strategy_kwargs)新建一个策略实例；多进程时strategy_cls需要是模块级的类
+        broker_kwargs: 传给CBroker，见CBroker.__init__
+        fill_at: next_open: 下一根最高级别K线开盘价成交；close: 当前K线收盘价立即成交
+        """
+        if fill_at not in ("next_open", "close"):
+            raise CChanException(f"unknown fill_at={fill_at}", ErrCode.PARA_ERROR)
+        if isinstance(config, CChanConfig):
+            config = copy.copy(config)
+            config.trigger_step = True
+        else:
+            config = CChanConfig(dict(config or {}, trigger_step=True))
+        self.job = CBacktestJob(
+            strategy_cls=strategy_cls,
+            strategy_kwargs=strategy_kwargs or {},
+            lv_list=lv_list,
+            config=config,
+            begin_time=begin_time,
+            end_time=end_time,
+            data_src=data_src,
+            autype=autype,
+            broker_kwargs=broker_kwargs or {},
+            fill_at=fill_at,
+            keep_equity=keep_equity,
+        )
+
+    def run(self, code: str) -> CBacktestResult:
+        return backtest_one(self.job, code)
+
+    def run_many(self, code_list: List[str], max_workers: Optional[int] = None) -> Iterator[CBacktestResult]:
+        """
+        按完成顺序返回每只股票的结果；max_workers=0表示在当前进程里串行
+        """
+        if max_workers == 0:
+            for code in code_list:
+                yield backtest_one(self.job, code)
+            return
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(self.job,)) as executor:
+            futures: Dict[Future, str] = {executor.submit(_backtest_in_worker, code): code for code in code_list}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:  # 子进程异常退出等
+                    yield CBacktestResult(code=futures[future], error=f"{type(e).__name__}: {e}")
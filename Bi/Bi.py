@@ -1,6 +1,6 @@
 from typing import List, Optional
 
-from Common.cache import make_cache
+from Common.cache import invalidate_cache, make_cache
 from Common.CEnum import BI_DIR, BI_TYPE, DATA_FIELD, FX_TYPE, MACD_ALGO
 from Common.ChanException import CChanException, ErrCode
 from KLine.KLine import CKLine
@@ -8,6 +8,11 @@ from KLine.KLine_Unit import CKLine_Unit
 
 
 class CBi:
+    __slots__ = (
+        "__begin_klc", "__end_klc", "__dir", "__idx", "__type", "__is_sure", "__sure_end", "__seg_idx",
+        "parent_seg", "bsp", "next", "pre", "_memoize_cache",
+    )
+
     def __init__(self, begin_klc: CKLine, end_klc: CKLine, idx: int, is_sure: bool):
         # self.__begin_klc = begin_klc
         # self.__end_klc = end_klc
@@ -31,8 +36,16 @@ class CBi:
         self.next: Optional[CBi] = None
         self.pre: Optional[CBi] = None
 
-    def clean_cache(self):
-        self._memoize_cache = {}
+    def clean_cache(self, field=None):
+        # field: begin_klc/end_klc，只失效依赖它的缓存；None全部失效
+        invalidate_cache(self, field)
+
+    def on_klc_combine(self, klc: CKLine):
+        # 登记过的合并K线又合并了新K线，high/low/峰值K线可能变了
+        if klc is self.__end_klc:
+            self.clean_cache("end_klc")
+        elif klc is self.__begin_klc:
+            self.clean_cache()
 
     @property
     def begin_klc(self): return self.__begin_klc
@@ -100,10 +113,12 @@ class CBi:
             self.__dir = BI_DIR.DOWN
         else:
             raise CChanException("ERROR DIRECTION when creating bi", ErrCode.BI_ERR)
-        self.check()
         self.clean_cache()
+        self.check()
+        begin_klc.add_watcher(self)
+        end_klc.add_watcher(self)
 
-    @make_cache
+    @make_cache(deps=("begin_klc",))
     def get_begin_val(self):
         return self.begin_klc.low if self.is_up() else self.begin_klc.high
 
@@ -111,7 +126,7 @@ class CBi:
     def get_end_val(self):
         return self.end_klc.high if self.is_up() else self.end_klc.low
 
-    @make_cache
+    @make_cache(deps=("begin_klc",))
     def get_begin_klu(self) -> CKLine_Unit:
         if self.is_up():
             return self.begin_klc.get_peak_klu(is_high=False)
@@ -151,11 +166,11 @@ class CBi:
     def _mid(self):
         return (self._high() + self._low()) / 2  # 笔的中位价
 
-    @make_cache
+    @make_cache(deps=("begin_klc",))
     def is_down(self):
         return self.dir == BI_DIR.DOWN
 
-    @make_cache
+    @make_cache(deps=("begin_klc",))
     def is_up(self):
         return self.dir == BI_DIR.UP
 
@@ -174,8 +189,9 @@ class CBi:
 
     def update_new_end(self, new_klc: CKLine):
         self.__end_klc = new_klc
+        self.clean_cache("end_klc")
         self.check()
-        self.clean_cache()
+        new_klc.add_watcher(self)
 
     def cal_macd_metric(self, macd_algo, is_reverse):
         if macd_algo == MACD_ALGO.AREA:
@@ -1,7 +1,9 @@
 from typing import List, Optional, Union, overload
 
 from Common.CEnum import FX_TYPE, KLINE_DIR
+from Common.RangeIndex import CChainIndex
 from KLine.KLine import CKLine
+from Math.MetricIndex import CMetricIndex
 
 from .Bi import CBi
 from .BiConfig import CBiConfig
@@ -14,6 +16,8 @@ class CBiList:
         self.config = bi_conf
 
         self.free_klc_lst = []  # 仅仅用作第一笔未画出来之前的缓存，为了获得更精准的结果而已，不加这块逻辑其实对后续计算没太大影响
+        self.metric_index = CMetricIndex()  # 计算买卖点背驰力度用的K线指标索引
+        self.klc_index = CKLineIndex()  # 合并K线高低点的区间极值，end_is_peak跨度大时用
 
     def __str__(self):
         return "\n".join([str(bi) for bi in self.bi_list])
@@ -62,7 +66,7 @@ class CBiList:
             return False
         if self.bi_list[-1].is_up() and klc.low > self.bi_list[-1].get_begin_val():
             return False
-        if not end_is_peak(self.bi_list[-2].begin_klc, klc):
+        if not end_is_peak(self.bi_list[-2].begin_klc, klc, self.klc_index):
             return False
         if self[-1].is_down() and self[-1].get_end_val() < self[-2].get_begin_val():
             return False
@@ -181,7 +185,7 @@ class CBiList:
             return False
         if not last_end.check_fx_valid(klc, self.config.bi_fx_check, for_virtual):
             return False
-        if self.config.bi_end_is_peak and not end_is_peak(last_end, klc):
+        if self.config.bi_end_is_peak and not end_is_peak(last_end, klc, self.klc_index):
             return False
         return True
 
@@ -213,7 +217,30 @@ class CBiList:
         return self.bi_list[-1].get_end_klu().idx if len(self) > 0 else None
 
 
-def end_is_peak(last_end: CKLine, cur_end: CKLine) -> bool:
+class CKLineIndex(CChainIndex[CKLine]):
+    # 合并K线的high/low，只有最后一根会原地变化
+    COLUMN_CNT = 2
+
+    def signature(self, klc: CKLine):
+        return klc.high, klc.low
+
+    def values(self, klc: CKLine):
+        return klc.high, klc.low
+
+    def prev(self, klc: CKLine):
+        return klc.pre if klc.idx > 0 else None
+
+
+END_PEAK_SCAN_LIMIT = 32  # 跨度不超过这么多根合并K线时直接遍历更快
+
+
+def end_is_peak(last_end: CKLine, cur_end: CKLine, klc_index: Optional[CKLineIndex] = None) -> bool:
+    # 两端之间的合并K线没有超过cur_end的；klc_index非空且跨度大时用区间极值查询，结果一样
+    if klc_index is not None and cur_end.idx - last_end.idx > END_PEAK_SCAN_LIMIT and last_end.fx in (FX_TYPE.BOTTOM, FX_TYPE.TOP) \
+       and klc_index.sync(cur_end.pre):
+        if last_end.fx == FX_TYPE.BOTTOM:
+            return klc_index.max(0, last_end.idx+1, cur_end.idx-1) <= cur_end.high
+        return klc_index.min(1, last_end.idx+1, cur_end.idx-1) >= cur_end.low
     if last_end.fx == FX_TYPE.BOTTOM:
         cmp_thred = cur_end.high  # 或者严格点选择get_klu_max_high()
         klc = last_end.get_next()
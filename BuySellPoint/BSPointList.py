@@ -4,6 +4,7 @@ from Bi.Bi import CBi
 from Bi.BiList import CBiList
 from Common.CEnum import BSP_TYPE
 from Common.func_util import has_overlap
+from Math.MetricIndex import CMetricIndex
 from Seg.Seg import CSeg
 from Seg.SegListComm import CSegListComm
 from ZS.ZS import CZS
@@ -106,6 +107,11 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
 
         self.update_last_pos(seg_list)
 
+    @staticmethod
+    def get_metric_index(bi_list: LINE_LIST_TYPE) -> Optional[CMetricIndex]:
+        # 线段买卖点的"笔"是线段，背驰力度只有O(1)的slope/amp，不需要索引
+        return bi_list.metric_index if isinstance(bi_list, CBiList) else None
+
     def update_last_pos(self, seg_list: CSegListComm):
         self.last_sure_pos = -1
         self.last_sure_seg_idx = 0
@@ -168,16 +174,16 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
            not seg.zs_lst[-1].is_one_bi_zs() and \
            ((seg.zs_lst[-1].bi_out and seg.zs_lst[-1].bi_out.idx >= seg.end_bi.idx) or seg.zs_lst[-1].bi_lst[-1].idx >= seg.end_bi.idx) \
            and seg.end_bi.idx - seg.zs_lst[-1].get_bi_in().idx > 2:
-            self.treat_bsp1(seg, BSP_CONF, is_target_bsp)
+            self.treat_bsp1(seg, BSP_CONF, bi_list, is_target_bsp)
         else:
             self.treat_pz_bsp1(seg, BSP_CONF, bi_list, is_target_bsp)
 
-    def treat_bsp1(self, seg: CSeg[LINE_TYPE], BSP_CONF: CPointConfig, is_target_bsp: bool):
+    def treat_bsp1(self, seg: CSeg[LINE_TYPE], BSP_CONF: CPointConfig, bi_list: LINE_LIST_TYPE, is_target_bsp: bool):
         last_zs = seg.zs_lst[-1]
         break_peak, _ = last_zs.out_bi_is_peak(seg.end_bi.idx)
         if BSP_CONF.bs1_peak and not break_peak:
             is_target_bsp = False
-        is_diver, divergence_rate = last_zs.is_divergence(BSP_CONF, out_bi=seg.end_bi)
+        is_diver, divergence_rate = last_zs.is_divergence(BSP_CONF, out_bi=seg.end_bi, metric_index=self.get_metric_index(bi_list))
         if not is_diver:
             is_target_bsp = False
         feature_dict = {'divergence_rate': divergence_rate}
@@ -194,8 +200,13 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
             return
         if last_bi.is_up() and last_bi._high() < pre_bi._high():  # 创新高
             return
-        in_metric = pre_bi.cal_macd_metric(BSP_CONF.macd_algo, is_reverse=False)
-        out_metric = last_bi.cal_macd_metric(BSP_CONF.macd_algo, is_reverse=True)
+        metric_index = self.get_metric_index(bi_list)
+        if metric_index is None:
+            in_metric = pre_bi.cal_macd_metric(BSP_CONF.macd_algo, is_reverse=False)
+            out_metric = last_bi.cal_macd_metric(BSP_CONF.macd_algo, is_reverse=True)
+        else:
+            in_metric = metric_index.cal_macd_metric(pre_bi, BSP_CONF.macd_algo, is_reverse=False)
+            out_metric = metric_index.cal_macd_metric(last_bi, BSP_CONF.macd_algo, is_reverse=True)
         is_diver, divergence_rate = out_metric <= BSP_CONF.divergence_rate*in_metric, out_metric/(in_metric+1e-7)
         if not is_diver:
             is_target_bsp = False
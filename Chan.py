@@ -3,7 +3,8 @@ import datetime
 import pickle
 import sys
 from collections import defaultdict
-from typing import Dict, Iterable, List, Optional, Union
+from functools import partial
+from typing import Dict, Iterable, List, Optional, Type, Union
 
 from BuySellPoint.BS_Point import CBS_Point
 from ChanConfig import CChanConfig
@@ -12,6 +13,8 @@ from Common.ChanException import CChanException, ErrCode
 from Common.CTime import CTime
 from Common.func_util import check_kltype_order, kltype_lte_day
 from DataAPI.CommonStockAPI import CCommonStockApi
+from DataAPI.Session import acquire_session, release_session
+from KLine.KLine_Frontier import CChan_Checkpoint, CKLine_Frontier
 from KLine.KLine_List import CKLine_List
 from KLine.KLine_Unit import CKLine_Unit
 
@@ -22,7 +25,7 @@ class CChan:
         code,
         begin_time=None,
         end_time=None,
-        data_src: Union[DATA_SRC, str] = DATA_SRC.BAO_STOCK,
+        data_src: Union[DATA_SRC, str, Type[CCommonStockApi]] = DATA_SRC.BAO_STOCK,
         lv_list=None,
         config=None,
         autype: AUTYPE = AUTYPE.QFQ,
@@ -106,16 +109,13 @@ class CChan:
     def get_next_lv_klu(self, lv_idx):
         if isinstance(lv_idx, int):
             lv_idx = self.lv_list[lv_idx]
-        if len(self.g_kl_iter[lv_idx]) == 0:
-            raise StopIteration
-        try:
-            return self.g_kl_iter[lv_idx][0].__next__()
-        except StopIteration:
-            self.g_kl_iter[lv_idx] = self.g_kl_iter[lv_idx][1:]
-            if len(self.g_kl_iter[lv_idx]) != 0:
-                return self.get_next_lv_klu(lv_idx)
-            else:
-                raise
+        iter_lst = self.g_kl_iter[lv_idx]
+        while iter_lst:
+            try:
+                return iter_lst[0].__next__()
+            except StopIteration:
+                del iter_lst[0]
+        raise StopIteration
 
     def step_load(self):
         assert self.conf.trigger_step
@@ -150,53 +150,131 @@ class CChan:
             for lv in self.lv_list:
                 self.kl_datas[lv].cal_seg_and_zs()
 
+    def append_klu(self, lv: KL_TYPE, klu: CKLine_Unit) -> CKLine_Unit:
+        """
+        增量追加一根K线，不需要deepcopy整个CChan
+        追加的K线视为未完成K线，在同级别下一次append_klu之前可以用update_last_klu原地更新
+        次级别K线挂在父级别最后一根K线下面，多级别时需要先追加父级别K线
+        返回实际存入的klu
+        """
+        lv_idx = self.lv_list.index(lv)
+        kl_list = self[lv_idx]
+        if len(kl_list) > 0 and not klu.time > kl_list[-1][-1].time:
+            raise CChanException(f"kline time err, cur={klu.time}, last={kl_list[-1][-1].time}", ErrCode.KL_NOT_MONOTONOUS)
+        parent_klu = None
+        if lv_idx > 0:
+            if len(self[lv_idx-1]) == 0:
+                raise CChanException(f"父级别{self.lv_list[lv_idx-1]}没有K线，请先追加父级别K线", ErrCode.KL_DATA_NOT_ALIGN)
+            parent_klu = self[lv_idx-1][-1][-1]
+            if klu.time > parent_klu.time:
+                raise CChanException(f"次级别K线{klu.time}晚于父级别最后一根K线{parent_klu.time}，请先追加父级别K线", ErrCode.KL_DATA_NOT_ALIGN)
+        self.try_set_klu_idx(lv_idx, klu)
+        if not hasattr(self, 'forming_frontier'):
+            self.forming_frontier: Dict[KL_TYPE, CKLine_Frontier] = {}
+        self.forming_frontier[lv] = kl_list.checkpoint()
+        return self.add_forming_klu(lv_idx, klu, parent_klu)
+
+    def update_last_klu(self, lv: KL_TYPE, klu: CKLine_Unit) -> CKLine_Unit:
+        """
+        用klu替换最后一根通过append_klu追加的未完成K线
+        只回滚这根K线影响到的尾部(合并K线、虚笔、不确定的线段、last_sure_pos之后的中枢和买卖点、指标状态)再重新计算，
+        开销和未确定的尾部成正比；已经挂在旧K线下的次级别K线会转挂到新K线下
+        """
+        lv_idx = self.lv_list.index(lv)
+        kl_list = self[lv_idx]
+        frontier = getattr(self, 'forming_frontier', {}).get(lv)
+        if frontier is None:
+            raise CChanException(f"{lv}级别没有未完成K线，需要先调用append_klu", ErrCode.COMMON_ERROR)
+        old_klu = kl_list[-1][-1]
+        if old_klu.pre is not None and not klu.time > old_klu.pre.time:
+            raise CChanException(f"kline time err, cur={klu.time}, last={old_klu.pre.time}", ErrCode.KL_NOT_MONOTONOUS)
+        parent_klu = old_klu.sup_kl
+        if parent_klu is not None and klu.time > parent_klu.time:
+            raise CChanException(f"次级别K线{klu.time}晚于父级别K线{parent_klu.time}", ErrCode.KL_DATA_NOT_ALIGN)
+        sub_klu_lst = list(old_klu.get_children())
+
+        kl_list.restore(frontier)
+        if parent_klu is not None:
+            parent_klu.sub_kl_list.remove(old_klu)
+        klu.set_idx(old_klu.idx)
+        klu = self.add_forming_klu(lv_idx, klu, parent_klu)
+        for sub_klu in sub_klu_lst:
+            klu.add_children(sub_klu)
+            sub_klu.set_parent(klu)
+        return klu
+
+    def checkpoint(self) -> CChan_Checkpoint:
+        """
+        记录所有级别可能被后续K线改动的尾部，之后可以任意append_klu/update_last_klu/trigger_load做推演，
+        再用restore回到这个时刻；开销和未确定的尾部大小成正比，和历史长度无关，同一个checkpoint可以反复restore
+        """
+        return CChan_Checkpoint(self)
+
+    def restore(self, checkpoint: CChan_Checkpoint):
+        checkpoint.restore(self)
+
+    def add_forming_klu(self, lv_idx: int, klu: CKLine_Unit, parent_klu: Optional[CKLine_Unit]) -> CKLine_Unit:
+        cur_lv = self.lv_list[lv_idx]
+        kl_list = self[lv_idx]
+        klu.kl_type = cur_lv
+        klu.set_pre_klu(kl_list[-1][-1] if len(kl_list) > 0 else None)
+        klu = self.add_new_kl(cur_lv, klu)
+        if parent_klu is not None:
+            self.set_klu_parent_relation(parent_klu, klu, cur_lv, lv_idx)
+        if hasattr(self, 'klu_last_t'):
+            self.klu_last_t[lv_idx] = klu.time
+        if not kl_list.step_calculation:  # 非逐步模式下add_single_klu不会计算线段中枢
+            kl_list.cal_seg_and_zs()
+        return klu
+
     def init_lv_klu_iter(self, stockapi_cls):
         # 为了跳过一些获取数据失败的级别
         lv_klu_iter = []
         valid_lv_list = []
-        for lv in self.lv_list:
-            try:
-                lv_klu_iter.append(self.get_load_stock_iter(stockapi_cls, lv))
-                valid_lv_list.append(lv)
-            except CChanException as e:
-                if e.errcode == ErrCode.SRC_DATA_NOT_FOUND and self.conf.auto_skip_illegal_sub_lv:
-                    if self.conf.print_warning:
-                        print(f"[WARNING-{self.code}]{lv}级别获取数据失败，跳过")
-                    del self.kl_datas[lv]
-                    continue
-                raise e
+        prefetch_iters = self.start_prefetch(stockapi_cls)
+        try:
+            for lv in self.lv_list:
+                try:
+                    if prefetch_iters is not None:
+                        prefetch_iters[lv].wait_ready()
+                        lv_klu_iter.append(iter(prefetch_iters[lv]))
+                    else:
+                        lv_klu_iter.append(self.get_load_stock_iter(stockapi_cls, lv))
+                    valid_lv_list.append(lv)
+                except CChanException as e:
+                    if e.errcode == ErrCode.SRC_DATA_NOT_FOUND and self.conf.auto_skip_illegal_sub_lv:
+                        if self.conf.print_warning:
+                            print(f"[WARNING-{self.code}]{lv}级别获取数据失败，跳过")
+                        del self.kl_datas[lv]
+                        continue
+                    raise e
+        except BaseException:
+            for prefetch_iter in (prefetch_iters or {}).values():
+                prefetch_iter.stop()
+            raise
         self.lv_list = valid_lv_list
         return lv_klu_iter
 
+    def start_prefetch(self, stockapi_cls):
+        # parallel_load时每个级别一个线程同时拉数据，合并仍在当前线程按级别顺序进行
+        if not self.conf.parallel_load or len(self.lv_list) < 2 or not stockapi_cls.is_thread_safe:
+            return None
+        from DataAPI.Prefetch import CPrefetchIter
+        return {lv: CPrefetchIter(partial(self.get_load_stock_iter, stockapi_cls, lv)) for lv in self.lv_list}
+
     def GetStockAPI(self):
-        _dict = {}
-        if self.data_src == DATA_SRC.BAO_STOCK:
-            from DataAPI.BaoStockAPI import CBaoStock
-            _dict[DATA_SRC.BAO_STOCK] = CBaoStock
-        elif self.data_src == DATA_SRC.CCXT:
-            from DataAPI.ccxt import CCXT
-            _dict[DATA_SRC.CCXT] = CCXT
-        elif self.data_src == DATA_SRC.CSV:
-            from DataAPI.csvAPI import CSV_API
-            _dict[DATA_SRC.CSV] = CSV_API
-        elif self.data_src == DATA_SRC.AKSHARE:
-            from DataAPI.AkshareAPI import CAkshare
-            _dict[DATA_SRC.AKSHARE] = CAkshare
-        if self.data_src in _dict:
-            return _dict[self.data_src]
-        assert isinstance(self.data_src, str)
-        if self.data_src.find("custom:") < 0:
-            raise CChanException("load src type error", ErrCode.SRC_DATA_TYPE_ERR)
-        package_info = self.data_src.split(":")[1]
-        package_name, cls_name = package_info.split(".")
-        import importlib
-        module = importlib.import_module(f"DataAPI.{package_name}")
-        return getattr(module, cls_name)
+        return self.wrap_bar_cache(get_stock_api_cls(self.data_src))
+
+    def wrap_bar_cache(self, stockapi_cls):
+        if self.conf.bar_cache_dir is None or not stockapi_cls.cacheable:
+            return stockapi_cls
+        from DataAPI.BarCache import cached_stock_api
+        return cached_stock_api(stockapi_cls, self.conf.bar_cache_dir)
 
     def load(self, step=False):
         stockapi_cls = self.GetStockAPI()
+        acquire_session(stockapi_cls)
         try:
-            stockapi_cls.do_init()
             for lv_idx, klu_iter in enumerate(self.init_lv_klu_iter(stockapi_cls)):
                 self.add_lv_iter(lv_idx, klu_iter)
             self.klu_cache: List[Optional[CKLine_Unit]] = [None for _ in self.lv_list]
@@ -209,19 +287,22 @@ class CChan:
         except Exception:
             raise
         finally:
-            stockapi_cls.do_close()
+            release_session(stockapi_cls)
         if len(self[0]) == 0:
             raise CChanException("最高级别没有获得任何数据", ErrCode.NO_DATA)
 
     def set_klu_parent_relation(self, parent_klu, kline_unit, cur_lv, lv_idx):
-        if self.conf.kl_data_check and kltype_lte_day(cur_lv) and kltype_lte_day(self.lv_list[lv_idx-1]):
+        if self.need_check_consitent(lv_idx):
             self.check_kl_consitent(parent_klu, kline_unit)
         parent_klu.add_children(kline_unit)
         kline_unit.set_parent(parent_klu)
 
-    def add_new_kl(self, cur_lv: KL_TYPE, kline_unit):
+    def need_check_consitent(self, lv_idx) -> bool:
+        return self.conf.kl_data_check and kltype_lte_day(self.lv_list[lv_idx]) and kltype_lte_day(self.lv_list[lv_idx-1])
+
+    def add_new_kl(self, cur_lv: KL_TYPE, kline_unit) -> CKLine_Unit:
         try:
-            self.kl_datas[cur_lv].add_single_klu(kline_unit)
+            return self.kl_datas[cur_lv].add_single_klu(kline_unit)
         except Exception:
             if self.conf.print_err_time:
                 print(f"[ERROR-{self.code}]在计算{kline_unit.time}K线时发生错误!")
@@ -238,42 +319,63 @@ class CChan:
     def load_iterator(self, lv_idx, parent_klu, step):
         # K线时间天级别以下描述的是结束时间，如60M线，每天第一根是10点30的
         # 天以上是当天日期
-        cur_lv = self.lv_list[lv_idx]
-        pre_klu = self[lv_idx][-1][-1] if len(self[lv_idx]) > 0 and len(self[lv_idx][-1]) > 0 else None
-        while True:
-            if self.klu_cache[lv_idx]:
-                kline_unit = self.klu_cache[lv_idx]
-                assert kline_unit is not None
-                self.klu_cache[lv_idx] = None
+        # 用显式栈代替逐级递归：每一帧是[级别, 父K线, 同级别上一根K线, 当前正在加载次级别的K线]
+        # 加完一根K线后压入次级别的帧，次级别遇到晚于父K线的K线(放回klu_cache)或者数据取完时出栈，再对父K线做对齐检查
+        lv_list, klu_cache, klu_last_t = self.lv_list, self.klu_cache, self.klu_last_t
+        last_lv_idx = len(lv_list) - 1
+        iter_lsts = [self.g_kl_iter[lv] for lv in lv_list]
+        check_consitent = [self.need_check_consitent(idx) for idx in range(len(lv_list))]
+        frames = [[lv_idx, parent_klu, self.get_last_klu(lv_idx), None]]
+        while frames:
+            frame = frames[-1]
+            cur_lv_idx, parent_klu = frame[0], frame[1]
+            kline_unit = klu_cache[cur_lv_idx]
+            if kline_unit is not None:
+                klu_cache[cur_lv_idx] = None
             else:
-                try:
-                    kline_unit = self.get_next_lv_klu(lv_idx)
-                    self.try_set_klu_idx(lv_idx, kline_unit)
-                    if not kline_unit.time > self.klu_last_t[lv_idx]:
-                        raise CChanException(f"kline time err, cur={kline_unit.time}, last={self.klu_last_t[lv_idx]}, or refer to quick_guide.md, try set auto=False in the CTime returned by your data source class", ErrCode.KL_NOT_MONOTONOUS)
-                    self.klu_last_t[lv_idx] = kline_unit.time
-                except StopIteration:
-                    break
-
-            if parent_klu and kline_unit.time > parent_klu.time:
-                self.klu_cache[lv_idx] = kline_unit
-                break
-            kline_unit.set_pre_klu(pre_klu)
-            pre_klu = kline_unit
-            self.add_new_kl(cur_lv, kline_unit)
+                iter_lst = iter_lsts[cur_lv_idx]
+                while iter_lst:
+                    kline_unit = next(iter_lst[0], None)
+                    if kline_unit is not None:
+                        break
+                    del iter_lst[0]
+                if kline_unit is not None:
+                    if kline_unit.idx < 0:
+                        self.try_set_klu_idx(cur_lv_idx, kline_unit)
+                    if not kline_unit.time > klu_last_t[cur_lv_idx]:
+                        raise CChanException(f"kline time err, cur={kline_unit.time}, last={klu_last_t[cur_lv_idx]}, or refer to quick_guide.md, try set auto=False in the CTime returned by your data source class", ErrCode.KL_NOT_MONOTONOUS)
+                    klu_last_t[cur_lv_idx] = kline_unit.time
+
+            if kline_unit is None or (parent_klu and kline_unit.time > parent_klu.time):
+                if kline_unit is not None:
+                    klu_cache[cur_lv_idx] = kline_unit
+                frames.pop()
+                if frames:  # 父K线的次级别加载完毕
+                    parent_lv_idx = frames[-1][0]
+                    self.check_kl_align(frames[-1][3], parent_lv_idx)
+                    if parent_lv_idx == 0 and step:
+                        yield self
+                continue
+            kline_unit.set_pre_klu(frame[2])
+            kline_unit = self.add_new_kl(lv_list[cur_lv_idx], kline_unit)
+            frame[2] = kline_unit
             if parent_klu:
-                self.set_klu_parent_relation(parent_klu, kline_unit, cur_lv, lv_idx)
-            if lv_idx != len(self.lv_list)-1:
-                for _ in self.load_iterator(lv_idx+1, kline_unit, step):
-                    ...
-                self.check_kl_align(kline_unit, lv_idx)
-            if lv_idx == 0 and step:
+                if check_consitent[cur_lv_idx]:
+                    self.check_kl_consitent(parent_klu, kline_unit)
+                parent_klu.add_children(kline_unit)
+                kline_unit.set_parent(parent_klu)
+            if cur_lv_idx != last_lv_idx:
+                frame[3] = kline_unit
+                frames.append([cur_lv_idx + 1, kline_unit, self.get_last_klu(cur_lv_idx + 1), None])
+            elif cur_lv_idx == 0 and step:
                 yield self
 
+    def get_last_klu(self, lv_idx) -> Optional[CKLine_Unit]:
+        kl_list = self[lv_idx]
+        return kl_list[-1][-1] if len(kl_list) > 0 and len(kl_list[-1]) > 0 else None
+
     def check_kl_consitent(self, parent_klu, sub_klu):
-        if parent_klu.time.year != sub_klu.time.year or \
-           parent_klu.time.month != sub_klu.time.month or \
-           parent_klu.time.day != sub_klu.time.day:
+        if parent_klu.time.epoch // 86400 != sub_klu.time.epoch // 86400:  # 年月日不同
             self.kl_inconsistent_detail[str(parent_klu.time)].append(sub_klu.time)
             if self.conf.print_warning:
                 print(f"[WARNING-{self.code}]父级别时间是{parent_klu.time}，次级别时间却是{sub_klu.time}")
@@ -345,6 +447,17 @@ class CChan:
 
         return chan
 
+    def chan_dump_snapshot(self, file_path):
+        # 二进制快照，比pickle小且加载快，见ChanSnapshot.py
+        from ChanSnapshot import dump_snapshot
+        dump_snapshot(self, file_path)
+
+    @staticmethod
+    def chan_load_snapshot(file_path, use_mmap=True) -> 'CChan':
+        # 只读头部，各级别数据在第一次访问chan[lv]时才构建
+        from ChanSnapshot import load_snapshot
+        return load_snapshot(file_path, use_mmap)
+
     def chan_pickle_restore(self):
         for kl_list in self.kl_datas.values():
             last_klu = None
@@ -377,3 +490,32 @@ class CChan:
                 if last_segseg:
                     last_segseg.next = segseg
                 last_segseg = segseg
+
+
+def get_stock_api_cls(data_src) -> Type[CCommonStockApi]:
+    # data_src可以是DATA_SRC、"custom:模块名.类名"或者直接传数据源类
+    if isinstance(data_src, type) and issubclass(data_src, CCommonStockApi):
+        return data_src
+    _dict = {}
+    if data_src == DATA_SRC.BAO_STOCK:
+        from DataAPI.BaoStockAPI import CBaoStock
+        _dict[DATA_SRC.BAO_STOCK] = CBaoStock
+    elif data_src == DATA_SRC.CCXT:
+        from DataAPI.ccxt import CCXT
+        _dict[DATA_SRC.CCXT] = CCXT
+    elif data_src == DATA_SRC.CSV:
+        from DataAPI.csvAPI import CSV_API
+        _dict[DATA_SRC.CSV] = CSV_API
+    elif data_src == DATA_SRC.AKSHARE:
+        from DataAPI.AkshareAPI import CAkshare
+        _dict[DATA_SRC.AKSHARE] = CAkshare
+    if data_src in _dict:
+        return _dict[data_src]
+    assert isinstance(data_src, str)
+    if data_src.find("custom:") < 0:
+        raise CChanException("load src type error", ErrCode.SRC_DATA_TYPE_ERR)
+    package_info = data_src.split(":")[1]
+    package_name, cls_name = package_info.split(".")
+    import importlib
+    module = importlib.import_module(f"DataAPI.{package_name}")
+    return getattr(module, cls_name)
@@ -1,4 +1,6 @@
-from typing import List
+import hashlib
+from enum import Enum
+from typing import List, Tuple
 
 from Bi.BiConfig import CBiConfig
 from BuySellPoint.BSPointConfig import CBSPointConfig
@@ -67,17 +69,64 @@ class CChanConfig:
             'countdown_cmp2close': True,
         })
         self.boll_n = conf.get("boll_n", 20)
+        self.columnar_kl = conf.get("columnar_kl", False)
+        self.batch_metric = conf.get("batch_metric", False)
+        self.keep_metric_history = conf.get("keep_metric_history", True)
+        self.bar_cache_dir = conf.get("bar_cache_dir", None)
+        self.parallel_load = conf.get("parallel_load", False)
 
         self.set_bsp_config(conf)
 
         conf.check()
 
+    def fingerprint(self) -> Tuple:
+        """
+        影响计算结果的全部参数的规范化元组，可哈希，跨进程稳定，可以作为缓存/去重的key
+        只影响性能、存储、日志的参数(columnar_kl/batch_metric/keep_metric_history/bar_cache_dir/parallel_load/print_*)不计入
+        """
+        return (
+            ("bi", _canonical(vars(self.bi_conf))),
+            ("seg", _canonical(vars(self.seg_conf))),
+            ("zs", _canonical(vars(self.zs_conf))),
+            ("step", (self.trigger_step, self.skip_step)),
+            ("kl_check", (self.kl_data_check, self.max_kl_misalgin_cnt, self.max_kl_inconsistent_cnt, self.auto_skip_illegal_sub_lv)),
+            ("metric", self.metric_fingerprint()),
+            ("bsp", self.bsp_fingerprint(self.bs_point_conf)),
+            ("seg_bsp", self.bsp_fingerprint(self.seg_bs_point_conf)),
+        )
+
+    def fingerprint_digest(self) -> str:
+        # 用于文件名、快照头等需要字符串的地方
+        return hashlib.sha1(repr(self.fingerprint()).encode()).hexdigest()
+
+    def metric_fingerprint(self) -> Tuple:
+        # GetMetricModel的输入，没开启的指标不计入参数
+        return _canonical({
+            "macd": (self.macd_config['fast'], self.macd_config['slow'], self.macd_config['signal']),
+            "mean": sorted(set(self.mean_metrics)),
+            "trend": sorted(set(self.trend_metrics)),
+            "boll": self.boll_n,
+            "demark": self.demark_config if self.cal_demark else None,
+            "rsi": self.rsi_cycle if self.cal_rsi else None,
+            "kdj": self.kdj_cycle if self.cal_kdj else None,
+        })
+
+    @staticmethod
+    def bsp_fingerprint(bsp_conf: CBSPointConfig) -> Tuple:
+        res = []
+        for point_conf in (bsp_conf.b_conf, bsp_conf.s_conf):
+            para = {k: v for k, v in vars(point_conf).items() if k != "tmp_target_types"}
+            para["target_types"] = sorted(t.value for t in point_conf.target_types)  # 只用到成员判断，顺序无关
+            res.append(_canonical(para))
+        return tuple(res)
+
     def GetMetricModel(self):
         res: List[CMACD | CTrendModel | BollModel | CDemarkEngine | RSI | KDJ] = [
             CMACD(
                 fastperiod=self.macd_config['fast'],
                 slowperiod=self.macd_config['slow'],
                 signalperiod=self.macd_config['signal'],
+                keep_history=self.keep_metric_history,
             )
         ]
         res.extend(CTrendModel(TREND_TYPE.MEAN, mean_T) for mean_T in self.mean_metrics)
@@ -95,6 +144,7 @@ class CChanConfig:
                 tiaokong_st=self.demark_config['tiaokong_st'],
                 setup_cmp2close=self.demark_config['setup_cmp2close'],
                 countdown_cmp2close=self.demark_config['countdown_cmp2close'],
+                keep_history=self.keep_metric_history,
             ))
         if self.cal_rsi:
             res.append(RSI(self.rsi_cycle))
@@ -159,6 +209,16 @@ class CChanConfig:
         self.seg_bs_point_conf.s_conf.parse_target_type()
 
 
+def _canonical(value):
+    if isinstance(value, Enum):
+        return f"{type(value).__name__}.{value.name}"
+    if isinstance(value, dict):
+        return tuple(sorted((k, _canonical(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical(v) for v in value)
+    return value
+
+
 class ConfigWithCheck:
     def __init__(self, conf):
         self.conf = conf
@@ -0,0 +1,710 @@
+"""
+CChan的二进制快照
+各级别的K线、合并K线、笔、线段、中枢、买卖点分别展开成对象表，对象之间的引用换成级别内的编号，
+每个字段按列存成numpy数组；配置、指标模型、特征等零散状态放在每个级别的一小段pickle里，
+里面引用到表中对象时同样只记编号，所以不会再有深递归。
+加载时mmap映射文件，K线数据直接作为CKLine_Store的列；某个级别第一次被访问时才创建对象并连接引用，
+有跨级别引用(sup_kl/sub_kl_list)的级别会一起创建。
+性能(Debug/benchmark.py snapshot，30M/5M/1M三级别、10万根1分钟线，单核)：文件约为pickle的一半，打开只读头部约2ms；
+全部级别构建完约为chan_load_pickle的7~8倍(对象K线)，columnar_kl下约3倍，没有达到10倍：
+剩下的开销主要是逐个创建合并K线/笔/线段等Python对象和连接引用，已经不在反序列化本身
+
+文件结构: MAGIC | 版本号(u32) | header偏移(u64) | header长度(u64) | 64字节对齐的各个数组 | header(json)
+"""
+import gc
+import importlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import types
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from enum import Enum
+from itertools import repeat
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from Bi.Bi import CBi
+from BuySellPoint.BS_Point import CBS_Point
+from Common.cache import CACHE_MISS
+from Common.CEnum import KL_TYPE
+from Common.ChanException import CChanException, ErrCode
+from Common.CTime import CTime
+from Common.func_util import slot_names
+from KLine.KLine import CKLine
+from KLine.KLine_List import CKLine_List
+from KLine.KLine_Store import CKLine_Store, CKLine_Unit_View, decode_times, encode_time
+from KLine.KLine_Unit import CKLine_Unit
+from Math.MACD import CMACD, CMACD_item
+from Seg.Seg import CSeg
+from ZS.ZS import CZS
+
+SNAPSHOT_MAGIC = b"CHANSNAP"
+SNAPSHOT_VERSION = 4  # 存盘对象的字段有变化时加1
+
+_PRELUDE = struct.Struct("<8sIQQ")
+_ALIGN = 64
+
+_TABLES = ("klu", "klc", "bi", "seg", "zs", "bsp")
+_TABLE_OF = {CKLine_Unit: "klu", CKLine: "klc", CBi: "bi", CSeg: "seg", CZS: "zs", CBS_Point: "bsp"}
+_TABLE_CACHE: Dict[type, Optional[str]] = {}
+_KLU_FIELDS = ("_sub_kl_list", "sup_kl", "pre", "next", "_klc")
+
+# 字段里的特殊值单独用mask记录，数组里只存普通值
+_REGULAR, _NONE, _UNSET, _MISS = 0, 1, 2, 3
+_UNSET_VALUE = object()  # 槽位没有赋值
+_SPECIAL_VALUE = {_NONE: None, _UNSET: _UNSET_VALUE, _MISS: CACHE_MISS}
+_SPECIAL_CODE = {id(None): _NONE, id(_UNSET_VALUE): _UNSET, id(CACHE_MISS): _MISS}
+_REF_SPECIALS = (CACHE_MISS, _UNSET_VALUE, None)  # 接在对象表最后，引用编号-code正好取到对应的特殊值
+
+# 遍历对象图时按类型分派，CTime当作不可变的值
+_SKIP_TYPES = (
+    int, float, str, bytes, bool, complex, type(None), Enum, type, np.ndarray, np.generic, CTime,
+    types.FunctionType, types.MethodType, types.BuiltinFunctionType, types.GeneratorType, types.ModuleType,
+)
+_W_SKIP, _W_TABLE, _W_SEQ, _W_MAP, _W_OBJ = range(5)
+_WALK_KIND: Dict[type, int] = {}
+_FIELD_NAMES: Dict[tuple, List[str]] = {}
+
+
+def _table_name(cls) -> Optional[str]:
+    if cls not in _TABLE_CACHE:
+        _TABLE_CACHE[cls] = next((_TABLE_OF[klass] for klass in cls.__mro__ if klass in _TABLE_OF), None)
+    return _TABLE_CACHE[cls]
+
+
+@contextmanager
+def _gc_paused():
+    # 一次性创建大量对象时分代gc会被反复触发，期间新建的对象都还有引用，不会产生垃圾
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _walk_kind(cls) -> int:
+    table = _table_name(cls)
+    if table is not None and table != "klu":
+        kind = _W_TABLE
+    elif issubclass(cls, _SKIP_TYPES):
+        kind = _W_SKIP
+    elif issubclass(cls, (list, tuple, set, frozenset, deque)):
+        kind = _W_SEQ
+    elif issubclass(cls, dict):
+        kind = _W_MAP
+    else:
+        kind = _W_OBJ
+    _WALK_KIND[cls] = kind
+    return kind
+
+
+def _cls_path(cls) -> str:
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+def _import_cls(path: str):
+    module, qualname = path.split(":")
+    obj = importlib.import_module(module)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _bulk_time(keys: np.ndarray) -> List[CTime]:
+    # 按encode_time的编码批量还原CTime，相同时间共用一个对象
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    times = decode_times(uniq)
+    return list(map(times.__getitem__, inverse.ravel().tolist()))
+
+
+class _CSnapshotPickler(pickle.Pickler):
+    def __init__(self, file, writer: '_CSnapshotWriter', with_conf: bool):
+        super(_CSnapshotPickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.writer = writer
+        self.with_conf = with_conf  # 配置本身按值保存，其余地方只记引用
+
+    def persistent_id(self, obj):
+        pid = self.writer.persistent_id(obj)
+        if self.with_conf and pid is not None and pid[0] == "conf":
+            return None
+        return pid
+
+
+class _CSnapshotWriter:
+    def __init__(self, chan):
+        self.chan = chan
+        self.kl_lists: List[CKLine_List] = [chan.kl_datas[lv] for lv in chan.lv_list]
+        self.tables: List[Dict[str, list]] = [{name: [] for name in _TABLES} for _ in self.kl_lists]
+        self.index: Dict[int, tuple] = {}  # id(obj) -> (级别, 表名, 行号)
+        self.special: Dict[int, tuple] = {}  # store/配置/根列表等整体替换成标记的对象
+        self.keep_alive = []
+        self.seen = set()  # 已经遍历过的非表对象
+        self.base: List[Dict[str, int]] = []
+        self.stores: List[CKLine_Store] = []
+        self.arrays = []
+        self.list_ids = set()
+
+    def add(self, lv_idx, obj):
+        name = _table_name(type(obj))
+        table = self.tables[lv_idx][name]
+        self.index[id(obj)] = (lv_idx, name, len(table))
+        table.append(obj)
+
+    def gid(self, obj) -> Optional[tuple]:
+        loc = self.index.get(id(obj))
+        if loc is None:
+            return None
+        lv_idx, table, row = loc
+        return lv_idx, self.base[lv_idx][table] + row
+
+    def persistent_id(self, obj):
+        pid = self.special.get(id(obj))
+        if pid is not None:
+            return pid
+        if _table_name(type(obj)) is not None:
+            loc = self.index.get(id(obj))
+            if loc is not None and self.tables[loc[0]][loc[1]][loc[2]] is obj:
+                return ("obj",) + self.gid(obj)
+        return None
+
+    def collect(self):
+        for lv_idx, kl_list in enumerate(self.kl_lists):
+            klus = list(kl_list.klu_iter())
+            store = kl_list.klu_store
+            if store is None:
+                store = CKLine_Store.from_units(kl_list.kl_type, klus)
+            elif len(store) != len(klus) or any(klu.pos != pos for pos, klu in enumerate(klus)):
+                raise CChanException(f"{kl_list.kl_type}的K线和列式存储不一致，无法保存快照", ErrCode.SNAPSHOT_ERR)
+            self.stores.append(store)
+            self.set_special(store, ("store", lv_idx))
+            for klu in klus:
+                self.add(lv_idx, klu)
+        conf = self.chan.conf
+        self.set_special(conf, ("conf", None))
+        for name, value in vars(conf).items():
+            if hasattr(value, "__dict__") and not isinstance(value, _SKIP_TYPES):
+                self.set_special(value, ("conf", name))
+
+        root_lists = []
+        for lv_idx, kl_list in enumerate(self.kl_lists):
+            for table, lst in (
+                ("klc", kl_list.lst),
+                ("bi", kl_list.bi_list.bi_list),
+                ("seg", kl_list.seg_list.lst),
+                ("seg", kl_list.segseg_list.lst),
+                ("zs", kl_list.zs_list.zs_lst),
+                ("zs", kl_list.segzs_list.zs_lst),
+            ):
+                begin = len(self.tables[lv_idx][table])
+                for obj in lst:
+                    if id(obj) not in self.index:
+                        self.add(lv_idx, obj)
+                if len(self.tables[lv_idx][table]) == begin + len(lst):
+                    root_lists.append((lst, lv_idx, table, begin))
+            for bsp in list(kl_list.bs_point_lst.bsp_iter()) + list(kl_list.seg_bs_point_lst.bsp_iter()):
+                if id(bsp) not in self.index:
+                    self.add(lv_idx, bsp)
+        for lst, *_ in root_lists:
+            self.seen.add(id(lst))
+            self.list_ids.add(id(lst))
+
+        for lv_idx, kl_list in enumerate(self.kl_lists):
+            self.walk(lv_idx, vars(kl_list).values())
+        walked = [{name: 0 for name in _TABLES} for _ in self.kl_lists]
+        self.walk_tables(walked)
+        # CChan自身的状态(比如未完成K线的前沿)引用到了级别里的对象时，要和各级别放在同一个pickle里才能保持引用关系
+        self.bundled = self.walk(0, self.chan_state().values(), set())
+        self.walk_tables(walked)
+
+        for tables in self.tables:
+            base, offset = {}, 0
+            for name in _TABLES:
+                base[name] = offset
+                offset += len(tables[name])
+            self.base.append(base)
+        for lst, lv_idx, table, begin in root_lists:
+            gid_begin = self.base[lv_idx][table] + begin
+            self.set_special(lst, ("rows", lv_idx, gid_begin, gid_begin + len(lst)))
+        for lv_idx, kl_list in enumerate(self.kl_lists):
+            for model in kl_list.metric_model_lst + kl_list.batch_metric_model_lst:
+                if isinstance(model, CMACD) and self.macd_in_store(model, self.stores[lv_idx]):
+                    self.set_special(model.macd_info, ("macd_info", lv_idx))
+
+    def set_special(self, obj, pid):
+        self.special[id(obj)] = pid
+        self.seen.add(id(obj))
+        self.keep_alive.append(obj)
+
+    @staticmethod
+    def macd_in_store(model: CMACD, store: CKLine_Store) -> bool:
+        # 保留全部历史的macd_info和store里的macd列一一对应，加载时直接从列还原
+        if not model.keep_history or len(model.macd_info) != len(store) or "macd_dif" not in store.columns:
+            return False
+        for attr, name in (("fast_ema", "macd_fast_ema"), ("slow_ema", "macd_slow_ema"), ("DIF", "macd_dif"), ("DEA", "macd_dea")):
+            values = np.fromiter((getattr(item, attr) for item in model.macd_info), dtype=np.float64, count=len(store))
+            if not np.array_equal(values, store.col(name), equal_nan=True):
+                return False
+        return True
+
+    def chan_state(self) -> dict:
+        return {name: value for name, value in vars(self.chan).items() if name not in ("kl_datas", "g_kl_iter")}
+
+    @staticmethod
+    def field_names(table, cls) -> List[str]:
+        names = _FIELD_NAMES.get((table, cls))
+        if names is None:
+            if table == "klu":
+                names = list(_KLU_FIELDS)
+            else:
+                names = list(slot_names(cls))
+                if cls.__dictoffset__:
+                    names.append("__dict__")
+            _FIELD_NAMES[(table, cls)] = names
+        return names
+
+    @staticmethod
+    def get_field(table, obj, name):
+        if table == "klu" and not isinstance(obj, CKLine_Unit_View):
+            if name == "_sub_kl_list":
+                return obj.sub_kl_list or None
+            if name == "_klc":
+                return getattr(obj, "_CKLine_Unit__klc", None)
+        if name == "__dict__":
+            return getattr(obj, "__dict__", None) or None
+        return getattr(obj, name, _UNSET_VALUE)
+
+    def field_values(self, table, obj):
+        return [self.get_field(table, obj, name) for name in self.field_names(table, type(obj))]
+
+    def walk_tables(self, walked):
+        changed = True
+        while changed:
+            changed = False
+            for lv_idx, tables in enumerate(self.tables):
+                for name, rows in tables.items():
+                    while walked[lv_idx][name] < len(rows):
+                        obj = rows[walked[lv_idx][name]]
+                        walked[lv_idx][name] += 1
+                        self.walk(lv_idx, self.field_values(name, obj))
+                        changed = True
+
+    def walk(self, lv_idx, roots, seen=None) -> bool:
+        # 把能访问到的表对象都登记进表里，只有klu必须是已经入库的K线，其余的K线按普通对象处理
+        # 传入单独的seen时，返回是否碰到了之前遍历过的对象
+        stack = list(roots)
+        index, special, shared_ids = self.index, self.special, self.seen
+        separate = seen is not None
+        if seen is None:
+            seen = self.seen
+        shared = False
+        while stack:
+            obj = stack.pop()
+            kind = _WALK_KIND.get(type(obj))
+            if kind is None:
+                kind = _walk_kind(type(obj))
+            if kind == _W_SKIP:
+                continue
+            obj_id = id(obj)
+            if kind == _W_TABLE:
+                if obj_id not in index:
+                    self.add(lv_idx, obj)
+                shared = True
+                continue
+            if obj_id in index:
+                shared = True
+                continue
+            if obj_id in seen or obj_id in special:
+                continue
+            if separate and obj_id in shared_ids:
+                shared = True
+                continue
+            seen.add(obj_id)
+            if kind == _W_SEQ:
+                stack.extend(obj)
+            elif kind == _W_MAP:
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            else:
+                stack.extend(getattr(obj, name) for name in slot_names(type(obj)) if hasattr(obj, name))
+                if hasattr(obj, "__dict__"):
+                    stack.extend(vars(obj).values())
+        return shared
+
+    def add_array(self, key, arr: np.ndarray) -> str:
+        self.arrays.append((key, np.ascontiguousarray(arr)))
+        return key
+
+    def encode(self, key, name, values: list, obj_fields: dict) -> dict:
+        codes = [_SPECIAL_CODE.get(id(value), _REGULAR) for value in values]
+        spec = {"mask": None, "unset": _UNSET in codes, "count": len(values)}
+        if codes and codes[0] != _REGULAR and codes.count(codes[0]) == len(codes):
+            spec.update(kind="const", code=codes[0])  # 全部是同一个特殊值
+            return spec
+        regular = [value for value, code in zip(values, codes) if code == _REGULAR] if any(codes) else values
+        types = set(map(type, regular))
+        if all(_table_name(t) is not None for t in types):
+            # 引用里的特殊值直接编码成负数，不需要mask
+            gids = [self.gid(value) if code == _REGULAR else (None, -code) for value, code in zip(values, codes)]
+            levels = {gid[0] for gid in gids if gid is not None and gid[0] is not None}
+            if None not in gids and len(levels) == 1:
+                data = np.array([gid[1] for gid in gids], dtype=np.int64)
+                spec.update(kind="ref", lv=levels.pop(), data=self.add_array(key, data))
+                return spec
+        if any(codes):
+            spec["mask"] = self.add_array(f"{key}.mask", np.array(codes, dtype=np.int8))
+        spec["count"] = len(regular)
+        spec.update(self.encode_regular(key, name, regular, types, obj_fields))
+        return spec
+
+    def encode_regular(self, key, name, values: list, types: set, obj_fields: dict) -> dict:
+        if len(types) == 1:
+            value_type = next(iter(types))
+            if value_type is bool:
+                return {"kind": "bool", "data": self.add_array(key, np.array(values, dtype=np.int8))}
+            if value_type is int and all(-2**63 <= v < 2**63 for v in values):
+                return {"kind": "int", "data": self.add_array(key, np.array(values, dtype=np.int64))}
+            if value_type is float:
+                return {"kind": "float", "data": self.add_array(key, np.array(values, dtype=np.float64))}
+            if issubclass(value_type, Enum):
+                member_idx = {member: idx for idx, member in enumerate(value_type)}
+                if all(value in member_idx for value in values):
+                    data = np.array([member_idx[value] for value in values], dtype=np.int32)
+                    return {"kind": "enum", "cls": _cls_path(value_type), "data": self.add_array(key, data)}
+            if value_type is CTime:
+                return {
+                    "kind": "time",
+                    "data": self.add_array(key, np.array([encode_time(t) for t in values], dtype=np.int64)),
+                }
+            if value_type is list:
+                spec = self.encode_lists(key, name, values, obj_fields)
+                if spec is not None:
+                    return spec
+        obj_fields[key] = values
+        return {"kind": "obj", "key": key}
+
+    def encode_lists(self, key, name, values: List[list], obj_fields: dict) -> Optional[dict]:
+        if len(set(map(id, values))) != len(values) or any(id(lst) in self.list_ids for lst in values):
+            return None  # 同一个list被多处引用，交给pickle保持引用关系
+        self.list_ids.update(id(lst) for lst in values)
+        if name == "_memoize_cache" and len(set(map(len, values))) == 1:
+            return {
+                "kind": "memo",
+                "slots": [self.encode(f"{key}.{slot}", "", [lst[slot] for lst in values], obj_fields) for slot in range(len(values[0]))],
+            }
+        gids = [self.gid(item) for lst in values for item in lst]
+        levels = {gid[0] for gid in gids if gid is not None}
+        if None in gids or len(levels) > 1:
+            return None
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(lst) for lst in values], out=offsets[1:])
+        return {
+            "kind": "reflist",
+            "lv": levels.pop() if levels else 0,
+            "data": self.add_array(key, np.array([gid[1] for gid in gids], dtype=np.int64)),
+            "offsets": self.add_array(f"{key}.offsets", offsets),
+        }
+
+    def pickle_blob(self, key, obj, with_conf=False) -> str:
+        import io
+        buf = io.BytesIO()
+        _CSnapshotPickler(buf, self, with_conf).dump(obj)
+        return self.add_array(key, np.frombuffer(buf.getbuffer(), dtype=np.uint8))
+
+    def build_level(self, lv_idx) -> dict:
+        kl_list, store = self.kl_lists[lv_idx], self.stores[lv_idx]
+        columns = {name: self.add_array(f"{lv_idx}.col.{name}", store.col(name)) for name in store.columns}
+        tables, obj_fields = {}, {}
+        for table in _TABLES:
+            rows = self.tables[lv_idx][table]
+            # K线加载后统一是CKLine_Unit_View
+            classes = [CKLine_Unit_View] if table == "klu" else list(dict.fromkeys(type(obj) for obj in rows))
+            spec = {"n": len(rows), "classes": [_cls_path(cls) for cls in classes], "cls_idx": None, "fields": {}}
+            if len(classes) > 1:
+                cls_idx = {cls: idx for idx, cls in enumerate(classes)}
+                spec["cls_idx"] = self.add_array(f"{lv_idx}.{table}.cls", np.array([cls_idx[type(obj)] for obj in rows], dtype=np.int32))
+            names = list(dict.fromkeys(name for cls in classes for name in self.field_names(table, cls)))
+            for name in names:
+                values = [self.get_field(table, obj, name) for obj in rows]
+                spec["fields"][name] = self.encode(f"{lv_idx}.{table}.{name}", name, values, obj_fields)
+            tables[table] = spec
+
+        state = dict(vars(kl_list))
+        state["klu_store"] = store
+        meta = {"cls": type(kl_list), "state": state, "store": (store.trend_keys, store.demark), "obj": obj_fields}
+        level = {"kl_type": kl_list.kl_type.name, "columns": columns, "tables": tables, "meta": None}
+        if not self.bundled:
+            level["meta"] = self.pickle_blob(f"{lv_idx}.meta", meta)
+        return level, meta
+
+    def write(self, path):
+        self.collect()
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"  # 多个进程/线程同时写同一个快照时互不覆盖
+        try:
+            self.write_file(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+
+    def write_file(self, tmp_path):
+        levels, metas = zip(*[self.build_level(lv_idx) for lv_idx in range(len(self.kl_lists))])
+        conf = self.pickle_blob("conf", self.chan.conf, with_conf=True)
+        chan_meta = self.pickle_blob("chan.meta", (type(self.chan), self.chan_state(), list(metas) if self.bundled else None))
+        with open(tmp_path, "wb") as f:
+            f.write(bytes(_PRELUDE.size))
+            pos = _PRELUDE.size
+            directory = {}
+            for key, arr in self.arrays:
+                pad = -pos % _ALIGN
+                f.write(bytes(pad))
+                pos += pad
+                directory[key] = [pos, arr.dtype.str, len(arr)]
+                f.write(memoryview(arr).cast("B"))
+                pos += arr.nbytes
+            header = json.dumps({"arrays": directory, "levels": levels, "conf": conf, "chan_meta": chan_meta, "bundled": self.bundled, "conf_fingerprint": self.chan.conf.fingerprint_digest()}).encode()
+            f.write(header)
+            f.seek(0)
+            f.write(_PRELUDE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, pos, len(header)))
+
+
+class _CSnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, reader: '_CSnapshotReader'):
+        super(_CSnapshotUnpickler, self).__init__(file)
+        self.reader = reader
+
+    def persistent_load(self, pid):
+        return self.reader.persistent_load(pid)
+
+
+class _CLazyLevels(dict):
+    """
+    快照加载出来的kl_datas，各级别第一次被访问时才真正创建
+    values()/items()/get()也会触发创建；pickle/deepcopy时按普通dict处理
+    """
+    def __init__(self, reader: '_CSnapshotReader', lv_list):
+        super(_CLazyLevels, self).__init__((lv, None) for lv in lv_list)
+        self.reader: Optional[_CSnapshotReader] = reader
+
+    def __getitem__(self, lv) -> CKLine_List:
+        kl_list = dict.__getitem__(self, lv)
+        if kl_list is None:
+            kl_list = self.reader.materialize(lv)
+        return kl_list
+
+    def is_loaded(self, lv) -> bool:
+        return dict.__getitem__(self, lv) is not None
+
+    def get(self, lv, default=None):
+        return self[lv] if lv in self else default
+
+    def values(self):
+        return [self[lv] for lv in self]
+
+    def items(self):
+        return [(lv, self[lv]) for lv in self]
+
+    def copy(self):
+        return dict(self.items())
+
+    def __reduce__(self):
+        return dict, (self.copy(),)
+
+
+def read_header(f, path) -> dict:
+    f.seek(0)
+    prelude = f.read(_PRELUDE.size)
+    if len(prelude) < _PRELUDE.size:
+        raise CChanException(f"{path}不是有效的快照文件", ErrCode.SNAPSHOT_ERR)
+    magic, version, header_offset, header_len = _PRELUDE.unpack(prelude)
+    if magic != SNAPSHOT_MAGIC:
+        raise CChanException(f"{path}不是有效的快照文件", ErrCode.SNAPSHOT_ERR)
+    if version != SNAPSHOT_VERSION:
+        raise CChanException(f"快照版本{version}和当前版本{SNAPSHOT_VERSION}不兼容，请重新生成", ErrCode.SNAPSHOT_ERR)
+    f.seek(header_offset)
+    header = f.read(header_len)
+    if len(header) < header_len:
+        raise CChanException(f"{path}不完整", ErrCode.SNAPSHOT_ERR)
+    f.seek(0)
+    return json.loads(header)
+
+
+class _CSnapshotReader:
+    def __init__(self, path, use_mmap=True):
+        with open(path, "rb") as f:
+            self.header = read_header(f, path)
+            # ACCESS_COPY：映射出来的数组可写，写入不会落到文件上；mmap一直被加载出来的数组引用，随它们一起释放
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) if use_mmap else bytearray(f.read())
+        self.levels = self.header["levels"]
+        self.lv_idx = {KL_TYPE[level["kl_type"]]: lv_idx for lv_idx, level in enumerate(self.levels)}
+        self.objs: Dict[int, list] = {}
+        self.stores: Dict[int, CKLine_Store] = {}
+        self.todo = deque()
+        self.conf = None
+        self.kl_datas: Optional[_CLazyLevels] = None
+
+    def array(self, key) -> np.ndarray:
+        offset, dtype, count = self.header["arrays"][key]
+        return np.frombuffer(self.buf, dtype=dtype, count=count, offset=offset)
+
+    def unpickle(self, key):
+        import io
+        return _CSnapshotUnpickler(io.BytesIO(self.array(key).tobytes()), self).load()
+
+    def load_chan(self):
+        with _gc_paused():
+            return self.__load_chan()
+
+    def __load_chan(self):
+        self.conf = self.unpickle(self.header["conf"])
+        if self.header["bundled"]:
+            # 各级别和CChan的状态在同一个pickle里，只能一次全部创建
+            for lv_idx in range(len(self.levels)):
+                self.objects(lv_idx)
+            self.todo.clear()
+        cls, state, metas = self.unpickle(self.header["chan_meta"])
+        chan = cls.__new__(cls)
+        chan.__dict__.update(state)
+        chan.g_kl_iter = defaultdict(list)
+        self.kl_datas = chan.kl_datas = _CLazyLevels(self, [KL_TYPE[level["kl_type"]] for level in self.levels])
+        for lv_idx, meta in enumerate(metas or []):
+            self.fill(lv_idx, meta)
+        self.fill_todo()
+        return chan
+
+    def materialize(self, lv) -> CKLine_List:
+        with _gc_paused():
+            self.objects(self.lv_idx[lv])
+            self.fill_todo()
+        return dict.__getitem__(self.kl_datas, lv)
+
+    def fill_todo(self):
+        while self.todo:
+            self.fill(self.todo.popleft())
+        if all(kl_list is not None for kl_list in dict.values(self.kl_datas)):
+            self.kl_datas.reader = None  # 全部级别都已创建，不再需要reader
+
+    def persistent_load(self, pid):
+        tag = pid[0]
+        if tag == "obj":
+            return self.objects(pid[1])[pid[2]]
+        if tag == "rows":
+            return self.objects(pid[1])[pid[2]:pid[3]]
+        if tag == "store":
+            self.objects(pid[1])
+            return self.stores[pid[1]]
+        if tag == "conf":
+            return self.conf if pid[1] is None else getattr(self.conf, pid[1])
+        if tag == "macd_info":
+            self.objects(pid[1])
+            cols = self.stores[pid[1]].columns
+            return list(map(CMACD_item, *(cols[name].tolist() for name in ("macd_fast_ema", "macd_slow_ema", "macd_dif", "macd_dea"))))
+        raise CChanException(f"unknown snapshot reference {pid}", ErrCode.SNAPSHOT_ERR)
+
+    def objects(self, lv_idx) -> list:
+        # 先只创建对象(字段为空)，引用关系在fill里连接
+        if lv_idx in self.objs:
+            return self.objs[lv_idx]
+        level = self.levels[lv_idx]
+        store = CKLine_Store.from_columns(KL_TYPE[level["kl_type"]], {name: self.array(key) for name, key in level["columns"].items()}, {}, {})
+        self.stores[lv_idx] = store
+        objs = []
+        for table in _TABLES:
+            spec = level["tables"][table]
+            n = spec["n"]
+            if table == "klu":
+                views = list(map(CKLine_Unit_View.__new__, repeat(CKLine_Unit_View, n)))
+                deque(map(CKLine_Unit_View._store.__set__, views, repeat(store, n)), maxlen=0)
+                deque(map(CKLine_Unit_View._pos.__set__, views, range(n)), maxlen=0)
+                objs.extend(views)
+            elif spec["cls_idx"] is None:
+                if n:
+                    cls = _import_cls(spec["classes"][0])
+                    objs.extend(map(cls.__new__, repeat(cls, n)))
+            else:
+                classes = [_import_cls(path) for path in spec["classes"]]
+                objs.extend(classes[idx].__new__(classes[idx]) for idx in self.array(spec["cls_idx"]).tolist())
+        objs.extend(_REF_SPECIALS)
+        self.objs[lv_idx] = objs
+        self.todo.append(lv_idx)
+        return objs
+
+    def decode(self, spec, obj_fields) -> list:
+        kind = spec["kind"]
+        if kind == "const":
+            return [_SPECIAL_VALUE[spec["code"]]] * spec["count"]
+        elif kind == "bool":
+            values = self.array(spec["data"]).astype(bool).tolist()
+        elif kind in ("int", "float"):
+            values = self.array(spec["data"]).tolist()
+        elif kind == "enum":
+            members = list(_import_cls(spec["cls"]))
+            values = list(map(members.__getitem__, self.array(spec["data"]).tolist()))
+        elif kind == "time":
+            values = _bulk_time(self.array(spec["data"])) if spec["count"] else []
+        elif kind == "ref":
+            values = list(map(self.objects(spec["lv"]).__getitem__, self.array(spec["data"]).tolist()))
+        elif kind == "reflist":
+            flat = list(map(self.objects(spec["lv"]).__getitem__, self.array(spec["data"]).tolist()))
+            offsets = self.array(spec["offsets"]).tolist()
+            values = [flat[begin:end] for begin, end in zip(offsets, offsets[1:])]
+        elif kind == "memo":
+            slots = [self.decode(slot, obj_fields) for slot in spec["slots"]]
+            values = list(map(list, zip(*slots))) if slots else [[] for _ in range(spec["count"])]
+        elif kind == "obj":
+            values = obj_fields.pop(spec["key"])
+        else:
+            raise CChanException(f"unknown snapshot field kind {kind}", ErrCode.SNAPSHOT_ERR)
+        if spec["mask"] is None:
+            return values
+        it = iter(values)
+        return [next(it) if code == _REGULAR else _SPECIAL_VALUE[code] for code in self.array(spec["mask"]).tolist()]
+
+    def fill(self, lv_idx, meta=None):
+        level = self.levels[lv_idx]
+        if meta is None:
+            meta = self.unpickle(level["meta"])
+        store = self.stores[lv_idx]
+        store.trend_keys, store.demark = meta["store"]
+        objs, offset = self.objs[lv_idx], 0
+        for table in _TABLES:
+            spec = level["tables"][table]
+            rows = objs[offset:offset + spec["n"]]
+            offset += spec["n"]
+            classes = [_import_cls(path) for path in spec["classes"]]
+            for name, field_spec in spec["fields"].items():
+                values = self.decode(field_spec, meta["obj"])
+                if name == "__dict__":
+                    for obj, value in zip(rows, values):
+                        if value is not None:
+                            obj.__dict__.update(value)
+                elif len(classes) == 1 and not field_spec["unset"]:
+                    deque(map(getattr(classes[0], name).__set__, rows, values), maxlen=0)
+                else:
+                    for obj, value in zip(rows, values):
+                        if value is not _UNSET_VALUE:
+                            setattr(obj, name, value)
+        kl_list = meta["cls"].__new__(meta["cls"])
+        kl_list.__dict__.update(meta["state"])
+        dict.__setitem__(self.kl_datas, KL_TYPE[level["kl_type"]], kl_list)
+
+
+def dump_snapshot(chan, path):
+    _CSnapshotWriter(chan).write(path)
+
+
+def load_snapshot(path, use_mmap=True):
+    return _CSnapshotReader(path, use_mmap).load_chan()
+
+
+def snapshot_fingerprint(path) -> Optional[str]:
+    # 只读头部，返回生成快照时的CChanConfig.fingerprint_digest()，旧快照没有记录时返回None
+    with open(path, "rb") as f:
+        return read_header(f, path).get("conf_fingerprint")
@@ -2,6 +2,8 @@ from Common.ChanException import CChanException, ErrCode
 
 
 class CCombine_Item:
+    __slots__ = ("time_begin", "time_end", "high", "low")
+
     def __init__(self, item):
         from Bi.Bi import CBi
         from KLine.KLine_Unit import CKLine_Unit
@@ -1,8 +1,8 @@
-from typing import Generic, Iterable, List, Optional, Self, TypeVar, Union, overload
+from typing import Generic, Iterable, List, Optional, Self, Tuple, TypeVar, Union, overload
 
-from Common.cache import make_cache
 from Common.CEnum import FX_TYPE, KLINE_DIR
 from Common.ChanException import CChanException, ErrCode
+from Common.func_util import slot_names
 from KLine.KLine_Unit import CKLine_Unit
 
 from .Combine_Item import CCombine_Item
@@ -11,22 +11,32 @@ T = TypeVar('T')
 
 
 class CKLine_Combiner(Generic[T]):
+    __slots__ = ("__time_begin", "__time_end", "__high", "__low", "__lst", "__dir", "__fx", "__pre", "__next", "__high_peak", "__low_peak", "__watchers")
+
     def __init__(self, kl_unit: T, _dir):
-        item = CCombine_Item(kl_unit)
-        self.__time_begin = item.time_begin
-        self.__time_end = item.time_end
-        self.__high = item.high
-        self.__low = item.low
+        self.__time_begin, self.__time_end = self.item_time(kl_unit)
+        self.__high, self.__low = self.item_range(kl_unit)
 
         self.__lst: List[T] = [kl_unit]  # 本级别每一根单位K线
+        self.__high_peak = 0  # lst里最后一个high等于self.high的下标，合并时增量维护
+        self.__low_peak = 0
+        self.__watchers: Optional[list] = None  # 缓存了本K线high/low/峰值的对象，合并新元素时通知
 
         self.__dir = _dir
         self.__fx = FX_TYPE.UNKNOWN
         self.__pre: Optional[Self] = None
         self.__next: Optional[Self] = None
 
-    def clean_cache(self):
-        self._memoize_cache = {}
+    @staticmethod
+    def item_range(item) -> Tuple[float, float]:
+        # 元素的(high, low)，子类按元素类型直接取，不用每次构造CCombine_Item
+        combine_item = CCombine_Item(item)
+        return combine_item.high, combine_item.low
+
+    @staticmethod
+    def item_time(item) -> Tuple:
+        combine_item = CCombine_Item(item)
+        return combine_item.time_begin, combine_item.time_end
 
     @property
     def time_begin(self): return self.__time_begin
@@ -57,22 +67,34 @@ class CKLine_Combiner(Generic[T]):
     @property
     def next(self): return self.__next
 
+    @property
+    def watchers(self): return self.__watchers
+
+    def add_watcher(self, obj):
+        # 只有还没有下一根、可能继续合并的K线需要登记，合并时回调obj.on_klc_combine(self)
+        if self.__next is not None:
+            return
+        if self.__watchers is None:
+            self.__watchers = [obj]
+        elif obj not in self.__watchers:
+            self.__watchers.append(obj)
+
     def get_next(self) -> Self:
         assert self.next is not None
         return self.next
 
-    def test_combine(self, item: CCombine_Item, exclude_included=False, allow_top_equal=None):
-        if (self.high >= item.high and self.low <= item.low):
+    def test_combine(self, high, low, exclude_included=False, allow_top_equal=None):
+        if (self.__high >= high and self.__low <= low):
             return KLINE_DIR.COMBINE
-        if (self.high <= item.high and self.low >= item.low):
-            if allow_top_equal == 1 and self.high == item.high and self.low > item.low:
+        if (self.__high <= high and self.__low >= low):
+            if allow_top_equal == 1 and self.__high == high and self.__low > low:
                 return KLINE_DIR.DOWN
-            elif allow_top_equal == -1 and self.low == item.low and self.high < item.high:
+            elif allow_top_equal == -1 and self.__low == low and self.__high < high:
                 return KLINE_DIR.UP
             return KLINE_DIR.INCLUDED if exclude_included else KLINE_DIR.COMBINE
-        if (self.high > item.high and self.low > item.low):
+        if (self.__high > high and self.__low > low):
             return KLINE_DIR.DOWN
-        if (self.high < item.high and self.low < item.low):
+        if (self.__high < high and self.__low < low):
             return KLINE_DIR.UP
         else:
             raise CChanException("combine type unknown", ErrCode.COMBINER_ERR)
@@ -85,44 +107,43 @@ class CKLine_Combiner(Generic[T]):
         # allow_top_equal = None普通模式
         # allow_top_equal = 1 被包含，顶部相等不合并
         # allow_top_equal = -1 被包含，底部相等不合并
-        combine_item = CCombine_Item(unit_kl)
-        _dir = self.test_combine(combine_item, exclude_included, allow_top_equal)
+        high, low = self.item_range(unit_kl)
+        _dir = self.test_combine(high, low, exclude_included, allow_top_equal)
         if _dir == KLINE_DIR.COMBINE:
             self.__lst.append(unit_kl)
             if isinstance(unit_kl, CKLine_Unit) and not skip_update_input:
                 unit_kl.set_klc(self)
-            if self.dir == KLINE_DIR.UP:
-                if combine_item.high != combine_item.low or combine_item.high != self.high:  # 处理一字K线
-                    self.__high = max([self.high, combine_item.high])
-                    self.__low = max([self.low, combine_item.low])
-            elif self.dir == KLINE_DIR.DOWN:
-                if combine_item.high != combine_item.low or combine_item.low != self.low:  # 处理一字K线
-                    self.__high = min([self.high, combine_item.high])
-                    self.__low = min([self.low, combine_item.low])
+            if self.__dir == KLINE_DIR.UP:
+                if high != low or high != self.__high:  # 处理一字K线
+                    self.__high = max(self.__high, high)
+                    self.__low = max(self.__low, low)
+            elif self.__dir == KLINE_DIR.DOWN:
+                if high != low or low != self.__low:  # 处理一字K线
+                    self.__high = min(self.__high, high)
+                    self.__low = min(self.__low, low)
             else:
                 raise CChanException(f"KLINE_DIR = {self.dir} err!!! must be {KLINE_DIR.UP}/{KLINE_DIR.DOWN}", ErrCode.COMBINER_ERR)
-            self.__time_end = combine_item.time_end
-            self.clean_cache()
+            # 合并后的high/low只会是原值或新元素的值，新元素取到了就是最后一个峰值，否则峰值位置不变
+            if high == self.__high:
+                self.__high_peak = len(self.__lst) - 1
+            if low == self.__low:
+                self.__low_peak = len(self.__lst) - 1
+            self.__time_end = self.item_time(unit_kl)[1]
+            if self.__watchers:
+                for obj in self.__watchers:
+                    obj.on_klc_combine(self)
         # 返回UP/DOWN/COMBINE给KL_LIST，设置下一个的方向
         return _dir
 
     def get_peak_klu(self, is_high) -> T:
         # 获取最大值 or 最小值所在klu/bi
-        return self.get_high_peak_klu() if is_high else self.get_low_peak_klu()
+        return self.__lst[self.__high_peak] if is_high else self.__lst[self.__low_peak]
 
-    @make_cache
     def get_high_peak_klu(self) -> T:
-        for kl in self.lst[::-1]:
-            if CCombine_Item(kl).high == self.high:
-                return kl
-        raise CChanException("can't find peak...", ErrCode.COMBINER_ERR)
+        return self.__lst[self.__high_peak]
 
-    @make_cache
     def get_low_peak_klu(self) -> T:
-        for kl in self.lst[::-1]:
-            if CCombine_Item(kl).low == self.low:
-                return kl
-        raise CChanException("can't find peak...", ErrCode.COMBINER_ERR)
+        return self.__lst[self.__low_peak]
 
     def update_fx(self, _pre: Self, _next: Self, exclude_included=False, allow_top_equal=None):
         # allow_top_equal = None普通模式
@@ -142,7 +163,6 @@ class CKLine_Combiner(Generic[T]):
             self.__fx = FX_TYPE.TOP
         elif _pre.high > self.high and _next.high > self.high and _pre.low > self.low and _next.low > self.low:
             self.__fx = FX_TYPE.BOTTOM
-        self.clean_cache()
 
     def __str__(self):
         return f"{self.time_begin}~{self.time_end} {self.low}->{self.high}"
@@ -162,10 +182,19 @@ class CKLine_Combiner(Generic[T]):
     def __iter__(self) -> Iterable[T]:
         yield from self.lst
 
+    def __copy__(self):
+        # lst单独复制一份，之后两边各自合并互不影响；不带watchers
+        new = object.__new__(type(self))
+        for name in slot_names(type(self)):
+            setattr(new, name, getattr(self, name))
+        new.__lst = list(self.__lst)
+        new.__watchers = None
+        return new
+
     def set_pre(self, _pre: Self | None):
         self.__pre = _pre
-        self.clean_cache()
 
     def set_next(self, _next: Self | None):
         self.__next = _next
-        self.clean_cache()
+        if _next is not None:
+            self.__watchers = None  # 有了下一根就不会再合并
@@ -116,6 +116,12 @@ class MACD_ALGO(Enum):
     RSI = auto()
 
 
+class CHANGE_TYPE(Enum):
+    NEW = auto()
+    CHANGED = auto()
+    REMOVED = auto()
+
+
 class DATA_FIELD:
     FIELD_TIME = "time_key"
     FIELD_OPEN = "open"
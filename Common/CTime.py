@@ -1,28 +1,117 @@
-from datetime import datetime
+from collections import deque
+from datetime import date, datetime
+from itertools import repeat
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_AUTO_DAY_SHIFT = 23 * 3600 + 59 * 60  # auto模式下0点的日线按当天23:59比较
+
+
+def days_from_civil(year, month, day):
+    # 公历日期 -> 1970-01-01起的天数，参数可以是int也可以是numpy数组
+    year = year - (month <= 2)
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + 9 - 12 * (month > 2)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
 
 
 class CTime:
+    """
+    内部只保存按本地时间当作UTC算出的整数秒(epoch)，年月日时分秒在第一次访问时才分解，字符串格式化结果会缓存
+    key用于比较大小：auto为True时0点的时间(日线及以上)按当天23:59比较
+    ts和旧版本一样是按本地时区算出的POSIX时间戳(float)，每次访问时现算，框架内部不再使用
+    CTime是不可变对象，year/month/day等都是只读属性，需要别的时间请重新构造
+    """
+    __slots__ = ("epoch", "key", "auto", "_fields", "_str")
+
     def __init__(self, year, month, day, hour, minute, second=0, auto=True):
-        self.year = year
-        self.month = month
-        self.day = day
-        self.hour = hour
-        self.minute = minute
-        self.second = second
+        self.epoch = (date(year, month, day).toordinal() - _EPOCH_ORDINAL) * 86400 + hour * 3600 + minute * 60 + second
         self.auto = auto  # 自适应对天的理解
-        self.set_timestamp()  # set self.ts
+        self._fields = (year, month, day, hour, minute, second)
+        self._str = None
+        self.key = self.epoch + _AUTO_DAY_SHIFT if auto and hour == 0 and minute == 0 else self.epoch
+
+    @classmethod
+    def from_epoch(cls, epoch: int, auto=True) -> 'CTime':
+        t = cls.__new__(cls)
+        t.epoch = epoch
+        t.auto = auto
+        t._fields = t._str = None
+        t.set_timestamp()
+        return t
+
+    @classmethod
+    def from_epochs(cls, epochs, auto=True) -> list:
+        """
+        numpy整数数组批量构造，不逐个调用datetime；auto可以是bool，也可以是和epochs等长的bool数组
+        """
+        n = len(epochs)
+        keys = epochs + _AUTO_DAY_SHIFT * ((epochs % 86400 < 60) & auto)
+        times = list(map(cls.__new__, repeat(cls, n)))
+        deque(map(CTime.epoch.__set__, times, epochs.tolist()), maxlen=0)
+        deque(map(CTime.key.__set__, times, keys.tolist()), maxlen=0)
+        deque(map(CTime.auto.__set__, times, auto.tolist() if hasattr(auto, "tolist") else repeat(bool(auto), n)), maxlen=0)
+        deque(map(CTime._fields.__set__, times, repeat(None, n)), maxlen=0)
+        deque(map(CTime._str.__set__, times, repeat(None, n)), maxlen=0)
+        return times
+
+    def __reduce__(self):
+        return CTime.from_epoch, (self.epoch, self.auto)
+
+    def __setstate__(self, state):
+        # 兼容旧版本按年月日时分秒字段pickle的CTime
+        slots = state[1] if isinstance(state, tuple) else state
+        self.__init__(slots["year"], slots["month"], slots["day"], slots["hour"], slots["minute"], slots["second"], slots["auto"])
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self  # 不可变对象
+
+    def fields(self):
+        if self._fields is None:
+            days, second = divmod(self.epoch, 86400)
+            day = date.fromordinal(days + _EPOCH_ORDINAL)
+            self._fields = (day.year, day.month, day.day, second // 3600, second // 60 % 60, second % 60)
+        return self._fields
+
+    @property
+    def year(self):
+        return self.fields()[0]
+
+    @property
+    def month(self):
+        return self.fields()[1]
+
+    @property
+    def day(self):
+        return self.fields()[2]
+
+    @property
+    def hour(self):
+        return self.fields()[3]
+
+    @property
+    def minute(self):
+        return self.fields()[4]
+
+    @property
+    def second(self):
+        return self.fields()[5]
 
     def __str__(self):
-        if self.hour == 0 and self.minute == 0:
-            return f"{self.year:04}/{self.month:02}/{self.day:02}"
-        else:
-            return f"{self.year:04}/{self.month:02}/{self.day:02} {self.hour:02}:{self.minute:02}"
+        return self.to_str()
 
     def to_str(self):
-        if self.hour == 0 and self.minute == 0:
-            return f"{self.year:04}/{self.month:02}/{self.day:02}"
-        else:
-            return f"{self.year:04}/{self.month:02}/{self.day:02} {self.hour:02}:{self.minute:02}"
+        if self._str is None:
+            year, month, day, hour, minute, _ = self.fields()
+            if hour == 0 and minute == 0:
+                self._str = "%04d/%02d/%02d" % (year, month, day)
+            else:
+                self._str = "%04d/%02d/%02d %02d:%02d" % (year, month, day, hour, minute)
+        return self._str
 
     def toDateStr(self, splt=''):
         return f"{self.year:04}{splt}{self.month:02}{splt}{self.day:02}"
@@ -31,14 +120,20 @@ class CTime:
         return CTime(self.year, self.month, self.day, 0, 0, auto=False)
 
     def set_timestamp(self):
-        if self.hour == 0 and self.minute == 0 and self.auto:
-            date = datetime(self.year, self.month, self.day, 23, 59, self.second)
+        if self.auto and self.epoch % 86400 < 60:  # 0点0分
+            self.key = self.epoch + _AUTO_DAY_SHIFT
         else:
-            date = datetime(self.year, self.month, self.day, self.hour, self.minute, self.second)
-        self.ts = date.timestamp()
+            self.key = self.epoch
+
+    @property
+    def ts(self) -> float:
+        year, month, day, hour, minute, second = self.fields()
+        if self.auto and hour == 0 and minute == 0:
+            hour, minute = 23, 59
+        return datetime(year, month, day, hour, minute, second).timestamp()
 
     def __gt__(self, t2):
-        return self.ts > t2.ts
+        return self.key > t2.key
 
     def __ge__(self, t2):
-        return self.ts >= t2.ts
+        return self.key >= t2.key
@@ -0,0 +1,159 @@
+from typing import Generic, List, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class CRangeExtremum:
+    """
+    只在尾部追加/截断的序列上求区间最大最小值，元素只要能比较大小即可(比如(值, 下标)元组)
+    按BLOCK个一块，整块的极值放在稀疏表里O(1)查询，两头不满一块的部分直接max/min切片
+    追加均摊O(1)，每满一块更新一次稀疏表
+    """
+    BLOCK = 64
+
+    def __init__(self):
+        self.vals: list = []
+        self.mx: List[list] = []  # mx[k][i]: 第i块起2^k块的最大值
+        self.mn: List[list] = []
+
+    def __len__(self):
+        return len(self.vals)
+
+    def append(self, value):
+        self.vals.append(value)
+        if len(self.vals) % self.BLOCK == 0:
+            blk = self.vals[-self.BLOCK:]
+            self.__push_block(max(blk), min(blk))
+
+    def __push_block(self, _max, _min):
+        if not self.mx:
+            self.mx.append([])
+            self.mn.append([])
+        self.mx[0].append(_max)
+        self.mn[0].append(_min)
+        k = 1
+        while True:
+            i = len(self.mx[0]) - (1 << k)
+            if i < 0:
+                break
+            if k == len(self.mx):
+                self.mx.append([])
+                self.mn.append([])
+            half = 1 << (k-1)
+            self.mx[k].append(max(self.mx[k-1][i], self.mx[k-1][i+half]))
+            self.mn[k].append(min(self.mn[k-1][i], self.mn[k-1][i+half]))
+            k += 1
+
+    def truncate(self, size):
+        del self.vals[size:]
+        blk_cnt = size // self.BLOCK
+        for k in range(len(self.mx)):
+            keep = max(0, blk_cnt - (1 << k) + 1)
+            del self.mx[k][keep:]
+            del self.mn[k][keep:]
+        while self.mx and not self.mx[-1]:
+            self.mx.pop()
+            self.mn.pop()
+
+    def __blocks(self, lo, hi):
+        # [lo, hi]闭区间里完整的块是[b0, b1)，两头剩下的零散部分单独算
+        b0 = (lo + self.BLOCK - 1) // self.BLOCK
+        b1 = (hi + 1) // self.BLOCK
+        return b0, b1
+
+    def max(self, lo, hi):
+        b0, b1 = self.__blocks(lo, hi)
+        if b0 >= b1:
+            return max(self.vals[lo:hi+1])
+        k = (b1 - b0).bit_length() - 1
+        res = max(self.mx[k][b0], self.mx[k][b1-(1 << k)])
+        if lo < b0*self.BLOCK:
+            res = max(res, max(self.vals[lo:b0*self.BLOCK]))
+        if hi >= b1*self.BLOCK:
+            res = max(res, max(self.vals[b1*self.BLOCK:hi+1]))
+        return res
+
+    def min(self, lo, hi):
+        b0, b1 = self.__blocks(lo, hi)
+        if b0 >= b1:
+            return min(self.vals[lo:hi+1])
+        k = (b1 - b0).bit_length() - 1
+        res = min(self.mn[k][b0], self.mn[k][b1-(1 << k)])
+        if lo < b0*self.BLOCK:
+            res = min(res, min(self.vals[lo:b0*self.BLOCK]))
+        if hi >= b1*self.BLOCK:
+            res = min(res, min(self.vals[b1*self.BLOCK:hi+1]))
+        return res
+
+
+class CChainIndex(Generic[T]):
+    """
+    K线合并/笔/线段这类按idx排列、用pre串起来的元素上的区间极值索引，子类定义签名和各列的值
+    元素只会在尾部增删改，查询前从查询的元素沿pre往前比对(对象, 签名)，第一个没变的位置之前都有效，之后的截断重建
+    restore/虚笔更新/线段重算等改动都靠比对发现，不需要调用方通知；只是缓存，deepcopy/pickle得到空索引
+    """
+    COLUMN_CNT = 1
+
+    def __init__(self):
+        self.items: List[T] = []
+        self.sigs: list = []
+        self.columns = [CRangeExtremum() for _ in range(self.COLUMN_CNT)]
+
+    def __deepcopy__(self, memo):
+        return type(self)()
+
+    def __reduce__(self):
+        return type(self), ()
+
+    def __len__(self):
+        return len(self.items)
+
+    def signature(self, item: T):
+        # 元素上会影响各列取值的全部状态
+        raise NotImplementedError
+
+    def values(self, item: T) -> Tuple:
+        raise NotImplementedError
+
+    def prev(self, item: T):
+        return item.pre
+
+    def truncate(self, size):
+        if size >= len(self.items):
+            return
+        del self.items[size:]
+        del self.sigs[size:]
+        for column in self.columns:
+            column.truncate(size)
+
+    def append(self, item: T):
+        self.items.append(item)
+        self.sigs.append(self.signature(item))
+        for column, value in zip(self.columns, self.values(item)):
+            column.append(value)
+
+    def sync(self, item: T) -> bool:
+        # 保证下标<=item.idx的部分和当前状态一致，idx不连续等无法索引的情况返回False
+        items, sigs = self.items, self.sigs
+        pending = []
+        while item is not None:
+            idx = item.idx
+            if idx < len(items) and items[idx] is item and sigs[idx] == self.signature(item):
+                break
+            pending.append(item)
+            item = self.prev(item)
+        if not pending:
+            return True
+        self.truncate(pending[-1].idx)
+        for item in reversed(pending):
+            if item.idx != len(items):
+                self.truncate(0)
+                return False
+            self.append(item)
+        return True
+
+    def max(self, col: int, lo: int, hi: int):
+        return self.columns[col].max(lo, hi)
+
+    def min(self, col: int, lo: int, hi: int):
+        return self.columns[col].min(lo, hi)
@@ -1,34 +1,151 @@
+import functools
 import inspect
-import types
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 
 
-class make_cache:
-    def __init__(self, func):
-        self.func = func
+class _CacheMiss:
+    # 缓存槽位的占位符，deepcopy/pickle后仍是同一个对象
+    def __reduce__(self):
+        return "CACHE_MISS"
+
+    def __repr__(self):
+        return "CACHE_MISS"
+
+
+CACHE_MISS = _CacheMiss()
+_CACHED_METHODS: List["CCachedMethod"] = []
+_STATS_ENABLED = False  # enable_cache_stats打开时生成带计数的版本
+_DEPS_SLOTS: Dict[tuple, List[int]] = {}
+
+
+@dataclass
+class CCacheStat:
+    name: str
+    hit: int = 0
+    miss: int = 0
+    invalidate: int = 0  # 已算好的结果被失效的次数
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hit / (self.hit + self.miss) if self.hit + self.miss else 0.0
+
+    @property
+    def invalidate_rate(self) -> float:
+        return self.invalidate / self.miss if self.miss else 0.0
 
+
+class CCachedMethod:
+    """
+    make_cache登记的一个方法：在类里分到固定下标，类属性是按下标读写`_memoize_cache`的普通函数，
+    取属性时走python自己的方法绑定，不再经过描述符和types.MethodType
+    """
+    def __init__(self, func, deps: Optional[Tuple[str, ...]]):
         fargspec = inspect.getfullargspec(func)
         if len(fargspec.args) != 1 or fargspec.args[0] != "self":
             raise Exception("@memoize must be `(self)`")
+        self.func = func
+        self.deps = deps
+        self.owner = None
+        self.name = func.__name__
+        self.slot = -1
+        self.stat = CCacheStat(func.__qualname__)
+
+    def __set_name__(self, owner, name):
+        # 子类继承父类已分配的下标，新方法继续往后排
+        self.owner, self.name = owner, name
+        self.slot = getattr(owner, "_memoize_cnt", 0)
+        owner._memoize_cnt = self.slot + 1
+        if "_memoize_methods" not in owner.__dict__:
+            owner._memoize_methods = list(getattr(owner, "_memoize_methods", []))
+        owner._memoize_methods.append(self)
+        _CACHED_METHODS.append(self)
+        setattr(owner, name, self.build())
+
+    def build(self):
+        func, slot, stat = self.func, self.slot, self.stat
+
+        if not _STATS_ENABLED:
+            def cached(instance):
+                try:
+                    cache = instance._memoize_cache
+                except AttributeError:
+                    cache = None
+                if cache is None:
+                    cache = instance._memoize_cache = [CACHE_MISS] * type(instance)._memoize_cnt
+                result = cache[slot]
+                if result is CACHE_MISS:
+                    result = cache[slot] = func(instance)
+                return result
+        else:
+            def cached(instance):
+                try:
+                    cache = instance._memoize_cache
+                except AttributeError:
+                    cache = None
+                if cache is None:
+                    cache = instance._memoize_cache = [CACHE_MISS] * type(instance)._memoize_cnt
+                result = cache[slot]
+                if result is CACHE_MISS:
+                    stat.miss += 1
+                    result = cache[slot] = func(instance)
+                else:
+                    stat.hit += 1
+                return result
+        functools.update_wrapper(cached, func)
+        return cached
+
+
+def make_cache(func=None, *, deps: Optional[Tuple[str, ...]] = None):
+    """
+    缓存无参方法的结果，实例的缓存是一个定长list，存放在`_memoize_cache`槽位里
+    deps: 结果依赖的字段，invalidate_cache(obj, field)只失效依赖field的结果；不填表示依赖全部字段
+    用法：@make_cache 或 @make_cache(deps=("begin_klc",))
+    """
+    if func is None:
+        return lambda f: CCachedMethod(f, deps)
+    return CCachedMethod(func, deps)
+
 
-        # set key for this function
-        self.func_key = str(func)
+def _deps_slots(cls, field) -> List[int]:
+    # 依赖field的方法下标(包括没有声明deps的)
+    key = (cls, field)
+    slots = _DEPS_SLOTS.get(key)
+    if slots is None:
+        slots = _DEPS_SLOTS[key] = [m.slot for m in getattr(cls, "_memoize_methods", []) if m.deps is None or field in m.deps]
+    return slots
 
-    def __get__(self, instance, cls):
-        if instance is None:
-            raise Exception("@memoize's must be bound")
 
-        if not hasattr(instance, "_memoize_cache"):
-            setattr(instance, "_memoize_cache", {})
+def invalidate_cache(instance, field: Optional[str] = None):
+    # field为None时整体失效(把`_memoize_cache`置为None)，否则只失效依赖field的结果
+    cache = getattr(instance, "_memoize_cache", None)
+    if cache is None:
+        instance._memoize_cache = None
+        return
+    slots = None if field is None else _deps_slots(type(instance), field)
+    if _STATS_ENABLED:
+        methods = type(instance)._memoize_methods
+        for method in methods if slots is None else (methods[slot] for slot in slots):
+            if cache[method.slot] is not CACHE_MISS:
+                method.stat.invalidate += 1
+    if slots is None:
+        instance._memoize_cache = None
+    else:
+        for slot in slots:
+            cache[slot] = CACHE_MISS
 
-        return types.MethodType(self, instance)
 
-    def __call__(self, *args, **kwargs):
-        instance = args[0]
-        cache = instance._memoize_cache
+def enable_cache_stats(enable=True):
+    """
+    打开/关闭按方法统计命中、未命中、失效次数，关闭时没有额外开销
+    打开时会清零之前的统计
+    """
+    global _STATS_ENABLED
+    _STATS_ENABLED = enable
+    for method in _CACHED_METHODS:
+        method.stat = CCacheStat(method.stat.name)
+        setattr(method.owner, method.name, method.build())
 
-        if self.func_key in cache:
-            return cache[self.func_key]
 
-        result = self.func(*args, **kwargs)
-        cache[self.func_key] = result
-        return result
+def cache_stats() -> List[CCacheStat]:
+    return [method.stat for method in _CACHED_METHODS]
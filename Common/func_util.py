@@ -1,5 +1,9 @@
+from typing import Dict, List
+
 from .CEnum import BI_DIR, KL_TYPE
 
+_SLOT_NAMES: Dict[type, List[str]] = {}
+
 
 def kltype_lt_day(_type):
     return _type in [KL_TYPE.K_1M, KL_TYPE.K_5M, KL_TYPE.K_15M, KL_TYPE.K_30M, KL_TYPE.K_60M]
@@ -52,3 +56,20 @@ def _parse_inf(v):
         if v == float("-inf"):
             v = 'float("-inf")'
     return v
+
+
+def slot_names(cls) -> List[str]:
+    # 类及其基类__slots__里的字段名，私有字段按name mangling之后的名字返回
+    names = _SLOT_NAMES.get(cls)
+    if names is None:
+        names = []
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get("__slots__", ())
+            for name in (slots,) if isinstance(slots, str) else slots:
+                if name in ("__dict__", "__weakref__"):
+                    continue
+                if name.startswith("__") and not name.endswith("__"):
+                    name = f"_{klass.__name__.lstrip('_')}{name}"
+                names.append(name)
+        _SLOT_NAMES[cls] = names
+    return names
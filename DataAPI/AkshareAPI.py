@@ -50,6 +50,7 @@ def create_item_dict(row, autype):
 
 class CAkshare(CCommonStockApi):
     """使用 akshare 获取A股数据"""
+    is_thread_safe = True
 
     def __init__(self, code, k_type=KL_TYPE.K_DAY, begin_date=None, end_date=None, autype=AUTYPE.QFQ):
         super(CAkshare, self).__init__(code, k_type, begin_date, end_date, autype)
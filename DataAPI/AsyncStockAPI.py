@@ -0,0 +1,234 @@
+"""
+异步数据源接口：aget_kl_data是async generator，ado_init/ado_close是类级别的协程
+同步数据源可以用async_stock_api包装，多只股票用aload_chans并发拉取
+
+    async for code, chan, error in aload_chans(codes, data_src=CAsyncMockAPI, lv_list=[KL_TYPE.K_DAY], concurrency=8):
+        ...
+"""
+import abc
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import islice
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Type, Union
+
+from ChanConfig import CChanConfig
+from Common.CEnum import AUTYPE, DATA_SRC, KL_TYPE
+from Common.ChanException import CChanException, ErrCode
+from KLine.KLine_Unit import CKLine_Unit
+
+from .CommonStockAPI import CCommonStockApi
+from .Session import acquire_session, release_session
+
+
+class CAsyncStockApi:
+    """
+    和CCommonStockApi对应的异步接口，构造函数不做IO，基本信息在aSetBasciInfo里获取
+    """
+    def __init__(self, code, k_type, begin_date, end_date, autype):
+        self.code = code
+        self.name = None
+        self.is_stock = None
+        self.k_type = k_type
+        self.begin_date = begin_date
+        self.end_date = end_date
+        self.autype = autype
+
+    @abc.abstractmethod
+    def aget_kl_data(self) -> AsyncIterator[CKLine_Unit]:
+        pass
+
+    async def aSetBasciInfo(self):
+        pass
+
+    @classmethod
+    async def ado_init(cls):
+        pass
+
+    @classmethod
+    async def ado_close(cls):
+        pass
+
+
+@lru_cache(maxsize=None)
+def async_stock_api(api_cls: Type[CCommonStockApi], chunk_size=1024) -> Type[CAsyncStockApi]:
+    """
+    把同步数据源包装成异步接口：构造和读取都放到线程池里执行，每次从生成器取chunk_size根K线
+    is_thread_safe为False的数据源(比如baostock的全局会话)用一把锁串行访问
+    """
+    lock = None if api_cls.is_thread_safe else threading.Lock()
+
+    def call(func, *args):
+        if lock is None:
+            return func(*args)
+        with lock:
+            return func(*args)
+
+    class CAsyncAdapter(CAsyncStockApi):
+        upstream_cls = api_cls
+
+        def __init__(self, code, k_type, begin_date=None, end_date=None, autype=None):
+            super(CAsyncAdapter, self).__init__(code, k_type, begin_date, end_date, autype)
+            self.upstream: Optional[CCommonStockApi] = None
+
+        async def aSetBasciInfo(self):
+            self.upstream = await asyncio.to_thread(call, api_cls, self.code, self.k_type, self.begin_date, self.end_date, self.autype)
+            self.name = self.upstream.name
+            self.is_stock = self.upstream.is_stock
+
+        async def aget_kl_data(self):
+            if self.upstream is None:
+                await self.aSetBasciInfo()
+            it = iter(self.upstream.get_kl_data())
+            while True:
+                chunk = await asyncio.to_thread(call, lambda: list(islice(it, chunk_size)))
+                for klu in chunk:
+                    yield klu
+                if len(chunk) < chunk_size:
+                    return
+
+        @classmethod
+        async def ado_init(cls):
+            await asyncio.to_thread(call, acquire_session, api_cls)
+
+        @classmethod
+        async def ado_close(cls):
+            await asyncio.to_thread(call, release_session, api_cls)
+
+    CAsyncAdapter.__name__ = CAsyncAdapter.__qualname__ = f"CAsync_{api_cls.__name__}"
+    return CAsyncAdapter
+
+
+def replay_stock_api(data: Dict[KL_TYPE, Union[List[CKLine_Unit], CChanException]], name=None, is_stock=None) -> Type[CCommonStockApi]:
+    """
+    把已经拉好的各级别K线包装成同步数据源，作为CChan的data_src，走和普通数据源完全一样的加载流程
+    某个级别拉取失败时data里放对应的CChanException，构造该级别时抛出，auto_skip_illegal_sub_lv照常生效
+    """
+    class CReplayStockApi(CCommonStockApi):
+        is_thread_safe = True
+        cacheable = False
+
+        def __init__(self, code, k_type, begin_date=None, end_date=None, autype=None):
+            if isinstance(data.get(k_type), CChanException):
+                raise data[k_type]
+            if k_type not in data:
+                raise CChanException(f"{code}没有{k_type}级别的数据", ErrCode.SRC_DATA_NOT_FOUND)
+            super(CReplayStockApi, self).__init__(code, k_type, begin_date, end_date, autype)
+
+        def get_kl_data(self):
+            return iter(data[self.k_type])
+
+        def SetBasciInfo(self):
+            self.name = name
+            self.is_stock = is_stock
+
+        @classmethod
+        def do_init(cls):
+            pass
+
+        @classmethod
+        def do_close(cls):
+            pass
+
+    return CReplayStockApi
+
+
+async def afetch_levels(api_cls: Type[CAsyncStockApi], code, lv_list, begin_time, end_time, autype, semaphore: asyncio.Semaphore):
+    # 各级别同时请求，每个请求占用一个semaphore名额
+    info = {}
+
+    async def fetch(lv):
+        async with semaphore:
+            api = api_cls(code, lv, begin_time, end_time, autype)
+            try:
+                await api.aSetBasciInfo()
+                klus = [klu async for klu in api.aget_kl_data()]
+            except CChanException as e:
+                if e.errcode != ErrCode.SRC_DATA_NOT_FOUND:
+                    raise
+                return e
+            info.setdefault("name", api.name)
+            info.setdefault("is_stock", api.is_stock)
+            return klus
+
+    results = await asyncio.gather(*(fetch(lv) for lv in lv_list))
+    return dict(zip(lv_list, results)), info
+
+
+async def aload_chans(
+    codes,
+    begin_time=None,
+    end_time=None,
+    data_src: Union[DATA_SRC, str, Type[CAsyncStockApi], Type[CCommonStockApi]] = DATA_SRC.BAO_STOCK,
+    lv_list=None,
+    config=None,
+    autype: AUTYPE = AUTYPE.QFQ,
+    concurrency=8,
+    max_pending: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, object, Optional[str]]]:
+    """
+    并发拉取多只股票，同时最多concurrency个请求在途；某只股票所有级别拉完后交给一个后台线程构造CChan，
+    计算期间事件循环继续收发其他请求，按完成顺序yield (code, chan, error)，出错的股票chan为None，error为错误信息
+    max_pending: 开始拉取但还没构造完的股票数上限(默认2*concurrency)，构造跟不上时拉好的K线不会无限堆积
+    data_src为同步数据源(DATA_SRC、"custom:..."或类)时自动用async_stock_api包装，配置了bar_cache_dir时先套本地缓存
+    """
+    from Chan import CChan, get_stock_api_cls
+    if lv_list is None:
+        lv_list = [KL_TYPE.K_DAY, KL_TYPE.K_60M]
+    if config is None:
+        config = CChanConfig()
+    if isinstance(data_src, type) and issubclass(data_src, CAsyncStockApi):
+        api_cls = data_src
+    else:
+        api_cls = get_stock_api_cls(data_src)
+        if config.bar_cache_dir is not None and api_cls.cacheable:
+            from .BarCache import cached_stock_api
+            api_cls = cached_stock_api(api_cls, config.bar_cache_dir)
+        api_cls = async_stock_api(api_cls)
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = asyncio.Semaphore(max_pending or 2 * concurrency)
+    executor = ThreadPoolExecutor(max_workers=1)  # CChan计算是CPU密集的，一个线程按顺序算，结果不受线程调度影响
+
+    async def load_one(code):
+        async with pending:  # 从开始拉取一直占到CChan构造完
+            try:
+                data, info = await afetch_levels(api_cls, code, lv_list, begin_time, end_time, autype, semaphore)
+                chan = await asyncio.get_running_loop().run_in_executor(executor, partial(
+                    CChan,
+                    code=code,
+                    begin_time=begin_time,
+                    end_time=end_time,
+                    data_src=replay_stock_api(data, **info),
+                    lv_list=list(lv_list),
+                    config=config,
+                    autype=autype,
+                ))
+            except Exception as e:
+                return code, None, f"{type(e).__name__}: {e}"
+        return code, chan, None
+
+    await api_cls.ado_init()
+    tasks = [asyncio.ensure_future(load_one(code)) for code in codes]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        executor.shutdown(wait=False)
+        await api_cls.ado_close()
+
+
+def load_chans(codes, **kwargs) -> Tuple[Dict[str, object], Dict[str, str]]:
+    # aload_chans的同步入口，返回({code: chan}, {code: 错误信息})
+    async def collect():
+        chans, errors = {}, {}
+        async for code, chan, error in aload_chans(codes, **kwargs):
+            if error is None:
+                chans[code] = chan
+            else:
+                errors[code] = error
+        return chans, errors
+    return asyncio.run(collect())
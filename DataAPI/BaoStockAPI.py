@@ -1,3 +1,6 @@
+import os
+import threading
+
 import baostock as bs
 
 from Common.CEnum import AUTYPE, DATA_FIELD, KL_TYPE
@@ -6,6 +9,7 @@ from Common.func_util import kltype_lt_day, str2float
 from KLine.KLine_Unit import CKLine_Unit
 
 from .CommonStockAPI import CCommonStockApi
+from .Session import cached_basic_info
 
 
 def create_item_dict(data, column_name):
@@ -56,6 +60,8 @@ def GetColumnNameFromFieldList(fileds: str):
 
 class CBaoStock(CCommonStockApi):
     is_connect = None
+    connect_pid = None  # fork出来的子进程不能沿用父进程的登录
+    query_lock = threading.RLock()  # baostock的会话是全局的一个socket，多线程时请求要串行
 
     def __init__(self, code, k_type=KL_TYPE.K_DAY, begin_date=None, end_date=None, autype=AUTYPE.QFQ):
         super(CBaoStock, self).__init__(code, k_type, begin_date, end_date, autype)
@@ -69,37 +75,49 @@ class CBaoStock(CCommonStockApi):
         else:
             fields = "date,open,high,low,close,volume,amount,turn"
         autype_dict = {AUTYPE.QFQ: "2", AUTYPE.HFQ: "1", AUTYPE.NONE: "3"}
-        rs = bs.query_history_k_data_plus(
-            code=self.code,
-            fields=fields,
-            start_date=self.begin_date,
-            end_date=self.end_date,
-            frequency=self.__convert_type(),
-            adjustflag=autype_dict[self.autype],
-        )
-        if rs.error_code != '0':
-            raise Exception(rs.error_msg)
-        while rs.error_code == '0' and rs.next():
-            yield CKLine_Unit(create_item_dict(rs.get_row_data(), GetColumnNameFromFieldList(fields)))
+        with self.query_lock:
+            rs = bs.query_history_k_data_plus(
+                code=self.code,
+                fields=fields,
+                start_date=self.begin_date,
+                end_date=self.end_date,
+                frequency=self.__convert_type(),
+                adjustflag=autype_dict[self.autype],
+            )
+            if rs.error_code != '0':
+                raise Exception(rs.error_msg)
+            rows = []
+            while rs.error_code == '0' and rs.next():
+                rows.append(rs.get_row_data())
+        column_name = GetColumnNameFromFieldList(fields)
+        for row in rows:
+            yield CKLine_Unit(create_item_dict(row, column_name))
 
     def SetBasciInfo(self):
-        rs = bs.query_stock_basic(code=self.code)
-        if rs.error_code != '0':
-            raise Exception(rs.error_msg)
-        code, code_name, ipoDate, outDate, stock_type, status = rs.get_row_data()
-        self.name = code_name
-        self.is_stock = (stock_type == '1')
+        self.name, self.is_stock = cached_basic_info(CBaoStock, self.code, self.query_basic_info)
+
+    def query_basic_info(self):
+        with self.query_lock:
+            rs = bs.query_stock_basic(code=self.code)
+            if rs.error_code != '0':
+                raise Exception(rs.error_msg)
+            code, code_name, ipoDate, outDate, stock_type, status = rs.get_row_data()
+        return code_name, stock_type == '1'
 
     @classmethod
     def do_init(cls):
-        if not cls.is_connect:
-            cls.is_connect = bs.login()
+        with cls.query_lock:
+            if not cls.is_connect or cls.connect_pid != os.getpid():
+                cls.is_connect = bs.login()
+                cls.connect_pid = os.getpid()
 
     @classmethod
     def do_close(cls):
-        if cls.is_connect:
-            bs.logout()
+        with cls.query_lock:
+            if cls.is_connect and cls.connect_pid == os.getpid():
+                bs.logout()
             cls.is_connect = None
+            cls.connect_pid = None
 
     def __convert_type(self):
         _dict = {
@@ -0,0 +1,327 @@
+"""
+本地K线二进制缓存：把任意CCommonStockApi数据源拉到的K线按(code, 级别, 复权)存成定长记录，
+之后同一区间的请求直接mmap读取，按时间列二分查找截取，不再解析文本也不再访问上游；
+截止日期超出已缓存区间时(比如每天收盘后重新扫描到今天)只向上游拉取缓存最后一个交易日之后的尾部
+
+    CChanConfig({"bar_cache_dir": "./bar_cache"})  # CChan会自动包装数据源
+    CachedApi = cached_stock_api(CBaoStock, "./bar_cache")  # 或者手动包装
+"""
+import datetime
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import uuid
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy as np
+
+from Common.CEnum import DATA_FIELD, TRADE_INFO_LST
+from KLine.KLine_Store import decode_times, encode_time
+from KLine.KLine_Unit import CKLine_Unit
+
+from .CommonStockAPI import CCommonStockApi
+from .Session import acquire_session, release_session
+
+BAR_CACHE_MAGIC = b"CHANBAR\0"
+BAR_CACHE_VERSION = 1
+_PRELUDE = struct.Struct("<8sII")  # magic, version, 数据区偏移
+_ALIGN = 64
+
+_PRICE_FIELDS = [DATA_FIELD.FIELD_OPEN, DATA_FIELD.FIELD_HIGH, DATA_FIELD.FIELD_LOW, DATA_FIELD.FIELD_CLOSE]
+BAR_DTYPE = np.dtype([("time_key", "<i8")] + [(field, "<f8") for field in _PRICE_FIELDS + TRADE_INFO_LST])  # 成交信息缺失时为nan
+
+
+def date_key(date_str: Optional[str], end: bool) -> Optional[int]:
+    # 把begin_date/end_date转成encode_time同一套编码的边界，end只给到日期时包含当天全部K线
+    if date_str is None:
+        return None
+    digits = re.sub(r"\D", "", str(date_str))
+    if len(digits) < 8:
+        raise ValueError(f"unknown date format: {date_str}")
+    clock = int(digits[8:14].ljust(6, "0")) if len(digits) > 8 else (235959 if end else 0)
+    key = int(digits[:8]) * 1000000 + clock
+    return key * 2 + int(end)
+
+
+def key_date(time_key: int) -> str:
+    # encode_time编码对应的日期，作为向上游请求的begin_date
+    digits = str((int(time_key) >> 1) // 1000000)
+    return f"{digits[:4]}-{digits[4:6]}-{digits[6:8]}"
+
+
+def _earlier(a: Optional[str], b: Optional[str], end: bool) -> Optional[str]:
+    # 按date_key比较日期字符串，None表示不限
+    if a is None or b is None:
+        return None
+    return a if date_key(a, end) <= date_key(b, end) else b
+
+
+def _later(a: Optional[str], b: Optional[str], end: bool) -> Optional[str]:
+    if a is None or b is None:
+        return None
+    return a if date_key(a, end) >= date_key(b, end) else b
+
+
+class CBarFile:
+    """
+    单个(code, 级别, 复权)的缓存文件：定长头 + json元信息 + 64字节对齐的定长记录
+    meta记录已覆盖的日期区间、股票名等基本信息
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.meta: Optional[dict] = None
+        self.bars: Optional[np.ndarray] = None
+        self.__mm: Optional[mmap.mmap] = None
+
+    def open(self) -> bool:
+        # 文件不存在或者版本不对时返回False，按未命中处理
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _PRELUDE.size:
+                return False
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, data_offset = _PRELUDE.unpack_from(mm, 0)
+        if magic != BAR_CACHE_MAGIC or version != BAR_CACHE_VERSION or data_offset > size:
+            mm.close()
+            return False
+        self.meta = json.loads(bytes(mm[_PRELUDE.size:data_offset]).rstrip(b"\0"))
+        self.bars = np.frombuffer(mm, dtype=BAR_DTYPE, offset=data_offset, count=self.meta["count"])
+        self.__mm = mm
+        return True
+
+    def close(self):
+        self.bars = None
+        if self.__mm is not None:
+            try:
+                self.__mm.close()
+            except BufferError:  # 还有外部引用的切片，交给gc
+                pass
+            self.__mm = None
+
+    def covers(self, begin_key: Optional[int], end_key: Optional[int]) -> bool:
+        # 截止日期为空表示要到最新，总是需要重新拉取
+        cache_begin = self.meta["begin_key"]
+        if cache_begin is not None and (begin_key is None or begin_key < cache_begin):
+            return False
+        return end_key is not None and end_key <= self.meta["end_key"]
+
+    def slice(self, begin_key: Optional[int], end_key: Optional[int]) -> np.ndarray:
+        time_key = self.bars["time_key"]
+        begin = 0 if begin_key is None else int(np.searchsorted(time_key, begin_key, side="left"))
+        end = len(time_key) if end_key is None else int(np.searchsorted(time_key, end_key, side="right"))
+        return self.bars[begin:end]
+
+    @staticmethod
+    def write(path: str, bars: np.ndarray, meta: dict):
+        meta = dict(meta, count=len(bars))
+        header = json.dumps(meta, ensure_ascii=False).encode()
+        data_offset = -(-(_PRELUDE.size + len(header)) // _ALIGN) * _ALIGN
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"  # 多个进程/线程同时写同一个缓存文件时互不覆盖
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(_PRELUDE.pack(BAR_CACHE_MAGIC, BAR_CACHE_VERSION, data_offset))
+                f.write(header.ljust(data_offset - _PRELUDE.size, b"\0"))
+                f.write(np.ascontiguousarray(bars, dtype=BAR_DTYPE).tobytes())
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)  # 多进程扫描时读到的要么是旧文件要么是新文件
+
+
+def klus_to_bars(klus: List[CKLine_Unit]) -> np.ndarray:
+    bars = np.empty(len(klus), dtype=BAR_DTYPE)
+    bars["time_key"] = [encode_time(klu.time) for klu in klus]
+    for field in _PRICE_FIELDS:
+        bars[field] = [getattr(klu, field) for klu in klus]
+    for field in TRADE_INFO_LST:
+        bars[field] = [np.nan if klu.trade_info.metric[field] is None else klu.trade_info.metric[field] for klu in klus]
+    return bars
+
+
+def bars_to_klus(bars: np.ndarray):
+    times = decode_times(bars["time_key"])
+    columns: List[Tuple[str, list]] = [(field, bars[field].tolist()) for field in _PRICE_FIELDS]
+    for field in TRADE_INFO_LST:
+        values = bars[field]
+        nan_mask = np.isnan(values)
+        if nan_mask.all():
+            continue  # 整列缺失，和上游一样不给这个字段
+        values = values.astype(object)
+        values[nan_mask] = None
+        columns.append((field, values.tolist()))
+    names = [DATA_FIELD.FIELD_TIME] + [name for name, _ in columns]
+    for row in zip(times, *(values for _, values in columns)):
+        yield CKLine_Unit(dict(zip(names, row)))
+
+
+class CBarCache:
+    """
+    按(code, 级别, 复权)管理缓存文件；请求区间被已缓存区间覆盖时直接截取，
+    只是截止日期超出时拉取尾部接上(和缓存最后一个交易日的K线对不上时整段重新拉取)，否则向上游拉取两者的并集后重写文件
+    截止日期为空或者不早于拉取当天时，当天及以后的K线可能还没走完，只把前一天之前的部分记为已覆盖
+    """
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hit = 0
+        self.miss = 0
+
+    def file_path(self, code, k_type, autype) -> str:
+        autype_name = autype.name if autype is not None else "NONE"
+        safe_code = re.sub(r"[^0-9A-Za-z._-]", "_", str(code))
+        return os.path.join(self.cache_dir, f"{safe_code}_{k_type.name}_{autype_name}.bar")
+
+    def lookup(self, code, k_type, autype, begin_date, end_date) -> Optional[CBarFile]:
+        # 命中时返回已打开的文件
+        bar_file = CBarFile(self.file_path(code, k_type, autype))
+        if bar_file.open():
+            if bar_file.covers(date_key(begin_date, end=False), date_key(end_date, end=True)):
+                self.hit += 1
+                return bar_file
+            bar_file.close()
+        self.miss += 1
+        return None
+
+    def fetch_range(self, code, k_type, autype, begin_date, end_date) -> Tuple[Optional[str], Optional[str], Optional[np.ndarray]]:
+        """
+        需要向上游请求的区间：本次请求和已缓存区间的并集，保证重写之后旧区间仍然可用
+        已缓存区间覆盖了请求的开始时，第三个返回值是缓存里已完成(不晚于end_key)的K线，只需要拉取它最后一个交易日起的尾部；
+        否则为None，整段重新拉取
+        """
+        bar_file = CBarFile(self.file_path(code, k_type, autype))
+        if not bar_file.open():
+            return begin_date, end_date, None
+        meta = bar_file.meta
+        keep = None
+        begin_key, cache_begin = date_key(begin_date, end=False), meta["begin_key"]
+        if cache_begin is None or (begin_key is not None and begin_key >= cache_begin):
+            keep = bar_file.slice(None, meta["end_key"]).copy()
+            begin_date = meta["begin_date"]
+            if len(keep) == 0:
+                keep = None
+        else:
+            begin_date = _earlier(begin_date, meta["begin_date"], end=False)
+        bar_file.close()
+        return begin_date, _later(end_date, meta["end_date"], end=True), keep
+
+    @staticmethod
+    def merge_tail(keep: np.ndarray, tail: np.ndarray) -> Optional[np.ndarray]:
+        """
+        tail从keep最后一个交易日开始，这一天的K线两边都有；重叠部分不一致时(比如前复权因子变了)返回None，需要整段重新拉取
+        """
+        overlap = keep[keep["time_key"] >= date_key(key_date(keep["time_key"][-1]), end=False)]
+        if len(tail) < len(overlap):
+            return None
+        tail_overlap = tail[:len(overlap)]
+        if not all(np.array_equal(overlap[field], tail_overlap[field], equal_nan=field != "time_key") for field in BAR_DTYPE.names):
+            return None
+        return np.concatenate([keep, tail[len(overlap):]])
+
+    def store(self, code, k_type, autype, begin_date, end_date, bars: np.ndarray, info: Dict[str, object]):
+        today = datetime.date.today()
+        last_done = str(today - datetime.timedelta(days=1))
+        end_key = date_key(end_date, end=True)
+        if end_date is None or end_key >= date_key(str(today), end=False):
+            end_key = date_key(last_done, end=True)
+        CBarFile.write(self.file_path(code, k_type, autype), bars, {
+            "begin_date": begin_date,
+            "end_date": end_date,
+            "begin_key": date_key(begin_date, end=False),
+            "end_key": end_key,
+            "info": info,
+        })
+
+
+@lru_cache(maxsize=None)
+def cached_stock_api(api_cls: Type[CCommonStockApi], cache_dir: str) -> Type[CCommonStockApi]:
+    """
+    生成包装了api_cls的数据源类，接口和api_cls一致
+    命中缓存时不会实例化上游数据源，也不会调用上游的do_init(比如baostock登录)
+    """
+    cache = CBarCache(cache_dir)
+
+    class CCachedStockApi(CCommonStockApi):
+        upstream_cls = api_cls
+        is_thread_safe = api_cls.is_thread_safe
+        bar_cache = cache
+        upstream_inited = False
+        upstream_lock = threading.Lock()
+
+        def __init__(self, code, k_type, begin_date=None, end_date=None, autype=None):
+            self.__upstream: Optional[CCommonStockApi] = None
+            self.__bar_file = cache.lookup(code, k_type, autype, begin_date, end_date)
+            super(CCachedStockApi, self).__init__(code, k_type, begin_date, end_date, autype)
+
+        def upstream(self, begin_date, end_date) -> CCommonStockApi:
+            cls = type(self)
+            with cls.upstream_lock:
+                if not cls.upstream_inited:
+                    acquire_session(api_cls)
+                    cls.upstream_inited = True
+            return api_cls(code=self.code, k_type=self.k_type, begin_date=begin_date, end_date=end_date, autype=self.autype)
+
+        def get_kl_data(self):
+            if self.__bar_file is not None:
+                try:
+                    yield from bars_to_klus(self.__bar_file.slice(date_key(self.begin_date, end=False), date_key(self.end_date, end=True)))
+                finally:
+                    self.__bar_file.close()
+                return
+            begin_date, end_date, keep = cache.fetch_range(self.code, self.k_type, self.autype, self.begin_date, self.end_date)
+            bars = None
+            if keep is not None:
+                upstream = self.upstream(key_date(keep["time_key"][-1]), end_date)
+                bars = cache.merge_tail(keep, self.fetch_bars(upstream))
+            if bars is None:
+                upstream = self.__upstream
+                if upstream is None or (begin_date, end_date) != (self.begin_date, self.end_date):
+                    upstream = self.upstream(begin_date, end_date)
+                bars = self.fetch_bars(upstream)
+            info = {"name": upstream.name, "is_stock": upstream.is_stock}
+            cache.store(self.code, self.k_type, self.autype, begin_date, end_date, bars, info)
+            bar_file = CBarFile(cache.file_path(self.code, self.k_type, self.autype))
+            bar_file.open()
+            try:
+                # 统一从缓存读出，保证命中和未命中时给出的K线完全一致
+                yield from bars_to_klus(bar_file.slice(date_key(self.begin_date, end=False), date_key(self.end_date, end=True)))
+            finally:
+                bar_file.close()
+
+        @staticmethod
+        def fetch_bars(upstream: CCommonStockApi) -> np.ndarray:
+            bars = upstream.get_kl_bars() if hasattr(upstream, "get_kl_bars") else None  # 能直接给出定长记录的数据源不用先构造K线
+            if bars is None:
+                bars = klus_to_bars(list(upstream.get_kl_data()))
+            return bars
+
+        def SetBasciInfo(self):
+            if self.__bar_file is not None:
+                self.name = self.__bar_file.meta["info"]["name"]
+                self.is_stock = self.__bar_file.meta["info"]["is_stock"]
+                return
+            self.__upstream = self.upstream(self.begin_date, self.end_date)
+            self.name = self.__upstream.name
+            self.is_stock = self.__upstream.is_stock
+
+        @classmethod
+        def do_init(cls):
+            pass
+
+        @classmethod
+        def do_close(cls):
+            with cls.upstream_lock:
+                if cls.upstream_inited:
+                    release_session(api_cls)
+                    cls.upstream_inited = False
+
+    CCachedStockApi.__name__ = CCachedStockApi.__qualname__ = f"CCached_{api_cls.__name__}"
+    return CCachedStockApi
@@ -5,6 +5,9 @@ from KLine.KLine_Unit import CKLine_Unit
 
 
 class CCommonStockApi:
+    is_thread_safe = False  # 不同实例能否在多个线程里同时取数据，为True时才支持CChanConfig的parallel_load
+    cacheable = True  # 为False时不套bar_cache_dir的本地缓存(比如数据本来就在内存里)
+
     def __init__(self, code, k_type, begin_date, end_date, autype):
         self.code = code
         self.name = None
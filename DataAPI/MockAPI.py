@@ -0,0 +1,189 @@
+import asyncio
+import datetime
+import os
+import random
+import zlib
+from collections import Counter
+from time import sleep
+from typing import Optional
+
+from Common.CEnum import AUTYPE, DATA_FIELD, KL_TYPE
+from Common.ChanException import CChanException, ErrCode
+from Common.CTime import CTime
+from KLine.KLine_Unit import CKLine_Unit
+
+from .AsyncStockAPI import CAsyncStockApi
+from .CommonStockAPI import CCommonStockApi
+from .Session import cached_basic_info
+
+# A股交易时段，K线时间描述的是结束时间
+_SESSIONS = [(9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60)]
+_ORIGIN = datetime.date(2015, 1, 1)  # 随机游走的起点，之后的K线和请求的开始日期无关
+_MINUTE_LV = {
+    KL_TYPE.K_1M: 1,
+    KL_TYPE.K_3M: 3,
+    KL_TYPE.K_5M: 5,
+    KL_TYPE.K_15M: 15,
+    KL_TYPE.K_30M: 30,
+    KL_TYPE.K_60M: 60,
+}
+
+
+def _parse_date(date_str, default):
+    if date_str is None:
+        return default
+    digits = "".join(ch for ch in date_str if ch.isdigit())  # 2015-01-01或者20150101
+    return datetime.date(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+
+
+def _trade_days(begin: datetime.date, end: datetime.date):
+    day = begin
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += datetime.timedelta(days=1)
+
+
+def _bar_times(k_type, begin: datetime.date, end: datetime.date):
+    if k_type in _MINUTE_LV:
+        step = _MINUTE_LV[k_type]
+        for day in _trade_days(begin, end):
+            for session_begin, session_end in _SESSIONS:
+                for minute in range(session_begin + step, session_end + 1, step):
+                    yield CTime(day.year, day.month, day.day, minute // 60, minute % 60)
+    elif k_type == KL_TYPE.K_DAY:
+        for day in _trade_days(begin, end):
+            yield CTime(day.year, day.month, day.day, 0, 0)
+    elif k_type in (KL_TYPE.K_WEEK, KL_TYPE.K_MON):
+        last_day = None
+        for day in _trade_days(begin, end):
+            if last_day is not None:
+                if (k_type == KL_TYPE.K_WEEK and day.isocalendar()[1] != last_day.isocalendar()[1]) or \
+                   (k_type == KL_TYPE.K_MON and day.month != last_day.month):
+                    yield CTime(last_day.year, last_day.month, last_day.day, 0, 0)
+            last_day = day
+        if last_day is not None:
+            yield CTime(last_day.year, last_day.month, last_day.day, 0, 0)
+    else:
+        raise CChanException(f"mock数据源不支持{k_type}级别", ErrCode.SRC_DATA_NOT_FOUND)
+
+
+class CMockAPI(CCommonStockApi):
+    """
+    本地模拟数据源，按code和级别生成确定性的随机游走K线，不依赖网络
+    用于benchmark和测试：data_src="custom:MockAPI.CMockAPI"
+    """
+    is_thread_safe = True
+    latency = 0.0  # 模拟网络延迟：每页数据返回前等待的秒数
+    page_size: Optional[int] = None  # 每页K线数，None表示一次请求返回全部
+
+    def __init__(self, code, k_type=KL_TYPE.K_DAY, begin_date=None, end_date=None, autype=AUTYPE.QFQ):
+        super(CMockAPI, self).__init__(code, k_type, begin_date, end_date, autype)
+
+    def get_kl_data(self):
+        begin = _parse_date(self.begin_date, _ORIGIN)
+        end = _parse_date(self.end_date, datetime.date(2024, 12, 31))
+        begin_time = CTime(begin.year, begin.month, begin.day, 0, 0, auto=False)
+        rnd = random.Random(zlib.crc32(f"{self.code}_{self.k_type.name}".encode()))
+        base_price = price = round(10.0 + rnd.random() * 90, 2)
+        idx = 0
+        for time in _bar_times(self.k_type, min(begin, _ORIGIN), end):
+            skip = time < begin_time  # 和真实数据源一样，同一根K线不会因为请求的开始日期不同而变化
+            if not skip and self.latency and (idx == 0 if self.page_size is None else idx % self.page_size == 0):
+                sleep(self.latency)
+            _open = price
+            drift = 0.001 * (base_price - _open) / base_price  # 均值回归，防止长历史价格发散
+            close = max(0.01, round(_open * (1 + drift + rnd.gauss(0, 0.01)), 2))
+            high = round(max(_open, close) * (1 + abs(rnd.gauss(0, 0.004))), 2)
+            low = round(min(_open, close) * (1 - abs(rnd.gauss(0, 0.004))), 2)
+            volume = rnd.randint(1000, 100000)
+            price = close
+            if skip:
+                continue
+            idx += 1
+            yield CKLine_Unit({
+                DATA_FIELD.FIELD_TIME: time,
+                DATA_FIELD.FIELD_OPEN: _open,
+                DATA_FIELD.FIELD_HIGH: max(high, _open, close),
+                DATA_FIELD.FIELD_LOW: min(low, _open, close),
+                DATA_FIELD.FIELD_CLOSE: close,
+                DATA_FIELD.FIELD_VOLUME: volume,
+                DATA_FIELD.FIELD_TURNOVER: volume * close,
+                DATA_FIELD.FIELD_TURNRATE: volume / 1e6,
+            })
+
+    def SetBasciInfo(self):
+        self.name = self.code
+        self.is_stock = True
+
+    @classmethod
+    def do_init(cls):
+        pass
+
+    @classmethod
+    def do_close(cls):
+        pass
+
+
+class CMockSessionAPI(CMockAPI):
+    """
+    模拟需要登录的数据源(类似baostock)：登录、查询基本信息、拉K线都算一次往返并等待对应的延迟，
+    round_trips记录各类请求次数，用于对比会话复用前后的请求数
+    """
+    login_latency = 0.0
+    query_latency = 0.0
+    round_trips: Counter = Counter()
+    connect_pid = None
+    cache_basic_info = True
+
+    def get_kl_data(self):
+        self.round_trip("kl_data", self.query_latency)
+        yield from super(CMockSessionAPI, self).get_kl_data()
+
+    def SetBasciInfo(self):
+        if not self.cache_basic_info:
+            self.name, self.is_stock = self.query_basic_info()
+            return
+        self.name, self.is_stock = cached_basic_info(CMockSessionAPI, self.code, self.query_basic_info)
+
+    def query_basic_info(self):
+        self.round_trip("basic_info", self.query_latency)
+        return self.code, True
+
+    @classmethod
+    def round_trip(cls, kind, latency):
+        cls.round_trips[kind] += 1
+        if latency:
+            sleep(latency)
+
+    @classmethod
+    def do_init(cls):
+        if cls.connect_pid != os.getpid():
+            cls.round_trip("login", cls.login_latency)
+            cls.connect_pid = os.getpid()
+
+    @classmethod
+    def do_close(cls):
+        if cls.connect_pid == os.getpid():
+            cls.round_trip("logout", cls.login_latency)
+        cls.connect_pid = None
+
+
+class CAsyncMockAPI(CAsyncStockApi):
+    """
+    CMockAPI的异步版本，K线完全相同；每页数据返回前await asyncio.sleep(latency)，模拟网络请求
+    """
+    latency = 0.0
+    page_size: Optional[int] = None
+
+    async def aSetBasciInfo(self):
+        self.name = self.code
+        self.is_stock = True
+
+    async def aget_kl_data(self):
+        api = CMockAPI(self.code, self.k_type, self.begin_date, self.end_date, self.autype)
+        api.latency = 0.0
+        for idx, klu in enumerate(api.get_kl_data()):
+            if self.latency and (idx == 0 if self.page_size is None else idx % self.page_size == 0):
+                await asyncio.sleep(self.latency)
+            yield klu
@@ -0,0 +1,71 @@
+import queue
+import threading
+from typing import Callable, Iterable, List
+
+_READY = object()
+_END = object()
+
+
+class _CFailure:
+    __slots__ = ("exc",)
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+class CPrefetchIter:
+    """
+    后台线程调用make_iter()并把结果分块读进缓冲区，用于多个级别同时拉取网络数据
+    构造数据源(make_iter)时的异常在wait_ready时抛出，读取过程中的异常在迭代到对应位置时抛出
+    消费方只在一个线程里按顺序读取，所以合并和父子关系的建立仍然是确定的
+    """
+    def __init__(self, make_iter: Callable[[], Iterable], chunk_size=1024):
+        self.queue: queue.Queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.chunk_size = chunk_size
+        self.thread = threading.Thread(target=self.run, args=(make_iter,), daemon=True)
+        self.thread.start()
+
+    def run(self, make_iter):
+        try:
+            it = make_iter()
+        except BaseException as e:
+            self.queue.put(_CFailure(e))
+            return
+        self.queue.put(_READY)
+        chunk: List = []
+        try:
+            for item in it:
+                if self.stop_event.is_set():  # 每取到一根就检查，慢数据源停下时不用等凑满一块
+                    return
+                chunk.append(item)
+                if len(chunk) >= self.chunk_size:
+                    self.queue.put(chunk)
+                    chunk = []
+            if chunk:
+                self.queue.put(chunk)
+            self.queue.put(_END)
+        except BaseException as e:
+            if chunk:  # 出错前读到的部分先交出去，和串行读取一样在出错的位置才抛出
+                self.queue.put(chunk)
+            self.queue.put(_CFailure(e))
+
+    def wait_ready(self):
+        msg = self.queue.get()
+        if isinstance(msg, _CFailure):
+            raise msg.exc
+
+    def stop(self):
+        self.stop_event.set()
+
+    def __iter__(self):
+        try:
+            while True:
+                msg = self.queue.get()
+                if msg is _END:
+                    return
+                if isinstance(msg, _CFailure):
+                    raise msg.exc
+                yield from msg
+        finally:
+            self.stop()
@@ -0,0 +1,106 @@
+"""
+数据源会话管理：CChan.load每次都会do_init/do_close，对baostock这种需要登录的数据源就是每只股票一次登录登出
+这里按数据源类做引用计数，在stock_session块内或者keep_session_alive之后，多次构建CChan复用同一个会话
+
+    with stock_session(CBaoStock):
+        for code in code_list:
+            chan = CChan(code, data_src=DATA_SRC.BAO_STOCK, ...)
+
+计数按进程区分，fork出来的子进程不会沿用父进程的计数，会在第一次用到时重新登录
+"""
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from multiprocessing.util import Finalize
+from typing import Callable, Dict, Tuple, Type
+
+from .CommonStockAPI import CCommonStockApi
+
+_lock = threading.RLock()
+_pid = os.getpid()
+_ref_cnt: Dict[Type[CCommonStockApi], int] = defaultdict(int)  # 正在使用会话的CChan.load数
+_hold_cnt: Dict[Type[CCommonStockApi], int] = defaultdict(int)  # 要求空闲时也不关闭的stock_session数
+_opened = set()
+_basic_info: Dict[Tuple[Type[CCommonStockApi], str], Tuple[object, object]] = {}
+
+
+def _check_fork():
+    global _pid
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _ref_cnt.clear()
+        _hold_cnt.clear()  # 父进程stock_session块的计数也不沿用，否则子进程用完不会登出
+        _opened.clear()
+
+
+def acquire_session(api_cls: Type[CCommonStockApi]):
+    with _lock:
+        _check_fork()
+        if api_cls not in _opened:
+            api_cls.do_init()
+            _opened.add(api_cls)
+        _ref_cnt[api_cls] += 1
+
+
+def release_session(api_cls: Type[CCommonStockApi]):
+    with _lock:
+        _check_fork()
+        if _ref_cnt[api_cls] > 0:
+            _ref_cnt[api_cls] -= 1
+        _close_if_idle(api_cls)
+
+
+def _close_if_idle(api_cls):
+    if _ref_cnt[api_cls] == 0 and _hold_cnt[api_cls] == 0 and api_cls in _opened:
+        _opened.discard(api_cls)
+        api_cls.do_close()
+
+
+@contextmanager
+def stock_session(api_cls: Type[CCommonStockApi]):
+    """
+    块内复用同一个会话：第一次用到时才do_init，块结束并且没有其他使用者时do_close
+    """
+    with _lock:
+        _check_fork()
+        _hold_cnt[api_cls] += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _check_fork()
+            _hold_cnt[api_cls] -= 1
+            _close_if_idle(api_cls)
+
+
+def keep_session_alive(api_cls: Type[CCommonStockApi]):
+    # 当前进程退出前一直保持会话，用于进程池的worker初始化
+    with _lock:
+        _check_fork()
+        _hold_cnt[api_cls] += 1
+    Finalize(None, _release_hold, args=(api_cls,), exitpriority=0)
+
+
+def _release_hold(api_cls):
+    with _lock:
+        _check_fork()
+        _hold_cnt[api_cls] = max(_hold_cnt[api_cls] - 1, 0)
+        _close_if_idle(api_cls)
+
+
+def cached_basic_info(api_cls: Type[CCommonStockApi], code: str, load: Callable[[], Tuple[object, object]]) -> Tuple[object, object]:
+    """
+    按(数据源, code)缓存(name, is_stock)，同一只股票的多个级别、多次构建只查询一次
+    """
+    key = (api_cls, code)
+    if key not in _basic_info:
+        info = load()
+        with _lock:
+            _basic_info.setdefault(key, info)
+    return _basic_info[key]
+
+
+def clear_basic_info_cache():
+    with _lock:
+        _basic_info.clear()
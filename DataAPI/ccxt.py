@@ -22,6 +22,7 @@ def GetColumnNameFromFieldList(fileds: str):
 
 
 class CCXT(CCommonStockApi):
+    is_thread_safe = True
     is_connect = None
 
     def __init__(self, code, k_type=KL_TYPE.K_DAY, begin_date=None, end_date=None, autype=AUTYPE.QFQ):
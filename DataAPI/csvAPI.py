@@ -1,4 +1,7 @@
 import os
+from typing import Dict, List, Optional
+
+import numpy as np
 
 from Common.CEnum import DATA_FIELD, KL_TYPE
 from Common.ChanException import CChanException, ErrCode
@@ -6,8 +9,16 @@ from Common.CTime import CTime
 from Common.func_util import str2float
 from KLine.KLine_Unit import CKLine_Unit
 
+from .BarCache import BAR_DTYPE, bars_to_klus
 from .CommonStockAPI import CCommonStockApi
 
+# parse_time_column支持的几种时间格式：长度 -> 年月日时分在字符串中的位置
+_TIME_LAYOUT = {
+    10: ((0, 4), (5, 7), (8, 10), None, None),
+    17: ((0, 4), (4, 6), (6, 8), (8, 10), (10, 12)),
+    19: ((0, 4), (5, 7), (8, 10), (11, 13), (14, 16)),
+}
+
 
 def create_item_dict(data, column_name):
     for i in range(len(data)):
@@ -40,10 +51,37 @@ def parse_time_column(inp):
     return CTime(year, month, day, hour, minute)
 
 
+def parse_time_keys(times: np.ndarray) -> Optional[np.ndarray]:
+    # 批量版parse_time_column，直接得到encode_time的编码；长度不一致或者格式不认识时返回None
+    lengths = np.char.str_len(times)
+    width = int(lengths[0])
+    if width not in _TIME_LAYOUT or (lengths != width).any():
+        return None
+    digits = np.frombuffer(times.tobytes(), dtype=np.uint8).reshape(len(times), -1)[:, :width].astype(np.int64) - ord("0")
+    key = np.zeros(len(times), dtype=np.int64)
+    for span in _TIME_LAYOUT[width]:
+        value = 0
+        if span is not None:
+            for pos in range(*span):
+                value = value * 10 + digits[:, pos]
+        key = key * 100 + value
+    return (key * 100) * 2 + 1  # 秒为0，auto为True，和CTime默认值一致
+
+
 class CSV_API(CCommonStockApi):
+    """
+    读取{data_dir}/{code}_{级别}.csv，data_dir默认为仓库根目录
+    默认按位置对应self.columns；设置column_map时按标题行的列名映射到DATA_FIELD，没映射的列忽略
+    bulk_load为True时整块用numpy解析，并且在有序的时间列上二分查找只解析请求的时间窗口
+    """
+    data_dir: Optional[str] = None
+    column_map: Optional[Dict[str, str]] = None  # 比如{"date": DATA_FIELD.FIELD_TIME, "open": DATA_FIELD.FIELD_OPEN, ...}
+    bulk_load = True
+    is_thread_safe = True
+
     def __init__(self, code, k_type=KL_TYPE.K_DAY, begin_date=None, end_date=None, autype=None):
         self.headers_exist = True  # 第一行是否是标题，如果是数据，设置为False
-        self.columns = [
+        self.columns: List[Optional[str]] = [
             DATA_FIELD.FIELD_TIME,
             DATA_FIELD.FIELD_OPEN,
             DATA_FIELD.FIELD_HIGH,
@@ -52,19 +90,39 @@ class CSV_API(CCommonStockApi):
             # DATA_FIELD.FIELD_VOLUME,
             # DATA_FIELD.FIELD_TURNOVER,
             # DATA_FIELD.FIELD_TURNRATE,
-        ]  # 每一列字段
+        ]  # 每一列字段，None表示忽略该列
         self.time_column_idx = self.columns.index(DATA_FIELD.FIELD_TIME)
         super(CSV_API, self).__init__(code, k_type, begin_date, end_date, autype)
 
-    def get_kl_data(self):
-        cur_path = os.path.dirname(os.path.realpath(__file__))
+    def file_path(self):
+        data_dir = self.data_dir or f"{os.path.dirname(os.path.realpath(__file__))}/.."
         k_type = self.k_type.name[2:].lower()
-        file_path = f"{cur_path}/../{self.code}_{k_type}.csv"
+        file_path = f"{data_dir}/{self.code}_{k_type}.csv"
         if not os.path.exists(file_path):
             raise CChanException(f"file not exist: {file_path}", ErrCode.SRC_DATA_NOT_FOUND)
+        return file_path
 
+    def apply_column_map(self, header: str):
+        if self.column_map is None:
+            return
+        if not self.headers_exist:
+            raise CChanException("column_map need csv header", ErrCode.PARA_ERROR)
+        self.columns = [self.column_map.get(name.strip()) for name in header.strip("\r\n").split(",")]
+        for field in (DATA_FIELD.FIELD_TIME, DATA_FIELD.FIELD_OPEN, DATA_FIELD.FIELD_HIGH, DATA_FIELD.FIELD_LOW, DATA_FIELD.FIELD_CLOSE):
+            if field not in self.columns:
+                raise CChanException(f"csv header missing {field}: {header}", ErrCode.SRC_DATA_FORMAT_ERROR)
+        self.time_column_idx = self.columns.index(DATA_FIELD.FIELD_TIME)
+
+    def get_kl_data(self):
+        if self.bulk_load:
+            bars = self.get_kl_bars()
+            if bars is not None:
+                yield from bars_to_klus(bars)
+                return
+        file_path = self.file_path()
         for line_number, line in enumerate(open(file_path, 'r')):
             if self.headers_exist and line_number == 0:
+                self.apply_column_map(line)
                 continue
             data = line.strip("\n").split(",")
             if len(data) != len(self.columns):
@@ -75,6 +133,66 @@ class CSV_API(CCommonStockApi):
                 continue
             yield CKLine_Unit(create_item_dict(data, self.columns))
 
+    def get_kl_bars(self) -> Optional[np.ndarray]:
+        """
+        整块解析成BarCache同样的定长记录(BAR_DTYPE)，可以直接写入缓存或者批量构造K线
+        时间窗口的过滤规则和逐行读取一致(按时间字符串比较)，文件不按时间升序时也一样
+        有无法解析的数值时返回None，由调用方退回逐行读取
+        """
+        with open(self.file_path(), 'rb') as f:
+            lines = f.read().replace(b"\r", b"").rstrip(b"\n").split(b"\n")
+        if self.headers_exist:
+            self.apply_column_map(lines[0].decode())
+            lines = lines[1:]
+        if lines == [b""]:
+            lines = []
+        time_idx = self.time_column_idx
+
+        def time_of(line: bytes) -> bytes:
+            return line.split(b",", time_idx + 1)[time_idx]
+        if (self.begin_date is not None or self.end_date is not None) and lines:
+            lines = self.filter_window(lines, np.array([time_of(line) for line in lines]))
+
+        bars = np.zeros(len(lines), dtype=BAR_DTYPE)
+        for field in BAR_DTYPE.names[1:]:
+            bars[field] = np.nan
+        if not lines:
+            return bars
+        use_cols = [idx for idx, field in enumerate(self.columns) if field is not None and field in BAR_DTYPE.names]
+        if any(line.count(b",") != len(self.columns) - 1 for line in (lines[0], lines[-1])):
+            raise CChanException(f"file format error: {self.file_path()}", ErrCode.SRC_DATA_FORMAT_ERROR)
+        time_width = max(len(time_of(lines[0])), len(time_of(lines[-1]))) + 1  # 多留一位，中间有更长的时间时能发现长度不一致
+        dtype = [(str(idx), f"S{time_width}" if idx == time_idx else np.float64) for idx in use_cols]
+        try:
+            table = np.loadtxt(lines, delimiter=",", dtype=dtype, usecols=use_cols, ndmin=1)
+        except ValueError:
+            return None
+        for idx in use_cols:
+            field = self.columns[idx]
+            if field == DATA_FIELD.FIELD_TIME:
+                time_key = parse_time_keys(table[str(idx)])
+                if time_key is None:
+                    return None
+                bars["time_key"] = time_key
+            else:
+                bars[field] = table[str(idx)]
+        return bars
+
+    def filter_window(self, lines: List[bytes], times: np.ndarray) -> List[bytes]:
+        # 时间列整列有序时二分查找窗口，否则逐行过滤；规则和逐行读取一样按时间字符串比较
+        begin_date = None if self.begin_date is None else self.begin_date.encode()
+        end_date = None if self.end_date is None else self.end_date.encode()
+        if len(times) < 2 or (times[1:] >= times[:-1]).all():
+            begin = 0 if begin_date is None else int(np.searchsorted(times, begin_date, side="left"))
+            end = len(lines) if end_date is None else int(np.searchsorted(times, end_date, side="right"))
+            return lines[begin:max(begin, end)]
+        mask = np.ones(len(times), dtype=bool)
+        if begin_date is not None:
+            mask &= times >= begin_date
+        if end_date is not None:
+            mask &= times <= end_date
+        return [lines[idx] for idx in np.flatnonzero(mask)]
+
     def SetBasciInfo(self):
         pass
 
@@ -0,0 +1,940 @@
+"""
+性能基准测试，使用本地模拟数据源(DataAPI/MockAPI.py)，不需要网络
+在仓库根目录运行：python -m Debug.benchmark <case> [--bars N]
+"""
+import argparse
+import datetime
+import gc
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from Chan import CChan
+from ChanConfig import CChanConfig
+from Common.CEnum import AUTYPE, KL_TYPE
+
+MOCK_SRC = "custom:MockAPI.CMockAPI"
+BEGIN_DATE = datetime.date(2015, 1, 1)
+BARS_PER_DAY = {
+    KL_TYPE.K_1M: 240,
+    KL_TYPE.K_5M: 48,
+    KL_TYPE.K_15M: 16,
+    KL_TYPE.K_30M: 8,
+    KL_TYPE.K_60M: 4,
+    KL_TYPE.K_DAY: 1,
+}
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace], None]] = {}
+
+
+def benchmark(name):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def end_date_for(bars: int, lv: KL_TYPE) -> str:
+    trade_days = bars // BARS_PER_DAY[lv] + 1
+    return str(BEGIN_DATE + datetime.timedelta(days=trade_days * 7 // 5 + 1))
+
+
+def make_chan(lv_list: List[KL_TYPE], bars: int, conf=None, code="sz.000001", chan_cls=CChan) -> CChan:
+    config = CChanConfig({"print_warning": False, **(conf or {})})
+    return chan_cls(
+        code=code,
+        begin_time=str(BEGIN_DATE),
+        end_time=end_date_for(bars, lv_list[-1]),
+        data_src=MOCK_SRC,
+        lv_list=lv_list,
+        config=config,
+    )
+
+
+def klu_cnt(chan: CChan) -> int:
+    return sum(len(klc) for lv in chan.lv_list for klc in chan[lv])
+
+
+def timeit(func):
+    gc.collect()
+    t = time.perf_counter()
+    res = func()
+    return res, time.perf_counter() - t
+
+
+def traced_memory(func):
+    gc.collect()
+    tracemalloc.start()
+    res = func()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return res, current
+
+
+def report(title, rows, headers):
+    print(f"== {title}")
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for r in rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(r, widths)))
+
+
+@benchmark("columnar")
+def bench_columnar(args):
+    # 对象模型 vs 列式存储：单根K线内存占用 & 加载耗时
+    rows = []
+    for columnar in (False, True):
+        conf = {"columnar_kl": columnar, "cal_rsi": True, "cal_kdj": True, "mean_metrics": [5, 20]}
+        chan, cost = timeit(lambda: make_chan([KL_TYPE.K_1M], args.bars, conf))
+        bars = klu_cnt(chan)
+        del chan
+        _, mem = traced_memory(lambda: make_chan([KL_TYPE.K_1M], args.bars, conf))
+        rows.append(["columnar" if columnar else "object", bars, f"{cost:.2f}s", f"{bars / cost:.0f}", f"{mem / bars:.0f}"])
+    report("CKLine_List storage", rows, ["mode", "bars", "load", "bars/s", "bytes/bar"])
+
+
+def object_size(obj) -> int:
+    # 对象本身 + __dict__ + memoize缓存
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    cache = getattr(obj, "_memoize_cache", None)
+    if cache is not None:
+        size += sys.getsizeof(cache)
+    return size
+
+
+def iter_model_objects(chan: CChan):
+    for lv in chan.lv_list:
+        kl_list = chan[lv]
+        for klc in kl_list:
+            yield klc
+            for klu in klc:
+                yield klu
+                yield klu.time
+                yield klu.macd
+                yield klu.boll
+                if hasattr(klu, "kdj"):
+                    yield klu.kdj
+        yield from kl_list.bi_list
+        yield from kl_list.seg_list
+        yield from kl_list.zs_list
+        yield from kl_list.bs_point_lst.bsp_iter()
+
+
+@benchmark("layout")
+def bench_layout(args):
+    # 热点模型类的单对象内存占用
+    chan = make_chan([KL_TYPE.K_1M], args.bars, {"cal_kdj": True})
+    stat: Dict[str, List[int]] = {}
+    for obj in iter_model_objects(chan):
+        cnt_size = stat.setdefault(type(obj).__name__, [0, 0])
+        cnt_size[0] += 1
+        cnt_size[1] += object_size(obj)
+    rows = [[name, cnt, f"{size / cnt:.0f}"] for name, (cnt, size) in sorted(stat.items())]
+    report(f"object layout ({klu_cnt(chan)} bars)", rows, ["class", "count", "bytes/object"])
+
+
+@benchmark("batch_metric")
+def bench_batch_metric(args):
+    # 逐根计算 vs 批量计算指标：单独的指标耗时 & 整体加载耗时
+    from Math.KDJ import KDJ
+    from Math.MetricBatch import cal_metric_batch, support_batch
+    conf = {"cal_rsi": True, "cal_kdj": True, "mean_metrics": [5, 20], "trend_metrics": [10]}
+    klu_lst = [klu for klc in make_chan([KL_TYPE.K_1M], args.bars)[0] for klu in klc]
+
+    def incremental():
+        metric_model_lst = [model for model in CChanConfig(conf).GetMetricModel() if support_batch(model)]
+        for klu in klu_lst:
+            for model in metric_model_lst:
+                model.add(klu.high, klu.low, klu.close) if isinstance(model, KDJ) else model.add(klu.close)
+
+    def batch():
+        for model in CChanConfig(conf).GetMetricModel():
+            if support_batch(model):
+                cal_metric_batch(model, klu_lst)
+
+    rows = []
+    for name, func in [("incremental", incremental), ("batch", batch)]:
+        _, cost = timeit(func)
+        rows.append([f"{name} metrics", len(klu_lst), f"{cost:.2f}s", f"{len(klu_lst) / cost:.0f}"])
+    for batch_metric in (False, True):
+        chan, cost = timeit(lambda: make_chan([KL_TYPE.K_1M], args.bars, dict(conf, batch_metric=batch_metric)))
+        rows.append([f"load batch_metric={batch_metric}", klu_cnt(chan), f"{cost:.2f}s", f"{klu_cnt(chan) / cost:.0f}"])
+    report("indicator calculation", rows, ["case", "bars", "cost", "bars/s"])
+
+
+@benchmark("rolling")
+def bench_rolling(args):
+    # 滑动窗口类指标单根add的耗时随窗口长度的变化，以及模型自身占用的内存
+    from Common.CEnum import TREND_TYPE
+    from Math.BOLL import BollModel
+    from Math.KDJ import KDJ
+    from Math.TrendModel import CTrendModel
+    klu_lst = [klu for klc in make_chan([KL_TYPE.K_1M], args.bars)[0] for klu in klc]
+    rows = []
+    for N in (20, 250, 1000):
+        models = {
+            "boll": BollModel(N),
+            "mean": CTrendModel(TREND_TYPE.MEAN, N),
+            "max": CTrendModel(TREND_TYPE.MAX, N),
+            "kdj": KDJ(N),
+        }
+        for name, model in models.items():
+            if name == "kdj":
+                _, cost = timeit(lambda: [model.add(klu.high, klu.low, klu.close) for klu in klu_lst])
+            else:
+                _, cost = timeit(lambda: [model.add(klu.close) for klu in klu_lst])
+            rows.append([name, N, len(klu_lst), f"{cost * 1e6 / len(klu_lst):.2f}us"])
+    report("rolling window models", rows, ["model", "N", "bars", "cost/bar"])
+
+
+@benchmark("retention")
+def bench_retention(args):
+    # 指标模型保留全部历史 vs 只保留计算状态
+    rows = []
+    for keep in (True, False):
+        conf = {"keep_metric_history": keep, "cal_demark": True, "cal_rsi": True, "cal_kdj": True, "mean_metrics": [5, 20]}
+        chan, mem = traced_memory(lambda: make_chan([KL_TYPE.K_1M], args.bars, conf))
+        macd_model = chan[0].metric_model_lst[0]
+        rows.append([keep, klu_cnt(chan), len(macd_model.macd_info), f"{mem / klu_cnt(chan):.0f}"])
+    report("indicator history retention", rows, ["keep_metric_history", "bars", "len(macd_info)", "bytes/bar"])
+
+
+@benchmark("scan")
+def bench_scan(args):
+    # 多标的扫描：串行 vs 进程池；加速比受限于机器核数
+    import os
+
+    from Scanner import CScanner
+    code_list = [f"sz.{i:06d}" for i in range(1, 17)]
+    config = CChanConfig({"print_warning": False})
+    rows = []
+    for max_workers in (0, None):
+        scanner = CScanner([KL_TYPE.K_DAY], config, str(BEGIN_DATE), end_date_for(args.bars, KL_TYPE.K_DAY), MOCK_SRC, max_workers=max_workers)
+        res, cost = timeit(lambda: scanner.scan_all(code_list))
+        assert all(r.ok for r in res)
+        rows.append(["serial" if max_workers == 0 else f"pool({os.cpu_count()} cpu)", len(code_list), f"{cost:.2f}s", f"{len(code_list) / cost:.2f}"])
+    report(f"scanner ({args.bars} daily bars/code)", rows, ["mode", "codes", "cost", "codes/s"])
+
+
+def speculative_klu(pre_klu, i: int, rnd):
+    # 接在pre_klu之后的第i根1分钟K线，价格在pre_klu收盘价附近随机游走
+    from Common.CEnum import DATA_FIELD
+    from Common.CTime import CTime
+    from KLine.KLine_Unit import CKLine_Unit
+    t = datetime.datetime(pre_klu.time.year, pre_klu.time.month, pre_klu.time.day, 15, 0) + datetime.timedelta(minutes=i + 1)
+    _open = pre_klu.close
+    close = round(_open * (1 + rnd.gauss(0, 0.01)), 2)
+    return CKLine_Unit({
+        DATA_FIELD.FIELD_TIME: CTime(t.year, t.month, t.day, t.hour, t.minute),
+        DATA_FIELD.FIELD_OPEN: _open,
+        DATA_FIELD.FIELD_HIGH: round(max(_open, close) * 1.002, 2),
+        DATA_FIELD.FIELD_LOW: round(min(_open, close) * 0.998, 2),
+        DATA_FIELD.FIELD_CLOSE: close,
+    })
+
+
+@benchmark("checkpoint")
+def bench_checkpoint(args):
+    # 推演若干根K线后回到原状态：deepcopy vs 只记录可变尾部的checkpoint/restore
+    import copy
+    import random
+    rows = []
+    for bars in [n for n in (10000, 100000, 1000000) if n <= args.bars]:
+        chan = make_chan([KL_TYPE.K_1M], bars)
+        lv = chan.lv_list[0]
+        rnd = random.Random(0)
+        # 1M根时deepcopy需要再占一份同样大小的内存，小内存机器上会OOM，只测checkpoint/restore
+        copy_cost = timeit(lambda: copy.deepcopy(chan))[1] if bars < 1000000 or args.deepcopy_1m else None
+        cp_cost = restore_cost = 0.0
+        for _ in range(args.repeat):
+            cp, cost = timeit(chan.checkpoint)
+            cp_cost += cost
+            pre_klu = chan[lv][-1][-1]
+            for i in range(args.spec_bars):
+                pre_klu = chan.append_klu(lv, speculative_klu(pre_klu, i, rnd))
+            _, cost = timeit(lambda: chan.restore(cp))
+            restore_cost += cost
+        cp_cost, restore_cost = cp_cost / args.repeat, restore_cost / args.repeat
+        rows.append([
+            klu_cnt(chan),
+            "-" if copy_cost is None else f"{copy_cost * 1e3:.1f}ms",
+            f"{cp_cost * 1e3:.3f}ms",
+            f"{restore_cost * 1e3:.3f}ms",
+            "-" if copy_cost is None else f"{copy_cost / (cp_cost + restore_cost):.0f}x",
+        ])
+        del chan
+    report(f"checkpoint/restore after {args.spec_bars} speculative bars", rows, ["bars", "deepcopy", "checkpoint", "restore", "speedup"])
+
+
+@benchmark("bar_cache")
+def bench_bar_cache(args):
+    # 数据源读取：每次都从上游生成/解析 vs 本地二进制缓存命中
+    import tempfile
+
+    from DataAPI.BarCache import cached_stock_api
+    from DataAPI.MockAPI import CMockAPI
+    lv = KL_TYPE.K_1M
+    end_date = end_date_for(args.bars, lv)
+    rows = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cached_api = cached_stock_api(CMockAPI, cache_dir)
+        for name, api_cls in (("upstream", CMockAPI), ("cache miss", cached_api), ("cache hit", cached_api)):
+            api = api_cls(code="sz.000001", k_type=lv, begin_date=str(BEGIN_DATE), end_date=end_date, autype=AUTYPE.QFQ)
+            klus, cost = timeit(lambda: list(api.get_kl_data()))
+            rows.append([name, len(klus), f"{cost:.2f}s", f"{len(klus) / cost / 1e3:.0f}k"])
+            del klus
+        api_cls.do_close()
+        _, chan_cost = timeit(lambda: make_chan([lv], args.bars))
+        _, cached_chan_cost = timeit(lambda: make_chan([lv], args.bars, {"bar_cache_dir": cache_dir}))
+        rows.append(["CChan", args.bars, f"{chan_cost:.2f}s", ""])
+        rows.append(["CChan(cache hit)", args.bars, f"{cached_chan_cost:.2f}s", ""])
+    report(f"bar cache ({lv.name})", rows, ["source", "bars", "cost", "bars/s"])
+
+
+def write_minute_csv(path, bars: int):
+    # 按A股交易时段生成bars根1分钟K线，时间格式为YYYY-MM-DD HH:MM:SS
+    import numpy as np
+    rnd = np.random.default_rng(0)
+    close = np.round(50 * np.exp(np.cumsum(rnd.normal(0, 0.001, bars))), 2)
+    _open = np.concatenate([[close[0]], close[:-1]])
+    high = np.round(np.maximum(_open, close) * (1 + np.abs(rnd.normal(0, 0.0005, bars))), 2)
+    low = np.round(np.minimum(_open, close) * (1 - np.abs(rnd.normal(0, 0.0005, bars))), 2)
+    minutes = [m for begin, end in ((9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60)) for m in range(begin + 1, end + 1)]
+    day, idx = BEGIN_DATE, 0
+    with open(path, "w") as f:
+        f.write("time,open,high,low,close\n")
+        while idx < bars:
+            if day.weekday() < 5:
+                for minute in minutes[:bars - idx]:
+                    f.write(f"{day} {minute // 60:02}:{minute % 60:02}:00,{_open[idx]},{high[idx]},{low[idx]},{close[idx]}\n")
+                    idx += 1
+            day += datetime.timedelta(days=1)
+    return day
+
+
+@benchmark("csv")
+def bench_csv(args):
+    # csv数据源：逐行解析 vs numpy整块解析(产出K线/只产出数组)，以及只取最后10%时间窗口时的二分下推
+    import os
+    import tempfile
+
+    from DataAPI.csvAPI import CSV_API
+    rows = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        last_day = write_minute_csv(os.path.join(data_dir, "bench_1m.csv"), args.bars)
+        window_begin = str(BEGIN_DATE + (last_day - BEGIN_DATE) * 9 / 10)
+
+        class LineCSV(CSV_API):
+            bulk_load = False
+
+        LineCSV.data_dir = CSV_API.data_dir = data_dir
+        try:
+            for begin_date, window in ((None, "all"), (window_begin, "last 10%")):
+                line_api = LineCSV("bench", k_type=KL_TYPE.K_1M, begin_date=begin_date)
+                bulk_api = CSV_API("bench", k_type=KL_TYPE.K_1M, begin_date=begin_date)
+                for name, load in (
+                    ("line -> CKLine_Unit", lambda: list(line_api.get_kl_data())),
+                    ("bulk -> CKLine_Unit", lambda: list(bulk_api.get_kl_data())),
+                    ("bulk -> arrays", bulk_api.get_kl_bars),
+                ):
+                    res, cost = timeit(load)
+                    rows.append([window, name, len(res), f"{cost:.2f}s", f"{len(res) / cost / 1e3:.0f}k"])
+                    del res
+        finally:
+            CSV_API.data_dir = None
+    report(f"csv loader ({args.bars} 1M bars in file)", rows, ["window", "path", "bars", "cost", "bars/s"])
+
+
+class LegacyTime:
+    # 改成整数epoch之前的CTime实现，作为对照
+    __slots__ = ("year", "month", "day", "hour", "minute", "second", "auto", "ts")
+
+    def __init__(self, year, month, day, hour, minute, second=0, auto=True):
+        self.year, self.month, self.day, self.hour, self.minute, self.second, self.auto = year, month, day, hour, minute, second, auto
+        if hour == 0 and minute == 0 and auto:
+            self.ts = datetime.datetime(year, month, day, 23, 59, second).timestamp()
+        else:
+            self.ts = datetime.datetime(year, month, day, hour, minute, second).timestamp()
+
+    def to_str(self):
+        if self.hour == 0 and self.minute == 0:
+            return f"{self.year:04}/{self.month:02}/{self.day:02}"
+        return f"{self.year:04}/{self.month:02}/{self.day:02} {self.hour:02}:{self.minute:02}"
+
+    def __gt__(self, t2):
+        return self.ts > t2.ts
+
+
+@benchmark("ctime")
+def bench_ctime(args):
+    # CTime构造/格式化/比较：datetime.timestamp()实现 vs 整数epoch实现，以及numpy批量构造
+    import numpy as np
+
+    from Common.CTime import CTime
+    epochs = np.int64(1420070400) + np.arange(args.bars, dtype=np.int64) * 60
+    fields = [t.fields()[:5] for t in CTime.from_epochs(epochs)]
+    rows = []
+    for name, build in (
+        ("legacy", lambda: [LegacyTime(*f) for f in fields]),
+        ("CTime(...)", lambda: [CTime(*f) for f in fields]),
+        ("CTime.from_epochs", lambda: CTime.from_epochs(epochs)),
+    ):
+        times, build_cost = timeit(build)
+        _, str_cost = timeit(lambda: [t.to_str() for t in times])
+        _, str_again_cost = timeit(lambda: [t.to_str() for t in times])
+        _, cmp_cost = timeit(lambda: [a > b for a, b in zip(times[1:], times)])
+        rows.append([name] + [f"{cost * 1e9 / args.bars:.0f}ns" for cost in (build_cost, str_cost, str_again_cost, cmp_cost)])
+        del times
+    report(f"CTime ({args.bars} times, per item)", rows, ["impl", "build", "to_str", "to_str again", "a > b"])
+
+
+class RecursiveLoadChan(CChan):
+    # 改成显式栈之前的load_iterator：每根父级别K线嵌套一个次级别生成器，作为对照
+    def load_iterator(self, lv_idx, parent_klu, step):
+        cur_lv = self.lv_list[lv_idx]
+        pre_klu = self.get_last_klu(lv_idx)
+        while True:
+            if self.klu_cache[lv_idx]:
+                kline_unit = self.klu_cache[lv_idx]
+                self.klu_cache[lv_idx] = None
+            else:
+                try:
+                    kline_unit = self.get_next_lv_klu(lv_idx)
+                    self.try_set_klu_idx(lv_idx, kline_unit)
+                    self.klu_last_t[lv_idx] = kline_unit.time
+                except StopIteration:
+                    break
+            if parent_klu and kline_unit.time > parent_klu.time:
+                self.klu_cache[lv_idx] = kline_unit
+                break
+            kline_unit.set_pre_klu(pre_klu)
+            kline_unit = self.add_new_kl(cur_lv, kline_unit)
+            pre_klu = kline_unit
+            if parent_klu:
+                self.set_klu_parent_relation(parent_klu, kline_unit, cur_lv, lv_idx)
+            if lv_idx != len(self.lv_list) - 1:
+                for _ in self.load_iterator(lv_idx + 1, kline_unit, step):
+                    ...
+                self.check_kl_align(kline_unit, lv_idx)
+            if lv_idx == 0 and step:
+                yield self
+
+
+def merge_only(chan_cls):
+    # 只保留多级别归并和父子关系，不做K线合并、笔、线段等计算
+    class MergeOnlyChan(chan_cls):
+        def add_new_kl(self, cur_lv, kline_unit):
+            self.merged[cur_lv].append(kline_unit)
+            return kline_unit
+
+        def get_last_klu(self, lv_idx):
+            merged = self.merged[self.lv_list[lv_idx]]
+            return merged[-1] if merged else None
+    return MergeOnlyChan
+
+
+@benchmark("multi_level_load")
+def bench_multi_level_load(args):
+    # 4级别(日/60M/15M/1M)加载：递归生成器 vs 显式栈，分别测只做归并和完整计算
+    from collections import defaultdict
+
+    from DataAPI.MockAPI import CMockAPI
+    lv_list = [KL_TYPE.K_DAY, KL_TYPE.K_60M, KL_TYPE.K_15M, KL_TYPE.K_1M]
+    end_date = end_date_for(args.bars, KL_TYPE.K_1M)
+    rows = []
+    for name, chan_cls in (("recursive", RecursiveLoadChan), ("iterative", CChan)):
+        chan = merge_only(chan_cls)(code="sz.000001", lv_list=lv_list, config=CChanConfig({"trigger_step": True, "print_warning": False}))
+        chan.merged = defaultdict(list)
+        inp = {lv: list(CMockAPI("sz.000001", lv, str(BEGIN_DATE), end_date).get_kl_data()) for lv in lv_list}
+        bars = sum(len(klus) for klus in inp.values())
+        _, merge_cost = timeit(lambda: chan.trigger_load(inp))
+        assert [len(chan.merged[lv]) for lv in lv_list] == [len(inp[lv]) for lv in lv_list]
+        del chan, inp
+        _, full_cost = timeit(lambda: make_chan(lv_list, args.bars, chan_cls=chan_cls))
+        rows.append([name, bars, f"{merge_cost:.2f}s", f"{bars / merge_cost / 1e3:.0f}k", f"{full_cost:.2f}s"])
+    report(f"4-level load ({'/'.join(lv.name for lv in lv_list)}, {args.bars} 1M bars)", rows, ["load_iterator", "bars", "merge only", "bars/s", "full CChan"])
+
+
+@benchmark("parallel_load")
+def bench_parallel_load(args):
+    # 3级别加载慢数据源(每次请求固定延迟)：串行 vs parallel_load，对照只加载最慢的单个级别
+    from DataAPI.MockAPI import CMockAPI
+    lv_list = [KL_TYPE.K_DAY, KL_TYPE.K_30M, KL_TYPE.K_5M]
+    bars, latency = min(args.bars, 20000), 1.0
+    CMockAPI.latency = latency
+    try:
+        serial, serial_cost = timeit(lambda: make_chan(lv_list, bars))
+        parallel, parallel_cost = timeit(lambda: make_chan(lv_list, bars, {"parallel_load": True}))
+        _, single_cost = timeit(lambda: make_chan(lv_list[-1:], bars))
+    finally:
+        CMockAPI.latency = 0.0
+    assert [[klu.time.key for klu in serial[lv].klu_iter()] for lv in lv_list] == [[klu.time.key for klu in parallel[lv].klu_iter()] for lv in lv_list]
+    rows = [
+        ["serial", klu_cnt(serial), f"{serial_cost:.2f}s"],
+        ["parallel_load", klu_cnt(parallel), f"{parallel_cost:.2f}s"],
+        [f"only {lv_list[-1].name}", "", f"{single_cost:.2f}s"],
+    ]
+    report(f"parallel load ({'/'.join(lv.name for lv in lv_list)}, {bars} bars of {lv_list[-1].name}, {latency:.1f}s latency per request)", rows, ["mode", "klc", "cost"])
+
+
+@benchmark("async_load")
+def bench_async_load(args):
+    # 多只股票、每次请求固定延迟：逐只同步构造CChan vs aload_chans不同并发数
+    from DataAPI.AsyncStockAPI import load_chans
+    from DataAPI.MockAPI import CAsyncMockAPI, CMockAPI
+    lv_list = [KL_TYPE.K_DAY, KL_TYPE.K_30M]
+    codes = [f"sz.{i:06d}" for i in range(16)]
+    bars, latency = min(args.bars, 5000), 0.5
+    config = CChanConfig({"print_warning": False})
+    kwargs = {"begin_time": str(BEGIN_DATE), "end_time": end_date_for(bars, lv_list[-1]), "lv_list": lv_list, "config": config}
+    CMockAPI.latency = CAsyncMockAPI.latency = latency
+    rows = []
+    try:
+        serial, cost = timeit(lambda: {code: make_chan(lv_list, bars, code=code) for code in codes})
+        rows.append(["serial", len(serial), f"{cost:.2f}s"])
+        for concurrency in (1, 4, 16):
+            (chans, errors), cost = timeit(lambda: load_chans(codes, data_src=CAsyncMockAPI, concurrency=concurrency, **kwargs))
+            assert not errors, errors
+            assert [klu_cnt(chans[code]) for code in codes] == [klu_cnt(serial[code]) for code in codes]
+            rows.append([f"aload_chans(concurrency={concurrency})", len(chans), f"{cost:.2f}s"])
+        _, cost = timeit(lambda: load_chans(codes, data_src=CMockAPI, concurrency=16, **kwargs))
+        rows.append(["aload_chans(sync CMockAPI adapter, 16)", len(codes), f"{cost:.2f}s"])
+    finally:
+        CMockAPI.latency = CAsyncMockAPI.latency = 0.0
+    report(f"async multi-symbol load ({len(codes)} codes, {'/'.join(lv.name for lv in lv_list)}, {latency:.1f}s latency per request)", rows, ["mode", "codes", "cost"])
+
+
+@benchmark("session")
+def bench_session(args):
+    # 需要登录的数据源扫描多只股票：每只股票登录一次 vs 缓存基本信息 vs stock_session复用会话
+    from DataAPI.MockAPI import CMockSessionAPI
+    from DataAPI.Session import clear_basic_info_cache, stock_session
+    from Scanner import CScanner
+    lv_list = [KL_TYPE.K_DAY, KL_TYPE.K_30M]
+    codes = [f"sz.{i:06d}" for i in range(20)]
+    bars = min(args.bars, 2000)
+    src = "custom:MockAPI.CMockSessionAPI"
+    config = CChanConfig({"print_warning": False})
+    end_date = end_date_for(bars, lv_list[-1])
+
+    def build_all():
+        for code in codes:
+            CChan(code, begin_time=str(BEGIN_DATE), end_time=end_date, data_src=src, lv_list=lv_list, config=config)
+
+    def with_session():
+        with stock_session(CMockSessionAPI):
+            build_all()
+
+    def scanner():
+        list(CScanner(lv_list, config, begin_time=str(BEGIN_DATE), end_time=end_date, data_src=src, max_workers=0).scan(codes))
+
+    CMockSessionAPI.login_latency, CMockSessionAPI.query_latency = 0.2, 0.02
+    rows = []
+    try:
+        for name, func, cache_info, clear_info in (
+            ("login per CChan, no info cache", build_all, False, True),
+            ("login per CChan", build_all, True, True),
+            ("stock_session", with_session, True, True),
+            ("stock_session, info cached", with_session, True, False),
+            ("CScanner(max_workers=0)", scanner, True, True),
+        ):
+            CMockSessionAPI.cache_basic_info = cache_info
+            if clear_info:
+                clear_basic_info_cache()
+            CMockSessionAPI.round_trips.clear()
+            _, cost = timeit(func)
+            trips = CMockSessionAPI.round_trips
+            rows.append([name, trips["login"], trips["basic_info"], trips["kl_data"], sum(trips.values()), f"{cost:.2f}s"])
+    finally:
+        CMockSessionAPI.login_latency = CMockSessionAPI.query_latency = 0.0
+        CMockSessionAPI.cache_basic_info = True
+    report(f"session reuse ({len(codes)} codes, {'/'.join(lv.name for lv in lv_list)}, login 0.2s, query 0.02s)", rows, ["mode", "login", "basic_info", "kl_data", "round trips", "cost"])
+
+
+@benchmark("scan_cache")
+def bench_scan_cache(args):
+    # 反复扫描同一批股票：不用缓存 vs 首次(miss) vs 数据没变(hit) vs 多了一周K线(extend)
+    import tempfile
+
+    from Scanner import CScanner
+    lv_list = [KL_TYPE.K_DAY, KL_TYPE.K_30M]
+    codes = [f"sz.{i:06d}" for i in range(8)]
+    bars = min(args.bars, 20000)
+    end_date = end_date_for(bars, lv_list[-1])
+    next_date = str(datetime.date.fromisoformat(end_date) + datetime.timedelta(days=7))
+    config = CChanConfig({"print_warning": False})
+    rows = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, end, cache in (
+            ("no cache", end_date, None),
+            ("miss", end_date, cache_dir),
+            ("hit", end_date, cache_dir),
+            ("extend (+1 week)", next_date, cache_dir),
+        ):
+            scanner = CScanner(lv_list, config, begin_time=str(BEGIN_DATE), end_time=end, data_src=MOCK_SRC, max_workers=0, cache_dir=cache)
+            res, cost = timeit(lambda: scanner.scan_all(codes))
+            assert all(r.ok for r in res)
+            rows.append([name, dict(scanner.cache_stats) or "", f"{cost:.2f}s", f"{cost / len(codes) * 1e3:.0f}ms"])
+    report(f"scan cache ({len(codes)} codes, {'/'.join(lv.name for lv in lv_list)}, {bars} bars of {lv_list[-1].name})", rows, ["scan", "cache", "cost", "per code"])
+
+
+@benchmark("sweep")
+def bench_sweep(args):
+    # 参数扫描：每组配置单独构建CChan vs 按阶段分组共用K线/笔/线段(和中枢)
+    from Sweep import CParamSweep, grid
+    lv_list = [KL_TYPE.K_DAY, KL_TYPE.K_30M]
+    bars = min(args.bars, 20000)
+    end_date = end_date_for(bars, lv_list[-1])
+    rows = []
+    for name, configs in (
+        ("bsp only", grid({"print_warning": False}, divergence_rate=[0.6, 0.8, 0.9, float("inf")], macd_algo=["peak", "area", "slope"], min_zs_cnt=[1, 2])),
+        ("zs + bsp", grid({"print_warning": False}, zs_algo=["normal", "over_seg"], zs_combine=[True, False], divergence_rate=[0.8, float("inf")], macd_algo=["peak", "area", "slope"])),
+    ):
+        def fresh():
+            for conf in configs.values():
+                CChan("sz.000001", str(BEGIN_DATE), end_date, MOCK_SRC, lv_list, CChanConfig(dict(conf)))
+        _, fresh_cost = timeit(fresh)
+        res, sweep_cost = timeit(lambda: CParamSweep(lv_list, configs, str(BEGIN_DATE), end_date, MOCK_SRC).run(["sz.000001"]))
+        assert not res.errors
+        rows.append([name, len(configs), dict(res.stats), f"{fresh_cost:.2f}s", f"{sweep_cost:.2f}s", f"{fresh_cost / sweep_cost:.1f}x"])
+    report(f"param sweep ({'/'.join(lv.name for lv in lv_list)}, {bars} bars of {lv_list[-1].name})", rows, ["grid", "configs", "stages", "fresh", "sweep", "speedup"])
+
+
+@benchmark("backtest")
+def bench_backtest(args):
+    # 事件驱动回测：裸step_load vs 回测引擎(只订阅买卖点 / 订阅全部事件)，按股票年的吞吐
+    from Backtest import CBacktester, CStrategy
+    from Common.CEnum import BSP_TYPE, CHANGE_TYPE
+
+    class BspStrategy(CStrategy):
+        def on_bsp(self, ctx, event):
+            if event.change != CHANGE_TYPE.NEW or event.is_seg or event.lv != ctx.lv_list[0] or BSP_TYPE.T1 not in event.bsp.type:
+                return
+            if event.bsp.is_buy and ctx.position == 0:
+                ctx.buy()
+            elif not event.bsp.is_buy and ctx.position > 0:
+                ctx.sell()
+
+    class AllEventStrategy(BspStrategy):
+        def on_bar(self, ctx, event):
+            pass
+
+        def on_bi(self, ctx, event):
+            pass
+
+        def on_seg(self, ctx, event):
+            pass
+
+        def on_zs(self, ctx, event):
+            pass
+
+    lv_list = [KL_TYPE.K_DAY]
+    codes = [f"sz.{i:06d}" for i in range(4)]
+    years = 10
+    end_date = str(BEGIN_DATE.replace(year=BEGIN_DATE.year + years))
+    config = {"print_warning": False}
+
+    def raw_step():
+        for code in codes:
+            chan = CChan(code, str(BEGIN_DATE), end_date, MOCK_SRC, lv_list, CChanConfig(dict(config, trigger_step=True)))
+            for _ in chan.step_load():
+                pass
+    rows = []
+    _, cost = timeit(raw_step)
+    rows.append(["step_load only", "", f"{cost:.2f}s", f"{len(codes) * years / cost:.1f}"])
+    for name, strategy_cls in (("bsp events", BspStrategy), ("all events", AllEventStrategy)):
+        tester = CBacktester(strategy_cls, lv_list, config, str(BEGIN_DATE), end_date, MOCK_SRC, broker_kwargs={"fee_rate": 0.0003, "slippage": 0.001})
+        res, cost = timeit(lambda: list(tester.run_many(codes, max_workers=0)))
+        assert all(r.ok for r in res), [r.error for r in res]
+        rows.append([name, sum(r.summary.trade_cnt for r in res), f"{cost:.2f}s", f"{len(codes) * years / cost:.1f}"])
+    report(f"backtest ({len(codes)} codes x {years} years, {'/'.join(lv.name for lv in lv_list)}, 1 process)", rows, ["run", "trades", "cost", "symbol-years/s"])
+
+
+@benchmark("metric_index")
+def bench_metric_index(args):
+    # 笔的背驰力度：CBi逐根K线遍历 vs 指标索引(区间极值O(1)/扁平数组扫描)，每笔都重新计算不走缓存
+    from Common.CEnum import MACD_ALGO
+    from Math.MetricIndex import CMetricIndex
+    rows = []
+    for columnar_kl in (False, True):
+        chan = make_chan([KL_TYPE.K_1M], args.bars, {"cal_rsi": True, "columnar_kl": columnar_kl})
+        bi_list = list(chan[0].bi_list)
+        index = CMetricIndex()
+        _, sync_cost = timeit(lambda: index.sync(bi_list[-1].end_klc.lst[-1]))
+        rows.append([f"columnar={columnar_kl}", "sync", len(bi_list), "", f"{sync_cost * 1e3:.1f}ms", ""])
+        for algo in (MACD_ALGO.PEAK, MACD_ALGO.DIFF, MACD_ALGO.RSI, MACD_ALGO.AREA, MACD_ALGO.FULL_AREA, MACD_ALGO.VOLUMN_AVG):
+            def walk():
+                for bi in bi_list:
+                    bi.clean_cache()
+                    bi.cal_macd_metric(algo, False)
+                    bi.cal_macd_metric(algo, True)
+
+            def query():
+                index.cache.clear()
+                for bi in bi_list:
+                    index.cal_macd_metric(bi, algo, False)
+                    index.cal_macd_metric(bi, algo, True)
+            query()  # rsi/成交量列第一次用到时才建
+            _, walk_cost = timeit(walk)
+            _, index_cost = timeit(query)
+            rows.append([f"columnar={columnar_kl}", algo.name, len(bi_list), f"{walk_cost * 1e3:.1f}ms", f"{index_cost * 1e3:.1f}ms", f"{walk_cost / index_cost:.1f}x"])
+    report(f"divergence metric ({args.bars} bars of K_1M)", rows, ["store", "algo", "bi", "walker", "index", "speedup"])
+
+
+@benchmark("range_index")
+def bench_range_index(args):
+    # 长的未确定尾部：end_is_peak/FindPeakBi/left_bi_break逐个遍历 vs 区间极值索引，跨度越长差距越大
+    import random
+    from Bi.BiList import CKLineIndex, end_is_peak
+    from Seg.SegListComm import CLineIndex, FindPeakBi
+    chan = make_chan([KL_TYPE.K_1M], args.bars)
+    klc_lst, bi_lst = chan[0].lst, chan[0].bi_list
+    seg_list = chan[0].seg_list
+    rnd = random.Random(0)
+
+    def best_of(func, repeat=3):
+        res, cost = timeit(func)
+        for _ in range(repeat - 1):
+            cost = min(cost, timeit(func)[1])
+        return res, cost
+    rows = []
+    for span in (16, 128, 1024, 8192):
+        klc_pairs = []
+        for _ in range(2000):
+            begin = rnd.randrange(len(klc_lst) - span)
+            klc_pairs.append((klc_lst[begin], klc_lst[begin + span]))
+        klc_index = CKLineIndex()
+        klc_index.sync(klc_lst[-1])
+        res_walk, walk_cost = best_of(lambda: [end_is_peak(last_end, cur_end) for last_end, cur_end in klc_pairs])
+        res_index, index_cost = best_of(lambda: [end_is_peak(last_end, cur_end, klc_index) for last_end, cur_end in klc_pairs])
+        assert res_walk == res_index
+        rows.append(["end_is_peak", span, f"{walk_cost / len(klc_pairs) * 1e6:.1f}us", f"{index_cost / len(klc_pairs) * 1e6:.1f}us", f"{walk_cost / index_cost:.1f}x"])
+    for span in (16, 128, 1024):
+        if span >= len(bi_lst):
+            break
+        seg_list.line_index = CLineIndex()
+        seg_list.use_line_index(bi_lst, 0)
+        begins = [len(bi_lst) - span + rnd.randrange(3) for _ in range(2000)]
+        res_walk, walk_cost = best_of(lambda: [FindPeakBi(bi_lst[begin:], is_high=begin % 2 == 0) for begin in begins])
+        res_index, index_cost = best_of(lambda: [seg_list.find_peak_bi(bi_lst, begin, is_high=begin % 2 == 0) for begin in begins])
+        assert res_walk == res_index
+        rows.append(["FindPeakBi", span, f"{walk_cost / len(begins) * 1e6:.1f}us", f"{index_cost / len(begins) * 1e6:.1f}us", f"{walk_cost / index_cost:.1f}x"])
+    report(f"range extremum index ({klu_cnt(chan)} bars of K_1M, {len(klc_lst)} klc, {len(bi_lst)} bi)", rows, ["check", "span", "walk", "index", "speedup"])
+
+
+@benchmark("add_klu")
+def bench_add_klu(args):
+    # CKLine_List.add_single_klu的吞吐(K线合并、分形、笔)，特征序列合并(线段)，以及每笔取起止K线(合并K线里的峰值klu)
+    from Common.CEnum import SEG_TYPE
+    from DataAPI.MockAPI import CMockAPI
+    from KLine.KLine_List import CKLine_List, get_seglist_instance
+    config = CChanConfig({"print_warning": False})
+    end_date = end_date_for(args.bars, KL_TYPE.K_1M)
+    costs = []
+    for _ in range(3):
+        klus = list(CMockAPI("sz.000001", KL_TYPE.K_1M, str(BEGIN_DATE), end_date).get_kl_data())
+        kl_list = CKLine_List(KL_TYPE.K_1M, conf=config)
+
+        def feed():
+            pre = None
+            for idx, klu in enumerate(klus):
+                klu.set_idx(idx)
+                klu.set_pre_klu(pre)
+                pre = kl_list.add_single_klu(klu)
+        costs.append(timeit(feed)[1])
+    bi_list = kl_list.bi_list
+    seg_cost = min(timeit(lambda: get_seglist_instance(config.seg_conf, SEG_TYPE.BI).update(bi_list))[1] for _ in range(3))
+
+    def peak():
+        for bi in bi_list:
+            bi.clean_cache()
+            bi.get_begin_klu()
+            bi.get_end_klu()
+    peak_cost = min(timeit(peak)[1] for _ in range(3))
+    rows = [
+        ["add_single_klu", f"{len(klus)} klu", f"{min(costs):.2f}s", f"{len(klus) / min(costs) / 1e3:.0f}k/s"],
+        ["seg_list.update", f"{len(bi_list)} bi", f"{seg_cost * 1e3:.0f}ms", f"{len(bi_list) / seg_cost / 1e3:.0f}k/s"],
+        ["bi begin/end klu", f"{len(bi_list)} bi", f"{peak_cost * 1e3:.0f}ms", f"{len(bi_list) / peak_cost / 1e3:.0f}k/s"],
+    ]
+    report(f"kline combine ({args.bars} bars of K_1M, {len(kl_list)} klc)", rows, ["stage", "items", "cost", "throughput"])
+
+
+@benchmark("memo_cache")
+def bench_memo_cache(args):
+    # make_cache缓存命中时取方法+调用的开销、加载耗时，以及打开统计后各方法的命中/失效情况(逐步计算，虚笔会反复更新终点)
+    from operator import methodcaller
+
+    from Common.cache import cache_stats, enable_cache_stats
+    chan, load_cost = timeit(lambda: make_chan([KL_TYPE.K_1M], args.bars))
+    bi_list = list(chan[0].bi_list)
+    repeat = max(1, 1000000 // len(bi_list))
+    rows = []
+    for name in ("is_up", "_high", "get_begin_val", "get_end_klu"):
+        call = methodcaller(name)
+        list(map(call, bi_list))
+        cost = min(timeit(lambda: [list(map(call, bi_list)) for _ in range(repeat)])[1] for _ in range(3))
+        rows.append([f"CBi.{name}()", f"{cost / repeat / len(bi_list) * 1e9:.0f}ns"])
+    rows.append([f"load {klu_cnt(chan)} bars", f"{load_cost:.2f}s"])
+    step_bars = min(args.bars, 20000)
+    chan = make_chan([KL_TYPE.K_1M], step_bars, {"trigger_step": True})
+    _, step_cost = timeit(lambda: [None for _ in chan.step_load()])
+    rows.append([f"step load {step_bars} bars", f"{step_cost:.2f}s"])
+    report("cached getter (hit)", rows, ["case", "cost"])
+
+    enable_cache_stats()
+    try:
+        chan = make_chan([KL_TYPE.K_1M], step_bars, {"trigger_step": True})
+        for _ in chan.step_load():
+            pass
+        stats = [stat for stat in cache_stats() if stat.hit + stat.miss]
+    finally:
+        enable_cache_stats(False)
+    rows = [[stat.name, stat.hit, stat.miss, stat.invalidate, f"{stat.hit_rate:.1%}", f"{stat.invalidate_rate:.1%}"] for stat in stats]
+    report(f"cache stats (step load, {step_bars} bars)", rows, ["method", "hit", "miss", "invalidate", "hit rate", "invalidate/miss"])
+
+
+def trend_klu(pre_klu, i: int):
+    # 接在pre_klu之后的第i根1分钟K线，涨8根跌6根的阶梯上涨，线段一直不能确定
+    from Common.CEnum import DATA_FIELD
+    from Common.CTime import CTime
+    from KLine.KLine_Unit import CKLine_Unit
+    t = datetime.datetime(pre_klu.time.year, pre_klu.time.month, pre_klu.time.day, 10, 0) + datetime.timedelta(days=i // 240 + 1, minutes=i % 240)
+    _open = pre_klu.close
+    close = round(_open * (1.004 if i % 14 < 8 else 0.9955), 2)
+    return CKLine_Unit({
+        DATA_FIELD.FIELD_TIME: CTime(t.year, t.month, t.day, t.hour, t.minute),
+        DATA_FIELD.FIELD_OPEN: _open,
+        DATA_FIELD.FIELD_HIGH: max(_open, close) + 0.01,
+        DATA_FIELD.FIELD_LOW: min(_open, close) - 0.01,
+        DATA_FIELD.FIELD_CLOSE: close,
+    })
+
+
+@benchmark("seg_step")
+def bench_seg_step(args):
+    # 逐步计算时线段的特征序列扫描：每次从最后一个确定线段后重扫 vs 从保存的扫描状态接着扫
+    # 随机游走的线段很短，两者持平；长时间单边走势(未确定线段很长)时重扫的代价随长度增长
+    import Seg.SegListChan
+    from Seg.SegListChan import CSegListChan
+    raw_update, raw_scan, raw_step = CSegListChan.update, CSegListChan.cal_seg_sure, Seg.SegListChan.EIGEN_CHECKPOINT_STEP
+    cost = {"scan": 0.0, "update": 0.0}
+    depth = [0]
+
+    def timed_update(self, bi_lst):
+        begin = time.perf_counter()
+        raw_update(self, bi_lst)
+        cost["update"] += time.perf_counter() - begin
+
+    def timed_scan(self, bi_lst, begin_idx):
+        # cal_seg_sure会递归，只计最外层
+        depth[0] += 1
+        begin = time.perf_counter()
+        try:
+            raw_scan(self, bi_lst, begin_idx)
+        finally:
+            depth[0] -= 1
+            if depth[0] == 0:
+                cost["scan"] += time.perf_counter() - begin
+
+    def random_walk(step_bars):
+        chan = make_chan([KL_TYPE.K_1M], step_bars, {"trigger_step": True})
+        for _ in chan.step_load():
+            pass
+        return chan
+
+    def long_trend(trend_bars):
+        chan = make_chan([KL_TYPE.K_1M], 2000, {"trigger_step": True})
+        for _ in chan.step_load():
+            pass
+        klu_lst, pre_klu = [], chan[0][-1][-1]
+        for i in range(trend_bars):
+            pre_klu = trend_klu(pre_klu, i)
+            klu_lst.append(pre_klu)
+        cost["scan"] = cost["update"] = 0.0  # 只计走势部分
+        chan.trigger_load({chan.lv_list[0]: klu_lst})
+        return chan
+
+    def run(func, bars, checkpoint_step):
+        Seg.SegListChan.EIGEN_CHECKPOINT_STEP = checkpoint_step
+        cost["scan"] = cost["update"] = 0.0
+        chan = func(bars)
+        return [(seg.start_bi.idx, seg.end_bi.idx, seg.is_sure) for seg in chan[0].seg_list], cost["scan"], cost["update"]
+
+    rows = []
+    CSegListChan.update, CSegListChan.cal_seg_sure = timed_update, timed_scan
+    try:
+        for name, func, bars in [("random walk", random_walk, min(args.bars, 20000)), ("long trend", long_trend, min(args.bars, 2000))]:
+            old_segs, old_scan, old_update = run(func, bars, 0)
+            new_segs, new_scan, new_update = run(func, bars, raw_step)
+            rows.append([
+                name,
+                bars,
+                f"{old_scan:.2f}s",
+                f"{new_scan:.2f}s",
+                f"{old_scan / new_scan:.1f}x",
+                f"{old_update:.2f}s",
+                f"{new_update:.2f}s",
+                old_segs == new_segs,
+            ])
+    finally:
+        CSegListChan.update, CSegListChan.cal_seg_sure = raw_update, raw_scan
+        Seg.SegListChan.EIGEN_CHECKPOINT_STEP = raw_step
+    report("seg list update in step mode", rows, ["case", "bars", "rescan eigen", "resume eigen", "speedup", "rescan update", "resume update", "same segs"])
+
+
+@benchmark("snapshot")
+def bench_snapshot(args):
+    # 多级别全量状态持久化：pickle vs 二进制快照(只读头部/首次访问全部级别)
+    import os
+    import tempfile
+    lv_list = [KL_TYPE.K_30M, KL_TYPE.K_5M, KL_TYPE.K_1M]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pkl_path, snap_path = os.path.join(tmp_dir, "chan.pkl"), os.path.join(tmp_dir, "chan.snap")
+        for columnar in (False, True):
+            chan = make_chan(lv_list, args.bars, {"columnar_kl": columnar})
+            _, pkl_dump = timeit(lambda: chan.chan_dump_pickle(pkl_path))
+            _, snap_dump = timeit(lambda: chan.chan_dump_snapshot(snap_path))
+            del chan
+            _, pkl_load = timeit(lambda: CChan.chan_load_pickle(pkl_path))
+            snap_chan, snap_open = timeit(lambda: CChan.chan_load_snapshot(snap_path))
+            _, snap_full = timeit(lambda: [snap_chan[lv] for lv in lv_list])
+            rows.append([
+                columnar,
+                f"{os.path.getsize(pkl_path) / 2**20:.1f}MB",
+                f"{os.path.getsize(snap_path) / 2**20:.1f}MB",
+                f"{pkl_dump:.2f}s",
+                f"{snap_dump:.2f}s",
+                f"{pkl_load:.2f}s",
+                f"{snap_open * 1e3:.1f}ms",
+                f"{snap_full:.2f}s",
+                f"{pkl_load / snap_full:.1f}x",
+            ])
+            del snap_chan
+    report(
+        f"snapshot vs pickle ({'/'.join(lv.name for lv in lv_list)}, {args.bars} bars of {lv_list[-1].name})",
+        rows,
+        ["columnar_kl", "pickle", "snapshot", "pickle dump", "snap dump", "pickle load", "snap open", "snap full", "speedup"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("case", choices=sorted(BENCHMARKS) + ["all"])
+    parser.add_argument("--bars", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--spec_bars", type=int, default=5, help="checkpoint用例中每次推演的K线数")
+    parser.add_argument("--deepcopy_1m", action="store_true", help="checkpoint用例在1M根K线时也跑deepcopy对照")
+    args = parser.parse_args()
+    sys.setrecursionlimit(0x100000)  # 长历史分钟线的线段计算递归较深，见quick_guide.md
+    for name, func in BENCHMARKS.items():
+        if args.case in (name, "all"):
+            func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-import copy
 from typing import List
 
 from Chan import CChan
@@ -34,8 +33,7 @@ if __name__ == "__main__":
         "trigger_step": True,
     })
 
-    # 快照
-    chan_snapshot = CChan(
+    chan = CChan(
         code=code,
         data_src=data_src_type,
         lv_list=lv_list,
@@ -51,11 +49,15 @@ if __name__ == "__main__":
         klu_60m = combine_60m_klu_form_15m(klu_15m_lst_tmp)  # 合成60分钟K线
 
         """
-        拷贝一份chan_snapshot
-        如果是用序列化方式，这里可以采用pickle.load()
+        不需要再deepcopy快照：
+        每个60M周期的第一根15M K线到来时append一根新的60M K线，之后只用update_last_klu原地更新这根未完成的60M K线，
+        CChan内部只回滚受影响的尾部(虚笔、不确定的线段、中枢、买卖点)再重新计算
         """
-        chan: CChan = copy.deepcopy(chan_snapshot)
-        chan.trigger_load({KL_TYPE.K_60M: [klu_60m], KL_TYPE.K_15M: klu_15m_lst_tmp})
+        if len(klu_15m_lst_tmp) == 1:
+            chan.append_klu(KL_TYPE.K_60M, klu_60m)
+        else:
+            chan.update_last_klu(KL_TYPE.K_60M, klu_60m)
+        chan.append_klu(KL_TYPE.K_15M, klu_15m)
 
         """
         策略开始：
@@ -67,11 +69,6 @@ if __name__ == "__main__":
         # 策略结束：
 
         if len(klu_15m_lst_tmp) == 4:  # 已经完成4根15分钟K线了，说明这个最新的60分钟K线和里面的4根15分钟K线在将来不会再变化
-            """
-            把当前完整chan重新保存成chan_snapshot
-            如果是序列化方式，这里可以采用pickle.dump()
-            """
-            chan_snapshot = chan
-            klu_15m_lst_tmp = []  # 清空1分钟K线，用于下一个五分钟周期的合成
+            klu_15m_lst_tmp = []  # 清空15分钟K线，用于下一个60分钟周期的合成
 
     CBaoStock.do_close()
@@ -7,12 +7,22 @@ from KLine.KLine_Unit import CKLine_Unit
 
 # 合并后的K线
 class CKLine(CKLine_Combiner[CKLine_Unit]):
+    __slots__ = ("idx", "kl_type")
+
     def __init__(self, kl_unit: CKLine_Unit, idx, _dir=KLINE_DIR.UP):
         super(CKLine, self).__init__(kl_unit, _dir)
         self.idx: int = idx
         self.kl_type = kl_unit.kl_type
         kl_unit.set_klc(self)
 
+    @staticmethod
+    def item_range(item: CKLine_Unit):
+        return item.high, item.low
+
+    @staticmethod
+    def item_time(item: CKLine_Unit):
+        return item.time, item.time
+
     def __str__(self):
         fx_token = ""
         if self.fx == FX_TYPE.TOP:
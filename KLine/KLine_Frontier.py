@@ -0,0 +1,318 @@
+"""
+K线列表的可变前沿(frontier)
+来一根新K线时，CKLine_List里会被改动的只有尾部：最后几根合并K线、末尾的笔、不确定的线段、
+last_sure_pos之后的中枢和买卖点，以及指标模型的递推状态。
+CKLine_Frontier只记录这部分对象的字段和各个容器在前沿处的下标，restore时原样写回，
+开销和未确定的尾部大小成正比，和历史长度无关；同一个快照可以反复restore。
+已经确定的部分之后不会再变，所以快照之后追加多根K线再restore也一样成立
+"""
+import copy
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from Common.ChanException import CChanException, ErrCode
+from Common.CTime import CTime
+from Common.func_util import slot_names
+from Math.Demark import CDemarkEngine
+from Math.MACD import CMACD
+
+
+class _CSentinel:
+    # 哨兵对象，pickle(比如保存快照)之后仍是同一个对象
+    def __init__(self, name):
+        self.name = name
+
+    def __reduce__(self):
+        return self.name
+
+
+_UNSET = _CSentinel("_UNSET")
+_KEEP = _CSentinel("_KEEP")  # 跳过的字段，restore时保持原样
+_CONTAINER_TYPES = (list, dict, deque, set)
+
+
+class _Nested:
+    # 字段指向的对象本身也会被原地修改，需要一并保存
+    __slots__ = ("obj", "state")
+
+    def __init__(self, obj, state):
+        self.obj = obj
+        self.state = state
+
+
+def _copy_value(value):
+    # 容器会被原地append/pop，只拷贝一层；_memoize_cache也按原样保存，
+    # 原流程里缓存并不总是及时失效，清空缓存反而会和不回滚的结果不一致
+    return copy.copy(value) if isinstance(value, _CONTAINER_TYPES) else value
+
+
+def capture_state(obj, skip=(), nested=()) -> dict:
+    # skip: 由调用方自己负责恢复的字段(一般是只追加的长list)
+    state = {name: _KEEP if name in skip else _copy_value(getattr(obj, name, _UNSET)) for name in slot_names(type(obj))}
+    if hasattr(obj, "__dict__"):
+        state.update((name, _KEEP if name in skip else _copy_value(value)) for name, value in vars(obj).items())
+    for name in nested:
+        if state.get(name) is not None:
+            state[name] = _Nested(state[name], capture_state(state[name]))
+    return state
+
+
+def restore_state(obj, state: dict):
+    if hasattr(obj, "__dict__"):
+        for name in [name for name in vars(obj) if name not in state]:
+            delattr(obj, name)
+    for name, value in state.items():
+        if value is _KEEP:
+            continue
+        if value is _UNSET:
+            if hasattr(obj, name):
+                delattr(obj, name)
+        elif isinstance(value, _Nested):
+            restore_state(value.obj, value.state)
+            setattr(obj, name, value.obj)
+        else:
+            setattr(obj, name, _copy_value(value))
+
+
+def state_changed(obj, state: dict) -> bool:
+    # 和capture_state的结果比较，_memoize_cache只是惰性缓存，不算改动
+    for name, value in state.items():
+        if value is _KEEP or name == "_memoize_cache":
+            continue
+        cur = getattr(obj, name, _UNSET)
+        if isinstance(value, _Nested):
+            if cur is not value.obj or state_changed(cur, value.state):
+                return True
+        elif cur is not value and cur != value and not _same_time(cur, value):
+            return True
+    return False
+
+
+def _same_time(a, b) -> bool:
+    # CTime没有定义__eq__，快照加载之后同一个时间可能是不同的对象
+    return isinstance(a, CTime) and isinstance(b, CTime) and (a.epoch, a.auto) == (b.epoch, b.auto)
+
+
+class _CListTail:
+    """
+    某个list从begin开始的尾部元素，以及这些元素各自的字段；base是更早的前沿，起点取两者中更靠前的
+    begin是按各算法的回刷范围推出来的，另外记下begin前一个元素(guard)的字段，
+    restore时如果它被改过，说明回刷越过了begin，尾部快照已经不完整，直接报错而不是恢复出错误的结果
+    """
+    def __init__(self, lst: list, begin: int, nested=(), base: Optional['_CListTail'] = None):
+        if base is not None:
+            begin = min(begin, base.begin)
+        self.begin = begin
+        self.items = [(item, capture_state(item, nested=nested)) for item in lst[begin:]]
+        self.guard = (lst[begin - 1], capture_state(lst[begin - 1], nested=nested)) if 0 < begin <= len(lst) else None
+
+    def restore(self, lst: list):
+        if self.guard is not None:
+            guard, state = self.guard
+            if len(lst) < self.begin or lst[self.begin - 1] is not guard or state_changed(guard, state):
+                raise CChanException(f"{type(guard).__name__}在前沿位置{self.begin}之前被修改，checkpoint的回刷范围不足", ErrCode.COMMON_ERROR)
+        lst[self.begin:] = [item for item, _ in self.items]
+        for item, state in self.items:
+            restore_state(item, state)
+
+
+def _capture_metric(model):
+    if isinstance(model, CMACD):
+        # 历史输出只会追加(或替换最后一个)，记下长度和最后一个即可
+        return capture_state(model, skip=("macd_info",)), len(model.macd_info), model.macd_info[-1:]
+    if isinstance(model, CDemarkEngine):
+        series = [(s, capture_state(s, nested=("countdown",))) for s in model.series]
+        return capture_state(model, skip=("kl_lst",) if model.keep_history else ()), len(model.kl_lst), series
+    # 其余指标模型只有定长的窗口状态
+    return copy.deepcopy(model)
+
+
+def _restore_metric(model, saved):
+    if isinstance(model, CMACD):
+        state, cnt, last = saved
+        restore_state(model, state)
+        del model.macd_info[cnt:]
+        model.macd_info[cnt - len(last):] = last
+    elif isinstance(model, CDemarkEngine):
+        state, cnt, series = saved
+        if model.keep_history:
+            del model.kl_lst[cnt:]
+        restore_state(model, state)
+        for s, s_state in series:
+            restore_state(s, s_state)
+    else:
+        model.__dict__.update(copy.deepcopy(saved).__dict__)
+
+
+def _seg_zs_begin(seg_lst) -> int:
+    # update_zs_in_seg会从后往前重算到第一个ele_inside_is_sure的线段为止
+    idx = len(seg_lst)
+    while idx > 0 and not seg_lst[idx - 1].ele_inside_is_sure:
+        idx -= 1
+    return idx
+
+
+def _line_begin(line_lst, seg_lst, seg_begin: int, last_sure_seg_start: int) -> int:
+    # 笔(或者作为线段的线段里的"笔")可能被修改的起点：
+    # 虚笔/最后一笔的更新，cal_seg回刷seg_idx的范围，会被删除重算的线段里的笔(parent_seg)
+    begin = min(len(line_lst) - 2, max(last_sure_seg_start, 0))
+    if seg_begin < len(seg_lst):
+        begin = min(begin, seg_lst[seg_begin].start_bi.idx)
+    return max(begin, 0)
+
+
+def _zs_begin(zs_list, seg_list, line_begin: int) -> int:
+    # last_sure_pos之后的中枢会被删除重算，update_zs_in_seg会重设未确定区域内中枢的进出笔，再往前两个可能被合并修改
+    thred = min(zs_list.last_sure_pos, line_begin)
+    seg_begin = _seg_zs_begin(seg_list)
+    if seg_begin < len(seg_list):
+        thred = min(thred, seg_list[seg_begin].start_bi.idx)
+    thred -= 1
+    idx = len(zs_list.zs_lst)
+    while idx > 0 and zs_list.zs_lst[idx - 1].end_bi.idx >= thred:
+        idx -= 1
+    return max(idx - 2, 0)
+
+
+def _bsp_begin(bsp_lst, line_begin: int) -> int:
+    idx = len(bsp_lst)
+    while idx > 0 and bsp_lst[idx - 1].bi.idx >= line_begin:
+        idx -= 1
+    return idx
+
+
+class _CBSPointFrontier:
+    def __init__(self, bsp_list, line_begin: int, base: Optional['_CBSPointFrontier'] = None):
+        self.state = capture_state(bsp_list, skip=("bsp_store_dict", "bsp_store_flat_dict", "bsp1_list", "bsp1_dict"))
+        self.store: Dict[object, Tuple[_CListTail, _CListTail]] = {}
+        for bsp_type, lst_pair in bsp_list.bsp_store_dict.items():
+            base_tails = base.store.get(bsp_type) if base is not None else None
+            self.store[bsp_type] = tuple(
+                _CListTail(lst, _bsp_begin(lst, line_begin), nested=("features",), base=base_tails[is_buy] if base_tails else None)
+                for is_buy, lst in enumerate(lst_pair)
+            )
+        self.bsp1 = _CListTail(bsp_list.bsp1_list, _bsp_begin(bsp_list.bsp1_list, line_begin), base=base.bsp1 if base is not None else None)
+
+    def restore(self, bsp_list):
+        # 同一根笔上的买卖点前后可能换了类型，所以先把所有尾部从flat_dict删掉，再统一写回
+        flat_dict = bsp_list.bsp_store_flat_dict
+        for bsp_type, lst_pair in list(bsp_list.bsp_store_dict.items()):
+            tails = self.store.get(bsp_type)
+            for is_buy in (False, True):
+                for bsp in lst_pair[is_buy][tails[is_buy].begin if tails else 0:]:
+                    del flat_dict[bsp.bi.idx]
+            if tails is None:  # 快照之后才出现的买卖点类型
+                del bsp_list.bsp_store_dict[bsp_type]
+        for bsp_type, tails in self.store.items():
+            lst_pair = bsp_list.bsp_store_dict.setdefault(bsp_type, ([], []))
+            for is_buy in (False, True):
+                tails[is_buy].restore(lst_pair[is_buy])
+                for bsp, _ in tails[is_buy].items:
+                    flat_dict[bsp.bi.idx] = bsp
+        if list(bsp_list.bsp_store_dict) != list(self.store):  # 保持类型的先后顺序
+            bsp_list.bsp_store_dict = {bsp_type: bsp_list.bsp_store_dict[bsp_type] for bsp_type in self.store}
+
+        for bsp in bsp_list.bsp1_list[self.bsp1.begin:]:
+            del bsp_list.bsp1_dict[bsp.bi.idx]
+        self.bsp1.restore(bsp_list.bsp1_list)
+        for bsp, _ in self.bsp1.items:
+            bsp_list.bsp1_dict[bsp.bi.idx] = bsp
+        restore_state(bsp_list, self.state)
+
+
+class _CLayerFrontier:
+    """
+    一层"笔-线段-中枢-买卖点"的前沿：笔层是(bi_list, seg_list, zs_list, bs_point_lst)，
+    线段层是(seg_list, segseg_list, segzs_list, seg_bs_point_lst)
+    """
+    def __init__(self, seg_list, zs_list, bsp_list, line_begin: int, seg_begin: int, base: Optional['_CLayerFrontier'] = None):
+        self.seg_list_state = capture_state(seg_list, skip=("lst",))
+        self.seg_tail = _CListTail(seg_list.lst, seg_begin, base=base and base.seg_tail)
+        self.zs_list_state = capture_state(zs_list, skip=("zs_lst",))
+        self.zs_tail = _CListTail(zs_list.zs_lst, _zs_begin(zs_list, seg_list, line_begin), base=base and base.zs_tail)
+        self.bsp = _CBSPointFrontier(bsp_list, line_begin, base=base and base.bsp)
+
+    def restore(self, seg_list, zs_list, bsp_list):
+        self.seg_tail.restore(seg_list.lst)
+        restore_state(seg_list, self.seg_list_state)
+        self.zs_tail.restore(zs_list.zs_lst)
+        restore_state(zs_list, self.zs_list_state)
+        self.bsp.restore(bsp_list)
+
+
+class CKLine_Frontier:
+    """
+    base: 这一级别未完成K线追加前的前沿(append_klu时记录的)
+    带上base之后，先restore(base)重算过的尾部也能被这个前沿完整地写回，
+    即在未完成K线上打的checkpoint，中间调用过update_last_klu也依然可以restore
+    """
+    def __init__(self, kl_list, base: Optional['CKLine_Frontier'] = None):
+        self.kl_list_state = {
+            "last_sure_seg_start_bi_idx": kl_list.last_sure_seg_start_bi_idx,
+            "last_sure_segseg_start_bi_idx": kl_list.last_sure_segseg_start_bi_idx,
+            "metric_pending_klu": list(kl_list.metric_pending_klu),
+        }
+        # 只有最后一根合并K线会被合并，倒数第二根会更新分形，倒数第三根会改next
+        self.klc_tail = _CListTail(kl_list.lst, max(len(kl_list.lst) - 3, 0), base=base and base.klc_tail)
+        klu_lst = [] if base is None else [klu for klu, _, _ in base.klu_link]
+        if kl_list.lst and kl_list.lst[-1].lst[-1] not in klu_lst:
+            klu_lst.append(kl_list.lst[-1].lst[-1])
+        self.klu_link = [(klu, klu.next, list(klu.sub_kl_list)) for klu in klu_lst]
+        self.store_size = None if kl_list.klu_store is None else len(kl_list.klu_store)
+        self.store_rows = None if base is None or base.store_size is None else kl_list.klu_store.get_rows(base.store_size)
+        self.metric_state = [(model, _capture_metric(model)) for model in kl_list.metric_model_lst + kl_list.batch_metric_model_lst]
+
+        bi_list, seg_list, segseg_list = kl_list.bi_list, kl_list.seg_list, kl_list.segseg_list
+        # 线段层：线段作为"笔"时被修改的范围，和线段自身会被删除重算/更新中枢的范围取并集
+        segseg_begin = min(segseg_list.frontier_begin(), _seg_zs_begin(segseg_list))
+        seg_as_line_begin = _line_begin(seg_list, segseg_list, segseg_list.frontier_begin(), kl_list.last_sure_segseg_start_bi_idx)
+        seg_begin = min(seg_list.frontier_begin(), _seg_zs_begin(seg_list), seg_as_line_begin)
+        bi_begin = _line_begin(bi_list, seg_list, seg_list.frontier_begin(), kl_list.last_sure_seg_start_bi_idx)
+        if base is not None:
+            bi_begin, seg_as_line_begin = min(bi_begin, base.bi_begin), min(seg_as_line_begin, base.seg_as_line_begin)
+        self.bi_begin, self.seg_as_line_begin = bi_begin, seg_as_line_begin
+
+        self.bi_list_state = capture_state(bi_list, skip=("bi_list",))
+        self.bi_tail = _CListTail(bi_list.bi_list, bi_begin, base=base and base.bi_tail)
+        self.bi_layer = _CLayerFrontier(seg_list, kl_list.zs_list, kl_list.bs_point_lst, bi_begin, seg_begin, base=base and base.bi_layer)
+        self.seg_layer = _CLayerFrontier(segseg_list, kl_list.segzs_list, kl_list.seg_bs_point_lst, seg_as_line_begin, segseg_begin, base=base and base.seg_layer)
+
+    def restore(self, kl_list):
+        kl_list.last_sure_seg_start_bi_idx = self.kl_list_state["last_sure_seg_start_bi_idx"]
+        kl_list.last_sure_segseg_start_bi_idx = self.kl_list_state["last_sure_segseg_start_bi_idx"]
+        kl_list.metric_pending_klu = list(self.kl_list_state["metric_pending_klu"])
+
+        self.klc_tail.restore(kl_list.lst)
+        for klu, _next, sub_kl_list in self.klu_link:
+            klu.next = _next
+            klu.sub_kl_list = list(sub_kl_list)
+        if self.store_size is not None:
+            kl_list.klu_store.truncate(self.store_size)
+            if self.store_rows is not None:
+                kl_list.klu_store.set_rows(self.store_rows)
+        for model, saved in self.metric_state:
+            _restore_metric(model, saved)
+
+        self.bi_tail.restore(kl_list.bi_list.bi_list)
+        restore_state(kl_list.bi_list, self.bi_list_state)
+        self.bi_layer.restore(kl_list.seg_list, kl_list.zs_list, kl_list.bs_point_lst)
+        self.seg_layer.restore(kl_list.segseg_list, kl_list.segzs_list, kl_list.seg_bs_point_lst)
+
+
+class CChan_Checkpoint:
+    """
+    CChan所有级别的前沿，加上CChan自身的加载状态(klu_last_t、klu_cache、未完成K线的前沿等)
+    restore之后比它晚打的checkpoint全部失效；数据源迭代器(g_kl_iter)不会回退
+    """
+    def __init__(self, chan):
+        forming_frontier = getattr(chan, "forming_frontier", {})
+        self.kl_frontier = {lv: kl_list.checkpoint(forming_frontier.get(lv)) for lv, kl_list in chan.kl_datas.items()}
+        self.chan_state = capture_state(chan, skip=("kl_datas", "g_kl_iter", "kl_inconsistent_detail"))
+        self.inconsistent_detail = {k: list(v) for k, v in chan.kl_inconsistent_detail.items()}
+
+    def restore(self, chan):
+        for lv, frontier in self.kl_frontier.items():
+            chan.kl_datas[lv].restore(frontier)
+        restore_state(chan, self.chan_state)
+        chan.kl_inconsistent_detail.clear()
+        chan.kl_inconsistent_detail.update((k, list(v)) for k, v in self.inconsistent_detail.items())
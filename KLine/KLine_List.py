@@ -1,5 +1,5 @@
 import copy
-from typing import List, Union, overload
+from typing import List, Optional, Union, overload
 
 from Bi.Bi import CBi
 from Bi.BiList import CBiList
@@ -13,6 +13,7 @@ from Seg.SegListComm import CSegListComm
 from ZS.ZSList import CZSList
 
 from .KLine import CKLine
+from .KLine_Frontier import CKLine_Frontier
 from .KLine_Unit import CKLine_Unit
 
 
@@ -49,14 +50,29 @@ class CKLine_List:
 
         self.metric_model_lst = conf.GetMetricModel()
 
+        self.klu_store = None
+        if conf.columnar_kl:
+            from .KLine_Store import CKLine_Store
+            self.klu_store = CKLine_Store(kl_type)
+
         self.step_calculation = self.need_cal_step_by_step()
 
+        # 非逐步模式下可以把指标留到cal_seg_and_zs之前批量计算
+        self.batch_metric_model_lst = []
+        if conf.batch_metric and not self.step_calculation:
+            from Math.MetricBatch import support_batch
+            self.batch_metric_model_lst = [model for model in self.metric_model_lst if support_batch(model)]
+            self.metric_model_lst = [model for model in self.metric_model_lst if not support_batch(model)]
+        self.metric_pending_klu: List[CKLine_Unit] = []  # 还没有计算批量指标的klu
+
         self.last_sure_seg_start_bi_idx = -1
         self.last_sure_segseg_start_bi_idx = -1
 
     def __deepcopy__(self, memo):
         new_obj = CKLine_List(self.kl_type, self.config)
         memo[id(self)] = new_obj
+        if self.klu_store is not None:
+            new_obj.klu_store = copy.deepcopy(self.klu_store, memo)
         for klc in self.lst:
             klus_new = []
             for klu in klc.lst:
@@ -85,8 +101,14 @@ class CKLine_List:
         new_obj.segzs_list = copy.deepcopy(self.segzs_list, memo)
         new_obj.bs_point_lst = copy.deepcopy(self.bs_point_lst, memo)
         new_obj.metric_model_lst = copy.deepcopy(self.metric_model_lst, memo)
+        new_obj.batch_metric_model_lst = copy.deepcopy(self.batch_metric_model_lst, memo)
+        new_obj.metric_pending_klu = [memo[id(klu)] for klu in self.metric_pending_klu]
         new_obj.step_calculation = copy.deepcopy(self.step_calculation, memo)
         new_obj.seg_bs_point_lst = copy.deepcopy(self.seg_bs_point_lst, memo)
+        for klc in self.lst[-2:]:  # 合并K线是重新构造的，补上还可能合并的K线上登记的笔
+            for obj in klc.watchers or ():
+                if id(obj) in memo:
+                    memo[id(klc)].add_watcher(memo[id(obj)])
         return new_obj
 
     @overload
@@ -101,7 +123,17 @@ class CKLine_List:
     def __len__(self):
         return len(self.lst)
 
+    def cal_metric_batch(self):
+        if not self.metric_pending_klu:
+            return
+        from Math.MetricBatch import cal_metric_batch
+        for metric_model in self.batch_metric_model_lst:
+            for klu, value in zip(self.metric_pending_klu, cal_metric_batch(metric_model, self.metric_pending_klu)):
+                klu.apply_metric(metric_model, value)
+        self.metric_pending_klu = []
+
     def cal_seg_and_zs(self):
+        self.cal_metric_batch()
         if not self.step_calculation:
             self.bi_list.try_add_virtual_bi(self.lst[-1])
         self.last_sure_seg_start_bi_idx = cal_seg(self.bi_list, self.seg_list, self.last_sure_seg_start_bi_idx)
@@ -119,8 +151,13 @@ class CKLine_List:
     def need_cal_step_by_step(self):
         return self.config.trigger_step
 
-    def add_single_klu(self, klu: CKLine_Unit):
+    def add_single_klu(self, klu: CKLine_Unit) -> CKLine_Unit:
+        # 返回实际存入的klu，列式存储模式下是CKLine_Unit_View
+        if self.klu_store is not None:
+            klu = self.klu_store.add(klu)
         klu.set_metric(self.metric_model_lst)
+        if self.batch_metric_model_lst:
+            self.metric_pending_klu.append(klu)
         if len(self.lst) == 0:
             self.lst.append(CKLine(klu, idx=0))
         else:
@@ -133,6 +170,14 @@ class CKLine_List:
                     self.cal_seg_and_zs()
             elif self.step_calculation and self.bi_list.try_add_virtual_bi(self.lst[-1], need_del_end=True):  # 这里的必要性参见issue#175
                 self.cal_seg_and_zs()
+        return klu
+
+    def checkpoint(self, base: Optional[CKLine_Frontier] = None) -> CKLine_Frontier:
+        # 保存之后的K线可能改动到的尾部状态，restore之后和调用checkpoint时完全一致
+        return CKLine_Frontier(self, base)
+
+    def restore(self, frontier: CKLine_Frontier):
+        frontier.restore(self)
 
     def klu_iter(self, klc_begin_idx=0):
         for klc in self.lst[klc_begin_idx:]:
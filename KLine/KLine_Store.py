@@ -0,0 +1,447 @@
+import copy
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from Common.CEnum import DATA_FIELD, TRADE_INFO_LST, TREND_TYPE
+from Common.CTime import CTime, days_from_civil
+from Math.BOLL import BOLL_Metric, BollModel
+from Math.Demark import CDemarkIndex
+from Math.KDJ import KDJ, KDJ_Item
+from Math.MACD import CMACD, CMACD_item
+from Math.RSI import RSI
+from Math.TrendModel import CTrendModel
+
+from .KLine_Unit import CKLine_Unit
+from .TradeInfo import CTradeInfo
+
+_INIT_CAPACITY = 1024
+
+_BASE_COLUMNS = {
+    "idx": np.int64,
+    "time_ts": np.int64,  # CTime.key，比较大小用
+    "time_key": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    DATA_FIELD.FIELD_VOLUME: np.float64,
+    DATA_FIELD.FIELD_TURNOVER: np.float64,
+    DATA_FIELD.FIELD_TURNRATE: np.float64,
+    "limit_flag": np.int8,
+    "trade_int": np.int8,  # 成交信息里原本是int的字段，按TRADE_INFO_LST的顺序按位标记
+}
+
+_MACD_COLUMNS = ["macd_fast_ema", "macd_slow_ema", "macd_dif", "macd_dea"]
+_BOLL_COLUMNS = ["boll_theta", "boll_up", "boll_down", "boll_mid"]
+_KDJ_COLUMNS = ["kdj_k", "kdj_d", "kdj_j"]
+_VIEW_STATE = ("_store", "_pos", "_sub_kl_list", "_klc", "sup_kl", "pre", "next")
+
+
+def encode_time(t: CTime) -> int:
+    # YYYYMMDDHHMMSS + auto标记，保证可以原样还原CTime
+    year, month, day, hour, minute, second = t.fields()
+    key = ((((year * 100 + month) * 100 + day) * 100 + hour) * 100 + minute) * 100 + second
+    return key * 2 + int(t.auto)
+
+
+def decode_time(key: int) -> CTime:
+    auto = bool(key & 1)
+    key >>= 1
+    key, second = divmod(key, 100)
+    key, minute = divmod(key, 100)
+    key, hour = divmod(key, 100)
+    key, day = divmod(key, 100)
+    year, month = divmod(key, 100)
+    return CTime(year, month, day, hour, minute, second, auto=auto)
+
+
+def decode_times(keys: np.ndarray) -> List[CTime]:
+    # decode_time的批量版本，不逐个构造datetime
+    auto = (keys & 1).astype(bool)
+    rest = keys >> 1
+    values = []
+    for _ in range(5):
+        rest, value = np.divmod(rest, 100)
+        values.append(value)
+    second, minute, hour, day, month = values
+    days = days_from_civil(rest, month, day)
+    return CTime.from_epochs(days * 86400 + hour * 3600 + minute * 60 + second, auto)
+
+
+def trend_column(trend_type: TREND_TYPE, T: int) -> str:
+    return f"trend_{trend_type.value}_{T}"
+
+
+class CKLine_Store:
+    """
+    列式K线存储：OHLC、时间、成交信息以及各指标输出都放在可增长的numpy数组里，
+    CKLine_Unit_View只保存下标，访问属性时再从数组中读取
+    时间另外按行缓存CTime对象(加入时直接用原K线的CTime，从列数据还原的行第一次访问时再解码)，
+    同一根K线每次取到的都是同一个CTime
+    """
+    def __init__(self, kl_type=None):
+        self.kl_type = kl_type
+        self.size = 0
+        self.capacity = _INIT_CAPACITY
+        self.columns: Dict[str, np.ndarray] = {name: np.zeros(self.capacity, dtype=dtype) for name, dtype in _BASE_COLUMNS.items()}
+        self.times: List[Optional[CTime]] = [None] * self.capacity
+        self.trend_keys: Dict[TREND_TYPE, List[int]] = {}
+        self.demark: Dict[int, CDemarkIndex] = {}  # 稀疏存储，只记录非空的demark
+
+    def __len__(self):
+        return self.size
+
+    def __deepcopy__(self, memo):
+        obj = CKLine_Store.__new__(CKLine_Store)
+        memo[id(self)] = obj
+        obj.kl_type = self.kl_type
+        obj.size = self.size
+        obj.capacity = max(self.size, 1)
+        obj.columns = {name: arr[:obj.capacity].copy() for name, arr in self.columns.items()}
+        obj.times = self.times[:obj.capacity]  # CTime不可变，可以共用
+        obj.trend_keys = {k: list(v) for k, v in self.trend_keys.items()}
+        obj.demark = copy.deepcopy(self.demark, memo)
+        return obj
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["capacity"] = max(self.size, 1)
+        state["columns"] = {name: arr[:state["capacity"]].copy() for name, arr in self.columns.items()}
+        state["times"] = [None] * state["capacity"]  # 不存CTime对象，读出来之后按time_key重新解码
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.fill_missing()
+
+    def fill_missing(self):
+        # 旧版本pickle/快照里没有的字段：成交信息都按float还原，时间第一次访问时解码
+        if "trade_int" not in self.columns:
+            self.columns["trade_int"] = np.zeros(self.capacity, dtype=np.int8)
+        if getattr(self, "times", None) is None:
+            self.times = [None] * self.capacity
+
+    def nbytes(self) -> int:
+        return sum(arr.nbytes for arr in self.columns.values())
+
+    def __grow(self):
+        new_capacity = max(self.capacity * 2, _INIT_CAPACITY)
+        for name, arr in self.columns.items():
+            new_arr = np.zeros(new_capacity, dtype=arr.dtype)
+            new_arr[:self.size] = arr[:self.size]
+            self.columns[name] = new_arr
+        self.times.extend([None] * (new_capacity - self.capacity))
+        self.capacity = new_capacity
+
+    def truncate(self, size):
+        # 丢弃size之后的K线，恢复前沿快照时使用
+        for pos in range(size, self.size):
+            self.demark.pop(pos, None)
+            self.times[pos] = None
+        self.size = size
+
+    def get_rows(self, begin):
+        # begin之后各行的拷贝，配合truncate/set_rows把被覆盖过的行写回
+        return begin, {name: arr[begin:self.size].copy() for name, arr in self.columns.items()}, \
+            {pos: self.demark[pos] for pos in range(begin, self.size) if pos in self.demark}
+
+    def set_rows(self, rows):
+        begin, columns, demark = rows
+        for name, values in columns.items():
+            self.columns[name][begin:begin + len(values)] = values
+            self.times[begin:begin + len(values)] = [None] * len(values)
+        for pos in range(begin, self.size):
+            self.demark.pop(pos, None)
+        self.demark.update(demark)
+
+    def add_column(self, name, dtype=np.float64):
+        if name not in self.columns:
+            self.columns[name] = np.full(self.capacity, np.nan, dtype=dtype)
+        return self.columns[name]
+
+    def col(self, name) -> np.ndarray:
+        # 只返回有效部分
+        return self.columns[name][:self.size]
+
+    @classmethod
+    def from_columns(cls, kl_type, columns: Dict[str, np.ndarray], trend_keys, demark) -> 'CKLine_Store':
+        # 直接接管已有的数组(比如从快照文件映射出来的)，追加时才会拷贝扩容
+        store = cls.__new__(cls)
+        store.kl_type = kl_type
+        store.size = store.capacity = len(columns["idx"])
+        store.columns = dict(columns)
+        store.times = None
+        store.trend_keys = trend_keys
+        store.demark = demark
+        store.fill_missing()
+        return store
+
+    @classmethod
+    def from_units(cls, kl_type, klus) -> 'CKLine_Store':
+        # 把普通CKLine_Unit的数据和指标拷贝成列式存储，不改动klu本身
+        store = cls(kl_type)
+        for klu in klus:
+            pos = store.__add_row(klu)
+            if hasattr(klu, "macd"):
+                store.set_macd(pos, klu.macd)
+            if hasattr(klu, "boll"):
+                store.set_boll(pos, klu.boll)
+            if hasattr(klu, "rsi"):
+                store.add_column("rsi")[pos] = klu.rsi
+            if hasattr(klu, "kdj"):
+                store.set_kdj(pos, klu.kdj)
+            for trend_type, T_dict in klu.trend.items():
+                for T, value in T_dict.items():
+                    store.set_trend(pos, trend_type, T, value)
+            if klu.demark.data:
+                store.demark[pos] = klu.demark
+        return store
+
+    def add(self, klu: CKLine_Unit) -> 'CKLine_Unit_View':
+        pos = self.__add_row(klu)
+        view = CKLine_Unit_View(self, pos)
+        view.set_pre_klu(klu.pre)
+        if klu.sup_kl is not None:
+            view.set_parent(klu.sup_kl)
+        for sub_klu in klu.sub_kl_list:
+            view.add_children(sub_klu)
+        return view
+
+    def __add_row(self, klu: CKLine_Unit) -> int:
+        if self.size == self.capacity:
+            self.__grow()
+        pos = self.size
+        self.size += 1
+        cols = self.columns
+        cols["idx"][pos] = klu.idx
+        cols["time_ts"][pos] = klu.time.key
+        cols["time_key"][pos] = encode_time(klu.time)
+        self.times[pos] = klu.time
+        cols["open"][pos] = klu.open
+        cols["high"][pos] = klu.high
+        cols["low"][pos] = klu.low
+        cols["close"][pos] = klu.close
+        int_mask = 0
+        for bit, metric_name in enumerate(TRADE_INFO_LST):
+            value = klu.trade_info.metric.get(metric_name)
+            cols[metric_name][pos] = np.nan if value is None else value
+            if type(value) is int:
+                int_mask |= 1 << bit
+        cols["trade_int"][pos] = int_mask
+        cols["limit_flag"][pos] = klu.limit_flag
+        return pos
+
+    def get_trade_info(self, pos) -> CTradeInfo:
+        info = {}
+        int_mask = self.columns["trade_int"].item(pos)
+        for bit, metric_name in enumerate(TRADE_INFO_LST):
+            value = self.columns[metric_name][pos]
+            if not np.isnan(value):
+                info[metric_name] = int(value) if int_mask >> bit & 1 else value.item()  # int超过2**53时float64已经丢了精度
+        return CTradeInfo(info)
+
+    def get_time(self, pos) -> CTime:
+        t = self.times[pos]
+        if t is None:
+            t = self.times[pos] = decode_time(self.columns["time_key"].item(pos))
+        return t
+
+    def set_macd(self, pos, item: CMACD_item):
+        cols = self.columns
+        if _MACD_COLUMNS[0] not in cols:
+            for name in _MACD_COLUMNS:
+                self.add_column(name)
+        cols["macd_fast_ema"][pos] = item.fast_ema
+        cols["macd_slow_ema"][pos] = item.slow_ema
+        cols["macd_dif"][pos] = item.DIF
+        cols["macd_dea"][pos] = item.DEA
+
+    def get_macd(self, pos) -> CMACD_item:
+        fast_ema, slow_ema, dif, dea = (self.columns[name].item(pos) for name in _MACD_COLUMNS)
+        return CMACD_item(fast_ema=fast_ema, slow_ema=slow_ema, DIF=dif, DEA=dea)
+
+    def set_boll(self, pos, item: BOLL_Metric):
+        cols = self.columns
+        if _BOLL_COLUMNS[0] not in cols:
+            for name in _BOLL_COLUMNS:
+                self.add_column(name)
+        cols["boll_theta"][pos] = item.theta
+        cols["boll_up"][pos] = item.UP
+        cols["boll_down"][pos] = item.DOWN
+        cols["boll_mid"][pos] = item.MID
+
+    def get_boll(self, pos) -> BOLL_Metric:
+        # BOLL_Metric构造时会截断theta/DOWN，这里直接还原保存的值
+        item = BOLL_Metric.__new__(BOLL_Metric)
+        item.theta, item.UP, item.DOWN, item.MID = (self.columns[name].item(pos) for name in _BOLL_COLUMNS)
+        return item
+
+    def set_kdj(self, pos, item: KDJ_Item):
+        for name, value in zip(_KDJ_COLUMNS, (item.k, item.d, item.j)):
+            self.add_column(name)[pos] = value
+
+    def get_kdj(self, pos) -> KDJ_Item:
+        return KDJ_Item(*(self.columns[name].item(pos) for name in _KDJ_COLUMNS))
+
+    def set_trend(self, pos, trend_type: TREND_TYPE, T: int, value: float):
+        if T not in self.trend_keys.setdefault(trend_type, []):
+            self.trend_keys[trend_type].append(T)
+        self.add_column(trend_column(trend_type, T))[pos] = value
+
+    def get_trend(self, pos) -> Dict[TREND_TYPE, Dict[int, float]]:
+        return {
+            trend_type: {T: self.columns[trend_column(trend_type, T)].item(pos) for T in T_lst}
+            for trend_type, T_lst in self.trend_keys.items()
+        }
+
+
+class CKLine_Unit_View(CKLine_Unit):
+    # sup_kl/pre/next复用基类的槽位，其余字段都从store读取
+    __slots__ = ("_store", "_pos", "_sub_kl_list", "_klc")
+
+    def __init__(self, store: CKLine_Store, pos: int):
+        self._store = store
+        self._pos = pos
+        self._sub_kl_list: Optional[list] = None
+        self.sup_kl: Optional[CKLine_Unit] = None
+        self.pre: Optional[CKLine_Unit] = None
+        self.next: Optional[CKLine_Unit] = None
+        self._klc = None
+
+    def __getstate__(self):
+        # 基类槽位中的time/open等在这里是只读property，只保存view真正用到的字段
+        return {name: getattr(self, name) for name in _VIEW_STATE}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __deepcopy__(self, memo):
+        obj = CKLine_Unit_View(copy.deepcopy(self._store, memo), self._pos)
+        memo[id(self)] = obj
+        return obj
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def pos(self):
+        return self._pos
+
+    @property
+    def kl_type(self):
+        return self._store.kl_type
+
+    @kl_type.setter
+    def kl_type(self, kl_type):
+        self._store.kl_type = kl_type
+
+    @property
+    def time(self) -> CTime:
+        return self._store.get_time(self._pos)
+
+    @property
+    def open(self):
+        return self._store.columns["open"].item(self._pos)
+
+    @property
+    def high(self):
+        return self._store.columns["high"].item(self._pos)
+
+    @property
+    def low(self):
+        return self._store.columns["low"].item(self._pos)
+
+    @property
+    def close(self):
+        return self._store.columns["close"].item(self._pos)
+
+    @property
+    def limit_flag(self):
+        return self._store.columns["limit_flag"].item(self._pos)
+
+    @property
+    def trade_info(self):
+        return self._store.get_trade_info(self._pos)
+
+    @property
+    def demark(self) -> CDemarkIndex:
+        return self._store.demark.get(self._pos) or CDemarkIndex()
+
+    @demark.setter
+    def demark(self, demark: CDemarkIndex):
+        if demark.data:
+            self._store.demark[self._pos] = demark
+        else:
+            self._store.demark.pop(self._pos, None)
+
+    @property
+    def trend(self):
+        return self._store.get_trend(self._pos)
+
+    @property
+    def macd(self) -> CMACD_item:
+        if _MACD_COLUMNS[0] not in self._store.columns:
+            raise AttributeError("macd")
+        return self._store.get_macd(self._pos)
+
+    @property
+    def boll(self) -> BOLL_Metric:
+        if _BOLL_COLUMNS[0] not in self._store.columns:
+            raise AttributeError("boll")
+        return self._store.get_boll(self._pos)
+
+    @property
+    def rsi(self):
+        if "rsi" not in self._store.columns:
+            raise AttributeError("rsi")
+        return self._store.columns["rsi"].item(self._pos)
+
+    @property
+    def kdj(self) -> KDJ_Item:
+        if _KDJ_COLUMNS[0] not in self._store.columns:
+            raise AttributeError("kdj")
+        return self._store.get_kdj(self._pos)
+
+    @property
+    def sub_kl_list(self):
+        return [] if self._sub_kl_list is None else self._sub_kl_list
+
+    @sub_kl_list.setter
+    def sub_kl_list(self, sub_kl_list):
+        self._sub_kl_list = sub_kl_list if sub_kl_list else None
+
+    @property
+    def klc(self):
+        assert self._klc is not None
+        return self._klc
+
+    def set_klc(self, klc):
+        self._klc = klc
+
+    @property
+    def idx(self):
+        return self._store.columns["idx"].item(self._pos)
+
+    def set_idx(self, idx):
+        self._store.columns["idx"][self._pos] = idx
+
+    def add_children(self, child):
+        if self._sub_kl_list is None:
+            self._sub_kl_list = []
+        self._sub_kl_list.append(child)
+
+    def apply_metric(self, metric_model, value) -> None:
+        store, pos = self._store, self._pos
+        if isinstance(metric_model, CMACD):
+            store.set_macd(pos, value)
+        elif isinstance(metric_model, CTrendModel):
+            store.set_trend(pos, metric_model.type, metric_model.T, value)
+        elif isinstance(metric_model, BollModel):
+            store.set_boll(pos, value)
+        elif isinstance(metric_model, RSI):
+            store.add_column("rsi")[pos] = value
+        elif isinstance(metric_model, KDJ):
+            store.set_kdj(pos, value)
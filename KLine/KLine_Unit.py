@@ -15,6 +15,12 @@ from .TradeInfo import CTradeInfo
 
 
 class CKLine_Unit:
+    # 用__slots__省内存，实例不能再挂自定义属性，见quick_guide.md
+    __slots__ = (
+        "kl_type", "time", "close", "open", "high", "low", "trade_info", "demark", "sub_kl_list", "sup_kl", "__klc",
+        "trend", "limit_flag", "pre", "next", "__idx", "macd", "boll", "rsi", "kdj",
+    )
+
     def __init__(self, kl_dict, autofix=False):
         # _time, _close, _open, _high, _low, _extra_info={}
         self.kl_type = None
@@ -118,20 +124,27 @@ class CKLine_Unit:
 
     def set_metric(self, metric_model_lst: list) -> None:
         for metric_model in metric_model_lst:
-            if isinstance(metric_model, CMACD):
-                self.macd: CMACD_item = metric_model.add(self.close)
-            elif isinstance(metric_model, CTrendModel):
-                if metric_model.type not in self.trend:
-                    self.trend[metric_model.type] = {}
-                self.trend[metric_model.type][metric_model.T] = metric_model.add(self.close)
-            elif isinstance(metric_model, BollModel):
-                self.boll: BOLL_Metric = metric_model.add(self.close)
-            elif isinstance(metric_model, CDemarkEngine):
+            if isinstance(metric_model, CDemarkEngine):
                 self.demark = metric_model.update(idx=self.idx, close=self.close, high=self.high, low=self.low)
-            elif isinstance(metric_model, RSI):
-                self.rsi = metric_model.add(self.close)
             elif isinstance(metric_model, KDJ):
-                self.kdj = metric_model.add(self.high, self.low, self.close)
+                self.apply_metric(metric_model, metric_model.add(self.high, self.low, self.close))
+            else:
+                self.apply_metric(metric_model, metric_model.add(self.close))
+
+    def apply_metric(self, metric_model, value) -> None:
+        # 保存指标模型算出的单根K线结果，逐根计算和批量计算共用
+        if isinstance(metric_model, CMACD):
+            self.macd: CMACD_item = value
+        elif isinstance(metric_model, CTrendModel):
+            if metric_model.type not in self.trend:
+                self.trend[metric_model.type] = {}
+            self.trend[metric_model.type][metric_model.T] = value
+        elif isinstance(metric_model, BollModel):
+            self.boll: BOLL_Metric = value
+        elif isinstance(metric_model, RSI):
+            self.rsi = value
+        elif isinstance(metric_model, KDJ):
+            self.kdj = value
 
     def get_parent_klc(self):
         assert self.sup_kl is not None
@@ -4,6 +4,8 @@ from Common.CEnum import TRADE_INFO_LST
 
 
 class CTradeInfo:
+    __slots__ = ("metric",)
+
     def __init__(self, info: Dict[str, float]):
         self.metric: Dict[str, Optional[float]] = {}
         for metric_name in TRADE_INFO_LST:
@@ -29,6 +29,8 @@ class T_DEMARK_INDEX(TypedDict):
 
 
 class CDemarkIndex:
+    __slots__ = ("data",)
+
     def __init__(self):
         self.data: List[T_DEMARK_INDEX] = []
 
@@ -143,7 +145,8 @@ class CDemarkEngine:
         max_countdown=13,
         tiaokong_st=True,
         setup_cmp2close=True,
-        countdown_cmp2close=True
+        countdown_cmp2close=True,
+        keep_history=True,
     ):
         CDemarkEngine.DEMARK_LEN = demark_len
         CDemarkEngine.SETUP_BIAS = setup_bias
@@ -153,11 +156,14 @@ class CDemarkEngine:
         CDemarkEngine.SETUP_CMP2CLOSE = setup_cmp2close
         CDemarkEngine.COUNTDOWN_CMP2CLOSE = countdown_cmp2close
 
-        self.kl_lst: List[C_KL] = []
+        self.kl_lst: List[C_KL] = []  # keep_history=False时只保留计算setup需要的最后几根
+        self.keep_history = keep_history
         self.series: List[CDemarkSetup] = []
 
     def update(self, idx: int, close: float, high: float, low: float) -> CDemarkIndex:
         self.kl_lst.append(C_KL(idx, close, high, low))
+        if not self.keep_history and len(self.kl_lst) > CDemarkEngine.SETUP_BIAS+2:
+            del self.kl_lst[0]
         if len(self.kl_lst) <= CDemarkEngine.SETUP_BIAS+1:
             return CDemarkIndex()
 
@@ -1,4 +1,9 @@
+from .RollingWindow import CRollingExtreme
+
+
 class KDJ_Item:
+    __slots__ = ("k", "d", "j")
+
     def __init__(self, k, d, j):
         self.k = k
         self.d = d
@@ -8,20 +13,14 @@ class KDJ_Item:
 class KDJ:
     def __init__(self, period: int = 9):
         super(KDJ, self).__init__()
-        self.arr = []
         self.period = period
+        self.high_window = CRollingExtreme(period, is_max=True)
+        self.low_window = CRollingExtreme(period, is_max=False)
         self.pre_kdj = KDJ_Item(50, 50, 50)
 
     def add(self, high, low, close) -> KDJ_Item:
-        self.arr.append({
-            'high': high,
-            'low': low,
-        })
-        if len(self.arr) > self.period:
-            self.arr.pop(0)
-
-        hn = max([x['high'] for x in self.arr])
-        ln = min([x['low'] for x in self.arr])
+        hn = self.high_window.add(high)
+        ln = self.low_window.add(low)
         cn = close
         rsv = 100 * (cn - ln) / (hn - ln) if hn != ln else 0.0
 
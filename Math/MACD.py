@@ -2,6 +2,8 @@ from typing import List
 
 
 class CMACD_item:
+    __slots__ = ("fast_ema", "slow_ema", "DIF", "DEA", "macd")
+
     def __init__(self, fast_ema, slow_ema, DIF, DEA):
         self.fast_ema = fast_ema
         self.slow_ema = slow_ema
@@ -11,8 +13,9 @@ class CMACD_item:
 
 
 class CMACD:
-    def __init__(self, fastperiod=12, slowperiod=26, signalperiod=9):
-        self.macd_info: List[CMACD_item] = []
+    def __init__(self, fastperiod=12, slowperiod=26, signalperiod=9, keep_history=True):
+        self.macd_info: List[CMACD_item] = []  # keep_history=False时只保留最后一个
+        self.keep_history = keep_history
         self.fastperiod = fastperiod
         self.slowperiod = slowperiod
         self.signalperiod = signalperiod
@@ -25,5 +28,9 @@ class CMACD:
             _slow_ema = (2 * value + (self.slowperiod - 1) * self.macd_info[-1].slow_ema) / (self.slowperiod + 1)
             _dif = _fast_ema - _slow_ema
             _dea = (2 * _dif + (self.signalperiod - 1) * self.macd_info[-1].DEA) / (self.signalperiod + 1)
-            self.macd_info.append(CMACD_item(fast_ema=_fast_ema, slow_ema=_slow_ema, DIF=_dif, DEA=_dea))
+            item = CMACD_item(fast_ema=_fast_ema, slow_ema=_slow_ema, DIF=_dif, DEA=_dea)
+            if self.keep_history:
+                self.macd_info.append(item)
+            else:
+                self.macd_info[-1] = item
         return self.macd_info[-1]
@@ -0,0 +1,173 @@
+"""
+非逐步模式下的批量指标计算(batch_metric)
+K线全部加入之后一次性算出整段序列的均线/最值/BOLL/KDJ，
+结果和逐根调用各模型的add()逐位相同，同时会把模型内部状态推进到最后一根，之后可以继续add()
+MACD(EMA)和RSI(平滑均值)每一根都依赖上一根的结果，numpy没法按同样的运算顺序并行算出逐位相同的值，
+不走批量计算，仍然逐根add；KDJ只有窗口最值和RSV是向量化的，K/D的平滑同理仍逐根递推
+"""
+import math
+from typing import List
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from Common.CEnum import TREND_TYPE
+from Common.ChanException import CChanException, ErrCode
+
+from .BOLL import BOLL_Metric, BollModel
+from .KDJ import KDJ, KDJ_Item
+from .RollingWindow import CRollingExtreme, CRollingSum, CRollingVar, merge_mean_m2
+from .TrendModel import CTrendModel
+
+
+def support_batch(metric_model) -> bool:
+    return isinstance(metric_model, (CTrendModel, BollModel, KDJ))
+
+
+def cal_metric_batch(metric_model, klu_lst) -> list:
+    # 返回每根klu对应的指标结果，与metric_model.add的返回值一致
+    if isinstance(metric_model, CTrendModel):
+        return trend_batch(metric_model, [klu.close for klu in klu_lst])
+    elif isinstance(metric_model, BollModel):
+        return boll_batch(metric_model, [klu.close for klu in klu_lst])
+    elif isinstance(metric_model, KDJ):
+        return kdj_batch(metric_model, [klu.high for klu in klu_lst], [klu.low for klu in klu_lst], [klu.close for klu in klu_lst])
+    raise CChanException(f"{type(metric_model)} not support batch calculation", ErrCode.PARA_ERROR)
+
+
+def _blocks(block: list, values: list, N: int):
+    # 从当前块开头起按N根一行排成矩阵，最后一行不足的部分补0
+    data = np.array(block + values, dtype=np.float64)
+    mat = np.zeros(-(-len(data) // N) * N, dtype=np.float64)
+    mat[:len(data)] = data
+    return mat.reshape(-1, N)
+
+
+def rolling_sum_batch(window: CRollingSum, values: list) -> np.ndarray:
+    N, n_old = window.N, len(window.block)
+    mat = _blocks(window.block, values, N)
+    head = np.cumsum(mat, axis=1)
+    suffix = np.zeros((len(mat), N + 1), dtype=np.float64)
+    suffix[:, :N] = np.cumsum(mat[:, ::-1], axis=1)[:, ::-1]
+    res = head.copy()
+    res[1:] = suffix[:-1, 1:] + head[1:]
+    if window.tail_suffix is not None:
+        res[0] = np.array(window.tail_suffix[1:]) + head[0]
+
+    remain = (n_old + len(values)) % N
+    if remain == 0:
+        window.block, window.head_sum, window.tail_suffix = [], 0.0, suffix[-1].tolist()
+    else:
+        window.block = (window.block + values)[-remain:]
+        window.head_sum = head[-1, remain - 1].item()
+        if len(mat) > 1:
+            window.tail_suffix = suffix[-2].tolist()
+    return res.ravel()[n_old:n_old + len(values)]
+
+
+def _welford_cols(mat, cols):
+    # 对每一行按cols的顺序做Welford递推，返回每一步之后的均值和M2
+    mean = np.zeros(len(mat), dtype=np.float64)
+    m2 = np.zeros(len(mat), dtype=np.float64)
+    res_mean = np.zeros((len(mat), mat.shape[1] + 1), dtype=np.float64)
+    res_m2 = np.zeros((len(mat), mat.shape[1] + 1), dtype=np.float64)
+    for cnt, j in enumerate(cols, start=1):
+        col = mat[:, j]
+        delta = col - mean
+        mean = mean + delta / cnt
+        m2 = m2 + delta * (col - mean)
+        res_mean[:, j], res_m2[:, j] = mean, m2
+    return res_mean, res_m2
+
+
+def rolling_var_batch(window: CRollingVar, values: list):
+    # 返回每个新值对应窗口的(均值, M2, 个数)数组
+    N, n_old = window.N, len(window.block)
+    mat = _blocks(window.block, values, N)
+    head_mean, head_m2 = (arr[:, :N] for arr in _welford_cols(mat, range(N)))
+    tail_mean, tail_m2 = _welford_cols(mat, range(N - 1, -1, -1))
+
+    prev_mean = np.empty_like(tail_mean)
+    prev_m2 = np.empty_like(tail_m2)
+    prev_mean[1:], prev_m2[1:] = tail_mean[:-1], tail_m2[:-1]
+    has_tail = np.ones(len(mat), dtype=bool)
+    if window.tail_mean is not None:
+        prev_mean[0], prev_m2[0] = window.tail_mean, window.tail_m2
+    else:
+        prev_mean[0], prev_m2[0] = 0.0, 0.0
+        has_tail[0] = False
+
+    k = np.arange(1, N + 1)
+    mean, m2, _ = merge_mean_m2(prev_mean[:, 1:], prev_m2[:, 1:], N - k, head_mean, head_m2, k)
+    use_head = (k == N) | ~has_tail[:, None]
+    mean = np.where(use_head, head_mean, mean)
+    m2 = np.where(use_head, head_m2, m2)
+    cnt = np.where(has_tail[:, None], N, k)
+
+    remain = (n_old + len(values)) % N
+    if remain == 0:
+        window.block, window.head_mean, window.head_m2 = [], 0.0, 0.0
+        window.tail_mean, window.tail_m2 = tail_mean[-1].tolist(), tail_m2[-1].tolist()
+    else:
+        window.block = (window.block + values)[-remain:]
+        window.head_mean, window.head_m2 = head_mean[-1, remain - 1].item(), head_m2[-1, remain - 1].item()
+        if len(mat) > 1:
+            window.tail_mean, window.tail_m2 = tail_mean[-2].tolist(), tail_m2[-2].tolist()
+    sl = slice(n_old, n_old + len(values))
+    return mean.ravel()[sl], m2.ravel()[sl], cnt.ravel()[sl]
+
+
+def rolling_extreme_batch(window: CRollingExtreme, values: list) -> np.ndarray:
+    N = window.N
+    pad = -math.inf if window.is_max else math.inf
+    # 窗口内的历史值只需要单调队列里的候选值，其余位置补pad不影响最值
+    first_idx = window.idx - (N - 2)
+    hist = [pad] * (N - 1)
+    for idx, value in window.queue:
+        if idx >= first_idx:
+            hist[idx - first_idx] = value
+    win = sliding_window_view(np.array(hist + values, dtype=np.float64), N)
+    res = win.max(axis=1) if window.is_max else win.min(axis=1)
+
+    # 只用最后N个值重建单调队列
+    if len(values) >= N:
+        window.queue.clear()
+        window.idx += len(values) - N
+        values = values[-N:]
+    for value in values:
+        window.add(value)
+    return res
+
+
+def trend_batch(model: CTrendModel, values: list) -> List[float]:
+    if model.type == TREND_TYPE.MEAN:
+        old_cnt = model.window.count
+        sums = rolling_sum_batch(model.window, values)
+        cnt = np.minimum(np.arange(old_cnt + 1, old_cnt + len(values) + 1), model.T)
+        return (sums / cnt).tolist()
+    return rolling_extreme_batch(model.window, values).tolist()
+
+
+def boll_batch(model: BollModel, values: list) -> List[BOLL_Metric]:
+    ma, m2, cnt = rolling_var_batch(model.window, values)
+    theta = np.sqrt(m2 / cnt)
+    return [BOLL_Metric(_ma, _theta) for _ma, _theta in zip(ma.tolist(), theta.tolist())]
+
+
+def kdj_batch(model: KDJ, highs: list, lows: list, closes: list) -> List[KDJ_Item]:
+    hn = rolling_extreme_batch(model.high_window, highs)
+    ln = rolling_extreme_batch(model.low_window, lows)
+    cn = np.array(closes, dtype=np.float64)
+    same = hn == ln
+    rsv = np.where(same, 0.0, 100 * (cn - ln) / np.where(same, 1.0, hn - ln)).tolist()
+
+    res: List[KDJ_Item] = []
+    pre_kdj = model.pre_kdj
+    for _rsv in rsv:
+        cur_k = 2 / 3 * pre_kdj.k + 1 / 3 * _rsv
+        cur_d = 2 / 3 * pre_kdj.d + 1 / 3 * cur_k
+        cur_j = 3 * cur_k - 2 * cur_d
+        pre_kdj = KDJ_Item(cur_k, cur_d, cur_j)
+        res.append(pre_kdj)
+    model.pre_kdj = pre_kdj
+    return res
@@ -0,0 +1,213 @@
+from bisect import bisect_right
+from functools import reduce
+from operator import add
+from typing import Dict, List, Optional
+
+from Common.CEnum import DATA_FIELD, MACD_ALGO
+from Common.RangeIndex import CRangeExtremum
+
+_TRADE_ALGO = {
+    MACD_ALGO.AMOUNT: (DATA_FIELD.FIELD_TURNOVER, False),
+    MACD_ALGO.VOLUMN: (DATA_FIELD.FIELD_VOLUME, False),
+    MACD_ALGO.VOLUMN_AVG: (DATA_FIELD.FIELD_VOLUME, True),
+    MACD_ALGO.AMOUNT_AVG: (DATA_FIELD.FIELD_TURNOVER, True),
+    MACD_ALGO.TURNRATE_AVG: (DATA_FIELD.FIELD_TURNRATE, True),
+}
+_EXACT_INT = 2**53  # 不超过这个值的非负整数之和用float逐个累加也没有舍入
+
+
+class CTradeColumn:
+    """
+    成交量/额/换手率的一列，非负整数值(成交量通常如此)的部分用整数前缀和O(1)求区间和，
+    其余情况按原顺序累加，保证和CBi.Cal_MACD_trade_metric逐个相加的结果一致
+    """
+    def __init__(self, field: str):
+        self.field = field
+        self.vals: List[Optional[float]] = []
+        self.int_sum: List[int] = [0]  # 整数值的前缀和，python int没有精度问题
+        self.bad_cnt: List[int] = [0]  # 不能用整数前缀和的值(None/小数/负数/非float)的个数前缀和
+
+    def append(self, klu):
+        value = klu.trade_info.metric[self.field]
+        self.vals.append(value)
+        if type(value) is float and value >= 0 and value.is_integer():
+            self.int_sum.append(self.int_sum[-1] + int(value))
+            self.bad_cnt.append(self.bad_cnt[-1])
+        else:
+            self.int_sum.append(self.int_sum[-1])
+            self.bad_cnt.append(self.bad_cnt[-1] + 1)
+
+    def truncate(self, size):
+        del self.vals[size:]
+        del self.int_sum[size+1:]
+        del self.bad_cnt[size+1:]
+
+    def sum(self, lo, hi):
+        if self.bad_cnt[hi+1] == self.bad_cnt[lo]:
+            _s = self.int_sum[hi+1] - self.int_sum[lo]
+            if _s <= _EXACT_INT:
+                return float(_s)
+        vals = self.vals[lo:hi+1]
+        if None in vals:
+            return 0.0
+        return reduce(add, vals, 0)
+
+
+class CMetricIndex:
+    """
+    一个级别的K线指标索引，按klu.idx存放macd柱、rsi、成交量等扁平数组，供笔的背驰力度计算
+        - peak/diff/rsi: 区间最大最小值，O(1)
+        - volumn/amount等: 整数前缀和O(1)，否则按顺序扫描扁平数组
+        - area/full_area: 浮点前缀和相减和逐个累加的舍入不同，为了结果完全一致，按同样的顺序扫描扁平数组，
+          area用macd同号区间的起点表二分找到扫描范围
+    查询时才从笔的尾部沿klu.pre同步，restore/update_last_klu后换掉的K线靠对象比对发现，从那里截断重建
+    结果和CBi.cal_macd_metric完全相同；slope/amp和线段的指标本来就是O(1)，直接调原方法
+    只是缓存，deepcopy/pickle得到空索引，用到时重新同步
+    """
+    CACHE_SIZE = 4096
+
+    def __init__(self):
+        self.klus: list = []
+        self.macd = CRangeExtremum()
+        self.pos_macd: List[float] = []  # 红柱，其余为0
+        self.neg_macd: List[float] = []  # 绿柱取绝对值，其余为0
+        self.run_start: List[int] = []  # macd同号区间(0单独成段)的起点
+        self.rsi: Optional[CRangeExtremum] = None  # 用到时才建
+        self.rsi_missing = 0
+        self.trade: Dict[str, CTradeColumn] = {}
+        self.cache: Dict[tuple, float] = {}  # 需要扫描的指标的结果
+
+    def __deepcopy__(self, memo):
+        return CMetricIndex()
+
+    def __reduce__(self):
+        return CMetricIndex, ()
+
+    def __len__(self):
+        return len(self.klus)
+
+    def truncate(self, size):
+        if size >= len(self.klus):
+            return
+        del self.klus[size:]
+        self.macd.truncate(size)
+        del self.pos_macd[size:]
+        del self.neg_macd[size:]
+        del self.run_start[bisect_right(self.run_start, size-1):]
+        if self.rsi is not None:
+            self.rsi = None  # rsi用得少，截断时直接丢掉，下次重建
+            self.rsi_missing = 0
+        for column in self.trade.values():
+            column.truncate(size)
+        self.cache.clear()
+
+    def append(self, klu):
+        pos = len(self.klus)
+        macd = klu.macd.macd
+        sign = (macd > 0) - (macd < 0)
+        if pos == 0 or sign == 0:
+            self.run_start.append(pos)
+        else:
+            pre = self.macd.vals[-1]
+            if sign != (pre > 0) - (pre < 0):
+                self.run_start.append(pos)
+        self.klus.append(klu)
+        self.macd.append(macd)
+        self.pos_macd.append(macd if macd > 0 else 0.0)
+        self.neg_macd.append(-macd if macd < 0 else 0.0)
+        if self.rsi is not None:
+            self.__append_rsi(klu)
+        for column in self.trade.values():
+            column.append(klu)
+
+    def __append_rsi(self, klu):
+        rsi = getattr(klu, "rsi", None)
+        if rsi is None:
+            self.rsi_missing += 1
+            rsi = 0.0
+        self.rsi.append(rsi)
+
+    def sync(self, klu) -> bool:
+        # 保证klu及之前的K线都已经入索引，klu.idx不连续等无法索引的情况返回False
+        klus = self.klus
+        idx = klu.idx
+        if idx < len(klus) and klus[idx] is klu:
+            return True
+        pending = []
+        while klu is not None and not (klu.idx < len(klus) and klus[klu.idx] is klu):
+            pending.append(klu)
+            klu = klu.pre
+        self.truncate(pending[-1].idx)
+        for klu in reversed(pending):
+            if klu.idx != len(self.klus):
+                self.truncate(0)
+                return False
+            self.append(klu)
+        return True
+
+    def enable_rsi(self):
+        if self.rsi is None:
+            self.rsi = CRangeExtremum()
+            self.rsi_missing = 0
+            for klu in self.klus:
+                self.__append_rsi(klu)
+
+    def enable_trade(self, field):
+        if field not in self.trade:
+            column = CTradeColumn(field)
+            for klu in self.klus:
+                column.append(klu)
+            self.trade[field] = column
+
+    def cal_macd_metric(self, bi, macd_algo, is_reverse):
+        if macd_algo in (MACD_ALGO.SLOPE, MACD_ALGO.AMP) or not hasattr(bi, "end_klc") or not self.sync(bi.end_klc.lst[-1]):
+            return bi.cal_macd_metric(macd_algo, is_reverse)
+        lo = bi.begin_klc.lst[0].idx  # klc_lst覆盖的klu范围
+        hi = bi.end_klc.lst[-1].idx
+        if macd_algo == MACD_ALGO.PEAK:
+            if bi.is_down():
+                return max(1e-7, -self.macd.min(lo, hi))
+            return max(1e-7, self.macd.max(lo, hi))
+        elif macd_algo == MACD_ALGO.DIFF:
+            return self.macd.max(lo, hi) - self.macd.min(lo, hi)
+        elif macd_algo == MACD_ALGO.RSI:
+            self.enable_rsi()
+            if self.rsi_missing:
+                return bi.Cal_Rsi()
+            return 10000.0/(self.rsi.min(lo, hi)+1e-7) if bi.is_down() else self.rsi.max(lo, hi)
+
+        key = (macd_algo, is_reverse, bi.is_down(), lo, hi, bi.get_begin_klu().idx, bi.get_end_klu().idx)
+        res = self.cache.get(key)
+        if res is not None:
+            return res
+        if macd_algo == MACD_ALGO.AREA:
+            res = self.half_area(bi, lo, hi, is_reverse)
+        elif macd_algo == MACD_ALGO.FULL_AREA:
+            begin, end = bi.get_begin_klu().idx, bi.get_end_klu().idx
+            res = reduce(add, (self.neg_macd if bi.is_down() else self.pos_macd)[begin:end+1], 1e-7)
+        elif macd_algo in _TRADE_ALGO:
+            field, cal_avg = _TRADE_ALGO[macd_algo]
+            self.enable_trade(field)
+            res = self.trade[field].sum(lo, hi)
+            if cal_avg:
+                res = res / bi.get_klu_cnt()
+        else:
+            return bi.cal_macd_metric(macd_algo, is_reverse)
+        if len(self.cache) >= self.CACHE_SIZE:
+            self.cache.clear()
+        self.cache[key] = res
+        return res
+
+    def half_area(self, bi, lo, hi, is_reverse):
+        # 从笔的起点往后(或终点往前)累加和起点同号的macd柱，遇到异号或0停止，不超出笔的klc范围
+        start = bi.get_end_klu().idx if is_reverse else bi.get_begin_klu().idx
+        peak = self.macd.vals[start]
+        if peak == 0:
+            return 1e-7
+        vals = self.pos_macd if peak > 0 else self.neg_macd
+        run_idx = bisect_right(self.run_start, start) - 1
+        if is_reverse:
+            begin = max(self.run_start[run_idx], lo)
+            return reduce(add, vals[start:begin-1 if begin > 0 else None:-1], 1e-7)
+        end = self.run_start[run_idx+1] - 1 if run_idx+1 < len(self.run_start) else len(vals) - 1
+        return reduce(add, vals[start:min(end, hi)+1], 1e-7)
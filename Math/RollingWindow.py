@@ -0,0 +1,121 @@
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+
+class CRollingSum:
+    """
+    长度为N的滑动窗口求和，均摊O(1)，内存只和N有关
+    序列按N根一块切分：当前块维护前缀和，上一块在填满时一次性算好后缀和，
+    窗口和 = 上一块的后缀和 + 当前块的前缀和；每N根从原始值重新累加，不会像加新减旧那样累积误差
+    """
+    def __init__(self, N: int):
+        assert N >= 1
+        self.N = N
+        self.block: List[float] = []  # 当前块的原始值
+        self.head_sum = 0.0
+        self.tail_suffix: Optional[List[float]] = None  # 上一块的后缀和，长度N+1，tail_suffix[N]=0
+
+    @property
+    def count(self) -> int:
+        return self.N if self.tail_suffix is not None else len(self.block)
+
+    def add(self, value) -> float:
+        self.block.append(value)
+        self.head_sum += value
+        k = len(self.block)
+        res = self.head_sum if self.tail_suffix is None else self.tail_suffix[k] + self.head_sum
+        if k == self.N:
+            self.roll()
+        return res
+
+    def roll(self):
+        suffix = [0.0] * (self.N + 1)
+        acc = 0.0
+        for i in range(self.N - 1, -1, -1):
+            acc += self.block[i]
+            suffix[i] = acc
+        self.tail_suffix = suffix
+        self.block = []
+        self.head_sum = 0.0
+
+
+class CRollingVar:
+    """
+    长度为N的滑动窗口均值&方差，均摊O(1)
+    分块方式同CRollingSum，块内用Welford递推，窗口结果由上一块后缀和当前块前缀两组(n, mean, M2)合并得到
+    """
+    def __init__(self, N: int):
+        assert N >= 1
+        self.N = N
+        self.block: List[float] = []
+        self.head_mean = 0.0
+        self.head_m2 = 0.0
+        self.tail_mean: Optional[List[float]] = None  # 上一块后缀的均值，长度N+1
+        self.tail_m2: Optional[List[float]] = None
+
+    def add(self, value) -> Tuple[float, float, int]:
+        # 返回窗口的 (均值, M2, 个数)，方差 = M2/个数
+        self.block.append(value)
+        k = len(self.block)
+        delta = value - self.head_mean
+        self.head_mean += delta / k
+        self.head_m2 += delta * (value - self.head_mean)
+        if self.tail_mean is None or k == self.N:
+            res = (self.head_mean, self.head_m2, k)
+        else:
+            res = merge_mean_m2(self.tail_mean[k], self.tail_m2[k], self.N - k, self.head_mean, self.head_m2, k)
+        if k == self.N:
+            self.roll()
+        return res
+
+    def roll(self):
+        tail_mean = [0.0] * (self.N + 1)
+        tail_m2 = [0.0] * (self.N + 1)
+        mean, m2 = 0.0, 0.0
+        for i in range(self.N - 1, -1, -1):
+            value = self.block[i]
+            delta = value - mean
+            mean += delta / (self.N - i)
+            m2 += delta * (value - mean)
+            tail_mean[i], tail_m2[i] = mean, m2
+        self.tail_mean, self.tail_m2 = tail_mean, tail_m2
+        self.block = []
+        self.head_mean = 0.0
+        self.head_m2 = 0.0
+
+
+def merge_mean_m2(mean_a, m2_a, n_a, mean_b, m2_b, n_b):
+    # Chan等人的并行方差合并公式；numpy批量计算时按同样的运算顺序求值
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    return mean_a + delta * n_b / n, m2_a + m2_b + delta * delta * n_a * n_b / n, n
+
+
+class CRollingExtreme:
+    """
+    长度为N的滑动窗口最大值/最小值，单调队列实现，均摊O(1)
+    """
+    def __init__(self, N: int, is_max: bool):
+        assert N >= 1
+        self.N = N
+        self.is_max = is_max
+        self.idx = -1
+        self.queue: Deque[Tuple[int, float]] = deque()  # (序号, 值)，值单调
+
+    def add(self, value) -> float:
+        self.idx += 1
+        queue = self.queue
+        if self.is_max:
+            while queue and queue[-1][1] <= value:
+                queue.pop()
+        else:
+            while queue and queue[-1][1] >= value:
+                queue.pop()
+        queue.append((self.idx, value))
+        if queue[0][0] <= self.idx - self.N:
+            queue.popleft()
+        return queue[0][1]
+
+    def values(self) -> List[float]:
+        # 窗口内还有可能成为最值的值，按时间顺序
+        return [value for _, value in self.queue]
@@ -1,22 +1,25 @@
 from Common.CEnum import TREND_TYPE
 from Common.ChanException import CChanException, ErrCode
 
+from .RollingWindow import CRollingExtreme, CRollingSum
+
 
 class CTrendModel:
+    """
+    MAX/MIN用单调队列，结果和直接max/min完全相同
+    MEAN用分块求和，和逐窗口直接sum只差在求和顺序，相对误差在T*eps量级，不保证逐位相同
+    """
     def __init__(self, trend_type: TREND_TYPE, T: int):
         self.T = T
-        self.arr = []
         self.type = trend_type
-
-    def add(self, value) -> float:
-        self.arr.append(value)
-        if len(self.arr) > self.T:
-            self.arr = self.arr[-self.T:]
         if self.type == TREND_TYPE.MEAN:
-            return sum(self.arr)/len(self.arr)
-        elif self.type == TREND_TYPE.MAX:
-            return max(self.arr)
-        elif self.type == TREND_TYPE.MIN:
-            return min(self.arr)
+            self.window = CRollingSum(T)
+        elif self.type in (TREND_TYPE.MAX, TREND_TYPE.MIN):
+            self.window = CRollingExtreme(T, is_max=self.type == TREND_TYPE.MAX)
         else:
             raise CChanException(f"Unknown trendModel Type = {self.type}", ErrCode.PARA_ERROR)
+
+    def add(self, value) -> float:
+        if self.type == TREND_TYPE.MEAN:
+            return self.window.add(value)/self.window.count
+        return self.window.add(value)
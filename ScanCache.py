@@ -0,0 +1,292 @@
+"""
+扫描结果缓存：反复扫描同一批股票时，只有最后几根K线变化也要从头算CChan
+按(code, lv_list, 配置指纹, 起始时间, 数据源, 复权)保存一份"已封口"的快照和上次的扫描结果，
+封口点是最高级别倒数第二根K线(最后一根可能还没走完)，各级别不晚于它的K线都在快照里
+
+再次扫描时先拉数据，和缓存里记录的水位(每个级别封口部分的K线数、最后时间、价格校验和)比对：
+    - 完全没变，且bsp_cnt、result_func、end_time都和上次一样：直接返回上次的结果(hit)
+    - 封口部分没变：加载快照，只把新K线trigger_load进去，重新生成结果(extend)
+    - 前复权调整了历史价格、起始时间变了等：从头计算(miss)
+result_func是lambda或者局部函数时没法判断前后是不是同一个函数，不缓存结果，每次都走extend
+每个条目是一个meta文件加上它引用的快照文件，快照文件名带随机后缀，新快照写完之后由meta的一次os.replace提交，
+中途被打断(超时、result_func报错、进程被杀)时meta仍指向旧快照；从快照加载/续算出错时整个条目删掉
+缓存目录按最近访问时间做LRU淘汰，总大小不超过max_bytes
+
+    scanner = CScanner(lv_list, config, begin_time="2023-01-01", data_src=DATA_SRC.AKSHARE, cache_dir="./scan_cache")
+"""
+import hashlib
+import os
+import pickle
+import time
+import uuid
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from Chan import CChan, get_stock_api_cls
+from Common.ChanException import CChanException, ErrCode
+from DataAPI.AsyncStockAPI import replay_stock_api
+from DataAPI.Session import acquire_session, release_session
+from KLine.KLine_Unit import CKLine_Unit
+
+SCAN_CACHE_VERSION = 2
+ORPHAN_SNAP_AGE = 3600  # 没有被meta引用的快照超过这个秒数才清理，避免删掉别的进程正在提交的快照
+
+
+def bars_signature(klus: List[CKLine_Unit]) -> Tuple[int, Optional[int], int]:
+    # (K线数, 最后一根的时间, 时间和OHLC的校验和)
+    values = array("d")
+    for klu in klus:
+        values.extend((klu.time.key, klu.open, klu.high, klu.low, klu.close))
+    return len(klus), klus[-1].time.key if klus else None, zlib.crc32(values.tobytes())
+
+
+def func_id(func) -> Optional[str]:
+    # 可以跨进程/跨次识别的函数名，lambda、局部函数等返回None
+    qualname = getattr(func, "__qualname__", None)
+    if qualname is None or "<" in qualname:
+        return None
+    return f"{func.__module__}:{qualname}"
+
+
+def fetch_bars(job, code, bar_cache_dir=None) -> Tuple[Dict[object, object], dict]:
+    # 和CChan.load取同样的数据，拉取失败(SRC_DATA_NOT_FOUND)的级别放异常，交给CChan按auto_skip_illegal_sub_lv处理
+    api_cls = get_stock_api_cls(job.data_src)
+    if bar_cache_dir is not None and api_cls.cacheable:
+        from DataAPI.BarCache import cached_stock_api
+        api_cls = cached_stock_api(api_cls, bar_cache_dir)
+    data, info = {}, {}
+    acquire_session(api_cls)
+    try:
+        for lv in job.lv_list:
+            try:
+                api = api_cls(code=code, k_type=lv, begin_date=job.begin_time, end_date=job.end_time, autype=job.autype)
+                data[lv] = list(api.get_kl_data())
+            except CChanException as e:
+                if e.errcode != ErrCode.SRC_DATA_NOT_FOUND:
+                    raise
+                data[lv] = e
+                continue
+            info.setdefault("name", api.name)
+            info.setdefault("is_stock", api.is_stock)
+    finally:
+        release_session(api_cls)
+    return data, info
+
+
+class CScanCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 1 << 30, max_entries: Optional[int] = None, resnap_ratio: float = 0.05):
+        """
+        resnap_ratio: 写快照的耗时和从头计算差不多，extend时新封口的K线数超过快照里K线数的这个比例才重写快照，
+            否则每次都从旧快照重放这些K线(重放比写快照便宜得多)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.resnap_ratio = resnap_ratio
+        self.stats: Counter = Counter()  # hit/extend/miss，进程池里每个子进程各自统计，汇总见CScanResult.cache_state
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __getstate__(self):
+        return dict(vars(self), stats=Counter())
+
+    def entry_key(self, job, code) -> str:
+        # 决定K线数据和快照内容的参数；只影响结果的bsp_cnt/result_func/end_time见result_key
+        key = (code, [lv.name for lv in job.lv_list], job.config.fingerprint_digest(), job.begin_time, str(job.data_src), str(job.autype))
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    @staticmethod
+    def result_key(job) -> Optional[tuple]:
+        # 缓存的结果只在这些参数都相同时可以直接复用，result_func没法识别时为None(不复用)
+        if job.result_func is not None and func_id(job.result_func) is None:
+            return None
+        return job.bsp_cnt, func_id(job.result_func), job.end_time
+
+    def meta_path(self, key) -> str:
+        return os.path.join(self.cache_dir, f"{key}.meta")
+
+    def snap_path(self, snap_name) -> str:
+        return os.path.join(self.cache_dir, snap_name)
+
+    def load_meta(self, key, touch=True) -> Optional[dict]:
+        meta_path = self.meta_path(key)
+        try:
+            with open(meta_path, "rb") as f:
+                meta = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if meta.get("version") != SCAN_CACHE_VERSION or (meta["snap"] is not None and not os.path.exists(self.snap_path(meta["snap"]))):
+            return None
+        if touch:
+            os.utime(meta_path)  # LRU按meta文件的修改时间
+        return meta
+
+    def save_meta(self, key, meta):
+        try:
+            buf = pickle.dumps(dict(meta, version=SCAN_CACHE_VERSION))
+        except (pickle.PicklingError, AttributeError, TypeError):  # result_func返回了不能pickle的对象，只缓存快照
+            buf = pickle.dumps(dict(meta, result=None, version=SCAN_CACHE_VERSION))
+        meta_path = self.meta_path(key)
+        tmp_path = f"{meta_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(buf)
+            os.replace(tmp_path, meta_path)
+        except BaseException:
+            self.remove_file(tmp_path)
+            raise
+
+    def build(self, job, code, result_cb) -> Tuple[str, object]:
+        """
+        返回(hit/extend/miss, 结果)；需要计算时用result_cb(chan)生成结果，命中时直接返回上次缓存的结果
+        """
+        data, info = fetch_bars(job, code, job.config.bar_cache_dir)
+        top = data[job.lv_list[0]]
+        if isinstance(top, CChanException):
+            raise top
+        valid_lv = [lv for lv in job.lv_list if not isinstance(data[lv], CChanException)]
+        full_sig = {lv: bars_signature(data[lv]) for lv in valid_lv}
+        key = self.entry_key(job, code)
+        result_key = self.result_key(job)
+        meta = self.load_meta(key)
+        if meta is not None and meta["full"] == full_sig and meta["result"] is not None and result_key is not None and meta["result_key"] == result_key:
+            self.stats["hit"] += 1
+            return "hit", meta["result"]
+
+        sealed_ts = top[-2].time.key if len(top) >= 2 else None
+        sealed_cnt = {lv: 0 if sealed_ts is None else bisect_right(data[lv], sealed_ts, key=lambda klu: klu.time.key) for lv in valid_lv}
+        old_snap = meta["snap"] if meta is not None else None
+        chan, snap, new_snap, state = None, None, None, "miss"
+        try:
+            if old_snap is not None and self.match_sealed(meta["sealed"], data):
+                chan, sealed_cnt, new_snap = self.load_sealed(key, job, meta, data, sealed_cnt)
+                snap = new_snap or old_snap
+                state = "extend" if chan is not None else "miss"
+            if chan is None and sealed_ts is not None:
+                chan = self.new_chan(job, code, {lv: data[lv][:sealed_cnt[lv]] if lv in sealed_cnt else data[lv] for lv in job.lv_list}, info)
+                snap = new_snap = self.dump_sealed(key, chan)
+            if chan is None:  # 只有一根K线，不值得缓存
+                chan = self.new_chan(job, code, data, info)
+                sealed = None
+            else:
+                sealed = {lv: bars_signature(data[lv][:sealed_cnt[lv]]) for lv in chan.lv_list}
+                try:
+                    chan.trigger_load({lv: data[lv][sealed_cnt[lv]:] for lv in chan.lv_list})
+                except BaseException:
+                    if state == "extend":  # 从快照续算出错，不能确定是不是快照本身的问题，整个条目作废
+                        self.remove(key)
+                    raise
+            result = result_cb(chan)
+            # meta替换成功才算提交，之前任何一步中断都只会留下没被引用的新快照
+            self.save_meta(key, {"sealed": sealed, "snap": snap, "full": full_sig, "result": result, "result_key": result_key})
+        except BaseException:
+            if new_snap is not None:
+                self.remove_file(self.snap_path(new_snap))
+            raise
+        if old_snap is not None and old_snap != snap:
+            self.remove_file(self.snap_path(old_snap))
+        self.stats[state] += 1
+        self.evict()
+        return state, result
+
+    def load_sealed(self, key, job, meta, data, sealed_cnt) -> Tuple[Optional[CChan], dict, Optional[str]]:
+        """
+        从快照恢复封口部分，新封口的K线足够多时写一份新快照；返回(chan, 实际封口的K线数, 新快照文件名)
+        快照损坏或者续算出错时删掉整个条目，返回的chan为None，由调用方从头计算；其他异常(比如超时)删掉条目后照常抛出
+        """
+        old_cnt = {lv: meta["sealed"][lv][0] for lv in meta["sealed"]}
+        try:
+            chan = CChan.chan_load_snapshot(self.snap_path(meta["snap"]), use_mmap=False)
+            chan.end_time = job.end_time
+            new_cnt = sum(max(sealed_cnt[lv] - old_cnt[lv], 0) for lv in old_cnt)
+            if new_cnt == 0 or new_cnt < self.resnap_ratio * sum(old_cnt.values()):
+                return chan, old_cnt, None
+            chan.trigger_load({lv: data[lv][old_cnt[lv]:sealed_cnt[lv]] for lv in old_cnt})
+        except CChanException:
+            self.remove(key)
+            return None, sealed_cnt, None
+        except BaseException:
+            self.remove(key)
+            raise
+        return chan, sealed_cnt, self.dump_sealed(key, chan)
+
+    @staticmethod
+    def match_sealed(sealed, data) -> bool:
+        for lv, (cnt, last_ts, crc) in sealed.items():
+            klus = data.get(lv)
+            if isinstance(klus, CChanException) or klus is None or len(klus) < cnt:
+                return False
+            if bars_signature(klus[:cnt]) != (cnt, last_ts, crc):
+                return False
+        return True
+
+    @staticmethod
+    def new_chan(job, code, data, info) -> CChan:
+        chan = CChan(
+            code=code,
+            begin_time=job.begin_time,
+            end_time=job.end_time,
+            data_src=replay_stock_api(data, **info),
+            lv_list=list(job.lv_list),
+            config=job.config,
+            autype=job.autype,
+        )
+        chan.data_src = job.data_src  # 快照里不能存临时的数据源类
+        return chan
+
+    def dump_sealed(self, key, chan: CChan) -> str:
+        # 每次写新文件，由meta引用；返回文件名
+        snap_name = f"{key}.{uuid.uuid4().hex}.snap"
+        chan.chan_dump_snapshot(self.snap_path(snap_name))
+        return snap_name
+
+    def evict(self):
+        # 按最近访问时间淘汰，直到总大小和条目数都在限制内；顺带清理没有被引用的旧快照
+        metas: Dict[str, os.stat_result] = {}
+        snaps: Dict[str, List[Tuple[str, os.stat_result]]] = {}
+        for name in os.listdir(self.cache_dir):
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            if name.endswith(".meta"):
+                metas[name[:-5]] = stat
+            elif name.endswith(".snap"):
+                snaps.setdefault(name.split(".", 1)[0], []).append((name, stat))
+        now = time.time()
+        for key, files in snaps.items():
+            if key in metas and len(files) == 1:
+                continue
+            meta = self.load_meta(key, touch=False) if key in metas else None
+            for name, stat in list(files):
+                if (meta is None or name != meta["snap"]) and now - stat.st_mtime > ORPHAN_SNAP_AGE:
+                    self.remove_file(self.snap_path(name))
+                    files.remove((name, stat))
+        entries = sorted((stat.st_mtime, stat.st_size + sum(s.st_size for _, s in snaps.get(key, [])), key) for key, stat in metas.items())
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes or (self.max_entries is not None and len(entries) > self.max_entries)):
+            _, size, key = entries.pop(0)
+            total -= size
+            self.remove(key, [name for name, _ in snaps.get(key, [])])
+
+    def remove(self, key, snap_names: Optional[List[str]] = None):
+        # 先删meta，条目立即失效，再删它名下的所有快照
+        self.remove_file(self.meta_path(key))
+        if snap_names is None:
+            snap_names = [name for name in os.listdir(self.cache_dir) if name.startswith(f"{key}.") and name.endswith(".snap")]
+        for name in snap_names:
+            self.remove_file(self.snap_path(name))
+
+    @staticmethod
+    def remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".meta"):
+                self.remove(name[:-5])
@@ -0,0 +1,275 @@
+"""
+多标的并行扫描
+把股票列表分发到进程池里，每个子进程独立构建CChan，只把精简结果(最近的买卖点、最后一根K线、错误信息)传回主进程
+
+    scanner = CScanner(lv_list=[KL_TYPE.K_DAY], config=config, begin_time="2023-01-01", data_src=DATA_SRC.AKSHARE)
+    for res in scanner.scan(code_list, progress_cb=lambda done, total, res: print(done, total, res.code)):
+        ...
+
+注意：windows/macOS默认用spawn方式创建子进程，调用scan的脚本需要放在`if __name__ == "__main__":`下
+"""
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from Chan import CChan, get_stock_api_cls
+from ChanConfig import CChanConfig
+from Common.CEnum import AUTYPE, DATA_SRC, KL_TYPE
+from Common.CTime import CTime
+from DataAPI.Session import keep_session_alive, stock_session
+from ScanCache import CScanCache
+
+
+@dataclass
+class CScanBsp:
+    lv: KL_TYPE
+    is_buy: bool
+    type: str  # 同CBS_Point.type2str()
+    time: CTime
+    klu_idx: int
+    price: float  # 买卖点所在笔的结束值
+
+
+@dataclass
+class CScanResult:
+    code: str
+    idx: int  # 在输入列表中的位置
+    last_time: Optional[CTime] = None  # 最高级别最后一根K线
+    last_close: Optional[float] = None
+    bsp_lst: List[CScanBsp] = field(default_factory=list)  # 各级别从新到旧
+    extra: Any = None  # result_func的返回值
+    error: Optional[str] = None
+    cost: float = 0.0
+    cache_state: Optional[str] = None  # 配置了cache_dir时为hit/extend/miss
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class CScanJob:
+    # 每个子进程只在初始化时接收一次
+    lv_list: List[KL_TYPE]
+    config: CChanConfig
+    begin_time: Optional[str]
+    end_time: Optional[str]
+    data_src: Union[DATA_SRC, str]
+    autype: AUTYPE
+    timeout: Optional[float]
+    bsp_cnt: int
+    result_func: Optional[Callable[[CChan], Any]]
+    cache: Optional[CScanCache] = None
+
+
+class ScanTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise ScanTimeout()
+
+
+def scan_one(job: CScanJob, idx: int, code: str) -> CScanResult:
+    res = CScanResult(code=code, idx=idx)
+    start = time.perf_counter()
+    # 单只股票超时依赖SIGALRM，只能在主线程里设置；windows下不生效
+    use_alarm = bool(job.timeout) and hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        pre_handler = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, job.timeout)
+    try:
+        try:
+            if job.cache is not None and not job.config.trigger_step:
+                res.cache_state, fields = job.cache.build(job, code, lambda chan: collect_result(job, chan))
+            else:
+                fields = collect_result(job, CChan(
+                    code=code,
+                    begin_time=job.begin_time,
+                    end_time=job.end_time,
+                    data_src=job.data_src,
+                    lv_list=job.lv_list,
+                    config=job.config,
+                    autype=job.autype,
+                ))
+            res.last_time, res.last_close, res.bsp_lst, res.extra = fields
+        finally:
+            # 在except ScanTimeout的范围内关掉定时器，刚算完还没关时到点的闹钟也按超时处理，不会漏到外面
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except ScanTimeout:
+        res.error = f"timeout after {job.timeout}s"
+    except Exception as e:
+        res.error = f"{type(e).__name__}: {e}"
+    finally:
+        if use_alarm:
+            signal.signal(signal.SIGALRM, pre_handler)
+    res.cost = time.perf_counter() - start
+    return res
+
+
+def collect_result(job: CScanJob, chan: CChan):
+    # (last_time, last_close, bsp_lst, extra)，扫描结果缓存里保存的也是这一组
+    last_time = last_close = None
+    if len(chan[0]) > 0:
+        last_klu = chan[0][-1][-1]
+        last_time, last_close = last_klu.time, last_klu.close
+    bsp_lst = []
+    for lv in chan.lv_list:
+        for bsp in chan[lv].bs_point_lst.get_latest_bsp(job.bsp_cnt):
+            bsp_lst.append(CScanBsp(
+                lv=lv,
+                is_buy=bsp.is_buy,
+                type=bsp.type2str(),
+                time=bsp.klu.time,
+                klu_idx=bsp.klu.idx,
+                price=bsp.bi.get_end_val(),
+            ))
+    extra = job.result_func(chan) if job.result_func is not None else None
+    return last_time, last_close, bsp_lst, extra
+
+
+_WORKER_JOB: Optional[CScanJob] = None
+
+
+def _init_worker(job: CScanJob):
+    global _WORKER_JOB
+    _WORKER_JOB = job
+    api_cls = _stock_api_cls(job)
+    if api_cls is not None:
+        keep_session_alive(api_cls)  # 每个子进程只登录一次，进程退出时登出
+
+
+def _stock_api_cls(job: CScanJob):
+    # 数据源导入失败时不在这里报错，留给每只股票的CScanResult.error
+    try:
+        return get_stock_api_cls(job.data_src)
+    except Exception:
+        return None
+
+
+def _scan_in_worker(idx: int, code: str) -> CScanResult:
+    assert _WORKER_JOB is not None
+    return scan_one(_WORKER_JOB, idx, code)
+
+
+class CScanner:
+    def __init__(
+        self,
+        lv_list: List[KL_TYPE],
+        config: Optional[CChanConfig] = None,
+        begin_time=None,
+        end_time=None,
+        data_src: Union[DATA_SRC, str] = DATA_SRC.BAO_STOCK,
+        autype: AUTYPE = AUTYPE.QFQ,
+        max_workers: Optional[int] = None,
+        timeout: Optional[float] = None,
+        bsp_cnt: int = 1,
+        result_func: Optional[Callable[[CChan], Any]] = None,
+        cache_dir: Optional[str] = None,
+        cache_max_bytes: int = 1 << 30,
+        cache_max_entries: Optional[int] = None,
+    ):
+        """
+        max_workers: 进程数，None表示cpu核数，0表示不开进程池，在当前进程里串行扫描
+        timeout: 单只股票的超时秒数(含取数据)，None不限制
+        bsp_cnt: 每个级别返回最近的几个买卖点，0表示全部
+        result_func: 在子进程里对CChan做额外的提取，返回值放在CScanResult.extra里；需要是模块级函数才能pickle
+        cache_dir: 扫描结果缓存目录(见ScanCache.py)，再次扫描时没变的股票直接返回上次结果，只多了新K线的从快照增量计算；
+            按最近访问淘汰，总大小不超过cache_max_bytes、条目数不超过cache_max_entries；
+            bsp_cnt、result_func或end_time和上次不同时会用快照重新生成结果
+        """
+        self.job = CScanJob(
+            lv_list=lv_list,
+            config=config if config is not None else CChanConfig(),
+            begin_time=begin_time,
+            end_time=end_time,
+            data_src=data_src,
+            autype=autype,
+            timeout=timeout,
+            bsp_cnt=bsp_cnt,
+            result_func=result_func,
+            cache=CScanCache(cache_dir, cache_max_bytes, cache_max_entries) if cache_dir is not None else None,
+        )
+        self.max_workers = max_workers
+        self.cache_stats: Counter = Counter()  # 累计的hit/extend/miss次数
+        self.__stop = False
+
+    def stop(self):
+        # 已经在跑的股票会跑完并照常返回，尚未开始的直接取消
+        self.__stop = True
+
+    def scan(
+        self,
+        code_list: Iterable[str],
+        ordered: bool = False,
+        progress_cb: Optional[Callable[[int, int, CScanResult], None]] = None,
+    ) -> Iterator[CScanResult]:
+        """
+        ordered=True按输入顺序返回结果，否则谁先算完先返回
+        progress_cb(已完成数, 总数, 刚完成的结果)在主进程里按完成顺序调用，每个传给progress_cb的结果都会返回
+        ordered=True时调用stop()，取消的股票留下空缺，已经算完、排在空缺后面的结果仍按输入顺序在最后返回
+        """
+        self.__stop = False
+        code_list = list(code_list)
+        total = len(code_list)
+        if self.max_workers == 0:
+            api_cls = _stock_api_cls(self.job)
+            with stock_session(api_cls) if api_cls is not None else nullcontext():
+                for idx, code in enumerate(code_list):
+                    if self.__stop:
+                        break
+                    res = scan_one(self.job, idx, code)
+                    self.count_cache_state(res)
+                    if progress_cb:
+                        progress_cb(idx + 1, total, res)
+                    yield res
+            return
+
+        executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=(self.job,))
+        try:
+            futures: Dict[Future, int] = {executor.submit(_scan_in_worker, idx, code): idx for idx, code in enumerate(code_list)}
+            buffer: Dict[int, CScanResult] = {}
+            next_idx = done_cnt = 0
+            remaining = set(futures)
+            while remaining:
+                for future in as_completed(remaining):
+                    remaining.discard(future)
+                    idx = futures[future]
+                    try:
+                        res = future.result()
+                    except Exception as e:  # 子进程异常退出等
+                        res = CScanResult(code=code_list[idx], idx=idx, error=f"{type(e).__name__}: {e}")
+                    done_cnt += 1
+                    self.count_cache_state(res)
+                    if progress_cb:
+                        progress_cb(done_cnt, total, res)
+                    if not ordered:
+                        yield res
+                    else:
+                        buffer[idx] = res
+                        while next_idx in buffer:
+                            yield buffer.pop(next_idx)
+                            next_idx += 1
+                    if self.__stop:
+                        # 取消尚未开始的，剩下已经算完或正在跑的接着等
+                        for pending in list(remaining):
+                            if pending.cancel():
+                                remaining.discard(pending)
+                        break
+            for idx in sorted(buffer):  # stop之后取消的股票留下了空缺
+                yield buffer[idx]
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def count_cache_state(self, res: CScanResult):
+        if res.cache_state is not None:
+            self.cache_stats[res.cache_state] += 1
+
+    def scan_all(self, code_list: Iterable[str], progress_cb=None) -> List[CScanResult]:
+        return list(self.scan(code_list, ordered=True, progress_cb=progress_cb))
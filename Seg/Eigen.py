@@ -6,10 +6,23 @@ from Common.CEnum import BI_DIR, FX_TYPE
 
 
 class CEigen(CKLine_Combiner[CBi]):
+    __slots__ = ("gap",)
+
     def __init__(self, bi, _dir):
         super(CEigen, self).__init__(bi, _dir)
         self.gap = False
 
+    @staticmethod
+    def item_range(item):
+        # 笔或线段(线段的线段)
+        return item._high(), item._low()
+
+    @staticmethod
+    def item_time(item):
+        if isinstance(item, CBi):
+            return item.begin_klc.idx, item.end_klc.idx
+        return item.start_bi.begin_klc.idx, item.end_bi.end_klc.idx
+
     def update_fx(self, _pre: Self, _next: Self, exclude_included=False, allow_top_equal=None):
         super(CEigen, self).update_fx(_pre, _next, exclude_included, allow_top_equal)
         if (self.fx == FX_TYPE.TOP and _pre.high < self.low) or \
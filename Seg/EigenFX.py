@@ -1,3 +1,4 @@
+import copy
 from typing import List, Optional
 
 from Bi.Bi import CBi
@@ -101,6 +102,14 @@ class CEigenFX:
         assert self.last_evidence_bi is not None
         return next((False for bi in self.lst if not bi.is_sure), self.last_evidence_bi.is_sure)
 
+    def copy(self) -> "CEigenFX":
+        # 复制扫描状态，特征序列元素和lst各自一份，笔对象共用
+        new = CEigenFX.__new__(CEigenFX)
+        new.__dict__.update(self.__dict__)
+        new.ele = [None if ele is None else copy.copy(ele) for ele in self.ele]
+        new.lst = list(self.lst)
+        return new
+
     def clear(self):
         self.ele = [None, None, None]
         self.lst = []
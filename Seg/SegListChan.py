@@ -1,14 +1,25 @@
+from typing import Dict, Optional, Tuple
+
 from Bi.BiList import CBiList
 from Common.CEnum import BI_DIR, SEG_TYPE
+from Common.RangeIndex import CChainIndex
 
+from .Eigen import CEigen
 from .EigenFX import CEigenFX
 from .SegConfig import CSegConfig
 from .SegListComm import CSegListComm
 
 
+EIGEN_CHECKPOINT_STEP = 16  # 每扫这么多笔保存一次特征序列状态，<=0时每次从头扫
+
+
 class CSegListChan(CSegListComm):
     def __init__(self, seg_config=CSegConfig(), lv=SEG_TYPE.BI):
         super(CSegListChan, self).__init__(seg_config=seg_config, lv=lv)
+        self.line_chain = CLineChain()  # 已经扫描过的笔，用来判断哪些扫描状态还有效
+        # (扫描起点, 起始线段方向) -> 扫描到各位置时的状态(pos, up_eigen, down_eigen, last_seg_dir)，只替换不原地修改
+        self.eigen_checkpoint: Dict[tuple, Tuple[tuple, ...]] = {}
+        self.used_checkpoint: Optional[dict] = None  # update过程中用到的扫描起点
 
     def do_init(self):
         # 删除末尾不确定的线段
@@ -25,20 +36,52 @@ class CSegListChan(CSegListComm):
                 # 如果确定线段的分形的第三元素包含不确定笔，也需要重新算，不然线段分形元素的高低点可能不对
                 self.lst.pop()
 
+    def frontier_begin(self) -> int:
+        # do_init会删除末尾不确定的线段以及可能删除最后一个确定线段，并修改它前一个线段的next
+        idx = len(self) - 1
+        while idx >= 0 and not self.lst[idx].is_sure:
+            idx -= 1
+        return max(idx - 1, 0)
+
     def update(self, bi_lst: CBiList):
+        self.sync_checkpoint(bi_lst)
+        self.used_checkpoint = {}
         self.do_init()
         if len(self) == 0:
             self.cal_seg_sure(bi_lst, begin_idx=0)
         else:
             self.cal_seg_sure(bi_lst, begin_idx=self[-1].end_bi.idx+1)
+        self.eigen_checkpoint, self.used_checkpoint = self.used_checkpoint, None  # 只留这次用到的扫描起点
         self.collect_left_seg(bi_lst)
 
+    def sync_checkpoint(self, bi_lst: CBiList):
+        # 扫描到pos的状态取决于pos+2及之前的笔(actual_break会往后看两笔)，这些笔有变化的状态作废
+        if not self.eigen_checkpoint:
+            return  # 没有保存的状态时不用同步，保存前再同步
+        changed = self.line_chain.sync_changed(bi_lst[-1]) if len(bi_lst) else 0
+        self.eigen_checkpoint = {
+            key: valid
+            for key, checkpoints in self.eigen_checkpoint.items()
+            if (valid := tuple(c for c in checkpoints if c[0]+2 < changed))
+        }
+
     def cal_seg_sure(self, bi_lst: CBiList, begin_idx: int):
-        up_eigen = CEigenFX(BI_DIR.UP, lv=self.lv)  # 上升线段下降笔
-        down_eigen = CEigenFX(BI_DIR.DOWN, lv=self.lv)  # 下降线段上升笔
         last_seg_dir = None if len(self) == 0 else self[-1].dir
-        for bi in bi_lst[begin_idx:]:
-            fx_eigen = None
+        key = (begin_idx, last_seg_dir)
+        checkpoints = self.eigen_checkpoint.get(key, ())
+        if checkpoints:  # 从最近一次保存的状态接着扫，结果和从begin_idx重扫一样
+            pos, up_eigen, down_eigen, last_seg_dir = checkpoints[-1]
+            up_eigen, down_eigen = up_eigen.copy(), down_eigen.copy()
+            scan_from = pos + 1
+        else:
+            up_eigen = CEigenFX(BI_DIR.UP, lv=self.lv)  # 上升线段下降笔
+            down_eigen = CEigenFX(BI_DIR.DOWN, lv=self.lv)  # 下降线段上升笔
+            scan_from = begin_idx
+        # 末尾几笔还会变，只在它们之前保存状态；扫描距离不到EIGEN_CHECKPOINT_STEP时重扫比复制状态更快，不保存
+        safe_pos = len(bi_lst) - 5 if EIGEN_CHECKPOINT_STEP > 0 and self.used_checkpoint is not None else -1
+        synced = False
+        fx_eigen = None
+        for bi in bi_lst[scan_from:]:
             if bi.is_down() and last_seg_dir != BI_DIR.UP:
                 if up_eigen.add(bi):
                     fx_eigen = up_eigen
@@ -58,8 +101,22 @@ class CSegListChan(CSegListComm):
                     last_seg_dir = None
 
             if fx_eigen:
-                self.treat_fx_eigen(fx_eigen, bi_lst)
                 break
+            scan_len = bi.idx - begin_idx
+            if bi.idx <= safe_pos and scan_len >= EIGEN_CHECKPOINT_STEP and (scan_len % EIGEN_CHECKPOINT_STEP == 0 or bi.idx == safe_pos):
+                if not synced:
+                    self.line_chain.sync_changed(bi_lst[-1])
+                    if len(self.line_chain) != len(bi_lst):  # 无法同步就不保存
+                        safe_pos = -1
+                        continue
+                    synced = True
+                if checkpoints and (checkpoints[-1][0] - begin_idx) % EIGEN_CHECKPOINT_STEP != 0:
+                    checkpoints = checkpoints[:-1]  # 不在间隔上的状态只留最新的一个
+                checkpoints += ((bi.idx, up_eigen.copy(), down_eigen.copy(), last_seg_dir),)
+        if self.used_checkpoint is not None and checkpoints:
+            self.used_checkpoint[key] = checkpoints
+        if fx_eigen:
+            self.treat_fx_eigen(fx_eigen, bi_lst)
 
     def treat_fx_eigen(self, fx_eigen, bi_lst: CBiList):
         _test = fx_eigen.can_be_end(bi_lst)
@@ -74,3 +131,33 @@ class CSegListChan(CSegListComm):
                 self.cal_seg_sure(bi_lst, end_bi_idx + 1)
         else:
             self.cal_seg_sure(bi_lst, fx_eigen.lst[1].idx)
+
+
+class CLineChain(CChainIndex):
+    """
+    只记录笔(线段的线段里是线段)本身，不建极值列，同步时给出第一个有变化的下标
+    签名是特征序列元素用到的方向、高低点和时间
+    """
+    COLUMN_CNT = 0
+
+    def __init__(self):
+        super(CLineChain, self).__init__()
+        self.changed = 0
+
+    def signature(self, line):
+        return line.dir, line._high(), line._low(), CEigen.item_time(line)
+
+    def values(self, line):
+        return ()
+
+    def truncate(self, size):
+        self.changed = min(self.changed, size)
+        super(CLineChain, self).truncate(size)
+
+    def sync_changed(self, line) -> int:
+        # 同步到line，返回第一个有变化(或新增)的下标，无法同步时返回0
+        self.changed = len(self.items)
+        if not self.sync(line):
+            return 0
+        self.truncate(line.idx+1)  # 笔变少了(删除虚笔/restore)
+        return self.changed
@@ -5,11 +5,13 @@ from Bi.Bi import CBi
 from Bi.BiList import CBiList
 from Common.CEnum import BI_DIR, LEFT_SEG_METHOD, SEG_TYPE
 from Common.ChanException import CChanException, ErrCode
+from Common.RangeIndex import CChainIndex
 
 from .Seg import CSeg
 from .SegConfig import CSegConfig
 
 SUB_LINE_TYPE = TypeVar('SUB_LINE_TYPE', CBi, "CSeg")
+LINE_SCAN_LIMIT = 32  # 不超过这么多笔时直接遍历
 
 
 class CSegListComm(Generic[SUB_LINE_TYPE]):
@@ -18,6 +20,7 @@ class CSegListComm(Generic[SUB_LINE_TYPE]):
         self.lv = lv
         self.do_init()
         self.config = seg_config
+        self.line_index = CLineIndex()  # 次级别笔(线段)的区间极值，找峰值笔、判断突破用
 
     def do_init(self):
         self.lst = []
@@ -42,7 +45,16 @@ class CSegListComm(Generic[SUB_LINE_TYPE]):
         if len(self) == 0:
             return False
         last_seg_end_bi = self[-1].end_bi
-        for bi in bi_lst[last_seg_end_bi.idx+1:]:
+        begin = last_seg_end_bi.idx+1
+        if begin >= len(bi_lst):
+            return False
+        if self.use_line_index(bi_lst, begin):
+            if last_seg_end_bi.is_up():
+                return self.line_index.max(CLineIndex.HIGH, begin, len(bi_lst)-1) > last_seg_end_bi._high()
+            elif last_seg_end_bi.is_down():
+                return self.line_index.min(CLineIndex.LOW, begin, len(bi_lst)-1) < last_seg_end_bi._low()
+            return False
+        for bi in bi_lst[begin:]:
             if last_seg_end_bi.is_up() and bi._high() > last_seg_end_bi._high():
                 return True
             elif last_seg_end_bi.is_down() and bi._low() < last_seg_end_bi._low():
@@ -53,14 +65,18 @@ class CSegListComm(Generic[SUB_LINE_TYPE]):
         if len(bi_lst) < 3:
             return
         if self.config.left_method == LEFT_SEG_METHOD.PEAK:
-            _high = max(bi._high() for bi in bi_lst)
-            _low = min(bi._low() for bi in bi_lst)
+            if self.use_line_index(bi_lst, 0):
+                _high = self.line_index.max(CLineIndex.HIGH, 0, len(bi_lst)-1)
+                _low = self.line_index.min(CLineIndex.LOW, 0, len(bi_lst)-1)
+            else:
+                _high = max(bi._high() for bi in bi_lst)
+                _low = min(bi._low() for bi in bi_lst)
             if abs(_high-bi_lst[0].get_begin_val()) >= abs(_low-bi_lst[0].get_begin_val()):
-                peak_bi = FindPeakBi(bi_lst, is_high=True)
+                peak_bi = self.find_peak_bi(bi_lst, 0, is_high=True)
                 assert peak_bi is not None
                 self.add_new_seg(bi_lst, peak_bi.idx, is_sure=False, seg_dir=BI_DIR.UP, split_first_seg=False, reason="0seg_find_high")
             else:
-                peak_bi = FindPeakBi(bi_lst, is_high=False)
+                peak_bi = self.find_peak_bi(bi_lst, 0, is_high=False)
                 assert peak_bi is not None
                 self.add_new_seg(bi_lst, peak_bi.idx, is_sure=False, seg_dir=BI_DIR.DOWN, split_first_seg=False, reason="0seg_find_low")
             self.collect_left_as_seg(bi_lst)
@@ -73,12 +89,12 @@ class CSegListComm(Generic[SUB_LINE_TYPE]):
     def collect_left_seg_peak_method(self, last_seg_end_bi, bi_lst):
         find_new_seg = False
         if last_seg_end_bi.is_down():
-            peak_bi = FindPeakBi(bi_lst[last_seg_end_bi.idx+3:], is_high=True)
+            peak_bi = self.find_peak_bi(bi_lst, last_seg_end_bi.idx+3, is_high=True)
             if peak_bi and peak_bi.idx - last_seg_end_bi.idx >= 3:
                 self.add_new_seg(bi_lst, peak_bi.idx, is_sure=False, seg_dir=BI_DIR.UP, reason="collectleft_find_high")
                 find_new_seg = True
         else:
-            peak_bi = FindPeakBi(bi_lst[last_seg_end_bi.idx+3:], is_high=False)
+            peak_bi = self.find_peak_bi(bi_lst, last_seg_end_bi.idx+3, is_high=False)
             if peak_bi and peak_bi.idx - last_seg_end_bi.idx >= 3:
                 self.add_new_seg(bi_lst, peak_bi.idx, is_sure=False, seg_dir=BI_DIR.DOWN, reason="collectleft_find_low")
                 find_new_seg = True
@@ -94,11 +110,11 @@ class CSegListComm(Generic[SUB_LINE_TYPE]):
         if last_bi.idx-last_seg_end_bi.idx < 3:
             return
         if last_seg_end_bi.is_down() and last_bi.get_end_val() <= last_seg_end_bi.get_end_val():
-            if peak_bi := FindPeakBi(bi_lst[last_seg_end_bi.idx+3:], is_high=True):
+            if peak_bi := self.find_peak_bi(bi_lst, last_seg_end_bi.idx+3, is_high=True):
                 self.add_new_seg(bi_lst, peak_bi.idx, is_sure=False, seg_dir=BI_DIR.UP, reason="collectleft_find_high_force")
                 self.collect_left_seg(bi_lst)
         elif last_seg_end_bi.is_up() and last_bi.get_end_val() >= last_seg_end_bi.get_end_val():
-            if peak_bi := FindPeakBi(bi_lst[last_seg_end_bi.idx+3:], is_high=False):
+            if peak_bi := self.find_peak_bi(bi_lst, last_seg_end_bi.idx+3, is_high=False):
                 self.add_new_seg(bi_lst, peak_bi.idx, is_sure=False, seg_dir=BI_DIR.DOWN, reason="collectleft_find_low_force")
                 self.collect_left_seg(bi_lst)
         # 剩下线段的尾部相比于最后一个线段的尾部，高低关系和最后一个虚线段的方向一致
@@ -154,10 +170,27 @@ class CSegListComm(Generic[SUB_LINE_TYPE]):
             raise e
         return True
 
+    def use_line_index(self, bi_lst, begin: int) -> bool:
+        # 从begin到末尾的笔足够多时才用索引，短的直接遍历更快，也省得反复同步尾部变化的笔
+        return len(bi_lst) - begin > LINE_SCAN_LIMIT and bi_lst[-1].idx == len(bi_lst)-1 and self.line_index.sync(bi_lst[-1])
+
+    def find_peak_bi(self, bi_lst, begin: int, is_high: bool):
+        # 等价于FindPeakBi(bi_lst[begin:], is_high)
+        if begin >= len(bi_lst):
+            return None
+        if not self.use_line_index(bi_lst, begin):
+            return FindPeakBi(bi_lst[begin:], is_high)
+        peak_val, peak_idx = self.line_index.max(CLineIndex.PEAK_HIGH if is_high else CLineIndex.PEAK_LOW, begin, len(bi_lst)-1)
+        return bi_lst[peak_idx] if peak_val != float("-inf") else None
+
     @abc.abstractmethod
     def update(self, bi_lst: CBiList):
         ...
 
+    def frontier_begin(self) -> int:
+        # 下一次update可能删除或修改的第一个线段下标，默认每次update都从头重算
+        return 0
+
     def exist_sure_seg(self):
         return any(seg.is_sure for seg in self.lst)
 
@@ -172,3 +205,27 @@ def FindPeakBi(bi_lst: Union[CBiList, List[CBi]], is_high):
             peak_val = bi.get_end_val()
             peak_bi = bi
     return peak_bi
+
+
+class CLineIndex(CChainIndex):
+    """
+    笔(或线段)的区间极值：_high/_low，以及FindPeakBi的候选峰值
+    FindPeakBi取同向、且不低于(高于)前一个同向笔的笔里终点最高(低)的，相同取最后一个，
+    所以候选存成(终点值, idx)，低点取负号，统一求最大值
+    """
+    COLUMN_CNT = 4
+    PEAK_HIGH, PEAK_LOW, HIGH, LOW = range(COLUMN_CNT)
+
+    def signature(self, line):
+        pre2 = line.pre.pre if line.pre else None
+        return line.dir, line.get_end_val(), line._high(), line._low(), pre2.get_end_val() if pre2 else None
+
+    def values(self, line):
+        end_val = line.get_end_val()
+        pre2 = line.pre.pre if line.pre else None
+        peak_high = peak_low = (float("-inf"), line.idx)
+        if line.is_up() and not (pre2 and pre2.get_end_val() > end_val):
+            peak_high = (end_val, line.idx)
+        elif line.is_down() and not (pre2 and pre2.get_end_val() < end_val):
+            peak_low = (-end_val, line.idx)
+        return peak_high, peak_low, line._high(), line._low()
@@ -40,6 +40,8 @@ class CSegListDYH(CSegListComm):
 
     def cal_bi_sure(self, bi_lst):
         BI_LEN = len(bi_lst)
+        if BI_LEN == 0:
+            return
         next_begin_bi = bi_lst[0]
         for idx, bi in enumerate(bi_lst):
             if idx + 2 >= BI_LEN or idx < 2:
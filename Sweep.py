@@ -0,0 +1,261 @@
+"""
+参数扫描：同一批股票在多组配置下的买卖点
+只改买卖点参数(divergence_rate/min_zs_cnt/macd_algo等)时，K线合并、笔、线段和中枢都不会变，没必要每组配置都重新构建CChan
+按CChanConfig.fingerprint()把配置分组：
+    - 笔、线段、指标等参数相同的配置共用一次取数据和构建(load)
+    - 组内中枢参数相同的只算一次中枢(zs)
+    - 每组配置只重算自己的买卖点(bsp)
+指纹完全相同的配置只算一次；trigger_step的配置每步都会算买卖点，没法共用，各自单独构建
+
+    sweep = CParamSweep([KL_TYPE.K_DAY], grid({"bi_strict": True}, divergence_rate=[0.6, 0.8, float("inf")], macd_algo=["peak", "area"]),
+                        begin_time="2018-01-01", data_src=DATA_SRC.AKSHARE)
+    res = sweep.run(["sz.000001", "sh.600000"])
+    df = res.to_dataframe()  # 每行一个买卖点，config列是配置名
+"""
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from itertools import product
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from BuySellPoint.BSPointList import CBSPointList
+from Chan import CChan
+from ChanConfig import CChanConfig
+from Common.CEnum import AUTYPE, DATA_SRC, KL_TYPE
+from Common.CTime import CTime
+from DataAPI.AsyncStockAPI import replay_stock_api
+from KLine.KLine_List import CKLine_List, update_zs_in_seg
+from ScanCache import fetch_bars
+from ZS.ZSList import CZSList
+
+SHARED_STAGES = ("zs", "bsp", "seg_bsp")  # fingerprint里可以在已有笔、线段上重算的部分
+
+
+@dataclass
+class CSweepSignal:
+    config: str
+    code: str
+    lv: KL_TYPE
+    line: str  # bi: 笔买卖点，seg: 线段买卖点
+    is_buy: bool
+    type: str  # 同CBS_Point.type2str()
+    time: CTime
+    klu_idx: int
+    bi_idx: int
+    price: float
+    is_sure: bool
+
+
+@dataclass
+class CSweepResult:
+    signals: List[CSweepSignal] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)  # code -> 错误信息
+    stats: Counter = field(default_factory=Counter)  # load/zs/bsp各阶段的计算次数，load里已经包含组内第一组配置的中枢和买卖点
+    cost: float = 0.0
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame([dict(asdict(signal), lv=signal.lv.name, time=signal.time.to_str()) for signal in self.signals])
+
+
+@dataclass
+class CSweepJob:
+    lv_list: List[KL_TYPE]
+    begin_time: Optional[str]
+    end_time: Optional[str]
+    data_src: Union[DATA_SRC, str]
+    autype: AUTYPE
+    bar_cache_dir: Optional[str] = None
+
+
+# 一个load组：[(zs指纹, [(配置, 同指纹的配置名列表)])]
+GROUP_TYPE = List[Tuple[object, List[Tuple[CChanConfig, List[str]]]]]
+
+
+def grid(base: Optional[dict] = None, **axes) -> Dict[str, dict]:
+    """
+    参数网格的笛卡尔积，返回{配置名: 配置字典}，配置名形如"divergence_rate=0.8,macd_algo=peak"
+    """
+    base = base or {}
+    names = list(axes.keys())
+    res = {}
+    for values in product(*axes.values()):
+        res[",".join(f"{k}={v}" for k, v in zip(names, values)) or "base"] = dict(base, **dict(zip(names, values)))
+    return res
+
+
+def group_configs(configs: Dict[str, CChanConfig]) -> List[GROUP_TYPE]:
+    # 相同指纹的配置合并，再按是否能共用load分组，组内按中枢参数排好
+    by_fp: Dict[tuple, List[str]] = defaultdict(list)
+    conf_of: Dict[tuple, CChanConfig] = {}
+    for name, config in configs.items():
+        fp = config.fingerprint()
+        by_fp[fp].append(name)
+        conf_of.setdefault(fp, config)
+    groups: Dict[tuple, Dict[object, list]] = defaultdict(lambda: defaultdict(list))
+    for fp, names in by_fp.items():
+        stages = dict(fp)
+        load_key = fp if conf_of[fp].trigger_step else tuple(item for item in fp if item[0] not in SHARED_STAGES)
+        groups[load_key][stages["zs"]].append((conf_of[fp], names))
+    return [list(zs_groups.items()) for zs_groups in groups.values()]
+
+
+def recal_zs(kl_list: CKLine_List, config: CChanConfig):
+    # 在已有的笔、线段上按config的中枢参数重新计算中枢，和一次性构建时cal_seg_and_zs的结果一致
+    for seg in kl_list.seg_list:
+        seg.ele_inside_is_sure = False
+    for seg in kl_list.segseg_list:
+        seg.ele_inside_is_sure = False
+    kl_list.zs_list = CZSList(zs_config=config.zs_conf)
+    kl_list.zs_list.cal_bi_zs(kl_list.bi_list, kl_list.seg_list)
+    update_zs_in_seg(kl_list.bi_list, kl_list.seg_list, kl_list.zs_list)
+    kl_list.segzs_list = CZSList(zs_config=config.zs_conf)
+    kl_list.segzs_list.cal_bi_zs(kl_list.seg_list, kl_list.segseg_list)
+    update_zs_in_seg(kl_list.seg_list, kl_list.segseg_list, kl_list.segzs_list)
+
+
+def recal_bsp(kl_list: CKLine_List, config: CChanConfig):
+    # 丢掉笔、线段上挂的旧买卖点，按config的买卖点参数重新计算
+    for line in kl_list.bi_list:
+        line.bsp = None
+    for line in kl_list.seg_list:
+        line.bsp = None
+    kl_list.seg_bs_point_lst = CBSPointList(bs_point_config=config.seg_bs_point_conf)
+    kl_list.seg_bs_point_lst.cal(kl_list.seg_list, kl_list.segseg_list)
+    kl_list.bs_point_lst = CBSPointList(bs_point_config=config.bs_point_conf)
+    kl_list.bs_point_lst.cal(kl_list.bi_list, kl_list.seg_list)
+
+
+def collect_signals(chan: CChan, code: str, names: List[str]) -> List[CSweepSignal]:
+    res = []
+    for lv in chan.lv_list:
+        kl_list = chan[lv]
+        for line, bsp_lst in (("bi", kl_list.bs_point_lst), ("seg", kl_list.seg_bs_point_lst)):
+            for bsp in sorted(bsp_lst.bsp_iter(), key=lambda bsp: bsp.bi.idx):
+                res.extend(CSweepSignal(
+                    config=name,
+                    code=code,
+                    lv=lv,
+                    line=line,
+                    is_buy=bsp.is_buy,
+                    type=bsp.type2str(),
+                    time=bsp.klu.time,
+                    klu_idx=bsp.klu.idx,
+                    bi_idx=bsp.bi.idx,
+                    price=bsp.bi.get_end_val(),
+                    is_sure=bsp.bi.is_sure,
+                ) for name in names)
+    return res
+
+
+def sweep_group(job: CSweepJob, code: str, group: GROUP_TYPE, data=None) -> CSweepResult:
+    res = CSweepResult()
+    start = time.perf_counter()
+    try:
+        if data is None:
+            data = fetch_bars(job, code, job.bar_cache_dir)
+        config = group[0][1][0][0]  # 第一组配置的中枢、买卖点随构建一起算好
+        chan = CChan(
+            code=code,
+            begin_time=job.begin_time,
+            end_time=job.end_time,
+            data_src=replay_stock_api(data[0], **data[1]),
+            lv_list=list(job.lv_list),
+            config=config,
+            autype=job.autype,
+        )
+        if config.trigger_step:
+            for _ in chan.step_load():
+                pass
+        res.stats["load"] += 1
+        for zs_idx, (_, bsp_groups) in enumerate(group):
+            for bsp_idx, (config, names) in enumerate(bsp_groups):
+                if zs_idx > 0 and bsp_idx == 0:
+                    for lv in chan.lv_list:
+                        recal_zs(chan[lv], config)
+                    res.stats["zs"] += 1
+                if zs_idx > 0 or bsp_idx > 0:
+                    for lv in chan.lv_list:
+                        recal_bsp(chan[lv], config)
+                    res.stats["bsp"] += 1
+                res.signals.extend(collect_signals(chan, code, names))
+    except Exception as e:
+        res.errors[code] = f"{type(e).__name__}: {e}"
+    res.cost = time.perf_counter() - start
+    return res
+
+
+def _sweep_in_worker(job: CSweepJob, code: str, group: GROUP_TYPE) -> CSweepResult:
+    return sweep_group(job, code, group)
+
+
+class CParamSweep:
+    def __init__(
+        self,
+        lv_list: List[KL_TYPE],
+        configs: Union[Dict[str, Union[dict, CChanConfig]], List[Union[dict, CChanConfig]]],
+        begin_time=None,
+        end_time=None,
+        data_src: Union[DATA_SRC, str] = DATA_SRC.BAO_STOCK,
+        autype: AUTYPE = AUTYPE.QFQ,
+        max_workers: Optional[int] = 0,
+    ):
+        """
+        configs: {配置名: 配置字典或CChanConfig}，传列表时配置名为下标；可以用grid()生成
+        max_workers: 进程数，0表示在当前进程里串行，None表示cpu核数；每个(股票, load组)是一个任务
+        """
+        if not isinstance(configs, dict):
+            configs = {str(idx): config for idx, config in enumerate(configs)}
+        self.configs: Dict[str, CChanConfig] = {
+            name: config if isinstance(config, CChanConfig) else CChanConfig(dict(config))
+            for name, config in configs.items()
+        }
+        self.groups = group_configs(self.configs)
+        self.job = CSweepJob(
+            lv_list=lv_list,
+            begin_time=begin_time,
+            end_time=end_time,
+            data_src=data_src,
+            autype=autype,
+            bar_cache_dir=next((config.bar_cache_dir for config in self.configs.values()), None),
+        )
+        self.max_workers = max_workers
+
+    def run(self, code_list: Iterable[str]) -> CSweepResult:
+        res = CSweepResult()
+        start = time.perf_counter()
+        code_list = list(code_list)
+        if self.max_workers == 0:
+            for code in code_list:
+                try:
+                    data = fetch_bars(self.job, code, self.job.bar_cache_dir)  # 同一只股票的各个load组共用
+                except Exception as e:
+                    res.errors[code] = f"{type(e).__name__}: {e}"
+                    continue
+                for group in self.groups:
+                    self.merge(res, sweep_group(self.job, code, group, data))
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures: Dict[Future, str] = {
+                    executor.submit(_sweep_in_worker, self.job, code, group): code
+                    for code in code_list
+                    for group in self.groups
+                }
+                for future in as_completed(futures):
+                    try:
+                        self.merge(res, future.result())
+                    except Exception as e:  # 子进程异常退出等
+                        res.errors[futures[future]] = f"{type(e).__name__}: {e}"
+        config_order = {name: idx for idx, name in enumerate(self.configs)}
+        code_order = {code: idx for idx, code in enumerate(code_list)}
+        lv_order = {lv: idx for idx, lv in enumerate(self.job.lv_list)}
+        res.signals.sort(key=lambda signal: (config_order[signal.config], code_order[signal.code], lv_order[signal.lv], signal.line, signal.bi_idx))
+        res.cost = time.perf_counter() - start
+        return res
+
+    @staticmethod
+    def merge(res: CSweepResult, sub_res: CSweepResult):
+        res.signals.extend(sub_res.signals)
+        res.errors.update(sub_res.errors)
+        res.stats.update(sub_res.stats)
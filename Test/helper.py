@@ -0,0 +1,85 @@
+"""
+测试公用的构造和比对函数：用本地模拟数据源(DataAPI/MockAPI.py)生成确定性的K线，
+dump_chan把各级别的K线/笔/线段/中枢/买卖点摘要成可以直接比较的结构
+"""
+import datetime
+from typing import List, Optional
+
+from Chan import CChan
+from ChanConfig import CChanConfig
+from Common.CEnum import KL_TYPE
+
+MOCK_SRC = "custom:MockAPI.CMockAPI"
+BEGIN_DATE = datetime.date(2015, 1, 1)
+BARS_PER_DAY = {KL_TYPE.K_1M: 240, KL_TYPE.K_5M: 48, KL_TYPE.K_15M: 16, KL_TYPE.K_30M: 8, KL_TYPE.K_60M: 4, KL_TYPE.K_DAY: 1}
+
+
+def end_date_for(bars: int, lv: KL_TYPE) -> str:
+    trade_days = bars // BARS_PER_DAY[lv] + 1
+    return str(BEGIN_DATE + datetime.timedelta(days=trade_days * 7 // 5 + 1))
+
+
+def make_conf(conf: Optional[dict] = None) -> CChanConfig:
+    return CChanConfig({"print_warning": False, **(conf or {})})
+
+
+def make_chan(bars: int, conf: Optional[dict] = None, lv_list: Optional[List[KL_TYPE]] = None, code="sz.000001", **kwargs) -> CChan:
+    lv_list = lv_list or [KL_TYPE.K_30M]
+    return CChan(
+        code=code,
+        begin_time=str(BEGIN_DATE),
+        end_time=end_date_for(bars, lv_list[-1]),
+        data_src=MOCK_SRC,
+        lv_list=lv_list,
+        config=make_conf(conf),
+        **kwargs,
+    )
+
+
+def mock_klus(bars: int, lv: KL_TYPE = KL_TYPE.K_30M, code="sz.000001") -> list:
+    from DataAPI.MockAPI import CMockAPI
+    api = CMockAPI(code, k_type=lv, begin_date=str(BEGIN_DATE), end_date=end_date_for(bars, lv))
+    return list(api.get_kl_data())
+
+
+def metric_values(value):
+    # 指标结果(float或BOLL_Metric/KDJ_Item等带slots的对象)转成可以逐位比较的repr
+    if isinstance(value, (int, float)):
+        return _f(value)
+    from Common.func_util import slot_names
+    return tuple((name, _f(getattr(value, name))) for name in slot_names(type(value)))
+
+
+def _f(value):
+    return repr(float(value)) if isinstance(value, (int, float)) else repr(value)
+
+
+def dump_klu(klu) -> tuple:
+    res = [klu.idx, str(klu.time), _f(klu.open), _f(klu.high), _f(klu.low), _f(klu.close), _f(klu.macd.macd), _f(klu.macd.DIF), _f(klu.macd.DEA)]
+    res += [_f(klu.boll.UP), _f(klu.boll.DOWN), _f(klu.boll.MID)]
+    res.append(repr(sorted((k.value, sorted((n, _f(v)) for n, v in d.items())) for k, d in klu.trend.items())))
+    for name in ("rsi", "kdj"):
+        value = getattr(klu, name, None)
+        res.append(None if value is None else _f(value) if name == "rsi" else (_f(value.k), _f(value.d), _f(value.j)))
+    res.append(klu.sup_kl.idx if klu.sup_kl else None)
+    res.append(tuple(sub.idx for sub in klu.sub_kl_list))
+    return tuple(res)
+
+
+def dump_level(kl_list) -> dict:
+    res = {
+        "klu": [dump_klu(klu) for klc in kl_list.lst for klu in klc.lst],
+        "klc": [(klc.idx, klc.fx.name, klc.dir.name, _f(klc.high), _f(klc.low), len(klc.lst)) for klc in kl_list.lst],
+        "bi": [(bi.idx, bi.begin_klc.idx, bi.end_klc.idx, bi.is_sure, bi.dir.name, bi.get_begin_klu().idx, bi.get_end_klu().idx) for bi in kl_list.bi_list],
+    }
+    for name in ("seg_list", "segseg_list"):
+        res[name] = [(s.idx, s.start_bi.idx, s.end_bi.idx, s.is_sure, s.dir.name, [z.begin_bi.idx for z in s.zs_lst]) for s in getattr(kl_list, name)]
+    for name in ("zs_list", "segzs_list"):
+        res[name] = [(z.begin_bi.idx, z.end_bi.idx, _f(z.low), _f(z.high), z.is_sure) for z in getattr(kl_list, name)]
+    for name in ("bs_point_lst", "seg_bs_point_lst"):
+        res[name] = sorted((b.bi.idx, b.is_buy, b.type2str(), b.klu.idx, repr(sorted(b.features.items()))) for b in getattr(kl_list, name).bsp_iter())
+    return res
+
+
+def dump_chan(chan: CChan) -> list:
+    return [dump_level(chan[lv]) for lv in chan.lv_list]
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import Chan
+from Common.CEnum import KL_TYPE
+from DataAPI.AsyncStockAPI import aload_chans, load_chans
+from DataAPI.MockAPI import CAsyncMockAPI
+from Test.helper import BEGIN_DATE, dump_chan, end_date_for, make_chan, make_conf
+
+LV_LIST = [KL_TYPE.K_DAY, KL_TYPE.K_30M]
+BARS = 800
+BAD_CODE = "sz.000666"
+LATENCY = {"sz.000001": 0.6, "sz.000002": 0.1, "sz.000003": 0.3}
+
+
+class CFakeAsyncAPI(CAsyncMockAPI):
+    # 每只股票固定延迟，BAD_CODE的请求失败
+    started = set()
+
+    async def aget_kl_data(self):
+        self.started.add(self.code)
+        if self.code == BAD_CODE:
+            raise ConnectionError("connection reset by peer")
+        await asyncio.sleep(LATENCY.get(self.code, 0.01))
+        async for klu in super().aget_kl_data():
+            yield klu
+
+
+def load_kwargs():
+    return {"begin_time": str(BEGIN_DATE), "end_time": end_date_for(BARS, LV_LIST[-1]), "lv_list": LV_LIST, "config": make_conf(), "data_src": CFakeAsyncAPI}
+
+
+def test_order_errors_and_results():
+    codes = list(LATENCY) + [BAD_CODE]
+
+    async def collect():
+        return [item async for item in aload_chans(codes, concurrency=8, **load_kwargs())]
+    start = time.perf_counter()
+    res = asyncio.run(collect())
+    cost = time.perf_counter() - start
+    assert [code for code, _, _ in res] == [BAD_CODE, "sz.000002", "sz.000003", "sz.000001"]  # 按完成顺序
+    code, chan, error = res[0]
+    assert chan is None and error == "ConnectionError: connection reset by peer"
+    for code, chan, error in res[1:]:
+        assert error is None
+        assert dump_chan(chan) == dump_chan(make_chan(BARS, lv_list=LV_LIST, code=code))
+    assert cost < sum(LATENCY.values())  # 各股票的请求是并发的
+
+    chans, errors = load_chans(codes, **load_kwargs())
+    assert sorted(chans) == sorted(LATENCY)
+    assert list(errors) == [BAD_CODE]
+
+
+def test_pending_symbols_are_bounded(monkeypatch):
+    # 构造CChan比拉取慢时，开始拉取但没构造完的股票数不超过max_pending
+    built, max_pending_seen = set(), [0]
+    orig_chan = Chan.CChan
+
+    def slow_chan(*args, **kwargs):
+        max_pending_seen[0] = max(max_pending_seen[0], len(CFakeAsyncAPI.started - built))
+        time.sleep(0.05)
+        chan = orig_chan(*args, **kwargs)
+        built.add(kwargs["code"])
+        return chan
+    monkeypatch.setattr(Chan, "CChan", slow_chan)
+    CFakeAsyncAPI.started = set()
+    codes = [f"sz.{idx:06d}" for idx in range(100, 112)]
+    chans, errors = load_chans(codes, concurrency=4, max_pending=3, **dict(load_kwargs(), end_time=end_date_for(100, KL_TYPE.K_30M)))
+    assert not errors and sorted(chans) == codes
+    assert 1 <= max_pending_seen[0] <= 3
@@ -0,0 +1,55 @@
+import Backtest
+from Backtest import CBacktester, CStrategy, _bi_sig, _diff_tail, _seg_sig
+from Common.CEnum import KL_TYPE
+from Test.helper import MOCK_SRC
+
+LOG = []
+
+
+class CRecorder(CStrategy):
+    def on_bi(self, ctx, event):
+        LOG.append(("bi", event.lv.name, event.change.name, event.idx, event.bi and _bi_sig(event.bi)))
+
+    def on_seg(self, ctx, event):
+        LOG.append(("seg", event.lv.name, event.seg.idx, _seg_sig(event.seg)))
+
+    def on_zs(self, ctx, event):
+        LOG.append(("zs", event.lv.name, event.zs.begin_bi.idx))
+
+    def on_bsp(self, ctx, event):
+        LOG.append(("bsp", event.lv.name, event.change.name, event.is_seg, event.bsp.bi.idx, event.bsp.type2str()))
+
+
+def run_events(conf=None):
+    LOG.clear()
+    tester = CBacktester(CRecorder, [KL_TYPE.K_DAY, KL_TYPE.K_30M], {"print_warning": False, **(conf or {})}, "2016-01-01", "2017-06-01", MOCK_SRC)
+    res = tester.run("sz.000001")
+    assert res.ok, res.error
+    return list(LOG)
+
+
+def test_diff_tail_long_unsure_tail():
+    # 确定的前缀之后有一长串不确定的元素，变化发生在离尾部很远的地方
+    old_sig = [(idx, True) for idx in range(3)] + [(idx, False) for idx in range(3, 20)]
+    items = [(idx, True) for idx in range(5)] + [(idx, False) for idx in range(5, 18)]
+    pos, old, new = _diff_tail(old_sig, 3, items, lambda item: item)
+    assert (pos, old, new) == (3, [(3, False), (4, False)] + [(idx, False) for idx in range(5, 20)], items[3:])
+    assert old_sig == items
+
+
+def test_diff_tail_sure_part_rolled_back():
+    # 上一步记录的稳定前缀末尾被改了，要往前找到断开处
+    old_sig = list(range(10))
+    items = [0, 1, 2, 30, 40, 50, 60]
+    pos, old, new = _diff_tail(old_sig, 6, items, lambda item: item)
+    assert (pos, old, new) == (3, list(range(3, 10)), [30, 40, 50, 60])
+    assert old_sig == items
+
+
+def test_events_match_full_diff(monkeypatch):
+    for conf in ({}, {"zs_algo": "over_seg"}):
+        events = run_events(conf)
+        with monkeypatch.context() as m:
+            m.setattr(Backtest, "_diff_tail", lambda old_sig, stable_len, items, make_sig: _diff_tail(old_sig, 0, items, make_sig))
+            assert run_events(conf) == events
+        assert {event[0] for event in events} == {"bi", "seg", "zs", "bsp"}
@@ -0,0 +1,104 @@
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from Common.CEnum import AUTYPE, KL_TYPE
+from DataAPI.BarCache import CBarFile, cached_stock_api
+from DataAPI.MockAPI import CMockAPI, CMockSessionAPI
+
+CODE = "sz.000001"
+
+
+class CRecordAPI(CMockSessionAPI):
+    # 记录每次向上游请求的区间；factor模拟前复权因子变化，所有价格同比例缩放
+    requests = []
+    factor = 1.0
+
+    def get_kl_data(self):
+        self.requests.append((self.begin_date, self.end_date))
+        for klu in super(CRecordAPI, self).get_kl_data():
+            klu.open, klu.high, klu.low, klu.close = (round(value * self.factor, 2) for value in (klu.open, klu.high, klu.low, klu.close))
+            yield klu
+
+
+@pytest.fixture
+def cached_api(tmp_path):
+    CRecordAPI.requests = []
+    CRecordAPI.factor = 1.0
+    yield cached_stock_api(CRecordAPI, str(tmp_path))
+    CRecordAPI.factor = 1.0
+
+
+def bars(api_cls, begin, end, lv=KL_TYPE.K_30M):
+    return [(str(klu.time), klu.open, klu.high, klu.low, klu.close) for klu in api_cls(CODE, lv, begin, end, AUTYPE.QFQ).get_kl_data()]
+
+
+def fresh(begin, end, lv=KL_TYPE.K_30M):
+    return bars(CRecordAPI, begin, end, lv)
+
+
+def test_hit_and_miss(cached_api):
+    assert bars(cached_api, "2015-01-01", "2015-06-01") == fresh("2015-01-01", "2015-06-01")
+    assert cached_api.bar_cache.miss == 1
+    CRecordAPI.requests.clear()
+    assert bars(cached_api, "2015-01-01", "2015-06-01") == fresh("2015-01-01", "2015-06-01")
+    assert bars(cached_api, "2015-02-01", "2015-03-01") == fresh("2015-02-01", "2015-03-01")
+    assert cached_api.bar_cache.hit == 2
+    assert CRecordAPI.requests == [("2015-01-01", "2015-06-01"), ("2015-02-01", "2015-03-01")]  # 只有fresh的请求
+
+
+def test_widen_range_with_mixed_date_formats(cached_api):
+    bars(cached_api, "2015-03-01", "2015-06-01")
+    CRecordAPI.requests.clear()
+    # 按日期比较而不是按字符串比较："20150101"早于"2015-03-01"
+    assert bars(cached_api, "20150101", "20150401") == fresh("2015-01-01", "2015-04-01")
+    assert CRecordAPI.requests[0] == ("20150101", "2015-06-01")
+    CRecordAPI.requests.clear()
+    assert bars(cached_api, "2015-01-01", "2015-06-01") == fresh("2015-01-01", "2015-06-01")
+    assert CRecordAPI.requests == [("2015-01-01", "2015-06-01")]
+
+
+def test_extend_end_fetches_only_tail(cached_api):
+    bars(cached_api, "2015-01-01", "2015-06-01")
+    CRecordAPI.requests.clear()
+    assert bars(cached_api, "2015-01-01", "2015-09-01") == fresh("2015-01-01", "2015-09-01")
+    assert CRecordAPI.requests[0] == ("2015-06-01", "2015-09-01")  # 从缓存最后一个交易日开始拉
+
+
+def test_today_cutoff(cached_api):
+    today = str(datetime.date.today())
+    begin = str(datetime.date.today() - datetime.timedelta(days=60))
+    for lv in (KL_TYPE.K_DAY, KL_TYPE.K_30M):
+        for _ in range(3):
+            CRecordAPI.requests.clear()
+            assert bars(cached_api, begin, today, lv) == fresh(begin, today, lv)
+            assert len(CRecordAPI.requests) == 2  # 缓存一次 + fresh一次
+        # 今天的K线可能没走完，不算已覆盖；再次请求只拉最后一个已完成交易日之后的尾部
+        tail_begin = CRecordAPI.requests[0][0]
+        assert begin < tail_begin < today
+        assert datetime.date.fromisoformat(today) - datetime.date.fromisoformat(tail_begin) <= datetime.timedelta(days=4)
+
+
+def test_adjust_change_refetches_all(cached_api):
+    bars(cached_api, "2015-01-01", "2015-06-01")
+    CRecordAPI.factor = 0.9
+    CRecordAPI.requests.clear()
+    assert bars(cached_api, "2015-01-01", "2015-09-01") == fresh("2015-01-01", "2015-09-01")
+    assert CRecordAPI.requests[:2] == [("2015-06-01", "2015-09-01"), ("2015-01-01", "2015-09-01")]  # 尾部对不上，整段重拉
+    assert bars(cached_api, "2015-01-01", "2015-03-01") == fresh("2015-01-01", "2015-03-01")
+
+
+def test_failed_write_keeps_old_file(cached_api, tmp_path):
+    bars(cached_api, "2015-01-01", "2015-06-01")
+    path = cached_api.bar_cache.file_path(CODE, KL_TYPE.K_30M, AUTYPE.QFQ)
+    with pytest.raises(TypeError):
+        CBarFile.write(path, np.zeros(3, dtype=[("x", "<f8")]), {})
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+    assert bars(cached_api, "2015-01-01", "2015-06-01") == fresh("2015-01-01", "2015-06-01")
+
+
+def test_mock_bars_do_not_depend_on_begin():
+    full = bars(CMockAPI, "2015-01-01", "2015-06-01")
+    assert bars(CMockAPI, "2015-03-02", "2015-06-01") == [bar for bar in full if bar[0] >= "2015/03/02"]
@@ -0,0 +1,74 @@
+import pytest
+
+from Bi.Bi import CBi
+from Common.cache import CACHE_MISS, cache_stats, enable_cache_stats
+from Common.CEnum import KLINE_DIR
+from KLine.KLine import CKLine
+from Test.helper import dump_chan, make_chan
+from Test.test_kline_combiner import make_klu
+
+BEGIN_ONLY = {"get_begin_val", "get_begin_klu", "is_down", "is_up"}  # deps=("begin_klc",)
+END_DEPENDENT = {"get_end_val", "get_end_klu", "amp", "_high", "_low", "_mid"}  # 没有声明deps，依赖全部字段
+
+
+@pytest.fixture
+def cache_stat():
+    enable_cache_stats()
+    yield {stat.name: stat for stat in cache_stats()}
+    enable_cache_stats(False)
+
+
+def make_up_bi():
+    # 底分型klc1到还没有下一根、可以继续合并的klc2的向上笔
+    klc0 = CKLine(make_klu(0, 5, 3), idx=0)
+    klc1 = CKLine(make_klu(1, 3, 1), idx=1, _dir=KLINE_DIR.DOWN)
+    klc2 = CKLine(make_klu(2, 6, 4), idx=2, _dir=KLINE_DIR.UP)
+    klc1.update_fx(klc0, klc2)
+    return CBi(klc1, klc2, idx=0, is_sure=False)
+
+
+def cached_names(bi):
+    return {method.name for method in CBi._memoize_methods if bi._memoize_cache[method.slot] is not CACHE_MISS}
+
+
+def fill_cache(bi):
+    for name in BEGIN_ONLY | END_DEPENDENT:  # 手工构造的K线没有指标和klu.idx，其余方法算不了
+        getattr(bi, name)()
+
+
+def test_combine_into_end_klc_invalidates_only_dependents(cache_stat):
+    bi = make_up_bi()
+    fill_cache(bi)
+    assert cached_names(bi) == BEGIN_ONLY | END_DEPENDENT
+    old_end_klu = bi.get_end_klu()
+
+    new_klu = make_klu(3, 6, 4.5)  # 被包含，向上合并，high相等所以峰值K线变成新的这根
+    assert bi.end_klc.try_add(new_klu) == KLINE_DIR.COMBINE
+    assert cached_names(bi) == BEGIN_ONLY
+    assert bi.get_end_klu() is new_klu is not old_end_klu
+    assert bi.get_end_val() == 6 and bi._low() == 1
+    assert bi.get_begin_klu() is bi.begin_klc.lst[0]
+
+    for name in BEGIN_ONLY | END_DEPENDENT:
+        stat = cache_stat[f"CBi.{name}"]
+        assert stat.invalidate == (name not in BEGIN_ONLY), name
+    assert cache_stat["CBi.get_end_klu"].miss == 2
+    assert cache_stat["CBi.get_end_klu"].hit == 1
+    assert cache_stat["CBi.get_begin_klu"].miss == 1
+    assert cache_stat["CBi.get_begin_klu"].hit == 1
+
+
+def test_stats_do_not_change_results(cache_stat):
+    chan = make_chan(600, {"trigger_step": True})
+    for _ in chan.step_load():
+        pass
+    end_val = cache_stat["CBi.get_end_val"]
+    assert end_val.hit > 0 and end_val.miss > 0 and end_val.invalidate > 0
+    assert 0 < end_val.hit_rate < 1 and 0 < end_val.invalidate_rate <= 1
+    assert cache_stat["CBi.is_up"].invalidate < end_val.invalidate  # 只依赖起点的结果失效得少
+    enable_cache_stats(False)
+    ref = make_chan(600, {"trigger_step": True})
+    for _ in ref.step_load():
+        pass
+    assert dump_chan(chan) == dump_chan(ref)
+    assert all(stat.hit == stat.miss == stat.invalidate == 0 for stat in cache_stats())  # 关闭时重新清零且不再计数
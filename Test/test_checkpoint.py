@@ -0,0 +1,77 @@
+import copy
+import random
+
+import pytest
+
+from Common.ChanException import CChanException
+from Common.CEnum import KL_TYPE
+from Test.helper import dump_chan, make_chan, mock_klus
+from Test.test_incremental import CONFS, feed, klu_cnt, variant
+
+
+def speculate(chan, klus, rnd):
+    for klu in klus:
+        feed(chan, chan.lv_list[0], variant(klu, rnd), rnd)
+
+
+@pytest.mark.parametrize("conf", [CONFS["metrics"], dict(CONFS["area"], columnar_kl=True)])
+def test_restore_round_trip(conf):
+    chan = make_chan(500, conf)
+    klus = mock_klus(900)
+    base, rnd = klu_cnt(chan), random.Random(1)
+    for i in range(base, len(klus) - 40, 13):
+        cp = chan.checkpoint()
+        expected = dump_chan(chan)
+        for _ in range(2):  # 同一个checkpoint可以反复restore
+            speculate(chan, klus[i:i + rnd.randint(1, 40)], rnd)
+            chan.restore(cp)
+            assert dump_chan(chan) == expected
+        for klu in klus[i:i + 13]:
+            feed(chan, chan.lv_list[0], klu, rnd)
+    ref = make_chan(500, conf)
+    ref.trigger_load({ref.lv_list[0]: mock_klus(900)[base:klu_cnt(chan)]})
+    assert dump_chan(chan) == dump_chan(ref)
+
+
+def test_checkpoint_on_forming_klu():
+    chan = make_chan(500, CONFS["default"])
+    lv, klus, rnd = chan.lv_list[0], mock_klus(700), random.Random(2)
+    base = klu_cnt(chan)
+    chan.append_klu(lv, variant(klus[base], rnd))
+    cp = chan.checkpoint()
+    expected = dump_chan(chan)
+    chan.update_last_klu(lv, variant(klus[base], rnd))
+    speculate(chan, klus[base + 1:base + 30], rnd)
+    chan.restore(cp)
+    assert dump_chan(chan) == expected
+    chan.update_last_klu(lv, klus[base])
+    ref = make_chan(500, CONFS["default"])
+    ref.trigger_load({lv: mock_klus(700)[base:base + 1]})
+    assert dump_chan(chan) == dump_chan(ref)
+
+
+def test_multi_level_restore():
+    lv_list = [KL_TYPE.K_60M, KL_TYPE.K_30M]
+    chan = make_chan(400, CONFS["metrics"], lv_list=lv_list)
+    expected = dump_chan(chan)
+    cp = chan.checkpoint()
+    parents, subs = mock_klus(600, KL_TYPE.K_60M), mock_klus(1200, KL_TYPE.K_30M)
+    base_p, base_s, rnd = klu_cnt(chan, 0), klu_cnt(chan, 1), random.Random(3)
+    for p in range(base_p, base_p + 60):
+        chan.append_klu(lv_list[0], variant(parents[p], rnd))
+        for s in (2 * (p - base_p) + base_s, 2 * (p - base_p) + base_s + 1):
+            feed(chan, lv_list[1], variant(subs[s], rnd), rnd)
+    chan.restore(cp)
+    assert dump_chan(chan) == expected
+
+
+def test_restore_rejects_change_before_boundary():
+    chan = make_chan(500)
+    kl_list = chan[0]
+    frontier = kl_list.checkpoint()
+    begin = frontier.bi_tail.begin
+    assert begin > 0
+    guard = kl_list.bi_list[begin - 1]
+    guard.parent_seg = copy.copy(guard.parent_seg)
+    with pytest.raises(CChanException):
+        kl_list.restore(frontier)
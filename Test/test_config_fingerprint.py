@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from Test.helper import make_conf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE = {"bi_strict": True, "divergence_rate": 0.9, "mean_metrics": [5, 20], "bs_type": "1,2,3a"}
+
+
+def digest(conf):
+    return make_conf(dict(conf)).fingerprint_digest()
+
+
+def test_order_and_duplicates_do_not_matter():
+    assert digest(BASE) == digest(dict(reversed(list(BASE.items()))))
+    assert digest(BASE) == digest(dict(BASE, mean_metrics=[20, 5, 20]))
+    assert digest(BASE) == digest(dict(BASE, bs_type="3a,1,2"))
+    assert hash(make_conf(dict(BASE)).fingerprint()) == hash(make_conf(dict(BASE)).fingerprint())
+
+
+@pytest.mark.parametrize("extra", [
+    {"columnar_kl": True}, {"batch_metric": True}, {"keep_metric_history": False},
+    {"bar_cache_dir": "/tmp/bars"}, {"parallel_load": True}, {"print_warning": True}, {"print_err_time": False},
+    {"rsi_cycle": 7}, {"kdj_cycle": 5},  # 没开启rsi/kdj时不影响结果
+])
+def test_non_result_params_are_ignored(extra):
+    assert digest(dict(BASE, **extra)) == digest(BASE)
+
+
+@pytest.mark.parametrize("extra", [
+    {"bi_strict": False}, {"bi_algo": "fx"}, {"seg_algo": "1+1"}, {"left_seg_method": "all"}, {"zs_algo": "over_seg"},
+    {"zs_combine": False}, {"trigger_step": True}, {"kl_data_check": False}, {"divergence_rate": 0.8},
+    {"divergence_rate-buy": 0.8}, {"macd_algo": "area"}, {"bs_type": "1,2"}, {"mean_metrics": [5]},
+    {"trend_metrics": [10]}, {"boll_n": 30}, {"macd": {"fast": 10, "slow": 26, "signal": 9}},
+    {"cal_rsi": True}, {"cal_kdj": True}, {"cal_demark": True},
+])
+def test_result_params_change_fingerprint(extra):
+    assert digest(dict(BASE, **extra)) != digest(BASE)
+
+
+def test_digest_is_stable_across_processes():
+    code = f"from Test.helper import make_conf; print(make_conf({BASE!r}).fingerprint_digest())"
+    outs = set()
+    for seed in ("0", "1", "12345"):
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=ROOT)
+        outs.add(subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip())
+    assert outs == {digest(BASE)}
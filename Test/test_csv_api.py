@@ -0,0 +1,78 @@
+import datetime
+import random
+
+import pytest
+
+from Common.CEnum import DATA_FIELD, KL_TYPE
+from DataAPI.csvAPI import CSV_API
+
+WINDOWS = [(None, None), ("2020-03-01", "2020-06-01"), ("2020-03-01", None), (None, "2020-02-10"), ("2030-01-01", None)]
+
+
+def make_rows(cnt=300):
+    rnd = random.Random(cnt)
+    day = datetime.date(2020, 1, 1)
+    rows = []
+    for _ in range(cnt):
+        close = round(10 + rnd.random() * 5, 2)
+        rows.append((str(day), round(close - 0.1, 2), round(close + 0.3, 2), round(close - 0.3, 2), close, rnd.randint(100, 10000)))
+        day += datetime.timedelta(days=1)
+    return rows
+
+
+def write_csv(path, rows, header):
+    with open(path, "w") as f:
+        if header is not None:
+            f.write(header + "\n")
+        for row in rows:
+            f.write(",".join(str(value) for value in row) + "\n")
+
+
+def make_api_cls(data_dir, bulk_load, column_map=None, headers_exist=True):
+    class CTestCSV(CSV_API):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.headers_exist = headers_exist
+
+    CTestCSV.data_dir = str(data_dir)
+    CTestCSV.bulk_load = bulk_load
+    CTestCSV.column_map = column_map
+    return CTestCSV
+
+
+def load(api_cls, begin, end):
+    api = api_cls("t", k_type=KL_TYPE.K_DAY, begin_date=begin, end_date=end)
+    return [(str(klu.time), klu.open, klu.high, klu.low, klu.close, klu.trade_info.metric[DATA_FIELD.FIELD_VOLUME]) for klu in api.get_kl_data()]
+
+
+@pytest.mark.parametrize("shuffled", [False, True])
+@pytest.mark.parametrize("layout", ["default", "no_header", "column_map"])
+def test_bulk_matches_line_path(tmp_path, shuffled, layout):
+    rows = make_rows()
+    if shuffled:
+        rows = rows[150:] + rows[:150]  # 后半段挪到前面，时间列不再有序
+    column_map = None
+    if layout == "column_map":
+        # 打乱列顺序，多一列不映射的列
+        write_csv(tmp_path / "t_day.csv", [(r[4], "x", r[0], r[2], r[3], r[1], r[5]) for r in rows], "close,memo,date,high,low,open,vol")
+        column_map = {"date": DATA_FIELD.FIELD_TIME, "open": DATA_FIELD.FIELD_OPEN, "high": DATA_FIELD.FIELD_HIGH,
+                      "low": DATA_FIELD.FIELD_LOW, "close": DATA_FIELD.FIELD_CLOSE, "vol": DATA_FIELD.FIELD_VOLUME}
+    else:
+        write_csv(tmp_path / "t_day.csv", [r[:5] for r in rows], None if layout == "no_header" else "date,open,high,low,close")
+    headers_exist = layout != "no_header"
+    bulk_cls = make_api_cls(tmp_path, True, column_map, headers_exist)
+    line_cls = make_api_cls(tmp_path, False, column_map, headers_exist)
+    for begin, end in WINDOWS:
+        expect = load(line_cls, begin, end)
+        assert load(bulk_cls, begin, end) == expect, (begin, end)
+        if begin is None and end is None:
+            assert len(expect) == len(rows)
+    assert len(load(line_cls, "2020-03-01", "2020-06-01")) == 93
+
+
+def test_bulk_falls_back_on_bad_value(tmp_path):
+    rows = [r[:5] for r in make_rows(20)]
+    rows[5] = (rows[5][0], rows[5][1], rows[5][2], rows[5][3], "n/a")  # 逐行读取时str2float当成0
+    write_csv(tmp_path / "t_day.csv", rows, "date,open,high,low,close")
+    assert make_api_cls(tmp_path, True)("t", k_type=KL_TYPE.K_DAY).get_kl_bars() is None
+    assert load(make_api_cls(tmp_path, True), None, "2020-01-05") == load(make_api_cls(tmp_path, False), None, "2020-01-05")
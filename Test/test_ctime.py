@@ -0,0 +1,41 @@
+import copy
+import pickle
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from Common.CTime import CTime
+from KLine.KLine_Store import decode_times, encode_time
+
+
+@pytest.mark.parametrize("args, auto, expected", [
+    ((2021, 6, 3, 10, 30, 15), True, datetime(2021, 6, 3, 10, 30, 15)),
+    ((2020, 1, 2, 0, 0), True, datetime(2020, 1, 2, 23, 59)),
+    ((2020, 1, 2, 0, 0), False, datetime(2020, 1, 2, 0, 0)),
+    ((1969, 12, 31, 9, 31), True, datetime(1969, 12, 31, 9, 31)),
+])
+def test_ts_is_local_posix_timestamp(args, auto, expected):
+    assert CTime(*args, auto=auto).ts == expected.timestamp()
+
+
+def test_compare_daily_after_intraday_of_same_day():
+    day, intraday = CTime(2020, 1, 2, 0, 0), CTime(2020, 1, 2, 15, 0)
+    assert day > intraday and day >= intraday and not intraday > day
+    assert CTime(2020, 1, 2, 0, 0, auto=False) < intraday
+
+
+def test_fields_are_read_only():
+    t = CTime(2020, 1, 2, 9, 31)
+    assert (t.year, t.month, t.day, t.hour, t.minute, t.second) == (2020, 1, 2, 9, 31, 0)
+    with pytest.raises(AttributeError):
+        t.year = 2021
+    assert copy.deepcopy(t) is t
+
+
+def test_bulk_decode_and_pickle_round_trip():
+    times = [CTime(2015, 1, 5, 9, 31), CTime(2015, 1, 5, 0, 0), CTime(2024, 2, 29, 15, 0, auto=False)]
+    decoded = decode_times(np.array([encode_time(t) for t in times], dtype=np.int64))
+    for other in (decoded, pickle.loads(pickle.dumps(times))):
+        for lhs, rhs in zip(times, other, strict=True):
+            assert (str(lhs), lhs.epoch, lhs.key, lhs.auto, lhs.ts) == (str(rhs), rhs.epoch, rhs.key, rhs.auto, rhs.ts)
@@ -0,0 +1,79 @@
+import copy
+import random
+
+import pytest
+
+from Common.CEnum import DATA_FIELD, KL_TYPE
+from KLine.KLine_Unit import CKLine_Unit
+from Test.helper import dump_chan, make_chan, mock_klus
+
+CONFS = {
+    "default": {},
+    "metrics": {"cal_rsi": True, "cal_kdj": True, "mean_metrics": [5, 20], "trend_metrics": [10], "boll_n": 20},
+    "area": {"macd_algo": "area", "bsp2_follow_1": False, "bsp3_follow_1": False, "min_zs_cnt": 0},
+}
+
+
+def variant(klu, rnd) -> CKLine_Unit:
+    # 同一时间、价格不同的未完成K线
+    close = round(klu.close * (1 + rnd.gauss(0, 0.01)), 2)
+    return CKLine_Unit({
+        DATA_FIELD.FIELD_TIME: klu.time,
+        DATA_FIELD.FIELD_OPEN: klu.open,
+        DATA_FIELD.FIELD_HIGH: max(klu.open, close),
+        DATA_FIELD.FIELD_LOW: min(klu.open, close),
+        DATA_FIELD.FIELD_CLOSE: close,
+        DATA_FIELD.FIELD_VOLUME: klu.trade_info.metric[DATA_FIELD.FIELD_VOLUME],
+    })
+
+
+def feed(chan, lv, klu, rnd):
+    # 随机先推几根未完成K线，最后update成最终值
+    forming = [variant(klu, rnd) for _ in range(rnd.randint(0, 2))]
+    for idx, cur in enumerate(forming + [klu]):
+        if idx == 0:
+            chan.append_klu(lv, cur)
+        else:
+            chan.update_last_klu(lv, cur)
+
+
+def klu_cnt(chan, lv_idx=0):
+    return sum(len(klc) for klc in chan[lv_idx])
+
+
+@pytest.mark.parametrize("conf_name", list(CONFS))
+def test_append_and_update_match_trigger_load(conf_name):
+    conf = CONFS[conf_name]
+    chan = make_chan(300, conf)
+    origin = copy.deepcopy(chan)
+    lv, base = chan.lv_list[0], klu_cnt(chan)
+    klus, ref_klus = mock_klus(700), mock_klus(700)
+    rnd = random.Random(conf_name)
+    for i in range(base, len(klus)):
+        feed(chan, lv, klus[i], rnd)
+        if (i - base) % 150 == 149 or i == len(klus) - 1:
+            ref = copy.deepcopy(origin)
+            ref.trigger_load({lv: ref_klus[base:i + 1]})
+            assert dump_chan(chan) == dump_chan(ref), i
+
+
+def test_update_parent_keeps_sub_klus_attached():
+    lv_list = [KL_TYPE.K_60M, KL_TYPE.K_30M]
+    chan = make_chan(400, CONFS["metrics"], lv_list=lv_list)
+    origin = copy.deepcopy(chan)
+    base_p, base_s = klu_cnt(chan, 0), klu_cnt(chan, 1)
+    parents, subs = mock_klus(600, KL_TYPE.K_60M), mock_klus(1200, KL_TYPE.K_30M)
+    rnd = random.Random(0)
+    n_parent = min(len(parents), len(subs) // 2) - base_p
+    for p in range(base_p, base_p + n_parent):
+        s = base_s + 2 * (p - base_p)
+        chan.append_klu(lv_list[0], variant(parents[p], rnd))
+        feed(chan, lv_list[1], subs[s], rnd)
+        chan.update_last_klu(lv_list[0], parents[p])
+        feed(chan, lv_list[1], subs[s + 1], rnd)
+    ref = copy.deepcopy(origin)
+    ref.trigger_load({
+        lv_list[0]: mock_klus(600, KL_TYPE.K_60M)[base_p:base_p + n_parent],
+        lv_list[1]: mock_klus(1200, KL_TYPE.K_30M)[base_s:base_s + 2 * n_parent],
+    })
+    assert dump_chan(chan) == dump_chan(ref)
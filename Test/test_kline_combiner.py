@@ -0,0 +1,78 @@
+import random
+
+from Combiner.KLine_Combiner import CKLine_Combiner
+from Common.CEnum import DATA_FIELD, KLINE_DIR
+from Common.CTime import CTime
+from KLine.KLine import CKLine
+from KLine.KLine_Unit import CKLine_Unit
+from Seg.Eigen import CEigen
+from Test.helper import make_chan
+
+
+def scan_peak(klc, is_high):
+    # 原来的实现：从后往前找第一个high(low)等于合并K线high(low)的元素
+    for item in klc.lst[::-1]:
+        high, low = klc.item_range(item)
+        if (high if is_high else low) == (klc.high if is_high else klc.low):
+            return item
+    raise AssertionError("can't find peak")
+
+
+def check_peak(klc):
+    assert klc.get_high_peak_klu() is scan_peak(klc, True) is klc.get_peak_klu(True)
+    assert klc.get_low_peak_klu() is scan_peak(klc, False) is klc.get_peak_klu(False)
+
+
+def make_klu(idx, high, low):
+    return CKLine_Unit({
+        DATA_FIELD.FIELD_TIME: CTime(2020 + idx // 300, idx // 25 % 12 + 1, idx % 25 + 1, 0, 0),
+        DATA_FIELD.FIELD_OPEN: low,
+        DATA_FIELD.FIELD_HIGH: high,
+        DATA_FIELD.FIELD_LOW: low,
+        DATA_FIELD.FIELD_CLOSE: high,
+    })
+
+
+def test_klc_peak_matches_backward_scan():
+    # 价格只取少数几个值，大量相等的高低点；两成是一字K线
+    rnd = random.Random(0)
+    klcs, merged = [], {KLINE_DIR.UP: 0, KLINE_DIR.DOWN: 0, "equal": 0, "one_price": 0}
+    for idx in range(3000):
+        if rnd.random() < 0.2:
+            high = low = rnd.randint(0, 8)
+        else:
+            low = rnd.randint(0, 7)
+            high = rnd.randint(low + 1, 8)
+        klu = make_klu(idx, high, low)
+        if not klcs:
+            klcs.append(CKLine(klu, idx=0))
+            continue
+        klc = klcs[-1]
+        old_high, old_low = klc.high, klc.low
+        _dir = klc.try_add(klu)
+        if _dir == KLINE_DIR.COMBINE:
+            merged[klc.dir] += 1
+            merged["equal"] += high == old_high or low == old_low
+            merged["one_price"] += high == low
+        else:
+            klcs.append(CKLine(klu, idx=len(klcs), _dir=_dir))
+        check_peak(klcs[-1])
+    for klc in klcs:
+        check_peak(klc)
+    assert all(cnt > 20 for cnt in merged.values()), merged
+
+
+def test_peak_on_real_klines_and_eigens(monkeypatch):
+    # 实际计算中每次合并后都和倒序查找比较，包括特征序列的exclude_included/allow_top_equal合并
+    checked = {CKLine: 0, CEigen: 0}
+    orig_try_add = CKLine_Combiner.try_add
+
+    def try_add(self, unit_kl, *args, **kwargs):
+        _dir = orig_try_add(self, unit_kl, *args, **kwargs)
+        if _dir == KLINE_DIR.COMBINE:
+            check_peak(self)
+            checked[type(self)] += 1
+        return _dir
+    monkeypatch.setattr(CKLine_Combiner, "try_add", try_add)
+    make_chan(3000, {"seg_algo": "chan"})
+    assert all(cnt > 0 for cnt in checked.values()), checked
@@ -0,0 +1,57 @@
+import copy
+
+from Chan import CChan
+from Common.CEnum import DATA_FIELD
+from KLine.KLine_Store import CKLine_Unit_View
+from Test.helper import dump_chan, make_chan, mock_klus
+
+METRIC_CONF = {"cal_rsi": True, "cal_kdj": True, "mean_metrics": [5, 20], "trend_metrics": [10]}
+
+
+def klu_list(chan, lv_idx=0):
+    return [klu for klc in chan[lv_idx] for klu in klc]
+
+
+def test_columnar_matches_object_model():
+    columnar = make_chan(1500, dict(METRIC_CONF, columnar_kl=True))
+    assert isinstance(klu_list(columnar)[0], CKLine_Unit_View)
+    assert dump_chan(columnar) == dump_chan(make_chan(1500, METRIC_CONF))
+
+
+def test_view_time_is_cached_per_row():
+    chan = make_chan(300, {"columnar_kl": True})
+    for klu, src in zip(klu_list(chan), mock_klus(300)):
+        assert klu.time is klu.time
+        assert (klu.time.ts, str(klu.time)) == (src.time.ts, str(src.time))
+
+
+def test_trade_info_keeps_int_values():
+    chan = make_chan(300, {"columnar_kl": True})
+    for klu, src in zip(klu_list(chan), mock_klus(300)):
+        for name in (DATA_FIELD.FIELD_VOLUME, DATA_FIELD.FIELD_TURNOVER):
+            value, expected = klu.trade_info.metric[name], src.trade_info.metric[name]
+            assert (type(value), value) == (type(expected), expected)
+
+
+def test_copy_and_pickle_rebuild_times(tmp_path):
+    chan = make_chan(500, {"columnar_kl": True})
+    expected = dump_chan(chan)
+    chan.chan_dump_pickle(tmp_path / "chan.pkl")
+    for other in (copy.deepcopy(chan), CChan.chan_load_pickle(tmp_path / "chan.pkl")):
+        assert dump_chan(other) == expected
+        klu = klu_list(other)[-1]
+        assert klu.time is klu.time
+        assert type(klu.trade_info.metric[DATA_FIELD.FIELD_VOLUME]) is int
+
+
+def test_restore_drops_cached_time_of_discarded_rows():
+    klus = mock_klus(400)
+    chan = make_chan(300, {"columnar_kl": True})
+    base = len(klu_list(chan))
+    cp = chan.checkpoint()
+    for klu in mock_klus(400)[base + 5:base + 25]:  # 时间和之后追加的不同
+        chan.append_klu(chan.lv_list[0], klu)
+    chan.restore(cp)
+    for klu in klus[base:]:
+        chan.append_klu(chan.lv_list[0], klu)
+    assert [str(klu.time) for klu in klu_list(chan)] == [str(klu.time) for klu in klus]
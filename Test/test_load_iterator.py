@@ -0,0 +1,157 @@
+import pytest
+
+from Chan import CChan
+from Common.CEnum import KL_TYPE
+from Common.ChanException import CChanException, ErrCode
+from DataAPI.AsyncStockAPI import replay_stock_api
+from DataAPI.MockAPI import CMockAPI
+from Test.helper import make_conf
+
+LV_LIST = [KL_TYPE.K_DAY, KL_TYPE.K_60M, KL_TYPE.K_30M, KL_TYPE.K_15M]
+END_DATE = "2015-02-15"
+MISALIGN_DAYS = ["2015/01/06", "2015/01/13", "2015/01/20"]  # 这几天30M少了11:00/11:30，60M的11:30找不到次级别
+INCONSISTENT_DAYS = ["2015/01/07", "2015/01/09", "2015/01/14", "2015/01/16", "2015/01/21"]  # 没有日线，60M挂到下一天
+
+
+def load_bars(misalign=0, inconsistent=0, lv_list=LV_LIST):
+    # 每次重新生成，两次加载不共用klu对象
+    data = {lv: list(CMockAPI("sz.000001", k_type=lv, begin_date="2015-01-01", end_date=END_DATE).get_kl_data()) for lv in lv_list}
+    if misalign:
+        bad = tuple(f"{day} {t}" for day in MISALIGN_DAYS[:misalign] for t in ("11:00", "11:30"))
+        data[KL_TYPE.K_30M] = [klu for klu in data[KL_TYPE.K_30M] if str(klu.time) not in bad]
+    if inconsistent:
+        data[KL_TYPE.K_DAY] = [klu for klu in data[KL_TYPE.K_DAY] if str(klu.time) not in INCONSISTENT_DAYS[:inconsistent]]
+    return data
+
+
+def recursive_load_iterator(self, lv_idx, parent_klu, step):
+    # 改成显式栈之前的逐级递归实现
+    cur_lv = self.lv_list[lv_idx]
+    pre_klu = self.get_last_klu(lv_idx)
+    while True:
+        if self.klu_cache[lv_idx]:
+            kline_unit = self.klu_cache[lv_idx]
+            self.klu_cache[lv_idx] = None
+        else:
+            try:
+                kline_unit = self.get_next_lv_klu(lv_idx)
+                self.try_set_klu_idx(lv_idx, kline_unit)
+                if not kline_unit.time > self.klu_last_t[lv_idx]:
+                    raise CChanException(f"kline time err, cur={kline_unit.time}, last={self.klu_last_t[lv_idx]}", ErrCode.KL_NOT_MONOTONOUS)
+                self.klu_last_t[lv_idx] = kline_unit.time
+            except StopIteration:
+                break
+        if parent_klu and kline_unit.time > parent_klu.time:
+            self.klu_cache[lv_idx] = kline_unit
+            break
+        kline_unit.set_pre_klu(pre_klu)
+        kline_unit = self.add_new_kl(cur_lv, kline_unit)
+        pre_klu = kline_unit
+        if parent_klu:
+            self.set_klu_parent_relation(parent_klu, kline_unit, cur_lv, lv_idx)
+        if lv_idx != len(self.lv_list)-1:
+            for _ in recursive_load_iterator(self, lv_idx+1, kline_unit, step):
+                ...
+            self.check_kl_align(kline_unit, lv_idx)
+        if lv_idx == 0 and step:
+            yield self
+
+
+def links(chan):
+    # 每个级别每根K线的(时间, idx, 前一根, 父K线, 子K线)
+    return [
+        [(str(klu.time), klu.idx, str(klu.pre.time) if klu.pre else None, str(klu.sup_kl.time) if klu.sup_kl else None, [str(sub.time) for sub in klu.sub_kl_list])
+         for klc in chan[lv] for klu in klc]
+        for lv in chan.lv_list
+    ]
+
+
+def run(data, conf):
+    # 逐步加载，记录每一步各级别K线数、最终的父子关系和检查状态，出错时记录错误
+    chan = CChan("sz.000001", "2015-01-01", END_DATE, replay_stock_api(data), list(data), make_conf({"trigger_step": True, **conf}))
+    steps, error = [], None
+    try:
+        for _ in chan.step_load():
+            steps.append(tuple(sum(len(klc) for klc in chan[lv]) for lv in chan.lv_list))
+    except CChanException as e:
+        error = (e.errcode, e.msg)
+    return {
+        "steps": steps,
+        "error": error,
+        "links": links(chan),
+        "misalign": chan.kl_misalign_cnt,
+        "inconsistent": {key: [str(t) for t in lst] for key, lst in chan.kl_inconsistent_detail.items()},
+    }
+
+
+def expected_links(data):
+    # 次级别K线挂在第一根时间不早于它的父级别K线下，最高级别取完之后剩下的次级别K线不加载
+    lv_list = list(data)
+    res, loaded = [], None
+    for lv_idx, lv in enumerate(lv_list):
+        klus = data[lv]
+        parent_of = [None] * len(klus)
+        if lv_idx > 0:
+            parents = loaded
+            p = 0
+            keep = []
+            for i, klu in enumerate(klus):
+                while p < len(parents) and parents[p].time < klu.time:
+                    p += 1
+                if p == len(parents):
+                    break
+                parent_of[i] = parents[p]
+                keep.append(i)
+            klus = [klus[i] for i in keep]
+            parent_of = [parent_of[i] for i in keep]
+        children = {}
+        for klu, parent in zip(klus, parent_of):
+            if parent is not None:
+                children.setdefault(id(parent), []).append(str(klu.time))
+        res.append((klus, parent_of, children))
+        loaded = klus
+    out = []
+    for lv_idx, (klus, parent_of, _) in enumerate(res):
+        sub_children = res[lv_idx+1][2] if lv_idx+1 < len(res) else {}
+        out.append([
+            (str(klu.time), idx, str(klus[idx-1].time) if idx else None, str(parent.time) if parent is not None else None, sub_children.get(id(klu), []))
+            for idx, (klu, parent) in enumerate(zip(klus, parent_of))
+        ])
+    return out
+
+
+CASES = {
+    "aligned": ({}, {}, None),
+    "misalign_under_limit": ({"misalign": 3}, {"max_kl_misalgin_cnt": 4}, None),
+    "misalign_over_limit": ({"misalign": 3}, {}, ErrCode.KL_DATA_NOT_ALIGN),
+    "inconsistent_under_limit": ({"inconsistent": 4}, {}, None),
+    "inconsistent_over_limit": ({"inconsistent": 5}, {}, ErrCode.KL_TIME_INCONSISTENT),
+    "no_check": ({"misalign": 3, "inconsistent": 5}, {"kl_data_check": False}, None),
+}
+
+
+@pytest.mark.parametrize("case", list(CASES))
+@pytest.mark.parametrize("lv_cnt", [3, 4])
+def test_explicit_stack_matches_recursive_load(case, lv_cnt, monkeypatch):
+    bad, conf, errcode = CASES[case]
+    lv_list = LV_LIST[:lv_cnt]
+    res = run(load_bars(**bad, lv_list=lv_list), conf)
+    monkeypatch.setattr(CChan, "load_iterator", recursive_load_iterator)
+    assert res == run(load_bars(**bad, lv_list=lv_list), conf)
+
+    assert (res["error"][0] if res["error"] else None) == errcode
+    if errcode is None:
+        data = load_bars(**bad, lv_list=lv_list)
+        assert res["links"] == expected_links(data)
+        assert len(res["steps"]) == len(data[KL_TYPE.K_DAY])  # 每根最高级别K线连同次级别加载完yield一次
+        assert res["steps"][-1] == tuple(len(lv_links) for lv_links in res["links"])
+    check = conf.get("kl_data_check", True)
+    if case.startswith("misalign"):
+        assert res["misalign"] == (3 if errcode is None else 2)  # 超限时在第2次抛出
+    else:
+        assert res["misalign"] == 0
+    if case.startswith("inconsistent") and check:
+        assert len(res["inconsistent"]) == (4 if errcode is None else 5)
+        assert all(lst and all(not t.startswith(day) for t in lst) for day, lst in res["inconsistent"].items())
+    else:
+        assert res["inconsistent"] == {}
@@ -0,0 +1,36 @@
+import pytest
+
+from Math.MACD import CMACD
+from Math.MetricBatch import cal_metric_batch, support_batch
+from Math.RSI import RSI
+from Test.helper import dump_chan, make_chan, make_conf, metric_values, mock_klus
+
+METRIC_CONF = {"cal_rsi": True, "cal_kdj": True, "mean_metrics": [5, 20], "trend_metrics": [10], "boll_n": 20}
+
+
+def test_batch_load_is_bit_identical():
+    batch = make_chan(1500, dict(METRIC_CONF, batch_metric=True))
+    assert batch[0].batch_metric_model_lst
+    assert dump_chan(batch) == dump_chan(make_chan(1500, METRIC_CONF))
+
+
+def test_recurrent_models_are_not_batched():
+    assert not support_batch(CMACD())
+    assert not support_batch(RSI())
+
+
+@pytest.mark.parametrize("split", [0, 1, 7, 300])
+def test_batch_then_add_matches_incremental(split):
+    # 先批量算一段，再逐根add，模型状态要和一直逐根add一致
+    klus = mock_klus(600)
+    batch_models = [m for m in make_conf(METRIC_CONF).GetMetricModel() if support_batch(m)]
+    step_models = [m for m in make_conf(METRIC_CONF).GetMetricModel() if support_batch(m)]
+
+    def add(model, klu):
+        return model.add(klu.high, klu.low, klu.close) if type(model).__name__ == "KDJ" else model.add(klu.close)
+
+    for batch_model, step_model in zip(batch_models, step_models):
+        expected = [metric_values(add(step_model, klu)) for klu in klus]
+        got = cal_metric_batch(batch_model, klus[:split]) if split else []
+        got += [add(batch_model, klu) for klu in klus[split:]]
+        assert [metric_values(v) for v in got] == expected
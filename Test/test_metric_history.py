@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from Math.Demark import CDemarkEngine
+from Math.MACD import CMACD
+from Test.helper import dump_chan, make_chan, mock_klus
+from Test.test_incremental import feed, klu_cnt
+
+CONF = {"cal_demark": True, "cal_rsi": True, "cal_kdj": True, "mean_metrics": [5, 20], "trigger_step": True}
+
+
+def find_model(chan, cls):
+    kl_list = chan[0]
+    return next(model for model in kl_list.metric_model_lst + kl_list.batch_metric_model_lst if isinstance(model, cls))
+
+
+def history_len(chan):
+    return len(find_model(chan, CMACD).macd_info), len(find_model(chan, CDemarkEngine).kl_lst)
+
+
+def dump_demark(chan):
+    return [[(item["type"], item["dir"], item["idx"]) for item in klu.demark.data] for klc in chan[0] for klu in klc]
+
+
+def dump_bsp(chan):
+    return [(bsp.type2str(), bsp.is_buy, bsp.klu.idx) for bsp in chan.get_latest_bsp(number=0)]
+
+
+def run(conf, rnd):
+    # 按步加载，再逐根推送(中间update_last_klu换掉最后一根)，隔一段推测几根再restore
+    # 每步记录历史长度和买卖点，每隔一段记录一次全部K线的结果
+    chan = make_chan(500, conf)
+    lv = chan.lv_list[0]
+    states, lens = [], []
+
+    def record():
+        cnt = klu_cnt(chan)
+        full = (dump_chan(chan), dump_demark(chan)) if cnt % 25 == 0 else None
+        states.append((full, dump_bsp(chan)))
+        lens.append((cnt, *history_len(chan)))
+    for _ in chan.step_load():
+        record()
+    klus, other_klus = mock_klus(900), mock_klus(900, code="sz.000002")
+    for i in range(klu_cnt(chan), len(klus)):
+        if i % 50 == 0:
+            cp = chan.checkpoint()
+            for klu in other_klus[i:i+10]:
+                feed(chan, lv, klu, rnd)
+            chan.restore(cp)
+        feed(chan, lv, klus[i], rnd)
+        record()
+    states.append(((dump_chan(chan), dump_demark(chan)), dump_bsp(chan)))
+    return states, lens
+
+
+@pytest.mark.parametrize("batch_metric", [False, True])
+def test_drop_history_keeps_results_and_bounds_state(batch_metric):
+    conf = {**CONF, "batch_metric": batch_metric}
+    ref_states, ref_lens = run(conf, random.Random(1))
+    states, lens = run({**conf, "keep_metric_history": False}, random.Random(1))
+    assert len(states) == len(ref_states)
+    for step, (state, ref_state) in enumerate(zip(states, ref_states)):
+        assert state == ref_state, step  # klu.macd/demark/买卖点逐步一致
+    assert any(bsp_lst for _, bsp_lst in states)
+    assert any(demark for demark in states[-1][0][1])
+
+    assert all(macd_len == 1 and kl_len <= CDemarkEngine.SETUP_BIAS+2 for _, macd_len, kl_len in lens)
+    assert all(macd_len == kl_len == cnt for cnt, macd_len, kl_len in ref_lens)  # 默认保留全部历史
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+import DataAPI.Prefetch
+from Chan import CChan
+from Common.CEnum import KL_TYPE
+from Common.ChanException import CChanException, ErrCode
+from DataAPI.AsyncStockAPI import replay_stock_api
+from DataAPI.Prefetch import CPrefetchIter
+from Test.helper import BEGIN_DATE, dump_chan, end_date_for, make_chan, make_conf, mock_klus
+
+LV_LIST = [KL_TYPE.K_DAY, KL_TYPE.K_60M, KL_TYPE.K_30M]
+
+
+@pytest.fixture
+def prefetch_iters(monkeypatch):
+    # 记录创建过的CPrefetchIter，确认确实走了并行拉取
+    created = []
+
+    class CRecordPrefetchIter(CPrefetchIter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+    monkeypatch.setattr(DataAPI.Prefetch, "CPrefetchIter", CRecordPrefetchIter)
+    return created
+
+
+def test_parallel_load_builds_identical_chan(prefetch_iters):
+    serial = make_chan(1200, lv_list=LV_LIST)
+    assert not prefetch_iters
+    parallel = make_chan(1200, {"parallel_load": True}, lv_list=LV_LIST)
+    assert len(prefetch_iters) == len(LV_LIST)
+    assert dump_chan(parallel) == dump_chan(serial)
+    for prefetch_iter in prefetch_iters:
+        prefetch_iter.thread.join(timeout=5)
+        assert not prefetch_iter.thread.is_alive()
+
+
+def replay_chan(sub_error, conf):
+    data = {KL_TYPE.K_DAY: mock_klus(300, KL_TYPE.K_DAY), KL_TYPE.K_30M: sub_error}
+    return CChan("sz.000001", str(BEGIN_DATE), end_date_for(300, KL_TYPE.K_DAY), replay_stock_api(data), [KL_TYPE.K_DAY, KL_TYPE.K_30M], make_conf(conf))
+
+
+@pytest.mark.parametrize("parallel_load", [False, True])
+def test_failing_sub_level_honors_auto_skip(parallel_load, prefetch_iters):
+    not_found = CChanException("no 30m data", ErrCode.SRC_DATA_NOT_FOUND)
+    conf = {"parallel_load": parallel_load}
+    chan = replay_chan(not_found, {**conf, "auto_skip_illegal_sub_lv": True})
+    assert chan.lv_list == [KL_TYPE.K_DAY] and list(chan.kl_datas) == [KL_TYPE.K_DAY]
+    assert dump_chan(chan) == dump_chan(make_chan(300, lv_list=[KL_TYPE.K_DAY]))
+
+    with pytest.raises(CChanException) as exc_info:
+        replay_chan(not_found, conf)
+    assert exc_info.value.errcode == ErrCode.SRC_DATA_NOT_FOUND
+    with pytest.raises(CChanException) as exc_info:  # 其他错误不跳过
+        replay_chan(CChanException("timeout", ErrCode.COMMON_ERROR), {**conf, "auto_skip_illegal_sub_lv": True})
+    assert exc_info.value.errcode == ErrCode.COMMON_ERROR
+
+    assert len(prefetch_iters) == (6 if parallel_load else 0)
+    for prefetch_iter in prefetch_iters:  # 出错时其他级别的拉取线程也要停下
+        prefetch_iter.thread.join(timeout=5)
+        assert not prefetch_iter.thread.is_alive()
+
+
+def test_stop_is_checked_per_item():
+    # 慢数据源：一块远没有凑满时stop，后台线程也要在下一根之后退出
+    produced = []
+    stopped = threading.Event()
+
+    def slow_source():
+        while True:
+            time.sleep(0.01)
+            produced.append(stopped.is_set())
+            yield len(produced)
+    prefetch_iter = CPrefetchIter(slow_source, chunk_size=10**6)
+    prefetch_iter.wait_ready()
+    time.sleep(0.1)
+    stopped.set()
+    prefetch_iter.stop()
+    prefetch_iter.thread.join(timeout=2)
+    assert not prefetch_iter.thread.is_alive()
+    assert 0 < produced.count(False) and produced.count(True) <= 1
+
+
+def test_items_and_errors_keep_order():
+    def source():
+        yield from range(10)
+        raise ValueError("broken")
+    prefetch_iter = CPrefetchIter(source, chunk_size=3)
+    prefetch_iter.wait_ready()
+    got = []
+    with pytest.raises(ValueError, match="broken"):
+        for item in prefetch_iter:
+            got.append(item)
+    assert got == list(range(10))  # 没凑满一块的部分也要在异常之前读到
+
+    def bad_init():
+        raise CChanException("no data", ErrCode.SRC_DATA_NOT_FOUND)
+    with pytest.raises(CChanException):
+        CPrefetchIter(bad_init).wait_ready()
@@ -0,0 +1,185 @@
+import random
+
+import pytest
+
+import Bi.BiList
+import Seg.SegListComm
+from Bi.BiList import CKLineIndex
+from Common.CEnum import KL_TYPE
+from Common.RangeIndex import CChainIndex, CRangeExtremum
+from Seg.SegListComm import CLineIndex, CSegListComm, FindPeakBi
+from Test.helper import make_chan, mock_klus
+from Test.test_incremental import feed, klu_cnt
+
+LV = KL_TYPE.K_30M
+
+
+def random_ranges(rnd, size, cnt=40):
+    if size == 0:
+        return []
+    ranges = [(0, size-1), (size-1, size-1)]
+    for _ in range(cnt):
+        lo = rnd.randrange(size)
+        ranges.append((lo, rnd.randrange(lo, size)))
+    return ranges
+
+
+def test_range_extremum_matches_scan():
+    rnd = random.Random(0)
+    index, vals = CRangeExtremum(), []
+    for step in range(3000):
+        if vals and rnd.random() < 0.05:
+            # 截断到任意位置，包括块边界上下
+            size = rnd.choice([rnd.randrange(len(vals)), len(vals) // 64 * 64, max(0, len(vals) // 64 * 64 - 1)])
+            index.truncate(size)
+            del vals[size:]
+        else:
+            value = (rnd.randint(0, 50), step)
+            index.append(value)
+            vals.append(value)
+        assert len(index) == len(vals)
+        for lo, hi in random_ranges(rnd, len(vals), 5):
+            assert index.max(lo, hi) == max(vals[lo:hi+1])
+            assert index.min(lo, hi) == min(vals[lo:hi+1])
+
+
+class CNode:
+    def __init__(self, idx, pre, value):
+        self.idx = idx
+        self.pre = pre
+        self.value = value
+
+
+class CNodeIndex(CChainIndex[CNode]):
+    def signature(self, node):
+        return node.value
+
+    def values(self, node):
+        return (node.value,)
+
+
+def test_chain_index_follows_tail_changes():
+    rnd = random.Random(1)
+    index, nodes = CNodeIndex(), []
+    for _ in range(2000):
+        op = rnd.random()
+        if nodes and op < 0.1:
+            nodes[-1].value = rnd.random()  # 最后一个原地修改
+        elif nodes and op < 0.2:
+            # 尾部若干个换成新对象，值可能不变
+            cut = max(0, len(nodes) - rnd.randint(1, 80))
+            del nodes[cut:]
+            for _ in range(rnd.randint(0, 80)):
+                nodes.append(CNode(len(nodes), nodes[-1] if nodes else None, rnd.choice([0.5, rnd.random()])))
+        else:
+            nodes.append(CNode(len(nodes), nodes[-1] if nodes else None, rnd.random()))
+        if not nodes:
+            continue
+        assert index.sync(nodes[-1])
+        assert len(index) >= len(nodes)  # 后面多出来的是旧的，下次同步时截掉
+        for lo, hi in random_ranges(rnd, len(nodes), 5):
+            assert index.max(0, lo, hi) == max(node.value for node in nodes[lo:hi+1])
+            assert index.min(0, lo, hi) == min(node.value for node in nodes[lo:hi+1])
+    assert not index.sync(CNode(len(nodes)+1, nodes[-1], 0.0))  # idx不连续时不能索引
+    assert len(index) == 0
+
+
+def check_indexes(chan, klc_index, line_indexes, rnd):
+    # 测试自己持有的索引，每步只从尾部同步，和当前的合并K线/笔/线段逐个扫描比较
+    kl_list = chan[0]
+    klcs = kl_list.lst[:-1]  # 最后一根合并K线还没有连上pre，end_is_peak也只同步到cur_end.pre
+    if klcs:
+        assert klc_index.sync(klcs[-1])
+        for lo, hi in random_ranges(rnd, len(klcs), 3):
+            assert klc_index.max(0, lo, hi) == max(klc.high for klc in klcs[lo:hi+1])
+            assert klc_index.min(1, lo, hi) == min(klc.low for klc in klcs[lo:hi+1])
+    for line_index, lines in zip(line_indexes, (kl_list.bi_list, kl_list.seg_list)):
+        if len(lines) == 0:
+            continue
+        assert line_index.sync(lines[-1])
+        for lo, hi in random_ranges(rnd, len(lines), 3):
+            assert line_index.max(CLineIndex.HIGH, lo, hi) == max(line._high() for line in lines[lo:hi+1])
+            assert line_index.min(CLineIndex.LOW, lo, hi) == min(line._low() for line in lines[lo:hi+1])
+            for is_high, col in ((True, CLineIndex.PEAK_HIGH), (False, CLineIndex.PEAK_LOW)):
+                peak_val, peak_idx = line_index.max(col, lo, hi)
+                peak = FindPeakBi(lines[lo:hi+1], is_high)
+                assert (peak_idx if peak_val != float("-inf") else None) == (peak.idx if peak else None)
+
+
+def line_state(chan):
+    kl_list = chan[0]
+    return tuple(
+        tuple((line.idx, line.dir, line.get_begin_val(), line.get_end_val(), line.is_sure) for line in lines)
+        for lines in (kl_list.bi_list, kl_list.seg_list, kl_list.segseg_list)
+    )
+
+
+def run(seg_algo, rnd):
+    # 按步加载，再逐根推送(中间update_last_klu换掉最后一根)，隔一段推测几根再restore
+    chan = make_chan(500, {"trigger_step": True, "seg_algo": seg_algo}, lv_list=[LV])
+    klc_index, line_indexes = CKLineIndex(), (CLineIndex(), CLineIndex())
+    states = []
+    for _ in chan.step_load():
+        check_indexes(chan, klc_index, line_indexes, rnd)
+        states.append(line_state(chan))
+    klus, other_klus = mock_klus(1100), mock_klus(1100, code="sz.000002")
+    for i in range(klu_cnt(chan), len(klus)):
+        if i % 40 == 0:
+            cp = chan.checkpoint()
+            for klu in other_klus[i:i+15]:
+                feed(chan, LV, klu, rnd)
+            check_indexes(chan, klc_index, line_indexes, rnd)
+            chan.restore(cp)
+        feed(chan, LV, klus[i], rnd)
+        check_indexes(chan, klc_index, line_indexes, rnd)
+        states.append(line_state(chan))
+    return states
+
+
+@pytest.mark.parametrize("seg_algo", ["chan", "1+1", "break"])
+def test_index_queries_match_linear_scan(seg_algo, monkeypatch):
+    # 阈值设成0，所有查询都走索引，每次调用同时和原来的逐个扫描比较
+    monkeypatch.setattr(Bi.BiList, "END_PEAK_SCAN_LIMIT", 0)
+    monkeypatch.setattr(Seg.SegListComm, "LINE_SCAN_LIMIT", 0)
+    used = {"end_is_peak": 0, "find_peak_bi": 0, "left_bi_break": 0}
+    orig_end_is_peak = Bi.BiList.end_is_peak
+
+    def checked_end_is_peak(last_end, cur_end, klc_index=None):
+        res = orig_end_is_peak(last_end, cur_end, klc_index)
+        assert res == orig_end_is_peak(last_end, cur_end)
+        used["end_is_peak"] += klc_index is not None and len(klc_index) > 0
+        return res
+    monkeypatch.setattr(Bi.BiList, "end_is_peak", checked_end_is_peak)
+
+    def checked(name, linear):
+        orig = getattr(CSegListComm, name)
+
+        def wrapper(self, bi_lst, *args, **kwargs):
+            res = orig(self, bi_lst, *args, **kwargs)
+            assert res is linear(self, bi_lst, *args, **kwargs)
+            used[name] += len(self.line_index) > 0
+            return res
+        monkeypatch.setattr(CSegListComm, name, wrapper)
+
+    checked("find_peak_bi", lambda self, bi_lst, begin, is_high: FindPeakBi(bi_lst[begin:], is_high) if begin < len(bi_lst) else None)
+
+    def left_bi_break(self, bi_lst):
+        if len(self) == 0:
+            return False
+        last_seg_end_bi = self[-1].end_bi
+        for bi in bi_lst[last_seg_end_bi.idx+1:]:
+            if last_seg_end_bi.is_up() and bi._high() > last_seg_end_bi._high():
+                return True
+            elif last_seg_end_bi.is_down() and bi._low() < last_seg_end_bi._low():
+                return True
+        return False
+    checked("left_bi_break", left_bi_break)
+
+    states = run(seg_algo, random.Random(seg_algo))
+    assert used["end_is_peak"] and used["find_peak_bi"], used
+    assert bool(used["left_bi_break"]) == (seg_algo == "1+1"), used  # 只有1+1用到
+
+    # 阈值调大全部逐个扫描，每一步的笔和线段都要一样
+    monkeypatch.setattr(Bi.BiList, "END_PEAK_SCAN_LIMIT", 10**9)
+    monkeypatch.setattr(Seg.SegListComm, "LINE_SCAN_LIMIT", 10**9)
+    assert run(seg_algo, random.Random(seg_algo)) == states
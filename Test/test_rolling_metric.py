@@ -0,0 +1,43 @@
+import math
+
+import pytest
+
+from Common.CEnum import TREND_TYPE
+from Math.BOLL import BollModel
+from Math.TrendModel import CTrendModel
+from Test.helper import mock_klus
+
+CLOSES = [klu.close for klu in mock_klus(20000)]
+
+
+def naive_window(values, i, N):
+    arr = values[max(0, i - N + 1):i + 1]
+    ma = sum(arr) / len(arr)
+    return arr, ma, math.sqrt(sum((x - ma) ** 2 for x in arr) / len(arr))
+
+
+@pytest.mark.parametrize("N", [2, 5, 20, 250])
+def test_boll_within_documented_tolerance(N):
+    model = BollModel(N)
+    for i, value in enumerate(CLOSES):
+        _, ma, theta = naive_window(CLOSES, i, N)
+        res = model.add(value)
+        assert res.MID == pytest.approx(ma, rel=N * 2.3e-16, abs=0)
+        assert abs(res.theta - max(theta, 1e-7)) <= 1e-12 * ma
+
+
+@pytest.mark.parametrize("N", [1, 5, 20, 250])
+def test_trend_model_against_naive_window(N):
+    models = {t: CTrendModel(t, N) for t in (TREND_TYPE.MEAN, TREND_TYPE.MAX, TREND_TYPE.MIN)}
+    for i, value in enumerate(CLOSES):
+        arr, ma, _ = naive_window(CLOSES, i, N)
+        assert models[TREND_TYPE.MAX].add(value) == max(arr)
+        assert models[TREND_TYPE.MIN].add(value) == min(arr)
+        assert models[TREND_TYPE.MEAN].add(value) == pytest.approx(ma, rel=N * 2.3e-16, abs=0)
+
+
+def test_flat_window_keeps_zero_theta_floor():
+    model = BollModel(5)
+    for _ in range(12):
+        res = model.add(10.0)
+    assert (res.MID, res.theta, res.UP) == (10.0, 1e-7, 10.0)
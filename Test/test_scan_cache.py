@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+from Chan import CChan
+from Common.CEnum import AUTYPE, KL_TYPE
+from ScanCache import CScanCache
+from Scanner import CScanJob, collect_result
+from Test.helper import BEGIN_DATE, MOCK_SRC, dump_chan, make_conf
+
+LV_LIST = [KL_TYPE.K_DAY, KL_TYPE.K_30M]
+CODE = "sz.000009"
+
+
+def last_close(chan):
+    return chan[0][-1][-1].close
+
+
+def bi_cnt(chan):
+    return len(chan[-1].bi_list)
+
+
+def make_job(end_time, bsp_cnt=0, result_func=None) -> CScanJob:
+    return CScanJob(LV_LIST, make_conf(), str(BEGIN_DATE), end_time, MOCK_SRC, AUTYPE.QFQ, None, bsp_cnt, result_func)
+
+
+def summary(fields):
+    last_time, close, bsp_lst, extra = fields
+    return str(last_time), close, [(b.lv, b.is_buy, b.type, str(b.time), b.klu_idx, b.price) for b in bsp_lst], extra
+
+
+def fresh(job):
+    chan = CChan(CODE, job.begin_time, job.end_time, MOCK_SRC, LV_LIST, job.config)
+    return dump_chan(chan), summary(collect_result(job, chan))
+
+
+def build(cache, job):
+    state, fields = cache.build(job, CODE, lambda chan: (dump_chan(chan), summary(collect_result(job, chan))))
+    assert fields == fresh(job)
+    return state
+
+
+def snap_files(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith(".snap"))
+
+
+def test_miss_hit_extend(tmp_path):
+    cache = CScanCache(str(tmp_path), resnap_ratio=0.2)
+    assert build(cache, make_job("2015-06-01")) == "miss"
+    assert build(cache, make_job("2015-06-01")) == "hit"
+    assert build(cache, make_job("2015-06-05")) == "extend"  # 新封口的K线少，沿用旧快照
+    assert build(cache, make_job("2015-09-01")) == "extend"  # 写新快照，旧快照删掉
+    assert build(cache, make_job("2015-09-01")) == "hit"
+    assert len(snap_files(tmp_path)) == 1
+
+
+def test_result_params_are_part_of_hit_check(tmp_path):
+    cache = CScanCache(str(tmp_path))
+    assert build(cache, make_job("2015-06-01", bsp_cnt=0)) == "miss"
+    assert build(cache, make_job("2015-06-01", bsp_cnt=1)) == "extend"
+    assert build(cache, make_job("2015-06-01", bsp_cnt=1, result_func=last_close)) == "extend"
+    assert build(cache, make_job("2015-06-01", bsp_cnt=1, result_func=bi_cnt)) == "extend"
+    assert build(cache, make_job("2015-06-01", bsp_cnt=1, result_func=bi_cnt)) == "hit"
+    # lambda没法确认是同一个函数，不复用结果
+    job = make_job("2015-06-01", bsp_cnt=1, result_func=lambda chan: 1)
+    assert build(cache, job) == "extend"
+    assert build(cache, job) == "extend"
+
+
+def test_interrupted_resnap_keeps_old_entry(tmp_path):
+    cache = CScanCache(str(tmp_path), resnap_ratio=0.0)
+    build(cache, make_job("2015-06-01"))
+    before = snap_files(tmp_path)
+
+    def broken(chan):
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        cache.build(make_job("2015-09-01"), CODE, broken)
+    assert snap_files(tmp_path) == before  # 新写的快照已清理
+    assert build(cache, make_job("2015-09-01")) in ("extend", "miss")
+    assert build(cache, make_job("2015-09-01")) == "hit"
+
+
+def test_commit_failure_leaves_no_orphan(tmp_path, monkeypatch):
+    cache = CScanCache(str(tmp_path), resnap_ratio=0.0)
+    build(cache, make_job("2015-06-01"))
+    before = snap_files(tmp_path)
+
+    def broken_save(key, meta):
+        raise OSError("disk full")
+    monkeypatch.setattr(cache, "save_meta", broken_save)
+    with pytest.raises(OSError):
+        build(cache, make_job("2015-09-01"))
+    monkeypatch.undo()
+    assert snap_files(tmp_path) == before
+    assert build(cache, make_job("2015-09-01")) == "extend"
+
+
+def test_corrupt_snapshot_falls_back_to_miss(tmp_path):
+    cache = CScanCache(str(tmp_path))
+    build(cache, make_job("2015-06-01"))
+    for name in snap_files(tmp_path):
+        with open(tmp_path / name, "r+b") as f:
+            f.write(b"garbage!")
+    assert build(cache, make_job("2015-06-08")) == "miss"
+    assert build(cache, make_job("2015-06-08")) == "hit"
+    assert len(snap_files(tmp_path)) == 1
+
+
+def test_evict_keeps_total_size(tmp_path):
+    cache = CScanCache(str(tmp_path), max_entries=2)
+    for code in ("sz.000001", "sz.000002", "sz.000003"):
+        cache.build(make_job("2015-03-01"), code, lambda chan: last_close(chan))
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".meta")]) == 2
+    assert len(snap_files(tmp_path)) == 2
+
+
+def test_failed_extend_drops_entry(tmp_path, monkeypatch):
+    cache = CScanCache(str(tmp_path), resnap_ratio=1.0)
+    build(cache, make_job("2015-06-01"))
+
+    def broken_load(self, inp):
+        raise RuntimeError("bad tail")
+    monkeypatch.setattr(CChan, "trigger_load", broken_load)
+    with pytest.raises(RuntimeError):
+        cache.build(make_job("2015-06-08"), CODE, last_close)
+    assert os.listdir(tmp_path) == []
+
+
+def test_evict_removes_stale_orphan_snapshot(tmp_path):
+    cache = CScanCache(str(tmp_path))
+    build(cache, make_job("2015-03-01"))
+    key = cache.entry_key(make_job("2015-03-01"), CODE)
+    fresh_orphan, stale_orphan = tmp_path / f"{key}.fresh.snap", tmp_path / "0123.stale.snap"
+    fresh_orphan.write_bytes(b"x")
+    stale_orphan.write_bytes(b"x")
+    os.utime(stale_orphan, (0, 0))
+    cache.evict()
+    assert fresh_orphan.exists() and not stale_orphan.exists()
+    assert build(cache, make_job("2015-03-01")) == "hit"
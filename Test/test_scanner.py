@@ -0,0 +1,111 @@
+import signal
+
+import pytest
+
+import Scanner
+from Common.CEnum import KL_TYPE
+from DataAPI.MockAPI import CMockAPI
+from Scanner import CScanner
+from Test.helper import BEGIN_DATE, end_date_for, make_conf
+
+CODES = [f"sz.{idx:06d}" for idx in range(1, 9)]
+LATENCY = {"sz.000001": 0.8, "sz.000003": 0.3}
+SLOW_CODE = "sz.000099"
+
+
+class CLatencyAPI(CMockAPI):
+    # 按code固定延迟，SLOW_CODE远超超时时间
+    def __init__(self, code, *args, **kwargs):
+        super().__init__(code, *args, **kwargs)
+        self.latency = 3.0 if code == SLOW_CODE else LATENCY.get(code, 0.0)
+
+
+def make_scanner(max_workers, **kwargs):
+    return CScanner(
+        lv_list=[KL_TYPE.K_DAY],
+        config=make_conf(),
+        begin_time=str(BEGIN_DATE),
+        end_time=end_date_for(300, KL_TYPE.K_DAY),
+        data_src=CLatencyAPI,
+        max_workers=max_workers,
+        **kwargs,
+    )
+
+
+def summary(res):
+    return res.code, res.idx, str(res.last_time), res.last_close, [(bsp.type, str(bsp.time), bsp.price) for bsp in res.bsp_lst], res.error
+
+
+def scan(scanner, codes, ordered, stop_after=None):
+    progress, results = [], []
+
+    def progress_cb(done, total, res):
+        progress.append((done, total, res.idx))
+        if stop_after is not None and done == stop_after:
+            scanner.stop()
+    for res in scanner.scan(codes, ordered=ordered, progress_cb=progress_cb):
+        results.append(res)
+    return progress, results
+
+
+@pytest.mark.parametrize("max_workers", [0, 2])
+@pytest.mark.parametrize("ordered", [True, False])
+def test_streaming_and_progress(max_workers, ordered):
+    progress, results = scan(make_scanner(max_workers), CODES, ordered)
+    assert [done for done, _, _ in progress] == list(range(1, len(CODES) + 1))
+    assert all(total == len(CODES) for _, total, _ in progress)
+    assert sorted(res.idx for res in results) == list(range(len(CODES)))
+    if ordered or max_workers == 0:
+        assert [res.idx for res in results] == list(range(len(CODES)))
+    else:
+        assert [res.idx for res in results] == [idx for _, _, idx in progress]  # 按完成顺序
+        assert results[0].idx != 0 and results[-1].idx == 0  # 第一只最慢
+    expect = [summary(res) for res in scan(make_scanner(0), CODES, True)[1]]
+    assert sorted(summary(res) for res in results) == expect
+    assert all(res.ok for res in results) and any(res.bsp_lst for res in results)
+
+
+@pytest.mark.parametrize("max_workers", [0, 2])
+def test_timeout(max_workers):
+    codes = ["sz.000002", SLOW_CODE, "sz.000004"]
+    _, results = scan(make_scanner(max_workers, timeout=1), codes, True)
+    assert [res.code for res in results] == codes
+    assert [res.error for res in results] == [None, "timeout after 1s", None]
+    assert results[1].cost < 2
+
+
+def test_alarm_between_body_and_disarm(monkeypatch):
+    # 闹钟恰好在算完之后、关定时器之前到点，也要按超时返回，不能从scan_one里漏出去
+    orig_setitimer = signal.setitimer
+
+    def setitimer(which, seconds, *args):
+        if seconds == 0 and orig_setitimer(which, 0) != (0.0, 0.0):  # 模拟定时器这时正好到点
+            Scanner._on_alarm(signal.SIGALRM, None)
+        return orig_setitimer(which, seconds, *args)
+    monkeypatch.setattr(signal, "setitimer", setitimer)
+    res = Scanner.scan_one(make_scanner(0, timeout=5).job, 0, "sz.000002")
+    monkeypatch.undo()
+    assert res.error == "timeout after 5s"
+    assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+    assert signal.getsignal(signal.SIGALRM) is not Scanner._on_alarm
+
+
+def test_stop_serial():
+    scanner = make_scanner(0)
+    progress, results = scan(scanner, CODES, True, stop_after=2)
+    assert [res.idx for res in results] == [0, 1]
+    assert [idx for _, _, idx in progress] == [0, 1]
+    assert [res.idx for res in scan(scanner, CODES[:3], True)[1]] == [0, 1, 2]  # 下次scan重新开始
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_stop_process(ordered):
+    # 第一只最慢，其余算完的在ordered模式下都在缓冲区里等它；stop之后等它跑完，缓冲区的结果也要返回
+    codes = CODES * 3
+    progress, results = scan(make_scanner(2), codes, ordered, stop_after=3)
+    assert 3 <= len(results) < len(codes)
+    assert sorted(res.idx for res in results) == sorted(idx for _, _, idx in progress)  # 完成的都返回了
+    if ordered:
+        assert [res.idx for res in results] == sorted(res.idx for res in results)
+        assert results[0].idx == 0
+    assert all(res.ok for res in results)
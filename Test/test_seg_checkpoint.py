@@ -0,0 +1,64 @@
+import datetime
+
+import pytest
+
+import Seg.SegListChan
+from Common.CEnum import DATA_FIELD, KL_TYPE
+from Common.CTime import CTime
+from KLine.KLine_Unit import CKLine_Unit
+from Test.helper import make_chan
+
+LV = KL_TYPE.K_30M
+DEFAULT_STEP = Seg.SegListChan.EIGEN_CHECKPOINT_STEP
+
+
+def trend_klu(pre_klu, i: int) -> CKLine_Unit:
+    # 涨8根跌6根的阶梯上涨，线段长时间不能确定，特征序列要从保存的状态接着扫很多笔
+    t = datetime.datetime(pre_klu.time.year, pre_klu.time.month, pre_klu.time.day) + datetime.timedelta(days=i // 8 + 1, hours=10 + i % 8 // 2, minutes=i % 2 * 30)
+    _open = pre_klu.close
+    close = round(_open * (1.004 if i % 14 < 8 else 0.9955), 2)
+    return CKLine_Unit({
+        DATA_FIELD.FIELD_TIME: CTime(t.year, t.month, t.day, t.hour, t.minute),
+        DATA_FIELD.FIELD_OPEN: _open,
+        DATA_FIELD.FIELD_HIGH: max(_open, close) + 0.01,
+        DATA_FIELD.FIELD_LOW: min(_open, close) - 0.01,
+        DATA_FIELD.FIELD_CLOSE: close,
+    })
+
+
+def seg_state(chan):
+    kl_list = chan[0]
+    return tuple(
+        tuple((seg.idx, seg.start_bi.idx, seg.end_bi.idx, seg.is_sure, seg.dir, seg.reason) for seg in seg_list)
+        for seg_list in (kl_list.seg_list, kl_list.segseg_list)
+    )
+
+
+def run_steps(conf, checkpoint_step, monkeypatch):
+    # 返回每一步的线段，以及是否真的用到过保存的扫描状态
+    monkeypatch.setattr(Seg.SegListChan, "EIGEN_CHECKPOINT_STEP", checkpoint_step)
+    chan = make_chan(800, {"trigger_step": True, **conf}, lv_list=[LV])
+    states, used = [], False
+    for _ in chan.step_load():
+        states.append(seg_state(chan))
+        used |= bool(getattr(chan[0].seg_list, "eigen_checkpoint", None))
+    pre_klu = chan[0][-1][-1]
+    for i in range(600):
+        pre_klu = trend_klu(pre_klu, i)
+        chan.append_klu(LV, pre_klu)
+        states.append(seg_state(chan))
+        used |= bool(getattr(chan[0].seg_list, "eigen_checkpoint", None))
+    return states, used
+
+
+@pytest.mark.parametrize("seg_algo", ["chan", "1+1", "break"])
+@pytest.mark.parametrize("left_seg_method", ["all", "peak"])
+def test_checkpoint_matches_rescan(seg_algo, left_seg_method, monkeypatch):
+    conf = {"seg_algo": seg_algo, "left_seg_method": left_seg_method}
+    expect, _ = run_steps(conf, 0, monkeypatch)  # 每次从最后一个确定线段之后从头扫
+    for checkpoint_step in (DEFAULT_STEP, 1):
+        states, used = run_steps(conf, checkpoint_step, monkeypatch)
+        assert used == (seg_algo == "chan")
+        assert len(states) == len(expect)
+        for step, (state, expect_state) in enumerate(zip(states, expect)):
+            assert state == expect_state, (checkpoint_step, step)
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+from collections import Counter
+
+import pytest
+
+from Chan import CChan
+from Common.CEnum import KL_TYPE
+from DataAPI import Session
+from DataAPI.MockAPI import CMockSessionAPI
+from DataAPI.Session import acquire_session, cached_basic_info, clear_basic_info_cache, keep_session_alive, release_session, stock_session
+from Test.helper import BEGIN_DATE, end_date_for, make_conf
+
+SESSION_SRC = "custom:MockAPI.CMockSessionAPI"
+LV_LIST = [KL_TYPE.K_DAY, KL_TYPE.K_30M]
+
+
+@pytest.fixture(autouse=True)
+def fresh_session():
+    CMockSessionAPI.round_trips = Counter()
+    CMockSessionAPI.connect_pid = None
+    CMockSessionAPI.cache_basic_info = True
+    clear_basic_info_cache()
+    yield
+    assert Session._ref_cnt[CMockSessionAPI] == 0 and Session._hold_cnt[CMockSessionAPI] == 0
+    assert CMockSessionAPI not in Session._opened
+    CMockSessionAPI.cache_basic_info = True
+    clear_basic_info_cache()
+
+
+def trips(*kinds):
+    return tuple(CMockSessionAPI.round_trips[kind] for kind in kinds)
+
+
+def build(code="sz.000001"):
+    return CChan(code, str(BEGIN_DATE), end_date_for(200, LV_LIST[-1]), SESSION_SRC, LV_LIST, make_conf())
+
+
+def test_ref_count():
+    acquire_session(CMockSessionAPI)
+    acquire_session(CMockSessionAPI)
+    release_session(CMockSessionAPI)
+    assert trips("login", "logout") == (1, 0)  # 还有一个使用者
+    release_session(CMockSessionAPI)
+    assert trips("login", "logout") == (1, 1)
+    release_session(CMockSessionAPI)  # 多余的release不会减成负数
+    assert Session._ref_cnt[CMockSessionAPI] == 0
+    assert trips("login", "logout") == (1, 1)
+
+
+def test_each_load_logs_in_without_session():
+    build()
+    build("sz.000002")
+    assert trips("login", "logout", "kl_data") == (2, 2, 4)
+
+
+def test_stock_session_holds_until_block_ends():
+    with stock_session(CMockSessionAPI):
+        assert trips("login") == (0,)  # 第一次用到时才登录
+        build()
+        with stock_session(CMockSessionAPI):
+            build("sz.000002")
+        build("sz.000003")
+        assert trips("login", "logout") == (1, 0)
+    assert trips("login", "logout", "kl_data") == (1, 1, 6)
+
+    with pytest.raises(RuntimeError):
+        with stock_session(CMockSessionAPI):
+            build()
+            raise RuntimeError()
+    assert trips("login", "logout") == (2, 2)  # 异常退出也会登出
+
+
+def test_keep_session_alive_releases_on_finalize():
+    keep_session_alive(CMockSessionAPI)
+    build()
+    build("sz.000002")
+    assert trips("login", "logout") == (1, 0)
+    Session._release_hold(CMockSessionAPI)  # 进程退出时Finalize调用
+    assert trips("login", "logout") == (1, 1)
+
+
+def _in_child(queue):
+    # fork出来的子进程：不沿用父进程的会话和计数，自己登录，用完登出
+    CMockSessionAPI.round_trips = Counter()
+    build()
+    queue.put((dict(CMockSessionAPI.round_trips), Session._ref_cnt[CMockSessionAPI], Session._hold_cnt[CMockSessionAPI], CMockSessionAPI in Session._opened))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="需要fork")
+def test_forked_child_does_not_inherit_session():
+    ctx = multiprocessing.get_context("fork")
+    with stock_session(CMockSessionAPI):
+        acquire_session(CMockSessionAPI)
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_in_child, args=(queue,))
+        proc.start()
+        child_trips, ref_cnt, hold_cnt, opened = queue.get(timeout=30)
+        proc.join(timeout=30)
+        assert proc.exitcode == 0
+        assert child_trips["login"] == 1 and child_trips["logout"] == 1
+        assert (ref_cnt, hold_cnt, opened) == (0, 0, False)
+        release_session(CMockSessionAPI)
+        assert trips("login", "logout") == (1, 0)  # 父进程的会话不受影响
+        assert CMockSessionAPI.connect_pid == os.getpid()
+    assert trips("login", "logout") == (1, 1)
+
+
+def test_cached_basic_info():
+    build()
+    build()
+    build("sz.000002")
+    assert trips("basic_info") == (2,)  # 每只股票只查一次，多个级别共用
+    clear_basic_info_cache()
+    build()
+    assert trips("basic_info") == (3,)
+
+    CMockSessionAPI.cache_basic_info = False
+    build()
+    assert trips("basic_info") == (3 + len(LV_LIST),)
+
+    loads = []
+    for _ in range(3):
+        assert cached_basic_info(CMockSessionAPI, "sz.000009", lambda: loads.append(1) or ("name", False)) == ("name", False)
+    assert len(loads) == 1
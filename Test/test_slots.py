@@ -0,0 +1,14 @@
+import pytest
+
+from Test.helper import make_chan
+
+
+def test_model_classes_reject_adhoc_attributes():
+    chan = make_chan(600)
+    kl_list = chan[0]
+    objs = [kl_list[-1], kl_list[-1][-1], kl_list[-1][-1].time, kl_list.bi_list[-1]]
+    objs += kl_list.seg_list[-1:] + kl_list.zs_list[-1:] + list(kl_list.bs_point_lst.bsp_iter())[-1:]
+    for obj in objs:
+        assert not hasattr(obj, "__dict__"), type(obj)
+        with pytest.raises(AttributeError):
+            obj.my_signal = 1
@@ -0,0 +1,69 @@
+import os
+import random
+
+import pytest
+
+import ChanSnapshot
+from Chan import CChan
+from ChanSnapshot import snapshot_fingerprint
+from Common.CEnum import KL_TYPE
+from Test.helper import dump_chan, make_chan, mock_klus
+from Test.test_incremental import CONFS, feed, klu_cnt, variant
+
+LV_LIST = [KL_TYPE.K_60M, KL_TYPE.K_30M]
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_snapshot_matches_pickle(tmp_path, columnar):
+    chan = make_chan(1200, dict(CONFS["metrics"], columnar_kl=columnar), lv_list=LV_LIST)
+    expected = dump_chan(chan)
+    chan.chan_dump_snapshot(tmp_path / "chan.snap")
+    chan.chan_dump_pickle(tmp_path / "chan.pkl")
+    assert dump_chan(CChan.chan_load_pickle(tmp_path / "chan.pkl")) == expected
+    for use_mmap in (True, False):
+        assert dump_chan(CChan.chan_load_snapshot(tmp_path / "chan.snap", use_mmap)) == expected
+
+
+def test_loaded_snapshot_keeps_growing(tmp_path):
+    chan = make_chan(800, CONFS["area"])
+    chan.chan_dump_snapshot(tmp_path / "chan.snap")
+    loaded = CChan.chan_load_snapshot(tmp_path / "chan.snap")
+    lv, base = chan.lv_list[0], klu_cnt(chan)
+    for other, klus in ((chan, mock_klus(1000)), (loaded, mock_klus(1000))):
+        rnd = random.Random(0)
+        for klu in klus[base:]:
+            feed(other, lv, klu, rnd)
+    assert dump_chan(loaded) == dump_chan(chan)
+
+
+def test_snapshot_with_forming_klu(tmp_path):
+    chan = make_chan(600, CONFS["metrics"])
+    lv, klus, rnd = chan.lv_list[0], mock_klus(700), random.Random(1)
+    base = klu_cnt(chan)
+    chan.append_klu(lv, variant(klus[base], rnd))
+    chan.chan_dump_snapshot(tmp_path / "chan.snap")
+    loaded = CChan.chan_load_snapshot(tmp_path / "chan.snap")
+    for other in (chan, loaded):
+        other.update_last_klu(lv, mock_klus(700)[base])
+    assert dump_chan(loaded) == dump_chan(chan)
+
+
+def test_fingerprint_reads_header_only(tmp_path):
+    chan = make_chan(300)
+    chan.chan_dump_snapshot(tmp_path / "chan.snap")
+    assert snapshot_fingerprint(tmp_path / "chan.snap") == chan.conf.fingerprint_digest()
+    assert os.listdir(tmp_path) == ["chan.snap"]
+
+
+def test_failed_dump_keeps_old_file(tmp_path, monkeypatch):
+    path = tmp_path / "chan.snap"
+    make_chan(300).chan_dump_snapshot(path)
+    old = path.read_bytes()
+
+    def broken_dumps(*args, **kwargs):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(ChanSnapshot.json, "dumps", broken_dumps)
+    with pytest.raises(RuntimeError):
+        make_chan(500).chan_dump_snapshot(path)
+    assert path.read_bytes() == old
+    assert os.listdir(tmp_path) == ["chan.snap"]
@@ -0,0 +1,75 @@
+from Chan import CChan
+from Common.CEnum import KL_TYPE
+from Sweep import CParamSweep, grid
+from Test.helper import BEGIN_DATE, MOCK_SRC, make_conf
+
+LV_LIST = [KL_TYPE.K_DAY, KL_TYPE.K_30M]
+CODES = ["sz.000001", "sz.000003"]
+END_TIME = "2016-03-01"
+
+
+def signal_rows(signals):
+    return [(s.lv.name, s.line, s.is_buy, s.type, str(s.time), s.klu_idx, s.bi_idx, s.price, s.is_sure) for s in signals]
+
+
+def fresh_rows(conf, code):
+    config = make_conf(conf)
+    chan = CChan(code, str(BEGIN_DATE), END_TIME, MOCK_SRC, LV_LIST, config)
+    if config.trigger_step:
+        for _ in chan.step_load():
+            pass
+    res = []
+    for lv in chan.lv_list:
+        for line, bsp_lst in (("bi", chan[lv].bs_point_lst), ("seg", chan[lv].seg_bs_point_lst)):
+            for bsp in sorted(bsp_lst.bsp_iter(), key=lambda bsp: bsp.bi.idx):
+                res.append((lv.name, line, bsp.is_buy, bsp.type2str(), str(bsp.klu.time), bsp.klu.idx, bsp.bi.idx, bsp.bi.get_end_val(), bsp.bi.is_sure))
+    return res
+
+
+def run_sweep(configs, max_workers=0):
+    res = CParamSweep(LV_LIST, configs, str(BEGIN_DATE), END_TIME, MOCK_SRC, max_workers=max_workers).run(CODES)
+    assert res.errors == {}
+    return res
+
+
+def check_against_fresh(configs, res):
+    got = {}
+    for signal in res.signals:
+        got.setdefault((signal.config, signal.code), []).append(signal)
+    for name, conf in configs.items():
+        for code in CODES:
+            assert signal_rows(got.get((name, code), [])) == fresh_rows(conf, code), (name, code)
+
+
+def test_grid_names():
+    configs = grid({"print_warning": False}, divergence_rate=[0.8, float("inf")], macd_algo=["peak"])
+    assert list(configs) == ["divergence_rate=0.8,macd_algo=peak", "divergence_rate=inf,macd_algo=peak"]
+    assert configs["divergence_rate=0.8,macd_algo=peak"] == {"print_warning": False, "divergence_rate": 0.8, "macd_algo": "peak"}
+    assert list(grid({"a": 1})) == ["base"]
+
+
+def test_shared_zs_and_bsp_match_fresh_build():
+    configs = grid({"print_warning": False}, zs_algo=["normal", "over_seg"], divergence_rate=[0.7, float("inf")], macd_algo=["peak", "area"])
+    res = run_sweep(configs)
+    check_against_fresh(configs, res)
+    # 一个load组，2组中枢参数，8组买卖点参数
+    assert res.stats == {"load": len(CODES), "zs": len(CODES), "bsp": 7 * len(CODES)}
+
+
+def test_separate_load_groups_match_fresh_build():
+    configs = grid({"print_warning": False}, bi_strict=[True, False], min_zs_cnt=[0, 1])
+    configs["dup"] = {"print_warning": False, "min_zs_cnt": 0}  # 和bi_strict=True,min_zs_cnt=0指纹相同，只算一次
+    configs["step"] = {"print_warning": False, "trigger_step": True}
+    res = run_sweep(configs)
+    check_against_fresh(configs, res)
+    assert res.stats["load"] == 3 * len(CODES)
+    assert res.stats["bsp"] == 2 * len(CODES)
+
+
+def test_worker_processes_match_serial():
+    configs = grid({"print_warning": False}, zs_combine=[True, False], bs_type=["1,2", "2,1,3a"])
+    serial = run_sweep(configs)
+    parallel = run_sweep(configs, max_workers=2)
+    assert [(s.config, s.code) + row for s, row in zip(parallel.signals, signal_rows(parallel.signals))] == \
+        [(s.config, s.code) + row for s, row in zip(serial.signals, signal_rows(serial.signals))]
+    assert parallel.stats == serial.stats
@@ -5,12 +5,18 @@ from BuySellPoint.BSPointConfig import CPointConfig
 from Common.ChanException import CChanException, ErrCode
 from Common.func_util import has_overlap
 from KLine.KLine_Unit import CKLine_Unit
+from Math.MetricIndex import CMetricIndex
 from Seg.Seg import CSeg
 
 LINE_TYPE = TypeVar('LINE_TYPE', CBi, "CSeg")
 
 
 class CZS(Generic[LINE_TYPE]):
+    __slots__ = (
+        "__is_sure", "__sub_zs_lst", "__begin", "__begin_bi", "__low", "__high", "__mid", "__end", "__end_bi",
+        "__peak_high", "__peak_low", "__bi_in", "__bi_out", "__bi_lst", "_memoize_cache",
+    )
+
     def __init__(self, lst: Optional[List[LINE_TYPE]], is_sure=True):
         # begin/end：永远指向 klu
         # low/high: 中枢的范围
@@ -42,7 +48,7 @@ class CZS(Generic[LINE_TYPE]):
         self.__bi_lst: List[LINE_TYPE] = []  # begin_bi~end_bi之间的笔，在update_zs_in_seg函数中更新
 
     def clean_cache(self):
-        self._memoize_cache = {}
+        self._memoize_cache = None
 
     @property
     def is_sure(self): return self.__is_sure
@@ -159,14 +165,18 @@ class CZS(Generic[LINE_TYPE]):
     def is_inside(self, seg: CSeg):
         return seg.start_bi.idx <= self.begin_bi.idx <= seg.end_bi.idx
 
-    def is_divergence(self, config: CPointConfig, out_bi=None):
+    def is_divergence(self, config: CPointConfig, out_bi=None, metric_index: Optional[CMetricIndex] = None):
+        # metric_index: 所在笔列表的指标索引，结果和直接调用笔的cal_macd_metric一致
         if not self.end_bi_break(out_bi):  # 最后一笔必须突破中枢
             return False, None
-        in_metric = self.get_bi_in().cal_macd_metric(config.macd_algo, is_reverse=False)
         if out_bi is None:
-            out_metric = self.get_bi_out().cal_macd_metric(config.macd_algo, is_reverse=True)
-        else:
+            out_bi = self.get_bi_out()
+        if metric_index is None:
+            in_metric = self.get_bi_in().cal_macd_metric(config.macd_algo, is_reverse=False)
             out_metric = out_bi.cal_macd_metric(config.macd_algo, is_reverse=True)
+        else:
+            in_metric = metric_index.cal_macd_metric(self.get_bi_in(), config.macd_algo, is_reverse=False)
+            out_metric = metric_index.cal_macd_metric(out_bi, config.macd_algo, is_reverse=True)
 
         if config.divergence_rate > 100:  # 保送
             return True, out_metric/in_metric